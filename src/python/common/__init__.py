@@ -12,3 +12,4 @@ from .multiprocessing_logger import MultiprocessingLogger
 from .status import Status, IStatusListener, StatusComponent, IStatusComponentListener
 from .app_process import AppProcess, AppOneShotProcess
 from .bounded_ordered_set import BoundedOrderedSet
+from .tree_traversal import TreeTraversal
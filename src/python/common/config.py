@@ -103,23 +103,31 @@ class InnerConfig(ABC):
     Each property has associated with is a checker and a converter function.
     The checker function performs boundary check on the native type value.
     The converter function converts the string representation into the native type.
+    A property may also have a default value, which is used when the property
+    is missing from a dict. This allows new properties to be added to existing
+    sections without invalidating older config files.
     """
     class PropMetadata:
         """Tracks property metadata"""
-        def __init__(self, checker: Callable, converter: Callable):
+        # Marker for properties without a default value
+        NO_DEFAULT = object()
+
+        def __init__(self, checker: Callable, converter: Callable, default: Any = NO_DEFAULT):
             self.checker = checker
             self.converter = converter
+            self.default = default
 
     # Global map to map a property to its metadata
     # Is there a way for each concrete class to do this separately?
     __prop_addon_map = collections.OrderedDict()
 
     @classmethod
-    def _create_property(cls, name: str, checker: Callable, converter: Callable) -> property:
+    def _create_property(cls, name: str, checker: Callable, converter: Callable,
+                         default: Any = PropMetadata.NO_DEFAULT) -> property:
         # noinspection PyProtectedMember
         prop = property(fget=lambda s: s._get_property(name),
                         fset=lambda s, v: s._set_property(name, v, checker))
-        prop_addon = InnerConfig.PropMetadata(checker=checker, converter=converter)
+        prop_addon = InnerConfig.PropMetadata(checker=checker, converter=converter, default=default)
         InnerConfig.__prop_addon_map[prop] = prop_addon
         return prop
 
@@ -144,13 +152,17 @@ class InnerConfig(ABC):
         config_dict = dict(config_dict)  # copy that we can modify
 
         # Loop over all the property name, and set them to the value given in config_dict
-        # Raise error if a matching key is not found in config_dict
+        # Raise error if a matching key is not found in config_dict, unless the property has a default
         # noinspection PyCallingNonCallable
         inner_config = cls()
         property_map = {p: getattr(cls, p) for p in dir(cls) if isinstance(getattr(cls, p), property)}
         for name, prop in property_map.items():
             if name not in config_dict:
-                raise ConfigError("Missing config: {}.{}".format(cls.__name__, name))
+                default = InnerConfig.__prop_addon_map[prop].default
+                if default is InnerConfig.PropMetadata.NO_DEFAULT:
+                    raise ConfigError("Missing config: {}.{}".format(cls.__name__, name))
+                inner_config.set_property(name, default)
+                continue
             inner_config.set_property(name, config_dict[name])
             del config_dict[name]
 
@@ -271,6 +283,15 @@ class Config(Persist):
         extract_path = PROP("extract_path", Checkers.string_nonempty, Converters.null)
         use_local_path_as_extract_path = PROP("use_local_path_as_extract_path", Checkers.null, Converters.bool)
         max_tracked_files = PROP("max_tracked_files", Checkers.int_positive, Converters.int)
+        use_local_inotify = PROP("use_local_inotify", Checkers.null, Converters.bool, default=False)
+        num_local_scan_threads = PROP("num_local_scan_threads", Checkers.int_positive, Converters.int, default=1)
+        num_remote_scan_threads = PROP("num_remote_scan_threads", Checkers.int_positive, Converters.int, default=1)
+        use_remote_scan_agent = PROP("use_remote_scan_agent", Checkers.null, Converters.bool, default=False)
+        use_remote_inotify = PROP("use_remote_inotify", Checkers.null, Converters.bool, default=False)
+        use_shared_memory_scan_results = PROP("use_shared_memory_scan_results", Checkers.null, Converters.bool,
+                                              default=False)
+        model_build_shard_min_roots = PROP("model_build_shard_min_roots", Checkers.int_non_negative,
+                                           Converters.int, default=20000)
 
         def __init__(self):
             super().__init__()
@@ -280,6 +301,13 @@ class Config(Persist):
             self.extract_path = None
             self.use_local_path_as_extract_path = None
             self.max_tracked_files = None
+            self.use_local_inotify = None
+            self.num_local_scan_threads = None
+            self.num_remote_scan_threads = None
+            self.use_remote_scan_agent = None
+            self.use_remote_inotify = None
+            self.use_shared_memory_scan_results = None
+            self.model_build_shard_min_roots = None
 
     class Web(InnerConfig):
         port = PROP("port", Checkers.int_positive, Converters.int)
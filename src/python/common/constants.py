@@ -14,3 +14,4 @@ class Constants:
     MIN_PERSIST_TO_FILE_INTERVAL_IN_SECS = 30
     JSON_PRETTY_PRINT_INDENT = 4
     LFTP_TEMP_FILE_SUFFIX = ".lftp"
+    LFTP_STATUS_FILE_SUFFIX = ".lftp-pget-status"
@@ -49,7 +49,7 @@ class Job(threading.Thread, ABC):
                 self.shutdown_flag.set()
                 break
 
-            time.sleep(Job._DEFAULT_SLEEP_INTERVAL_IN_SECS)
+            self.wait()
 
         # ... Clean shutdown code here ...
         self.logger.debug("Calling cleanup for {}".format(self.name))
@@ -65,6 +65,14 @@ class Job(threading.Thread, ABC):
         """
         self.shutdown_flag.set()
 
+    def wait(self):
+        """
+        Wait is run between executes, by default it sleeps for a fixed interval
+        Jobs that know when there is new work can override this to wait for it instead
+        :return:
+        """
+        time.sleep(Job._DEFAULT_SLEEP_INTERVAL_IN_SECS)
+
     def propagate_exception(self):
         """
         Raises any exception captured by this job in whatever thread calls this method
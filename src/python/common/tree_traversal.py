@@ -0,0 +1,64 @@
+# Copyright 2017, Inderpreet Singh, All rights reserved.
+
+from typing import Callable, Iterable, Iterator, List, TypeVar
+
+T = TypeVar('T')
+R = TypeVar('R')
+
+
+class TreeTraversal:
+    """
+    Iterative depth-first traversals of a tree
+
+    The tree is described by a function that returns the children of a node,
+    so these work on any tree (ModelFiles, SystemFiles, or a tree that is
+    being built during the traversal). Being iterative, deep trees don't
+    run into the recursion limit, and unlike a BFS over a list, each node
+    is visited in constant time.
+    """
+    __DONE = object()
+
+    @staticmethod
+    def pre_order(roots: Iterable[T], get_children: Callable[[T], Iterable[T]]) -> Iterator[T]:
+        """
+        Yield every node, parents before their children, siblings in order
+        :param roots:
+        :param get_children:
+        :return:
+        """
+        stack = list(roots)
+        stack.reverse()
+        while stack:
+            node = stack.pop()
+            yield node
+            children = list(get_children(node))
+            children.reverse()
+            stack += children
+
+    @staticmethod
+    def fold(root: T,
+             expand: Callable[[T], Iterable[T]],
+             combine: Callable[[T, List[R]], R]) -> R:
+        """
+        Post-order fold of a tree, in a single pass
+        expand is called on each node before any of its descendants, and returns its
+        children (so it can also build them). combine is called on each node after all
+        of its children, with their results in order, and returns the result of the node.
+        :param root:
+        :param expand:
+        :param combine:
+        :return: the result of the root
+        """
+        # Stack of (node, iterator over its children, results of its combined children)
+        stack = [(root, iter(expand(root)), [])]
+        while True:
+            node, children, results = stack[-1]
+            child = next(children, TreeTraversal.__DONE)
+            if child is not TreeTraversal.__DONE:
+                stack.append((child, iter(expand(child)), []))
+                continue
+            stack.pop()
+            result = combine(node, results)
+            if not stack:
+                return result
+            stack[-1][2].append(result)
@@ -3,7 +3,7 @@
 import json
 import threading
 from abc import ABC, abstractmethod
-from typing import Set, List, Callable, Tuple
+from typing import Set, List, Callable, Tuple, Optional
 import fnmatch
 
 from common import overrides, Constants, Context, Persist, PersistError, Serializable
@@ -138,6 +138,14 @@ class AutoQueueModelListener(IModelListener):
     def file_removed(self, file: ModelFile):
         pass
 
+    @overrides(IModelListener)
+    def files_changed(self, changes: List[Tuple[Optional[ModelFile], Optional[ModelFile]]]):
+        self.new_files += [new_file for old_file, new_file in changes if old_file is None]
+        self.modified_files += [
+            (old_file, new_file) for old_file, new_file in changes
+            if old_file is not None and new_file is not None
+        ]
+
 
 class AutoQueuePersistListener(IAutoQueuePersistListener):
     """Keeps track of newly added patterns"""
@@ -1,6 +1,7 @@
 # Copyright 2017, Inderpreet Singh, All rights reserved.
 
 from abc import ABC, abstractmethod
+import multiprocessing
 import threading
 from typing import Dict, List, Optional, Tuple
 from threading import Lock
@@ -16,7 +17,7 @@ from .webhook_manager import WebhookManager
 from .extract import ExtractStatus
 from .model_builder import ModelBuilder
 from .memory_monitor import MemoryMonitor
-from common import Context, AppError, MultiprocessingLogger
+from common import Context, AppError, MultiprocessingLogger, TreeTraversal
 from model import ModelError, ModelFile, Model, ModelDiff, ModelDiffUtil, IModelListener
 from lftp import LftpError, LftpJobStatus, LftpJobStatusParserError
 from .controller_persist import ControllerPersist
@@ -77,6 +78,50 @@ class Controller:
         def add_callback(self, callback: ICallback):
             self.callbacks.append(callback)
 
+    class BatchCommand:
+        """
+        Class by which clients of Controller can request one Action to be executed on many files
+        The whole batch is checked against a single model snapshot and executed in one
+        controller pass, using batched lftp, extract and delete operations. The callbacks
+        are notified once, with the result for every file.
+        Note: callbacks will be executed in Controller thread, so any heavy computation
+              should be moved out of the callback
+        """
+        class Result:
+            """Result of a batch command for one file"""
+            def __init__(self, success: bool, error: Optional[str] = None, error_code: Optional[int] = None):
+                self.success = success
+                self.error = error
+                self.error_code = error_code
+
+        class ICallback(ABC):
+            """Batch command callback interface"""
+            @abstractmethod
+            def on_complete(self, results: Dict[str, "Controller.BatchCommand.Result"]):
+                """
+                Called once the batch was executed.
+
+                Args:
+                    results: Result of each file name, in the order the names were given.
+                        A failed result has the same error message and code as a
+                        failed Command would for that file.
+                """
+                pass
+
+        def __init__(self, action: "Controller.Command.Action", filenames: List[str]):
+            self.action = action
+            self.filenames = filenames
+            self.callbacks = []
+
+        def add_callback(self, callback: ICallback):
+            self.callbacks.append(callback)
+
+    # Number of recent model changes kept for resuming model streams
+    __MODEL_JOURNAL_SIZE = 1000
+    # Longest wait for work between two process() calls
+    # This bounds how stale the lftp status can get, since lftp doesn't notify of changes
+    __MAX_PROCESS_INTERVAL_IN_SECS = 0.5
+
     def __init__(self,
                  context: Context,
                  persist: ControllerPersist,
@@ -91,10 +136,18 @@ class Controller:
         # The command queue
         self.__command_queue = Queue()
 
+        # Set whenever there is new work for process(): a command, a scan result,
+        # a completed extraction or a webhook import
+        # A multiprocessing Event, so that the scanner and extract processes can set it
+        self.__wake_event = multiprocessing.Event()
+        self.__webhook_manager.set_import_callback(self.wake)
+
         # The model
-        self.__model = Model()
+        # Its journal lets model streams resume after a reconnect
+        self.__model = Model(journal_size=Controller.__MODEL_JOURNAL_SIZE)
         self.__model.set_base_logger(self.logger)
-        # Lock for the model
+        # Lock for changes to the model
+        # Readers don't take it, they read the model's latest immutable snapshot instead
         # Note: While the scanners are in a separate process, the rest of the application
         #       is threaded in a single process. (The webserver is bottle+paste which is
         #       multi-threaded). Therefore it is safe to use a threading Lock for the model
@@ -102,7 +155,9 @@ class Controller:
         self.__model_lock = Lock()
 
         # Model builder
-        self.__model_builder = ModelBuilder()
+        self.__model_builder = ModelBuilder(
+            shard_min_roots=self.__context.config.controller.model_build_shard_min_roots
+        )
         self.__model_builder.set_base_logger(self.logger)
         self.__model_builder.set_downloaded_files(self.__persist.downloaded_file_names)
         self.__model_builder.set_extracted_files(self.__persist.extracted_file_names)
@@ -116,7 +171,8 @@ class Controller:
         # Setup the scan manager
         self.__scan_manager = ScanManager(
             context=self.__context,
-            mp_logger=self.__mp_logger
+            mp_logger=self.__mp_logger,
+            result_event=self.__wake_event
         )
 
         # Setup the file operation manager
@@ -124,7 +180,8 @@ class Controller:
             context=self.__context,
             mp_logger=self.__mp_logger,
             force_local_scan_callback=self.__scan_manager.force_local_scan,
-            force_remote_scan_callback=self.__scan_manager.force_remote_scan
+            force_remote_scan_callback=self.__scan_manager.force_remote_scan,
+            completed_event=self.__wake_event
         )
 
         # Keep track of active downloading files
@@ -205,6 +262,27 @@ class Controller:
         # Process webhook imports
         self.__check_webhook_imports()
 
+    def wait_for_work(self):
+        """
+        Block until there may be new work for process()
+        Returns when a command was queued, a scan result or completed extraction is
+        available, or a webhook import was received, and at the latest after the max
+        process interval. Wakes that happened since the last call return immediately.
+        :return:
+        """
+        self.__wake_event.wait(timeout=Controller.__MAX_PROCESS_INTERVAL_IN_SECS)
+        # Cleared before process() runs, so work that arrives after this
+        # is either seen by process() or wakes the next wait
+        self.__wake_event.clear()
+
+    def wake(self):
+        """
+        Wake a pending or the next wait_for_work()
+        Thread-safe
+        :return:
+        """
+        self.__wake_event.set()
+
     def exit(self):
         self.logger.debug("Exiting controller")
         if self.__started:
@@ -217,6 +295,7 @@ class Controller:
             self.__lftp_manager.exit()
             self.__scan_manager.stop()
             self.__file_op_manager.stop()
+            self.__model_builder.close()
             self.__mp_logger.stop()
             self.__started = False
             self.logger.info("Exited controller")
@@ -224,11 +303,12 @@ class Controller:
     def get_model_files(self) -> List[ModelFile]:
         """
         Returns a copy of all the model files
+        This reads the latest model snapshot, and does not wait for a model update in progress
         :return:
         """
-        with self.__model_lock:
-            model_files = self.__get_model_files()
-        return model_files
+        # Files are frozen (immutable) after being added to the model,
+        # so we can safely return direct references without deep copying.
+        return self.__model.snapshot.get_files()
 
     def is_file_stopped(self, filename: str) -> bool:
         """
@@ -266,8 +346,7 @@ class Controller:
         :param listener:
         :return:
         """
-        with self.__model_lock:
-            self.__model.add_listener(listener)
+        self.__model.add_listener(listener)
 
     def remove_model_listener(self, listener: IModelListener):
         """
@@ -275,8 +354,7 @@ class Controller:
         :param listener:
         :return:
         """
-        with self.__model_lock:
-            self.__model.remove_listener(listener)
+        self.__model.remove_listener(listener)
 
     def get_model_files_and_add_listener(self, listener: IModelListener):
         """
@@ -288,25 +366,47 @@ class Controller:
             2. add_listener() -> model updated -> get_model()
                The model update is duplicated on client side (once through listener, and once
                through the model).
+        The listener is added together with the model snapshot it was added at,
+        so this does not wait for a model update in progress.
         :param listener:
         :return:
         """
-        with self.__model_lock:
-            self.__model.add_listener(listener)
-            model_files = self.__get_model_files()
-        return model_files
+        return self.__model.add_listener_and_get_snapshot(listener).get_files()
+
+    def get_model_changes_and_add_listener(self,
+                                           listener: IModelListener,
+                                           journal_id: Optional[str],
+                                           version: Optional[int]) \
+            -> Tuple[str, int, Optional[List[ModelFile]], Optional[List[Tuple[Optional[ModelFile],
+                                                                             Optional[ModelFile]]]]]:
+        """
+        Like get_model_files_and_add_listener(), but for a client that may already have
+        the model up to the given version of the given model journal
+        Every change the listener is notified of increments the version by one.
+        :param listener:
+        :param journal_id: journal id of the model the client has, None if it has none
+        :param version: version of the model the client has, None if it has none
+        :return: (journal id, version, files, changes) where the journal id and version are
+                 those of the current model. If the model could be resumed from the given
+                 version, changes are the changes since then (see Model.get_changes_since)
+                 and files is None. Otherwise, files are all the model files and changes
+                 is None.
+        """
+        if journal_id == self.__model.journal_id and version is not None:
+            snapshot, changes = self.__model.add_listener_and_get_changes_since(listener, version)
+        else:
+            snapshot, changes = self.__model.add_listener_and_get_snapshot(listener), None
+        model_files = snapshot.get_files() if changes is None else None
+        return snapshot.journal_id, snapshot.version, model_files, changes
 
     def queue_command(self, command: Command):
         self.__command_queue.put(command)
+        self.wake()
 
-    def __get_model_files(self) -> List[ModelFile]:
-        # Files are frozen (immutable) after being added to the model,
-        # so we can safely return direct references without deep copying.
-        # This significantly reduces memory churn on API requests.
-        model_files = []
-        for filename in self.__model.get_file_names():
-            model_files.append(self.__model.get_file(filename))
-        return model_files
+    def queue_batch_command(self, batch_command: BatchCommand):
+        # Batch commands share the command queue, so they are ordered with respect to other commands
+        self.__command_queue.put(batch_command)
+        self.wake()
 
     # =========================================================================
     # __update_model() helper methods
@@ -392,13 +492,19 @@ class Controller:
             extracted_results: List of completed extraction results.
         """
         if remote_scan is not None:
-            self.__model_builder.set_remote_files(remote_scan.files)
+            if remote_scan.is_partial:
+                self.__model_builder.update_remote_files(remote_scan.files, remote_scan.partial_names)
+            else:
+                self.__model_builder.set_remote_files(remote_scan.files)
         if local_scan is not None:
-            self.__model_builder.set_local_files(local_scan.files)
+            if local_scan.is_partial:
+                self.__model_builder.update_local_files(local_scan.files, local_scan.partial_names)
+            else:
+                self.__model_builder.set_local_files(local_scan.files)
         if active_scan is not None:
             self.__model_builder.set_active_files(active_scan.files)
         if lftp_statuses is not None:
-            self.__model_builder.set_lftp_statuses(lftp_statuses)
+            self.__model_builder.set_lftp_statuses(lftp_statuses, self.__lftp_manager.status_version)
         if extract_statuses is not None:
             self.__model_builder.set_extract_statuses(extract_statuses.statuses)
         if extracted_results:
@@ -541,19 +647,19 @@ class Controller:
 
         Also detects newly downloaded files and updates tracking.
 
+        The diff is applied as a single batch, so that each model listener
+        is notified once with all the changes.
+
         Must be called while holding the model lock.
 
         Args:
             model_diff: List of model diff entries to apply.
         """
-        for diff in model_diff:
-            if diff.change == ModelDiff.Change.ADDED:
-                self.__model.add_file(diff.new_file)
-            elif diff.change == ModelDiff.Change.REMOVED:
-                self.__model.remove_file(diff.old_file.name)
-            elif diff.change == ModelDiff.Change.UPDATED:
-                self.__model.update_file(diff.new_file)
+        # An ADDED diff has no old file and a REMOVED diff has no new file,
+        # which is how Model.apply_batch() tells them apart
+        self.__model.apply_batch([(diff.old_file, diff.new_file) for diff in model_diff])
 
+        for diff in model_diff:
             # Detect if a file was just queued or downloaded and update persist state
             self._detect_and_track_queued(diff)
             self._detect_and_track_download(diff)
@@ -583,6 +689,7 @@ class Controller:
         # Model builder creates files with default import_status=NONE.
         # Without this, every rebuild cycle produces spurious SSE events:
         #   update(NONE) then update(IMPORTED), causing repeated frontend toasts.
+        imported_changes = []
         for file_name in new_model.get_file_names():
             if file_name in self.__persist.imported_file_names:
                 try:
@@ -591,9 +698,11 @@ class Controller:
                         new_file = copy.copy(file)
                         new_file._ModelFile__frozen = False
                         new_file.import_status = ModelFile.ImportStatus.IMPORTED
-                        new_model.update_file(new_file)
+                        imported_changes.append((file, new_file))
                 except ModelError:
                     pass
+        if imported_changes:
+            new_model.apply_batch(imported_changes)
 
         # Lock the model for all modifications
         with self.__model_lock:
@@ -683,12 +792,9 @@ class Controller:
             try:
                 root_file = self.__model.get_file(root_name)
                 if root_file.is_dir:
-                    # BFS over children to collect all child names
-                    frontier = list(root_file.get_children())
-                    while frontier:
-                        child = frontier.pop(0)
+                    # Collect all child names
+                    for child in TreeTraversal.pre_order(root_file.get_children(), ModelFile.get_children):
                         name_to_root[child.name.lower()] = root_name
-                        frontier.extend(child.get_children())
             except ModelError:
                 pass
 
@@ -697,21 +803,34 @@ class Controller:
         for file_name in newly_imported:
             self.__persist.imported_file_names.add(file_name)
             self.logger.info("Recorded webhook import: '{}'".format(file_name))
-            # Update model file import status for UI badge
-            try:
-                old_file = self.__model.get_file(file_name)
-                if old_file.import_status != ModelFile.ImportStatus.IMPORTED:
-                    new_file = copy.copy(old_file)
-                    new_file._ModelFile__frozen = False
-                    new_file.import_status = ModelFile.ImportStatus.IMPORTED
-                    self.__model.update_file(new_file)
-            except ModelError:
-                pass  # File no longer in model
 
             # Schedule auto-delete if enabled
             if self.__context.config.autodelete.enabled:
                 self.__schedule_auto_delete(file_name)
 
+        if newly_imported:
+            self.__set_imported_status(newly_imported)
+
+    def __set_imported_status(self, file_names: List[str]):
+        """
+        Set the import status of the model files for the UI badge
+        The files are updated as one batch, so the model's files are copied once
+        """
+        with self.__model_lock:
+            imported_changes = {}
+            for file_name in file_names:
+                try:
+                    old_file = self.__model.get_file(file_name)
+                except ModelError:
+                    continue  # File no longer in model
+                if old_file.import_status != ModelFile.ImportStatus.IMPORTED and file_name not in imported_changes:
+                    new_file = copy.copy(old_file)
+                    new_file._ModelFile__frozen = False
+                    new_file.import_status = ModelFile.ImportStatus.IMPORTED
+                    imported_changes[file_name] = (old_file, new_file)
+            if imported_changes:
+                self.__model.apply_batch(list(imported_changes.values()))
+
     def __schedule_auto_delete(self, file_name: str):
         """Schedule auto-delete of local file after safety delay."""
         # Cancel existing timer if file was re-detected
@@ -758,135 +877,216 @@ class Controller:
                 "File '{}' no longer in model, skipping auto-delete".format(file_name)
             )
 
-    def __handle_queue_command(self, file: ModelFile, command: Command) -> (bool, str, int):
+    def __check_command_file(self, action: Command.Action, file: ModelFile) -> Optional[Tuple[str, int]]:
         """
-        Handle QUEUE command action.
-        Returns (success, error_message, error_code) tuple.
+        Check whether the action can be executed on the file in its current state.
+        Returns the (error_message, error_code) if it can't, None if it can.
         """
-        if file.remote_size is None:
-            return False, "File '{}' does not exist remotely".format(command.filename), 404
-        try:
-            self.__lftp_manager.queue(file.name, file.is_dir)
-            # Remove from stopped files - user explicitly wants to download this
-            self.__persist.stopped_file_names.discard(file.name)
-            return True, None, None
-        except LftpError as e:
-            return False, "Lftp error: {}".format(str(e)), 500
+        if action == Controller.Command.Action.QUEUE:
+            if file.remote_size is None:
+                return "File '{}' does not exist remotely".format(file.name), 404
 
-    def __handle_stop_command(self, file: ModelFile, command: Command) -> (bool, str, int):
-        """
-        Handle STOP command action.
-        Returns (success, error_message, error_code) tuple.
-        """
-        if file.state not in (ModelFile.State.DOWNLOADING, ModelFile.State.QUEUED):
-            return False, "File '{}' is not Queued or Downloading".format(command.filename), 409
-        try:
-            self.__lftp_manager.kill(file.name)
-            # Track this file as stopped so it won't be auto-queued on restart
-            self.__persist.stopped_file_names.add(file.name)
-            return True, None, None
-        except (LftpError, LftpJobStatusParserError) as e:
-            return False, "Lftp error: {}".format(str(e)), 500
+        elif action == Controller.Command.Action.STOP:
+            if file.state not in (ModelFile.State.DOWNLOADING, ModelFile.State.QUEUED):
+                return "File '{}' is not Queued or Downloading".format(file.name), 409
 
-    def __handle_extract_command(self, file: ModelFile, command: Command) -> (bool, str, int):
-        """
-        Handle EXTRACT command action.
-        Returns (success, error_message, error_code) tuple.
-        """
-        # Note: We don't check the is_extractable flag because it's just a guess
-        if file.state not in (
-                ModelFile.State.DEFAULT,
-                ModelFile.State.DOWNLOADED,
-                ModelFile.State.EXTRACTED
-        ):
-            return False, "File '{}' in state {} cannot be extracted".format(
-                command.filename, str(file.state)
-            ), 409
-        elif file.local_size is None:
-            return False, "File '{}' does not exist locally".format(command.filename), 404
-        else:
-            self.__file_op_manager.extract(file)
-            return True, None, None
+        elif action == Controller.Command.Action.EXTRACT:
+            # Note: We don't check the is_extractable flag because it's just a guess
+            if file.state not in (
+                    ModelFile.State.DEFAULT,
+                    ModelFile.State.DOWNLOADED,
+                    ModelFile.State.EXTRACTED
+            ):
+                return "File '{}' in state {} cannot be extracted".format(file.name, str(file.state)), 409
+            elif file.local_size is None:
+                return "File '{}' does not exist locally".format(file.name), 404
 
-    def __handle_delete_command(self, file: ModelFile, command: Command) -> (bool, str, int):
-        """
-        Handle DELETE_LOCAL and DELETE_REMOTE command actions.
-        Returns (success, error_message, error_code) tuple.
-        """
-        if command.action == Controller.Command.Action.DELETE_LOCAL:
+        elif action == Controller.Command.Action.DELETE_LOCAL:
             if file.state not in (
                 ModelFile.State.DEFAULT,
                 ModelFile.State.DOWNLOADED,
                 ModelFile.State.EXTRACTED
             ):
-                return False, "Local file '{}' cannot be deleted in state {}".format(
-                    command.filename, str(file.state)
-                ), 409
+                return "Local file '{}' cannot be deleted in state {}".format(file.name, str(file.state)), 409
             elif file.local_size is None:
-                return False, "File '{}' does not exist locally".format(command.filename), 404
-            else:
-                self.__file_op_manager.delete_local(file)
-                # Track as stopped to prevent auto-queuing on restart
-                self.__persist.stopped_file_names.add(command.filename)
-                return True, None, None
+                return "File '{}' does not exist locally".format(file.name), 404
 
-        elif command.action == Controller.Command.Action.DELETE_REMOTE:
+        elif action == Controller.Command.Action.DELETE_REMOTE:
             if file.state not in (
                 ModelFile.State.DEFAULT,
                 ModelFile.State.DOWNLOADED,
                 ModelFile.State.EXTRACTED,
                 ModelFile.State.DELETED
             ):
-                return False, "Remote file '{}' cannot be deleted in state {}".format(
-                    command.filename, str(file.state)
-                ), 409
+                return "Remote file '{}' cannot be deleted in state {}".format(file.name, str(file.state)), 409
             elif file.remote_size is None:
-                return False, "File '{}' does not exist remotely".format(command.filename), 404
-            else:
-                self.__file_op_manager.delete_remote(file)
-                return True, None, None
+                return "File '{}' does not exist remotely".format(file.name), 404
 
-        return False, "Unknown delete action", 500
+        else:
+            return "Unknown action", 500
 
-    def __process_commands(self):
-        def _notify_failure(_command: Controller.Command, _msg: str, _code: int = 400):
-            self.logger.warning("Command failed. {}".format(_msg))
-            for _callback in _command.callbacks:
-                _callback.on_failure(_msg, _code)
+        return None
 
-        while not self.__command_queue.empty():
-            command = self.__command_queue.get()
-            self.logger.info("Received command {} for file {}".format(str(command.action), command.filename))
+    def __execute_action(self, action: Command.Action, files: List[ModelFile]) -> Dict[str, Tuple[str, int]]:
+        """
+        Execute the action on the files, which were already checked with __check_command_file().
+        Several files are handed to lftp or the file operation manager as one batch. If the
+        batch fails, the files are retried one at a time, so that each gets its own result.
+        Returns the (error_message, error_code) of each file the action failed for.
+        """
+        if len(files) > 1:
             try:
-                file = self.__model.get_file(command.filename)
-            except ModelError:
-                _notify_failure(command, "File '{}' not found".format(command.filename), 404)
-                continue
+                return self.__execute_action_call(action, files)
+            except (LftpError, LftpJobStatusParserError) as e:
+                # The batch calls fail before executing the action on any file
+                self.logger.warning("Batch {} of {} files failed, retrying them one at a time: {}".format(
+                    str(action), len(files), str(e)
+                ))
+        errors = {}
+        for file in files:
+            try:
+                errors.update(self.__execute_action_call(action, [file]))
+            except (LftpError, LftpJobStatusParserError) as e:
+                errors[file.name] = ("Lftp error: {}".format(str(e)), 500)
+        return errors
+
+    def __execute_action_call(self, action: Command.Action, files: List[ModelFile]) -> Dict[str, Tuple[str, int]]:
+        """
+        Execute the action on the files in one call, a batch call if there are several
+        Returns the (error_message, error_code) of each file the action failed for.
+        Raises LftpError or LftpJobStatusParserError if the call failed.
+        """
+        errors = {}
+        if action == Controller.Command.Action.QUEUE:
+            if len(files) == 1:
+                self.__lftp_manager.queue(files[0].name, files[0].is_dir)
+            else:
+                self.__lftp_manager.queue_many([(file.name, file.is_dir) for file in files])
+            # Remove from stopped files - user explicitly wants to download these
+            for file in files:
+                self.__persist.stopped_file_names.discard(file.name)
+
+        elif action == Controller.Command.Action.STOP:
+            if len(files) == 1:
+                found = {files[0].name: self.__lftp_manager.kill(files[0].name)}
+            else:
+                found = self.__lftp_manager.kill_many([file.name for file in files])
+            for file in files:
+                if found.get(file.name):
+                    # Track as stopped so it won't be auto-queued on restart
+                    self.__persist.stopped_file_names.add(file.name)
+                else:
+                    errors[file.name] = ("File '{}' is not Queued or Downloading".format(file.name), 409)
+
+        elif action == Controller.Command.Action.EXTRACT:
+            if len(files) == 1:
+                self.__file_op_manager.extract(files[0])
+            else:
+                self.__file_op_manager.extract_many(files)
 
-            success = False
-            error_msg = None
-            error_code = 400
+        elif action == Controller.Command.Action.DELETE_LOCAL:
+            if len(files) == 1:
+                self.__file_op_manager.delete_local(files[0])
+            else:
+                self.__file_op_manager.delete_local_many(files)
+            # Track as stopped to prevent auto-queuing on restart
+            for file in files:
+                self.__persist.stopped_file_names.add(file.name)
+
+        elif action == Controller.Command.Action.DELETE_REMOTE:
+            if len(files) == 1:
+                self.__file_op_manager.delete_remote(files[0])
+            else:
+                self.__file_op_manager.delete_remote_many(files)
 
-            if command.action == Controller.Command.Action.QUEUE:
-                success, error_msg, error_code = self.__handle_queue_command(file, command)
+        return errors
 
-            elif command.action == Controller.Command.Action.STOP:
-                success, error_msg, error_code = self.__handle_stop_command(file, command)
+    def __process_commands(self):
+        commands = []
+        while not self.__command_queue.empty():
+            commands.append(self.__command_queue.get())
 
-            elif command.action == Controller.Command.Action.EXTRACT:
-                success, error_msg, error_code = self.__handle_extract_command(file, command)
+        # Only batch commands are executed as one batch, each command is
+        # handled on its own so that its result is its own
+        for command in commands:
+            if isinstance(command, Controller.BatchCommand):
+                self.__process_batch_command(command)
+            else:
+                self.__process_command(command)
 
-            elif command.action in (Controller.Command.Action.DELETE_LOCAL,
-                                    Controller.Command.Action.DELETE_REMOTE):
-                success, error_msg, error_code = self.__handle_delete_command(file, command)
+    def __process_command(self, command: Command):
+        file = self.__get_command_file(command)
+        if file is None:
+            return
+        error = self.__check_command_file(command.action, file)
+        if error is None:
+            error = self.__execute_action(command.action, [file]).get(file.name)
+        if error is not None:
+            self.__notify_command_failure(command, *error)
+            return
+        for callback in command.callbacks:
+            callback.on_success()
 
-            if not success:
-                _notify_failure(command, error_msg, error_code)
+    def __process_batch_command(self, batch_command: BatchCommand):
+        """
+        Check all files of the batch command against one model snapshot, execute
+        the action on the valid ones as a single batch and notify one result map
+        """
+        self.logger.info("Received batch command {} for {} files".format(
+            str(batch_command.action), len(batch_command.filenames)
+        ))
+        snapshot = self.__model.snapshot
+        results = {}
+        files = []
+        for filename in batch_command.filenames:
+            if filename in results:
+                continue
+            try:
+                file = snapshot.get_file(filename)
+            except ModelError:
+                results[filename] = Controller.BatchCommand.Result(
+                    False, "File '{}' not found".format(filename), 404
+                )
                 continue
+            error = self.__check_command_file(batch_command.action, file)
+            if error is not None:
+                results[filename] = Controller.BatchCommand.Result(False, *error)
+            else:
+                # Placeholder to keep the order of results
+                results[filename] = None
+                files.append(file)
+
+        if files:
+            errors = self.__execute_action(batch_command.action, files)
+            for file in files:
+                error = errors.get(file.name)
+                results[file.name] = Controller.BatchCommand.Result(True) if error is None \
+                    else Controller.BatchCommand.Result(False, *error)
+
+        num_failed = sum(1 for result in results.values() if not result.success)
+        if num_failed:
+            self.logger.warning("Batch command {} failed for {} of {} files".format(
+                str(batch_command.action), num_failed, len(results)
+            ))
+        for callback in batch_command.callbacks:
+            callback.on_complete(results)
+
+    def __get_command_file(self, command: Command) -> Optional[ModelFile]:
+        """
+        Returns the model file of the command, or None after notifying the
+        command's failure if there is no such file
+        """
+        self.logger.info("Received command {} for file {}".format(str(command.action), command.filename))
+        try:
+            return self.__model.get_file(command.filename)
+        except ModelError:
+            self.__notify_command_failure(command, "File '{}' not found".format(command.filename), 404)
+            return None
 
-            # If we get here, it was a success
-            for callback in command.callbacks:
-                callback.on_success()
+    def __notify_command_failure(self, command: Command, msg: str, code: int = 400):
+        self.logger.warning("Command failed. {}".format(msg))
+        for callback in command.callbacks:
+            callback.on_failure(msg, code)
 
     def __propagate_exceptions(self):
         """
@@ -29,6 +29,15 @@ class ControllerJob(Job):
         self.__controller.process()
         self.__auto_queue.process()
 
+    @overrides(Job)
+    def wait(self):
+        self.__controller.wait_for_work()
+
+    @overrides(Job)
+    def terminate(self):
+        super().terminate()
+        self.__controller.wake()
+
     @overrides(Job)
     def cleanup(self):
         self.__controller.exit()
@@ -2,28 +2,29 @@
 
 import os
 import shutil
-from typing import Optional
+from typing import List, Optional
 
 from common import AppOneShotProcess
 from ssh import Sshcp, SshcpError
 
 
 class DeleteLocalProcess(AppOneShotProcess):
-    def __init__(self, local_path: str, file_name: str):
+    def __init__(self, local_path: str, file_names: List[str]):
         super().__init__(name=self.__class__.__name__)
         self.__local_path = local_path
-        self.__file_name = file_name
+        self.__file_names = file_names
 
     def run_once(self):
-        file_path = os.path.join(self.__local_path, self.__file_name)
-        self.logger.debug("Deleting local file {}".format(self.__file_name))
-        if not os.path.exists(file_path):
-            self.logger.error("Failed to delete non-existing file: {}".format(file_path))
-        else:
-            if os.path.isfile(file_path):
-                os.remove(file_path)
+        for file_name in self.__file_names:
+            file_path = os.path.join(self.__local_path, file_name)
+            self.logger.debug("Deleting local file {}".format(file_name))
+            if not os.path.exists(file_path):
+                self.logger.error("Failed to delete non-existing file: {}".format(file_path))
             else:
-                shutil.rmtree(file_path, ignore_errors=True)
+                if os.path.isfile(file_path):
+                    os.remove(file_path)
+                else:
+                    shutil.rmtree(file_path, ignore_errors=True)
 
 
 class DeleteRemoteProcess(AppOneShotProcess):
@@ -33,10 +34,10 @@ class DeleteRemoteProcess(AppOneShotProcess):
                  remote_password: Optional[str],
                  remote_port: int,
                  remote_path: str,
-                 file_name: str):
+                 file_names: List[str]):
         super().__init__(name=self.__class__.__name__)
         self.__remote_path = remote_path
-        self.__file_name = file_name
+        self.__file_names = file_names
         self.__ssh = Sshcp(host=remote_address,
                            port=remote_port,
                            user=remote_username,
@@ -44,10 +45,11 @@ class DeleteRemoteProcess(AppOneShotProcess):
 
     def run_once(self):
         self.__ssh.set_base_logger(self.logger)
-        file_path = os.path.join(self.__remote_path, self.__file_name)
-        self.logger.debug("Deleting remote file {}".format(self.__file_name))
+        # Delete all the files with a single ssh command
+        file_paths = [os.path.join(self.__remote_path, file_name) for file_name in self.__file_names]
+        self.logger.debug("Deleting remote files {}".format(", ".join(self.__file_names)))
         try:
-            out = self.__ssh.shell("rm -rf '{}'".format(file_path))
+            out = self.__ssh.shell("rm -rf {}".format(" ".join("'{}'".format(p) for p in file_paths)))
             self.logger.debug("Remote delete output: {}".format(out.decode()))
         except SshcpError:
             self.logger.exception("Exception while deleting remote file")
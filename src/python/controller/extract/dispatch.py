@@ -12,7 +12,7 @@ import re
 
 from .extract import Extract, ExtractError
 from model import ModelFile
-from common import AppError
+from common import AppError, TreeTraversal
 
 
 class ExtractDispatchError(AppError):
@@ -120,13 +120,8 @@ class ExtractDispatch:
 
         if model_file.is_dir:
             # For a directory, try and find all archives
-            # Loop through all directories using BFS
-            frontier = [model_file]
-            while frontier:
-                curr_file = frontier.pop(0)
-                if curr_file.is_dir:
-                    frontier += curr_file.get_children()
-                else:
+            for curr_file in TreeTraversal.pre_order([model_file], ModelFile.get_children):
+                if not curr_file.is_dir:
                     archive_full_path = os.path.join(self.__local_path, curr_file.full_path)
                     out_dir_path = os.path.join(self.__out_dir_path, os.path.dirname(curr_file.full_path))
                     if curr_file.local_size is not None \
@@ -1,6 +1,7 @@
 # Copyright 2017, Inderpreet Singh, All rights reserved.
 
 import multiprocessing
+import multiprocessing.synchronize
 import datetime
 import time
 import queue
@@ -29,9 +30,13 @@ class ExtractProcess(AppProcess):
     __DEFAULT_SLEEP_INTERVAL_IN_SECS = 0.5
 
     class __ExtractListener(ExtractListener):
-        def __init__(self, logger: logging.Logger, completed_queue: multiprocessing.Queue):
+        def __init__(self,
+                     logger: logging.Logger,
+                     completed_queue: multiprocessing.Queue,
+                     completed_event: Optional[multiprocessing.synchronize.Event]):
             self.logger = logger
             self.completed_queue = completed_queue
+            self.completed_event = completed_event
 
         def extract_completed(self, name: str, is_dir: bool):
             self.logger.info("Extraction completed for {}".format(name))
@@ -39,6 +44,8 @@ class ExtractProcess(AppProcess):
                                                       name=name,
                                                       is_dir=is_dir)
             self.completed_queue.put(completed_result)
+            if self.completed_event is not None:
+                self.completed_event.set()
 
         def extract_failed(self, name: str, is_dir: bool):
             self.logger.error("Extraction failed for {}".format(name))
@@ -50,8 +57,18 @@ class ExtractProcess(AppProcess):
         self.__command_queue = multiprocessing.Queue()
         self.__status_result_queue = multiprocessing.Queue()
         self.__completed_result_queue = multiprocessing.Queue()
+        self.__completed_event = None
         self.__dispatch = None
 
+    def set_completed_event(self, completed_event: multiprocessing.synchronize.Event):
+        """
+        Set an event for the process to set whenever an extraction completes
+        Must be called before the process is started
+        :param completed_event:
+        :return:
+        """
+        self.__completed_event = completed_event
+
     @overrides(AppProcess)
     def run_init(self):
         # Create dispatch inside the process
@@ -61,7 +78,8 @@ class ExtractProcess(AppProcess):
         # Add extract listener
         listener = ExtractProcess.__ExtractListener(
             logger=self.logger,
-            completed_queue=self.__completed_result_queue
+            completed_queue=self.__completed_result_queue,
+            completed_event=self.__completed_event
         )
         self.__dispatch.add_listener(listener)
 
@@ -77,11 +95,12 @@ class ExtractProcess(AppProcess):
         # Forward all the extract commands
         try:
             while True:
-                file = self.__command_queue.get(block=False)
-                try:
-                    self.__dispatch.extract(file)
-                except ExtractDispatchError as e:
-                    self.logger.warning(str(e))
+                files = self.__command_queue.get(block=False)
+                for file in files:
+                    try:
+                        self.__dispatch.extract(file)
+                    except ExtractDispatchError as e:
+                        self.logger.warning(str(e))
         except queue.Empty:
             pass
 
@@ -99,7 +118,15 @@ class ExtractProcess(AppProcess):
         :param file:
         :return:
         """
-        self.__command_queue.put(file)
+        self.extract_many([file])
+
+    def extract_many(self, files: List[ModelFile]):
+        """
+        Process-safe method to queue several extractions at once
+        :param files:
+        :return:
+        """
+        self.__command_queue.put(list(files))
 
     def pop_latest_statuses(self) -> Optional[ExtractStatusResult]:
         """
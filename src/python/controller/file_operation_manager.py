@@ -1,6 +1,7 @@
 # Copyright 2017, Inderpreet Singh, All rights reserved.
 
 import logging
+import multiprocessing.synchronize
 from typing import List, Optional, Tuple, Callable
 
 from common import Context, MultiprocessingLogger, AppOneShotProcess
@@ -37,15 +38,19 @@ class FileOperationManager:
                  context: Context,
                  mp_logger: MultiprocessingLogger,
                  force_local_scan_callback: Callable,
-                 force_remote_scan_callback: Callable):
+                 force_remote_scan_callback: Callable,
+                 completed_event: Optional[multiprocessing.synchronize.Event] = None):
         """
         Create the file operation manager.
 
         Args:
             context: Application context with config and logger
             mp_logger: Multiprocessing logger for child processes
-            force_local_scan_callback: Callback to trigger a local scan after delete
-            force_remote_scan_callback: Callback to trigger a remote scan after delete
+            force_local_scan_callback: Callback to trigger a local scan after delete,
+                called with the names of the root files to rescan
+            force_remote_scan_callback: Callback to trigger a remote scan after delete,
+                called with the names of the root files to rescan
+            completed_event: Event set by the extract process whenever an extraction completes
         """
         self.__context = context
         self.__mp_logger = mp_logger
@@ -70,6 +75,8 @@ class FileOperationManager:
             local_path=context.config.lftp.local_path
         )
         self.__extract_process.set_multiprocessing_logger(mp_logger)
+        if completed_event is not None:
+            self.__extract_process.set_completed_event(completed_event)
 
         # Track active extracting files
         self.__active_extracting_file_names: List[str] = []
@@ -113,6 +120,15 @@ class FileOperationManager:
         """
         self.__extract_process.extract(file)
 
+    def extract_many(self, files: List[ModelFile]) -> None:
+        """
+        Queue several files for extraction in one batch.
+
+        Args:
+            files: The model files to extract
+        """
+        self.__extract_process.extract_many(files)
+
     def pop_extract_statuses(self) -> Optional[object]:
         """
         Get the latest extract statuses.
@@ -163,14 +179,27 @@ class FileOperationManager:
         Returns:
             True if delete process was started successfully
         """
+        return self.delete_local_many([file])
+
+    def delete_local_many(self, files: List[ModelFile]) -> bool:
+        """
+        Start one local deletion process for several files.
+
+        Args:
+            files: The model files to delete locally
+
+        Returns:
+            True if delete process was started successfully
+        """
+        file_names = [file.name for file in files]
         process = DeleteLocalProcess(
             local_path=self.__context.config.lftp.local_path,
-            file_name=file.name
+            file_names=file_names
         )
         process.set_multiprocessing_logger(self.__mp_logger)
         wrapper = CommandProcessWrapper(
             process=process,
-            post_callback=self.__force_local_scan
+            post_callback=lambda: self.__force_local_scan(file_names)
         )
         self.__active_command_processes.append(wrapper)
         wrapper.process.start()
@@ -186,18 +215,33 @@ class FileOperationManager:
         Returns:
             True if delete process was started successfully
         """
+        return self.delete_remote_many([file])
+
+    def delete_remote_many(self, files: List[ModelFile]) -> bool:
+        """
+        Start one remote deletion process for several files.
+
+        All the files are deleted over a single ssh connection.
+
+        Args:
+            files: The model files to delete remotely
+
+        Returns:
+            True if delete process was started successfully
+        """
+        file_names = [file.name for file in files]
         process = DeleteRemoteProcess(
             remote_address=self.__context.config.lftp.remote_address,
             remote_username=self.__context.config.lftp.remote_username,
             remote_password=self.__password,
             remote_port=self.__context.config.lftp.remote_port,
             remote_path=self.__context.config.lftp.remote_path,
-            file_name=file.name
+            file_names=file_names
         )
         process.set_multiprocessing_logger(self.__mp_logger)
         wrapper = CommandProcessWrapper(
             process=process,
-            post_callback=self.__force_remote_scan
+            post_callback=lambda: self.__force_remote_scan(file_names)
         )
         self.__active_command_processes.append(wrapper)
         wrapper.process.start()
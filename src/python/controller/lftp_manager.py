@@ -1,10 +1,11 @@
 # Copyright 2017, Inderpreet Singh, All rights reserved.
 
 import logging
-from typing import List, Optional
+import time
+from typing import Dict, List, Optional, Tuple
 
 from common import Context, Constants
-from lftp import Lftp, LftpError, LftpJobStatus, LftpJobStatusParserError
+from lftp import Lftp, LftpError, LftpJobStatus, LftpJobStatusParserError, LftpStatusMetrics
 
 
 class LftpManager:
@@ -14,14 +15,23 @@ class LftpManager:
     Responsible for:
     - LFTP initialization and configuration
     - Queue/stop command execution
-    - Status collection
+    - Status collection, polled adaptively
     - Lifecycle management (exit)
     - Exception propagation
 
     Thread-safety: The Lftp class handles its own thread safety for the
     underlying LFTP process communication. LftpManager methods can be
     called from any thread.
+
+    Status polling: lftp is polled on every status() call while it has jobs.
+    Once it has none, polls back off from __MIN_IDLE_STATUS_INTERVAL_IN_SECS,
+    doubling up to __MAX_IDLE_STATUS_INTERVAL_IN_SECS. New jobs only come from
+    this manager, so queueing or killing resets polling to every call.
     """
+    __MIN_IDLE_STATUS_INTERVAL_IN_SECS = 1.0
+    __MAX_IDLE_STATUS_INTERVAL_IN_SECS = 8.0
+    # Interval between debug logs of the status metrics
+    __STATUS_METRICS_LOG_INTERVAL_IN_SECS = 300.0
 
     def __init__(self, context: Context):
         """
@@ -57,6 +67,12 @@ class LftpManager:
         self.__lftp.temp_file_name = "*" + Constants.LFTP_TEMP_FILE_SUFFIX
         self.__lftp.set_verbose_logging(context.config.general.verbose)
 
+        # Adaptive status polling state
+        self.__idle_status_interval_in_secs = 0.0
+        self.__next_status_time = 0.0
+        self.__num_skipped_status_polls = 0
+        self.__next_status_metrics_log_time = time.monotonic() + LftpManager.__STATUS_METRICS_LOG_INTERVAL_IN_SECS
+
     @property
     def lftp(self) -> Lftp:
         """
@@ -81,34 +97,128 @@ class LftpManager:
         Raises:
             LftpError: If LFTP fails to queue the file
         """
+        self.__poll_status_now()
         self.__lftp.queue(file_name, is_dir)
 
-    def kill(self, file_name: str) -> None:
+    def queue_many(self, files: List[Tuple[str, bool]]) -> None:
+        """
+        Queue several files or directories for download in one batch.
+
+        Args:
+            files: (name, is_dir) of each file/directory to queue
+
+        Raises:
+            LftpError: If LFTP fails to queue the files
+        """
+        self.__poll_status_now()
+        self.__lftp.queue_many(files)
+
+    def kill(self, file_name: str) -> bool:
         """
         Stop/kill a queued or downloading transfer.
 
         Args:
             file_name: Name of the file to stop
 
+        Returns:
+            True if the transfer was found
+
         Raises:
             LftpError: If LFTP fails to kill the transfer
             LftpJobStatusParserError: If status parsing fails
         """
-        self.__lftp.kill(file_name)
+        self.__poll_status_now()
+        return self.__lftp.kill(file_name)
+
+    def kill_many(self, file_names: List[str]) -> Dict[str, bool]:
+        """
+        Stop/kill several queued or downloading transfers in one batch.
+
+        Args:
+            file_names: Names of the files to stop
+
+        Returns:
+            For each name, True if its transfer was found
+
+        Raises:
+            LftpError: If LFTP fails to kill the transfers
+            LftpJobStatusParserError: If status parsing fails
+        """
+        self.__poll_status_now()
+        return self.__lftp.kill_many(file_names)
+
+    @property
+    def status_version(self) -> int:
+        """
+        Version of the statuses last returned by status().
+
+        Statuses with the same version are identical, so consumers can skip
+        comparing them.
+        """
+        return self.__lftp.status_version
+
+    @property
+    def status_metrics(self) -> LftpStatusMetrics:
+        """Poll latency and parse time metrics of the status polls."""
+        return self.__lftp.status_metrics
+
+    @property
+    def num_skipped_status_polls(self) -> int:
+        """Number of status() calls that didn't poll lftp because it was idle."""
+        return self.__num_skipped_status_polls
 
     def status(self) -> Optional[List[LftpJobStatus]]:
         """
         Get the current status of all LFTP jobs.
 
+        While LFTP has no jobs, it isn't polled on every call, see the class
+        description.
+
         Returns:
-            List of LftpJobStatus objects, or None if an error occurred.
+            List of LftpJobStatus objects, or None if an error occurred or
+            LFTP wasn't polled.
         """
+        now = time.monotonic()
+        if now < self.__next_status_time:
+            self.__num_skipped_status_polls += 1
+            return None
         try:
-            return self.__lftp.status()
+            statuses = self.__lftp.status()
         except (LftpError, LftpJobStatusParserError) as e:
             self.logger.warning("Caught lftp error: {}".format(str(e)))
             return None
 
+        if statuses:
+            self.__idle_status_interval_in_secs = 0.0
+        else:
+            self.__idle_status_interval_in_secs = min(
+                max(2 * self.__idle_status_interval_in_secs, LftpManager.__MIN_IDLE_STATUS_INTERVAL_IN_SECS),
+                LftpManager.__MAX_IDLE_STATUS_INTERVAL_IN_SECS
+            )
+        self.__next_status_time = now + self.__idle_status_interval_in_secs
+
+        if now >= self.__next_status_metrics_log_time:
+            self.__next_status_metrics_log_time = now + LftpManager.__STATUS_METRICS_LOG_INTERVAL_IN_SECS
+            self.__log_status_metrics()
+        return statuses
+
+    def __log_status_metrics(self):
+        metrics = self.__lftp.status_metrics
+        num_parsed = metrics.num_polls - metrics.num_unchanged
+        self.logger.debug(
+            "Status polls: {} polled, {} unchanged, {} skipped while idle, "
+            "avg poll latency {:.1f}ms, avg parse time {:.1f}ms".format(
+                metrics.num_polls, metrics.num_unchanged, self.__num_skipped_status_polls,
+                1000 * metrics.total_poll_latency_in_secs / max(metrics.num_polls, 1),
+                1000 * metrics.total_parse_time_in_secs / max(num_parsed, 1)
+            )
+        )
+
+    def __poll_status_now(self):
+        # Jobs are about to change, so stop backing off
+        self.__idle_status_interval_in_secs = 0.0
+        self.__next_status_time = 0.0
+
     def exit(self) -> None:
         """
         Exit the LFTP process.
@@ -2,11 +2,15 @@
 
 import os
 import logging
+import multiprocessing
 import time
-from typing import List, Optional, Set
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, List, Optional, Set, Tuple
 import math
 
 # my libs
+from common import TreeTraversal, BoundedOrderedSet
 from system import SystemFile
 from lftp import LftpJobStatus
 from model import ModelFile, Model, ModelError
@@ -21,20 +25,59 @@ class ModelBuilder:
       * local file system as a Dict[name, SystemFile]
       * remote file system as a Dict[name, SystemFile]
       * lftp status as Dict[name, LftpJobStatus]
+
+    The model is rebuilt incrementally. Each source marks the names of the
+    root files that it changed as dirty, and only those roots are rebuilt.
+    The frozen ModelFiles of all the other roots are reused from the
+    previous build. Within a rebuilt root, child subtrees whose sources are
+    unchanged and that have no active transfers are also reused.
+
+    When a lot of roots need to be built (e.g. the first build of a large
+    library), they can be split into shards that are built by worker
+    processes. The workers come from a forkserver (or are spawned), never
+    forked from this multithreaded process, and are kept for later builds.
+    Each shard is sent the sources of its roots, and sends back the frozen
+    root files along with their reusable child subtrees.
+    Call close() to stop the workers.
     """
     # TTL for cached model in seconds (30 minutes)
     CACHE_TTL_SECONDS = 30 * 60
 
-    def __init__(self):
+    # Max number of worker processes for a sharded build
+    __MAX_SHARD_WORKERS = 8
+    # Number of shards per worker, so that the workers finish around the same time
+    __SHARDS_PER_WORKER = 4
+
+    def __init__(self, shard_min_roots: int = 0):
+        """
+        :param shard_min_roots: min number of roots to build before they are built
+                                by worker processes, 0 to always build them in-process
+        """
         self.logger = logging.getLogger("ModelBuilder")
         self.__local_files = dict()
         self.__remote_files = dict()
         self.__lftp_statuses = dict()
+        # Version of the current lftp statuses, see set_lftp_statuses()
+        self.__lftp_status_version = None  # type: Optional[int]
         self.__downloaded_files = set()
         self.__extract_statuses = dict()
         self.__extracted_files = set()
+        # Contents of the downloaded and extracted sets when they were last
+        # set, since the same (mutated) sets are passed in again
+        self.__prev_downloaded_files = set()
+        self.__prev_extracted_files = set()
         self.__cached_model = None
         self.__cache_timestamp = None
+        # Root files of the previous build
+        self.__built_files = dict()  # type: Dict[str, ModelFile]
+        # Names of the root files to rebuild, None to rebuild all of them
+        self.__dirty_names = None  # type: Optional[Set[str]]
+        # Child subtrees of the previous build, by root name and path below the root
+        self.__built_subtrees = dict()  # type: Dict[str, Dict[str, ModelBuilder._Subtree]]
+        self.__shard_min_roots = shard_min_roots
+        # Worker processes of sharded builds, started by the first one
+        self.__shard_executor = None  # type: Optional[ProcessPoolExecutor]
+        self.__num_shard_workers = min(os.cpu_count() or 1, ModelBuilder.__MAX_SHARD_WORKERS)
 
     def set_base_logger(self, base_logger: logging.Logger):
         self.logger = base_logger.getChild("ModelBuilder")
@@ -43,60 +86,126 @@ class ModelBuilder:
         # Update the local file state with this latest information
         for file in active_files:
             self.__local_files[file.name] = file
-        # Invalidate the cache
-        if len(active_files) > 0:
-            self.__cached_model = None
+        self.__mark_dirty({file.name for file in active_files})
 
     def set_local_files(self, local_files: List[SystemFile]):
         prev_local_files = self.__local_files
         self.__local_files = {file.name: file for file in local_files}
-        # Invalidate the cache
-        if self.__local_files != prev_local_files:
-            self.__cached_model = None
+        self.__mark_dirty(ModelBuilder.__changed_names(prev_local_files, self.__local_files))
 
     def set_remote_files(self, remote_files: List[SystemFile]):
         prev_remote_files = self.__remote_files
         self.__remote_files = {file.name: file for file in remote_files}
+        self.__mark_dirty(ModelBuilder.__changed_names(prev_remote_files, self.__remote_files))
+
+    def update_local_files(self, local_files: List[SystemFile], scanned_names: Set[str]):
+        """
+        Merge the result of a targeted local scan
+        :param local_files: the scanned root files that exist
+        :param scanned_names: names of all the scanned root files
+        :return:
+        """
+        self.__mark_dirty(ModelBuilder.__merge_files(self.__local_files, local_files, scanned_names))
+
+    def update_remote_files(self, remote_files: List[SystemFile], scanned_names: Set[str]):
+        """
+        Merge the result of a targeted remote scan
+        :param remote_files: the scanned root files that exist
+        :param scanned_names: names of all the scanned root files
+        :return:
+        """
+        self.__mark_dirty(ModelBuilder.__merge_files(self.__remote_files, remote_files, scanned_names))
+
+    @staticmethod
+    def __merge_files(files: Dict[str, SystemFile],
+                      scanned_files: List[SystemFile],
+                      scanned_names: Set[str]) -> Set[str]:
+        """
+        Replace the scanned entries in files
+        :return: names of the entries that changed
+        """
+        new_files = {file.name: file for file in scanned_files}
+        changed_names = set()
+        for name in scanned_names:
+            if name not in new_files and files.pop(name, None) is not None:
+                changed_names.add(name)
+        for name, file in new_files.items():
+            prev_file = files.get(name)
+            if prev_file is None or prev_file != file:
+                files[name] = file
+                changed_names.add(name)
+        return changed_names
+
+    @staticmethod
+    def __changed_names(prev: Dict, new: Dict) -> Set[str]:
+        """
+        Returns the names whose entries differ between prev and new
+        """
+        changed_names = set(prev.keys()).symmetric_difference(new.keys())
+        for name in prev.keys() & new.keys():
+            prev_value = prev[name]
+            new_value = new[name]
+            if prev_value is not new_value and prev_value != new_value:
+                changed_names.add(name)
+        return changed_names
+
+    def __mark_dirty(self, names: Set[str]):
+        if not names:
+            return
+        if self.__dirty_names is not None:
+            self.__dirty_names.update(names)
         # Invalidate the cache
-        if self.__remote_files != prev_remote_files:
-            self.__cached_model = None
+        self.__cached_model = None
+
+    def __mark_all_dirty(self):
+        self.__dirty_names = None
+        self.__built_files = dict()
+        self.__built_subtrees = dict()
+        # Invalidate the cache
+        self.__cached_model = None
 
-    def set_lftp_statuses(self, lftp_statuses: List[LftpJobStatus]):
+    def set_lftp_statuses(self, lftp_statuses: List[LftpJobStatus], status_version: Optional[int] = None):
+        """
+        :param lftp_statuses:
+        :param status_version: version of the statuses, if given, statuses of the same
+                               version as the current ones are known to be unchanged
+        :return:
+        """
+        if status_version is not None and status_version == self.__lftp_status_version:
+            return
+        self.__lftp_status_version = status_version
         prev_lftp_statuses = self.__lftp_statuses
         self.__lftp_statuses = {file.name: file for file in lftp_statuses}
-        # Invalidate the cache
-        if self.__lftp_statuses != prev_lftp_statuses:
-            self.__cached_model = None
+        self.__mark_dirty(ModelBuilder.__changed_names(prev_lftp_statuses, self.__lftp_statuses))
 
     def set_downloaded_files(self, downloaded_files: Set[str]):
-        prev_downloaded_files = self.__downloaded_files
         self.__downloaded_files = downloaded_files
-        # Invalidate the cache
-        if self.__downloaded_files != prev_downloaded_files:
-            self.__cached_model = None
+        curr_downloaded_files = set(downloaded_files)
+        self.__mark_dirty(self.__prev_downloaded_files.symmetric_difference(curr_downloaded_files))
+        self.__prev_downloaded_files = curr_downloaded_files
 
     def set_extract_statuses(self, extract_statuses: List[ExtractStatus]):
         prev_extract_statuses = self.__extract_statuses
         self.__extract_statuses = {status.name: status for status in extract_statuses}
-        # Invalidate the cache
-        if self.__extract_statuses != prev_extract_statuses:
-            self.__cached_model = None
+        self.__mark_dirty(ModelBuilder.__changed_names(prev_extract_statuses, self.__extract_statuses))
 
     def set_extracted_files(self, extracted_files: Set[str]):
-        prev_extracted_files = self.__extracted_files
         self.__extracted_files = extracted_files
-        # Invalidate the cache
-        if self.__extracted_files != prev_extracted_files:
-            self.__cached_model = None
+        curr_extracted_files = set(extracted_files)
+        self.__mark_dirty(self.__prev_extracted_files.symmetric_difference(curr_extracted_files))
+        self.__prev_extracted_files = curr_extracted_files
 
     def clear(self):
         self.__local_files.clear()
         self.__remote_files.clear()
         self.__lftp_statuses.clear()
+        self.__lftp_status_version = None
         self.__downloaded_files.clear()
         self.__extract_statuses.clear()
         self.__extracted_files.clear()
-        self.__cached_model = None
+        self.__prev_downloaded_files = set()
+        self.__prev_extracted_files = set()
+        self.__mark_all_dirty()
         self.__cache_timestamp = None
 
     def has_changes(self) -> bool:
@@ -111,7 +220,8 @@ class ModelBuilder:
         Build a model from all data sources.
 
         Combines remote files, local files, and LFTP statuses to create
-        a unified model with proper state for each file.
+        a unified model with proper state for each file. Only the dirty
+        root files are rebuilt, the others are reused from the previous build.
         """
         # Check cache validity
         if self._is_cache_valid():
@@ -126,15 +236,157 @@ class ModelBuilder:
             self.__lftp_statuses.keys()
         )
 
+        if self.__dirty_names is None:
+            names_to_build = all_file_names
+        else:
+            names_to_build = {name for name in all_file_names
+                              if name in self.__dirty_names or name not in self.__built_files}
+        sharded_files = dict()
+        if 0 < self.__shard_min_roots <= len(names_to_build):
+            sharded_files = self.__build_root_files_sharded(sorted(names_to_build))
+
+        built_files = dict()
+        # Added as one batch, so the model copies its files only once
+        added_files = []
         for name in all_file_names:
-            model_file = self._build_root_file(name)
-            self._determine_final_state(model_file)
-            model.add_file(model_file)
-
+            if name in names_to_build:
+                model_file = sharded_files.get(name, None)
+            else:
+                model_file = self.__built_files[name]
+            if model_file is None:
+                model_file, all_children_downloaded = self._build_root_file(name)
+                self._determine_final_state(model_file, all_children_downloaded)
+            elif model_file.state == ModelFile.State.DELETED:
+                # Refresh position in LRU tracker, same as an in-process build would
+                self.__downloaded_files.touch(name)
+            added_files.append((None, model_file))
+            built_files[name] = model_file
+        model.apply_batch(added_files)
+
+        self.__built_files = built_files
+        self.__built_subtrees = {name: self.__built_subtrees[name]
+                                 for name in built_files if name in self.__built_subtrees}
+        self.__dirty_names = set()
         self.__cached_model = model
         self.__cache_timestamp = time.time()
         return model
 
+    def close(self):
+        """
+        Stop the worker processes of sharded builds, if any were started
+        """
+        if self.__shard_executor is not None:
+            self.__shard_executor.shutdown(wait=True)
+            self.__shard_executor = None
+
+    def __get_shard_executor(self) -> Optional[ProcessPoolExecutor]:
+        if self.__shard_executor is None:
+            if self.__num_shard_workers < 2:
+                # Nothing to gain from a single worker
+                return None
+            # Forking this multithreaded process could copy locks held by other
+            # threads into the workers, so workers come from a forkserver instead
+            methods = multiprocessing.get_all_start_methods()
+            context = multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+            if context.get_start_method() == "forkserver":
+                context.set_forkserver_preload([__name__])
+            self.__shard_executor = ProcessPoolExecutor(max_workers=self.__num_shard_workers, mp_context=context)
+        return self.__shard_executor
+
+    def __build_root_files_sharded(self, names: List[str]) -> Dict[str, ModelFile]:
+        """
+        Build the given roots in worker processes, and keep their child subtrees
+        Returns an empty dict if the workers could not be used, so the roots are built in-process
+        """
+        executor = self.__get_shard_executor()
+        if executor is None:
+            return dict()
+        num_shards = self.__num_shard_workers * ModelBuilder.__SHARDS_PER_WORKER
+        shards = [names[i::num_shards] for i in range(num_shards) if names[i::num_shards]]
+        self.logger.debug("Building {} roots in {} shards".format(len(names), len(shards)))
+        try:
+            futures = [executor.submit(ModelBuilder._build_shard, *self.__shard_sources(shard))
+                       for shard in shards]
+            results = [future.result() for future in futures]
+        except (BrokenProcessPool, OSError) as e:
+            self.logger.warning("Sharded model build failed, building in-process: {}".format(str(e)))
+            self.close()
+            return dict()
+
+        model_files = dict()
+        for shard_files, shard_subtrees in results:
+            for model_file in shard_files:
+                model_files[model_file.name] = model_file
+            for name, subtrees in shard_subtrees.items():
+                self.__link_subtree_sources(name, subtrees)
+                self.__built_subtrees[name] = subtrees
+        return model_files
+
+    def __shard_sources(self, names: List[str]) -> Tuple:
+        """
+        Returns the arguments of _build_shard() for the given roots
+        """
+        def pick(files: Dict) -> List:
+            return [files[name] for name in names if name in files]
+        return (
+            names,
+            pick(self.__remote_files),
+            pick(self.__local_files),
+            pick(self.__lftp_statuses),
+            pick(self.__extract_statuses),
+            [name for name in names if name in self.__downloaded_files],
+            [name for name in names if name in self.__extracted_files],
+        )
+
+    @staticmethod
+    def _build_shard(names: List[str],
+                     remote_files: List[SystemFile],
+                     local_files: List[SystemFile],
+                     lftp_statuses: List[LftpJobStatus],
+                     extract_statuses: List[ExtractStatus],
+                     downloaded_names: List[str],
+                     extracted_names: List[str]) -> Tuple[List[ModelFile], Dict[str, Dict[str, List]]]:
+        """
+        Build the given roots from their sources, in a worker process
+        The sources of the child subtrees are left out of the returned subtrees,
+        the builder links them to its own copies of the sources.
+        """
+        model_builder = ModelBuilder()
+        model_builder.set_remote_files(remote_files)
+        model_builder.set_local_files(local_files)
+        model_builder.set_lftp_statuses(lftp_statuses)
+        model_builder.set_extract_statuses(extract_statuses)
+        # The builder touches downloaded roots, the touch is repeated by the caller
+        model_builder.set_downloaded_files(BoundedOrderedSet(iterable=downloaded_names))
+        model_builder.set_extracted_files(set(extracted_names))
+        model_files = []
+        for name in names:
+            model_file, all_children_downloaded = model_builder._build_root_file(name)
+            model_builder._determine_final_state(model_file, all_children_downloaded)
+            model_file.freeze()
+            model_files.append(model_file)
+        subtrees = model_builder.__built_subtrees
+        for root_subtrees in subtrees.values():
+            for subtree in root_subtrees.values():
+                subtree[0] = None
+                subtree[1] = None
+        return model_files, subtrees
+
+    def __link_subtree_sources(self, name: str, subtrees: Dict[str, List]):
+        """
+        Set the sources of subtrees built by a worker to the builder's own system files
+        """
+        for root, index in ((self.__remote_files.get(name, None), 0), (self.__local_files.get(name, None), 1)):
+            if root is None:
+                continue
+            stack = [(child, child.name) for child in root.children]
+            while stack:
+                file, path = stack.pop()
+                subtree = subtrees.get(path, None)
+                if subtree is not None:
+                    subtree[index] = file
+                stack.extend((child, os.path.join(path, child.name)) for child in file.children)
+
     def _is_cache_valid(self) -> bool:
         """
         Check if the cached model is still valid.
@@ -148,13 +400,13 @@ class ModelBuilder:
             cache_age = time.time() - self.__cache_timestamp
             if cache_age > self.CACHE_TTL_SECONDS:
                 self.logger.debug("Model cache expired after {:.0f} seconds".format(cache_age))
-                self.__cached_model = None
+                self.__mark_all_dirty()
                 self.__cache_timestamp = None
                 return False
 
         return True
 
-    def _build_root_file(self, name: str) -> ModelFile:
+    def _build_root_file(self, name: str) -> Tuple[ModelFile, bool]:
         """
         Build a ModelFile for a root-level file, including all its children.
 
@@ -162,7 +414,8 @@ class ModelBuilder:
             name: The name of the file to build
 
         Returns:
-            A fully populated ModelFile with all children
+            A fully populated ModelFile with all children, and whether all
+            of its remote children are downloaded
         """
         remote = self.__remote_files.get(name, None)
         local = self.__local_files.get(name, None)
@@ -183,13 +436,17 @@ class ModelBuilder:
         self._fill_model_file(model_file, remote, local, transfer_state)
 
         # Build children if sources exist
+        subtrees = dict()
+        all_children_downloaded = True
         if remote or local:
-            self._build_children(model_file, remote, local, status)
+            all_children_downloaded = self._build_children(model_file, remote, local, status,
+                                                           self.__built_subtrees.get(name, dict()), subtrees)
+        self.__built_subtrees[name] = subtrees
 
         # Estimate ETA if not provided
         self._estimate_root_eta(model_file)
 
-        return model_file
+        return model_file, all_children_downloaded
 
     def _determine_is_dir(self,
                           remote: Optional[SystemFile],
@@ -265,7 +522,7 @@ class ModelBuilder:
                                model_file: ModelFile,
                                remote: Optional[SystemFile],
                                local: Optional[SystemFile]) -> None:
-        """Set the transferred size and propagate to parent directories."""
+        """Set the transferred size, directories add up their children's later."""
         if not (local and remote):
             return
 
@@ -274,81 +531,146 @@ class ModelBuilder:
             model_file.transferred_size = 0
         else:
             model_file.transferred_size = min(local.size, remote.size)
-            # Propagate to parent directories
-            parent_file = model_file.parent
-            while parent_file is not None:
-                parent_file.transferred_size += model_file.transferred_size
-                parent_file = parent_file.parent
 
     def _set_extractable_flag(self, model_file: ModelFile) -> None:
-        """Set the is_extractable flag and propagate to parents."""
+        """Set the is_extractable flag, directories take it from their children later."""
         if model_file.is_dir:
             return
 
         if Extract.is_archive_fast(model_file.name):
             model_file.is_extractable = True
-            # Propagate to parent directories
-            parent_file = model_file.parent
-            while parent_file is not None:
-                parent_file.is_extractable = True
-                parent_file = parent_file.parent
 
     def _set_timestamps(self,
                         model_file: ModelFile,
                         remote: Optional[SystemFile],
                         local: Optional[SystemFile]) -> None:
         """Set created and modified timestamps from local and remote sources."""
-        if local:
-            if local.timestamp_created:
-                model_file.local_created_timestamp = local.timestamp_created
-            if local.timestamp_modified:
-                model_file.local_modified_timestamp = local.timestamp_modified
-        if remote:
-            if remote.timestamp_created:
-                model_file.remote_created_timestamp = remote.timestamp_created
-            if remote.timestamp_modified:
-                model_file.remote_modified_timestamp = remote.timestamp_modified
+        model_file.set_epoch_timestamps(
+            local.epoch_created if local else None,
+            local.epoch_modified if local else None,
+            remote.epoch_created if remote else None,
+            remote.epoch_modified if remote else None
+        )
+
+    # Sources of a built child subtree: [remote, local, whether the root was queued or downloading,
+    # the subtree that they built, and whether all its remote files are downloaded]
+    _Subtree = List
 
     def _build_children(self,
                         root_model_file: ModelFile,
                         remote: Optional[SystemFile],
                         local: Optional[SystemFile],
-                        status: Optional[LftpJobStatus]) -> None:
+                        status: Optional[LftpJobStatus],
+                        prev_subtrees: Dict[str, _Subtree],
+                        subtrees: Dict[str, _Subtree]) -> bool:
         """
-        Build child ModelFiles using BFS traversal.
+        Build child ModelFiles in a single depth-first pass.
 
         Traverses the remote and local SystemFile trees, creating corresponding
-        ModelFiles and determining their states.
+        ModelFiles and determining their states on the way down. On the way
+        back up, directories add up the properties of their children.
+        A child subtree from the previous build is reused if it was built from
+        the same sources and has no active transfers.
 
         Args:
             root_model_file: The root ModelFile to add children to
             remote: Remote SystemFile (may have children)
             local: Local SystemFile (may have children)
             status: LFTP status for transfer state lookup
-        """
-        # Frontier contains (remote, local, status, parent_model_file) tuples
-        frontier = [(remote, local, status, root_model_file)]
+            prev_subtrees: Subtrees of the previous build of this root, by path below the root
+            subtrees: Receives the subtrees of this build that can be reused
 
-        while frontier:
-            parent_remote, parent_local, parent_status, parent_model_file = frontier.pop(0)
+        Returns:
+            True if all the remote files below the root are downloaded
+        """
+        is_root_queued = root_model_file.state in (ModelFile.State.QUEUED, ModelFile.State.DOWNLOADING)
+        # Paths below the root that contain an active transfer
+        active_paths = set()
+        if status:
+            for path, _ in status.get_active_file_transfer_states():
+                while path and path not in active_paths:
+                    active_paths.add(path)
+                    path = os.path.dirname(path)
+
+        # Nodes are (remote, local, model_file, path, subtree, is_reused) tuples
+        # where subtree is the reusable subtree entry, if any
+        def expand(node) -> List:
+            parent_remote, parent_local, parent_model_file, parent_path, _, is_reused = node
+            if is_reused or not parent_model_file.is_dir:
+                return []
 
             remote_children = {sf.name: sf for sf in parent_remote.children} if parent_remote else {}
             local_children = {sf.name: sf for sf in parent_local.children} if parent_local else {}
             all_children_names = set().union(remote_children.keys(), local_children.keys())
 
+            child_nodes = []
             for child_name in all_children_names:
                 remote_child = remote_children.get(child_name, None)
                 local_child = local_children.get(child_name, None)
+                child_path = os.path.join(parent_path, child_name) if parent_path else child_name
+                is_active = child_path in active_paths
+
+                if not is_active:
+                    prev_subtree = prev_subtrees.get(child_path, None)
+                    if prev_subtree is not None and \
+                            ModelBuilder.__is_same_file(prev_subtree[0], remote_child) and \
+                            ModelBuilder.__is_same_file(prev_subtree[1], local_child) and \
+                            prev_subtree[2] == is_root_queued:
+                        child_model_file = prev_subtree[3]
+                        parent_model_file.add_shared_child(child_model_file)
+                        # Keep the latest sources, so that the previous ones can be released
+                        prev_subtree[0] = remote_child
+                        prev_subtree[1] = local_child
+                        subtrees[child_path] = prev_subtree
+                        child_nodes.append((remote_child, local_child, child_model_file, child_path,
+                                            prev_subtree, True))
+                        continue
 
                 child_model_file = self._build_child_file(
-                    child_name, remote_child, local_child, parent_status, root_model_file, parent_model_file
+                    child_name, child_path, remote_child, local_child, status, root_model_file,
+                    parent_model_file
                 )
+                subtree = None
+                if not is_active:
+                    subtree = [remote_child, local_child, is_root_queued, child_model_file, None]
+                    subtrees[child_path] = subtree
+                child_nodes.append((remote_child, local_child, child_model_file, child_path, subtree, False))
+            return child_nodes
+
+        def combine(node, children_downloaded: List[bool]) -> bool:
+            _, _, model_file, _, subtree, is_reused = node
+            if is_reused:
+                return subtree[4]
+            if model_file.is_dir:
+                all_downloaded = all(children_downloaded)
+                self._aggregate_children(model_file)
+            else:
+                all_downloaded = model_file.remote_size is None or model_file.state == ModelFile.State.DOWNLOADED
+            if subtree is not None:
+                subtree[4] = all_downloaded
+            return all_downloaded
+
+        return TreeTraversal.fold((remote, local, root_model_file, "", None, False), expand, combine)
 
-                # Add to frontier for further traversal
-                frontier.append((remote_child, local_child, parent_status, child_model_file))
+    @staticmethod
+    def __is_same_file(a: Optional[SystemFile], b: Optional[SystemFile]) -> bool:
+        return a is b or (a is not None and b is not None and a == b)
+
+    def _aggregate_children(self, model_file: ModelFile) -> None:
+        """
+        Add up the transferred size and extractable flag of a directory's children.
+
+        Children are complete by now, directories included.
+        """
+        children = model_file.get_children()
+        if model_file.transferred_size is not None:
+            model_file.transferred_size += sum(child.transferred_size or 0 for child in children)
+        if any(child.is_extractable for child in children):
+            model_file.is_extractable = True
 
     def _build_child_file(self,
                           child_name: str,
+                          child_path: str,
                           remote_child: Optional[SystemFile],
                           local_child: Optional[SystemFile],
                           status: Optional[LftpJobStatus],
@@ -359,6 +681,7 @@ class ModelBuilder:
 
         Args:
             child_name: Name of the child file
+            child_path: Path of the child file without the root component
             remote_child: Remote SystemFile for this child
             local_child: Local SystemFile for this child
             status: LFTP status for transfer state lookup
@@ -379,7 +702,7 @@ class ModelBuilder:
         parent_model_file.add_child(child_model_file)
 
         # Find transfer state for this child
-        child_transfer_state = self._find_child_transfer_state(child_model_file, status)
+        child_transfer_state = self._find_child_transfer_state(child_path, status)
 
         # Determine child state
         child_model_file.state = self._determine_child_state(
@@ -392,7 +715,7 @@ class ModelBuilder:
         return child_model_file
 
     def _find_child_transfer_state(self,
-                                    child_model_file: ModelFile,
+                                    child_path: str,
                                     status: Optional[LftpJobStatus]
                                     ) -> Optional[LftpJobStatus.TransferState]:
         """
@@ -402,16 +725,7 @@ class ModelBuilder:
         """
         if not status:
             return None
-
-        # Build path without root component
-        path_parts = child_model_file.full_path.split(os.sep)
-        child_status_path = os.path.join(*path_parts[1:])
-
-        for name, transfer_state in status.get_active_file_transfer_states():
-            if name == child_status_path:
-                return transfer_state
-
-        return None
+        return status.get_active_file_transfer_state(child_path)
 
     def _determine_child_state(self,
                                 is_dir: bool,
@@ -458,19 +772,19 @@ class ModelBuilder:
         remaining_size = max(model_file.remote_size - model_file.transferred_size, 0)
         model_file.eta = int(math.ceil(remaining_size / model_file.downloading_speed))
 
-    def _determine_final_state(self, model_file: ModelFile) -> None:
+    def _determine_final_state(self, model_file: ModelFile, all_children_downloaded: bool) -> None:
         """
         Determine the final state for a root file.
 
         Checks in order: Downloaded, Deleted, Extracting, Extracted.
         Each check only applies if the file is in an appropriate initial state.
         """
-        self._check_downloaded_state(model_file)
+        self._check_downloaded_state(model_file, all_children_downloaded)
         self._check_deleted_state(model_file)
         self._check_extracting_state(model_file)
         self._check_extracted_state(model_file)
 
-    def _check_downloaded_state(self, model_file: ModelFile) -> None:
+    def _check_downloaded_state(self, model_file: ModelFile, all_children_downloaded: bool) -> None:
         """
         Check if a DEFAULT file should be marked as DOWNLOADED.
 
@@ -489,27 +803,9 @@ class ModelBuilder:
                 model_file.state = ModelFile.State.DOWNLOADED
         elif model_file.remote_size is not None:
             # Directory check - all remote children must be downloaded
-            if self._are_all_children_downloaded(model_file):
+            if all_children_downloaded:
                 model_file.state = ModelFile.State.DOWNLOADED
 
-    def _are_all_children_downloaded(self, model_file: ModelFile) -> bool:
-        """
-        Check if all remote children of a directory are downloaded.
-
-        Uses BFS traversal to check all descendants.
-        """
-        frontier = list(model_file.get_children())
-
-        while frontier:
-            child_file = frontier.pop(0)
-            # Only check non-directory files that exist remotely
-            if not child_file.is_dir and child_file.remote_size is not None:
-                if child_file.state != ModelFile.State.DOWNLOADED:
-                    return False
-            frontier.extend(child_file.get_children())
-
-        return True
-
     def _check_deleted_state(self, model_file: ModelFile) -> None:
         """
         Check if a DEFAULT file should be marked as DELETED.
@@ -1,32 +1,202 @@
 # Copyright 2017, Inderpreet Singh, All rights reserved.
 
 import logging
-from typing import List
+import time
+from typing import Dict, List, Optional, Set
 
 from .scanner_process import IScanner, ScannerError
 from common import overrides, Localization, Constants
-from system import SystemScanner, SystemFile, SystemScannerError
+from system import SystemScanner, SystemFile, SystemScannerError, InotifyWatcher, InotifyError
 
 
 class LocalScanner(IScanner):
     """
     Scanner implementation to scan the local filesystem
+    Scans are incremental by default, with a periodic forced full rescan
+
+    Optionally, on Linux, the local path can be watched with inotify. In that
+    mode, bursts of change events are turned into targeted rescans of only the
+    affected root entries. If inotify is unavailable, the watch limit is
+    exceeded or events are lost, the scanner falls back to periodic full scans.
+
+    Full scans can walk the tree with multiple threads, which helps when the
+    local path is on a network filesystem.
     """
-    def __init__(self, local_path: str, use_temp_file: bool):
+    # Number of incremental scans between forced full rescans
+    DEFAULT_FULL_SCAN_INTERVAL = 30
+    # Time between safety full scans in inotify mode
+    DEFAULT_WATCH_FULL_SCAN_INTERVAL_IN_SECS = 10 * 60
+
+    # Quiet period that ends a burst of inotify events
+    __WATCH_DEBOUNCE_IN_SECS = 0.2
+    # Max time spent waiting for a burst of inotify events to end
+    __WATCH_MAX_DEBOUNCE_IN_SECS = 2.0
+
+    def __init__(self,
+                 local_path: str,
+                 use_temp_file: bool,
+                 incremental: bool = True,
+                 full_scan_interval: int = DEFAULT_FULL_SCAN_INTERVAL,
+                 use_inotify: bool = False,
+                 watch_full_scan_interval_in_secs: int = DEFAULT_WATCH_FULL_SCAN_INTERVAL_IN_SECS,
+                 num_scan_threads: int = 1):
+        self.__local_path = local_path
         self.__scanner = SystemScanner(local_path)
+        self.__use_temp_file = use_temp_file
         if use_temp_file:
             self.__scanner.set_lftp_temp_suffix(Constants.LFTP_TEMP_FILE_SUFFIX)
+        self.__scanner.set_incremental(incremental, full_scan_interval)
+        self.__scanner.set_num_threads(num_scan_threads)
+        self.__incremental = incremental
+        self.__use_inotify = use_inotify
+        self.__watch_full_scan_interval_in_secs = watch_full_scan_interval_in_secs
+        # Watcher is created lazily in the scanner process
+        self.__watcher = None  # type: Optional[InotifyWatcher]
+        self.__watch_failed = False
+        self.__files = None  # type: Optional[Dict[str, SystemFile]]
+        self.__last_full_scan_time = None
         self.logger = logging.getLogger("LocalScanner")
 
     @overrides(IScanner)
     def set_base_logger(self, base_logger: logging.Logger):
         self.logger = base_logger.getChild("LocalScanner")
 
+    @overrides(IScanner)
+    def is_watching(self) -> bool:
+        return self.__watcher is not None
+
+    @overrides(IScanner)
+    def wait_for_changes(self, timeout_in_s: float) -> bool:
+        if self.__watcher is None:
+            return False
+        try:
+            if not self.__watcher.poll(timeout_in_s):
+                return False
+            # Let the burst of events settle so that it's handled in a single scan
+            deadline = time.monotonic() + LocalScanner.__WATCH_MAX_DEBOUNCE_IN_SECS
+            while time.monotonic() < deadline and \
+                    self.__watcher.poll(LocalScanner.__WATCH_DEBOUNCE_IN_SECS):
+                pass
+        except InotifyError as e:
+            self.__stop_watching(str(e))
+        return True
+
     @overrides(IScanner)
     def scan(self) -> List[SystemFile]:
+        if self.__use_inotify and self.__watcher is None and not self.__watch_failed:
+            # Watches are added before the full scan so that no changes are missed
+            self.__start_watching()
+
+        if self.__watcher is None:
+            return self.__full_scan()
+
+        try:
+            self.__watcher.poll(0)
+            changed_names = self.__watcher.pop_changes()
+        except InotifyError as e:
+            self.__stop_watching(str(e))
+            return self.__full_scan()
+
+        if changed_names is None:
+            self.logger.warning("Lost inotify events, running a full scan")
+            return self.__full_scan()
+        if self.__files is None or \
+                time.monotonic() - self.__last_full_scan_time >= self.__watch_full_scan_interval_in_secs:
+            return self.__full_scan()
+        if changed_names:
+            self.__rescan_roots(changed_names)
+        return sorted(self.__files.values(), key=lambda f: f.name)
+
+    def __full_scan(self) -> List[SystemFile]:
+        prev_cache_hits = self.__scanner.cache_hits
+        prev_cache_misses = self.__scanner.cache_misses
         try:
             result = self.__scanner.scan()
         except SystemScannerError:
             self.logger.exception("Caught SystemScannerError")
             raise ScannerError(Localization.Error.LOCAL_SERVER_SCAN, recoverable=False)
+        if self.__incremental:
+            self.logger.debug("Directory cache: {} hits, {} misses (total {} hits, {} misses)".format(
+                self.__scanner.cache_hits - prev_cache_hits,
+                self.__scanner.cache_misses - prev_cache_misses,
+                self.__scanner.cache_hits,
+                self.__scanner.cache_misses
+            ))
+        if self.__watcher is not None:
+            self.__files = {f.name: f for f in result}
+            self.__last_full_scan_time = time.monotonic()
         return result
+
+    @overrides(IScanner)
+    def scan_roots(self, names: Set[str]) -> Optional[List[SystemFile]]:
+        return sorted(self.__rescan_roots(names).values(), key=lambda f: f.name)
+
+    def __rescan_roots(self, changed_names: Set[str]) -> Dict[str, SystemFile]:
+        """
+        Rescan only the given root entries, and update the cached result if there is one
+        :param changed_names: raw names of the changed root entries on disk
+        :return: the rescanned root files that exist
+        """
+        self.logger.debug("Rescanning changed entries: {}".format(sorted(changed_names)))
+        files = dict()
+        for name in self.__candidate_root_names(changed_names):
+            try:
+                file = self.__scanner.scan_single(name)
+            except SystemScannerError:
+                # Deleted, or not a valid root name
+                if self.__files is not None:
+                    self.__files.pop(name, None)
+                continue
+            except FileNotFoundError:
+                # Deleted while scanning
+                if self.__files is not None:
+                    self.__files.pop(name, None)
+                continue
+            if self.__files is not None:
+                if file.name != name:
+                    # Name on disk differs from the model name, e.g. a temp file
+                    self.__files.pop(name, None)
+                self.__files[file.name] = file
+            files[file.name] = file
+        return files
+
+    def __candidate_root_names(self, changed_names: Set[str]) -> Set[str]:
+        """
+        Returns the root names that could be affected by changes to the given names on disk
+        An lftp status or temp file changes the root entry for its original name.
+        Names excluded from full scans, such as the lftp status files themselves,
+        are never candidates.
+        """
+        candidates = set()
+        for name in changed_names:
+            candidates.add(name)
+            if name.endswith(Constants.LFTP_STATUS_FILE_SUFFIX):
+                name = name[:-len(Constants.LFTP_STATUS_FILE_SUFFIX)]
+                candidates.add(name)
+            if self.__use_temp_file and name != Constants.LFTP_TEMP_FILE_SUFFIX and \
+                    name.endswith(Constants.LFTP_TEMP_FILE_SUFFIX):
+                candidates.add(name[:-len(Constants.LFTP_TEMP_FILE_SUFFIX)])
+        return {name for name in candidates if name and not self.__scanner.is_excluded(name)}
+
+    def __start_watching(self):
+        if not InotifyWatcher.is_supported():
+            self.logger.warning("inotify is not supported on this platform, using periodic scans")
+            self.__watch_failed = True
+            return
+        watcher = InotifyWatcher(self.__local_path)
+        try:
+            watcher.start()
+        except InotifyError as e:
+            self.logger.warning("Failed to watch local path, using periodic scans: {}".format(str(e)))
+            self.__watch_failed = True
+            return
+        self.logger.info("Watching local path with {} inotify watches".format(watcher.num_watches))
+        self.__watcher = watcher
+        self.__files = None
+
+    def __stop_watching(self, reason: str):
+        self.logger.warning("Stopped watching local path, using periodic scans: {}".format(reason))
+        self.__watcher.close()
+        self.__watcher = None
+        self.__watch_failed = True
+        self.__files = None
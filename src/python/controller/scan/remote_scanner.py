@@ -1,21 +1,41 @@
 # Copyright 2017, Inderpreet Singh, All rights reserved.
 
+import json
 import logging
 import pickle
-from typing import List
+from typing import List, Set, Tuple
 import os
 from typing import Optional
 import hashlib
 
 from .scanner_process import IScanner, ScannerError
 from common import overrides, Localization
-from ssh import Sshcp, SshcpError
-from system import SystemFile
+from ssh import Sshcp, SshcpError, SshcpTimeoutError, SshcpChannel
+from system import SystemFile, SystemFileCodec, SystemFileCodecError, SystemFileCodecVersionError, SystemFileDelta, \
+    ScanAgent
 
 
 class RemoteScanner(IScanner):
     """
     Scanner implementation to scan the remote filesystem
+    scanfs is asked for the compact binary format, falling back to pickle
+    if the remote scanfs doesn't support it
+
+    Scans are delta scans: scanfs keeps a snapshot of the last scan on the
+    remote, and only sends the root files that changed since the state
+    identified by our token. Any mismatch results in a full scan.
+
+    Optionally, scanfs is kept running on the remote as a scan agent over a
+    single ssh session, which avoids the cost of a new ssh session and a
+    scanfs cold start on every scan. A dropped session is transparently
+    reconnected.
+
+    The agent can also watch the remote path with inotify and push the
+    names of the root files that changed. This wakes up the scanner
+    process right away, and the next scan only rescans those roots.
+    If the remote doesn't support inotify, scans stay periodic.
+
+    Targeted scans of some root files are only supported through the agent.
     """
     def __init__(self,
                  remote_address: str,
@@ -24,11 +44,28 @@ class RemoteScanner(IScanner):
                  remote_port: int,
                  remote_path_to_scan: str,
                  local_path_to_scan_script: str,
-                 remote_path_to_scan_script: str):
+                 remote_path_to_scan_script: str,
+                 num_scan_threads: int = 1,
+                 use_agent: bool = False,
+                 use_watch: bool = False):
         self.logger = logging.getLogger("RemoteScanner")
         self.__remote_path_to_scan = remote_path_to_scan
         self.__local_path_to_scan_script = local_path_to_scan_script
         self.__remote_path_to_scan_script = remote_path_to_scan_script
+        self.__num_scan_threads = num_scan_threads
+        self.__use_binary_format = True
+        self.__use_delta_format = True
+        self.__use_agent = use_agent
+        self.__agent = None  # type: Optional[SshcpChannel]
+        self.__use_watch = use_watch
+        self.__agent_watching = False
+        # Root names that the agent reported as changed since the last scan
+        self.__pending_changes = set()  # type: Set[str]
+        # True if the agent reported lost events
+        self.__pending_full_scan = False
+        # Result of the last scan, and the token that identifies it on the remote
+        self.__remote_files = None  # type: Optional[List[SystemFile]]
+        self.__scan_token = None  # type: Optional[str]
         self.__ssh = Sshcp(host=remote_address,
                            port=remote_port,
                            user=remote_username,
@@ -40,47 +77,295 @@ class RemoteScanner(IScanner):
         if os.path.basename(self.__remote_path_to_scan_script) != script_name:
             self.__remote_path_to_scan_script = os.path.join(self.__remote_path_to_scan_script, script_name)
 
+        # Snapshot file lives next to the scan script, one per scanned path
+        self.__remote_path_to_scan_state = "{}.{}.state".format(
+            self.__remote_path_to_scan_script,
+            hashlib.md5(self.__remote_path_to_scan.encode()).hexdigest()[:8]
+        )
+
     @overrides(IScanner)
     def set_base_logger(self, base_logger: logging.Logger):
         self.logger = base_logger.getChild("RemoteScanner")
         self.__ssh.set_base_logger(self.logger)
 
+    @overrides(IScanner)
+    def is_watching(self) -> bool:
+        return self.__agent_watching
+
+    @overrides(IScanner)
+    def wait_for_changes(self, timeout_in_s: float) -> bool:
+        if not self.__agent_watching:
+            return False
+        if not self.__has_pending_changes():
+            try:
+                self.__read_agent_frame(timeout_in_s)
+                # Drain any other notifications that are already here
+                while True:
+                    self.__read_agent_frame(0)
+            except SshcpTimeoutError:
+                pass
+            except SshcpError as e:
+                # Let the next scan reconnect
+                self.logger.info("Scan agent failed while waiting for changes: {}".format(str(e)))
+                self.__close_agent()
+                return True
+        return self.__has_pending_changes()
+
+    @overrides(IScanner)
+    def scan_roots(self, names: Set[str]) -> Optional[List[SystemFile]]:
+        if self.__remote_files is None or self.__pending_full_scan or \
+                not (self.__use_agent and self.__use_binary_format and self.__use_delta_format):
+            return None
+        # Changes pushed by the agent are rescanned along with these
+        names = names | self.__pending_changes
+        self.__pending_changes.update(names)
+        return [file for file in self.scan() if file.name in names]
+
     @overrides(IScanner)
     def scan(self) -> List[SystemFile]:
         if self.__first_run:
             self._install_scanfs()
 
+        remote_files = None
+        out = self.__run_scan()
+        if SystemFileDelta.is_encoded(out):
+            try:
+                remote_files = self.__apply_delta(SystemFileDelta.decode(out))
+            except SystemFileCodecVersionError as err:
+                self.logger.warning("Falling back to full scans: {}".format(str(err)))
+                self.__use_delta_format = False
+                out = self.__run_scan()
+            except SystemFileCodecError as err:
+                self.logger.error("Scan data decoding error: {}".format(str(err)))
+                self.__scan_token = None
+                raise ScannerError(
+                    Localization.Error.REMOTE_SERVER_SCAN.format("Invalid scan data"),
+                    recoverable=False
+                )
+
+        if remote_files is None and SystemFileCodec.is_encoded(out):
+            try:
+                remote_files = SystemFileCodec.decode(out)
+            except SystemFileCodecVersionError as err:
+                self.logger.warning("Falling back to pickled scan data: {}".format(str(err)))
+                self.__use_binary_format = False
+                out = self.__run_scan()
+            except SystemFileCodecError as err:
+                self.logger.error("Scan data decoding error: {}".format(str(err)))
+                raise ScannerError(
+                    Localization.Error.REMOTE_SERVER_SCAN.format("Invalid scan data"),
+                    recoverable=False
+                )
+
+        if remote_files is None:
+            try:
+                remote_files = pickle.loads(out)
+            except pickle.UnpicklingError as err:
+                self.logger.error("Unpickling error: {}\n{}".format(str(err), out))
+                raise ScannerError(
+                    Localization.Error.REMOTE_SERVER_SCAN.format("Invalid pickled data"),
+                    recoverable=False
+                )
+
+        self.__first_run = False
+        return remote_files
+
+    def __apply_delta(self, delta: SystemFileDelta) -> List[SystemFile]:
+        """
+        Apply a delta to the result of the previous scan
+        :return: the new scan result
+        """
+        if delta.is_full:
+            remote_files = list(delta.files)
+        else:
+            if self.__remote_files is None:
+                raise SystemFileCodecError("Received a delta without a previous scan")
+            files_by_name = {f.name: f for f in self.__remote_files}
+            for name in delta.removed_names:
+                files_by_name.pop(name, None)
+            for file in delta.files:
+                files_by_name[file.name] = file
+            remote_files = sorted(files_by_name.values(), key=lambda f: f.name)
+            self.logger.debug("Delta scan: {} changed, {} removed".format(
+                len(delta.files), len(delta.removed_names)
+            ))
+        self.__remote_files = remote_files
+        self.__scan_token = delta.token
+        return list(remote_files)
+
+    def __run_scan(self) -> bytes:
+        if self.__use_agent and self.__use_binary_format and self.__use_delta_format:
+            out = self.__run_agent_scan()
+            if out is not None:
+                return out
+        # One-off scans always rescan everything
+        self.__pop_pending_changes()
         try:
-            out = self.__ssh.shell("'{}' '{}'".format(
-                self.__remote_path_to_scan_script,
-                self.__remote_path_to_scan)
-            )
+            return self.__ssh.shell(self.__scan_command(daemon=False))
         except SshcpError as e:
+            if self.__use_binary_format and self.__use_delta_format and "unrecognized arguments" in str(e):
+                # Remote scanfs predates delta scans
+                self.logger.warning("Remote scanfs doesn't support delta scans, falling back to full scans")
+                self.__use_delta_format = False
+                return self.__run_scan()
+            if self.__use_binary_format and "unrecognized arguments" in str(e):
+                # Remote scanfs predates the binary format
+                self.logger.warning("Remote scanfs doesn't support the binary format, falling back to pickle")
+                self.__use_binary_format = False
+                return self.__run_scan()
             self.logger.warning("Caught an SshcpError: {}".format(str(e)))
-            recoverable = True
-            # Any scanner errors are fatal
-            if "SystemScannerError" in str(e):
-                recoverable = False
-            # First time errors are fatal
-            # User should be prompted to correct these
-            if self.__first_run:
-                recoverable = False
-            raise ScannerError(
-                Localization.Error.REMOTE_SERVER_SCAN.format(str(e).strip()),
-                recoverable=recoverable
-            )
+            raise self.__create_scan_error(str(e))
+
+    def __run_agent_scan(self) -> Optional[bytes]:
+        """
+        Run a scan through the scan agent, starting it if needed
+        A failed request is retried once over a new session
+        Returns None if the remote scanfs doesn't support the agent
+        """
+        request = ScanAgent.encode_request(self.__since_token(), self.__pop_pending_changes())
+        for attempt in range(2):
+            try:
+                if self.__agent is None or not self.__agent.is_alive():
+                    self.__close_agent()
+                    self.logger.debug("Starting scan agent")
+                    self.__agent = self.__ssh.open_channel(self.__scan_command(daemon=True))
+                    if self.__use_watch:
+                        self.__start_agent_watch()
+                self.__agent.send_line(request)
+                status, encoded_payload = self.__read_agent_response()
+            except SshcpError as e:
+                self.__close_agent()
+                if "unrecognized arguments" in str(e):
+                    # Remote scanfs predates the scan agent
+                    self.logger.warning("Remote scanfs doesn't support the scan agent, using one-off scans")
+                    self.__use_agent = False
+                    return None
+                if attempt == 0:
+                    self.logger.info("Scan agent failed, reconnecting: {}".format(str(e)))
+                    continue
+                self.logger.warning("Caught an SshcpError: {}".format(str(e)))
+                raise self.__create_scan_error(str(e))
+
+            try:
+                payload = ScanAgent.decode_response_payload(encoded_payload)
+            except ValueError:
+                self.__close_agent()
+                self.logger.error("Invalid scan agent response: {}".format(encoded_payload))
+                raise ScannerError(
+                    Localization.Error.REMOTE_SERVER_SCAN.format("Invalid scan data"),
+                    recoverable=False
+                )
+            if status == ScanAgent.STATUS_ERROR:
+                error = payload.decode(errors="replace")
+                self.logger.warning("Scan agent error: {}".format(error))
+                raise self.__create_scan_error(error)
+            return payload
 
+    def __start_agent_watch(self):
+        """
+        Ask the agent to push change notifications
+        Watching is requested before the scan so that no change falls in between
+        """
+        self.__agent.send_line(ScanAgent.encode_watch_request())
+        status, encoded_payload = self.__read_agent_response()
+        if status == ScanAgent.STATUS_OK:
+            self.logger.info("Watching remote path for changes")
+            self.__agent_watching = True
+        else:
+            try:
+                error = ScanAgent.decode_response_payload(encoded_payload).decode(errors="replace")
+            except ValueError:
+                error = "Invalid response"
+            self.logger.warning("Remote change notifications are unavailable, using periodic scans: {}"
+                                .format(error))
+            self.__use_watch = False
+
+    def __read_agent_response(self) -> Tuple[str, bytes]:
+        """
+        Read frames until the response to a request, recording any change notifications
+        :return: status and encoded payload
+        """
+        while True:
+            status, encoded_payload = self.__read_agent_frame()
+            if status != ScanAgent.STATUS_CHANGES:
+                return status, encoded_payload
+
+    def __read_agent_frame(self, timeout_in_secs: Optional[float] = None) -> Tuple[str, bytes]:
+        match = self.__agent.expect(ScanAgent.FRAME_HEADER_PATTERN, timeout_in_secs)
+        status = match.group(1).decode()
         try:
-            remote_files = pickle.loads(out)
-        except pickle.UnpicklingError as err:
-            self.logger.error("Unpickling error: {}\n{}".format(str(err), out))
-            raise ScannerError(
-                Localization.Error.REMOTE_SERVER_SCAN.format("Invalid pickled data"),
-                recoverable=False
-            )
+            encoded_payload = self.__agent.read(int(match.group(2)))
+        except SshcpTimeoutError:
+            # Not the same as no frame arriving in time
+            raise SshcpError("Timed out reading a scan agent frame")
+        if status == ScanAgent.STATUS_CHANGES:
+            try:
+                changes = json.loads(ScanAgent.decode_response_payload(encoded_payload).decode())
+            except ValueError:
+                changes = None
+            if isinstance(changes, list):
+                self.logger.debug("Remote changes: {}".format(changes))
+                self.__pending_changes.update(name for name in changes if isinstance(name, str))
+            else:
+                self.__pending_full_scan = True
+        return status, encoded_payload
 
-        self.__first_run = False
-        return remote_files
+    def __has_pending_changes(self) -> bool:
+        return self.__pending_full_scan or len(self.__pending_changes) > 0
+
+    def __pop_pending_changes(self) -> Optional[List[str]]:
+        """
+        Returns the root names to rescan, None to rescan everything
+        """
+        roots = None
+        if not self.__pending_full_scan and self.__pending_changes:
+            roots = sorted(self.__pending_changes)
+        self.__pending_changes = set()
+        self.__pending_full_scan = False
+        return roots
+
+    def __close_agent(self):
+        self.__agent_watching = False
+        if self.__agent is not None:
+            self.__agent.close()
+            self.__agent = None
+
+    def __since_token(self) -> Optional[str]:
+        if self.__remote_files is not None:
+            return self.__scan_token
+        return None
+
+    def __scan_command(self, daemon: bool) -> str:
+        command = "'{}' '{}'".format(
+            self.__remote_path_to_scan_script,
+            self.__remote_path_to_scan
+        )
+        if daemon:
+            command += " --daemon --state-file '{}'".format(self.__remote_path_to_scan_state)
+        elif self.__use_binary_format:
+            command += " --format binary"
+            if self.__use_delta_format:
+                command += " --state-file '{}'".format(self.__remote_path_to_scan_state)
+                since_token = self.__since_token()
+                if since_token is not None:
+                    command += " --since {}".format(since_token)
+        if self.__num_scan_threads > 1:
+            command += " --threads {}".format(self.__num_scan_threads)
+        return command
+
+    def __create_scan_error(self, error: str) -> ScannerError:
+        recoverable = True
+        # Any scanner errors are fatal
+        if "SystemScannerError" in error:
+            recoverable = False
+        # First time errors are fatal
+        # User should be prompted to correct these
+        if self.__first_run:
+            recoverable = False
+        return ScannerError(
+            Localization.Error.REMOTE_SERVER_SCAN.format(error.strip()),
+            recoverable=recoverable
+        )
 
     def _install_scanfs(self):
         # Check md5sum on remote to see if we can skip installation
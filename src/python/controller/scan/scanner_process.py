@@ -3,12 +3,15 @@
 import logging
 from abc import ABC, abstractmethod
 import multiprocessing
+import multiprocessing.synchronize
 from datetime import datetime
-from typing import List, Optional
+from typing import Dict, Iterable, List, Optional, Set
 import queue
+import time
 
 from common import overrides, AppProcess, AppError
-from system import SystemFile
+from system import SystemFile, SystemFileCodec
+from .shared_buffer import SharedScanBuffer
 
 
 class ScannerError(AppError):
@@ -37,41 +40,177 @@ class IScanner(ABC):
     def set_base_logger(self, base_logger: logging.Logger):
         pass
 
+    def is_watching(self) -> bool:
+        """
+        Returns true if the scanner can detect changes on its own, in which
+        case wait_for_changes() is used to wake up the scanner process early
+        """
+        return False
+
+    def wait_for_changes(self, timeout_in_s: float) -> bool:
+        """
+        Block until a change is detected or the timeout expires
+        Returns true if a change was detected
+        """
+        return False
+
+    def scan_roots(self, names: Set[str]) -> Optional[List[SystemFile]]:
+        """
+        Rescan only the root files with the given names
+        Returns the ones that exist, or None if targeted scans are not
+        supported, in which case a full scan is done instead
+        """
+        return None
+
 
 class ScannerResult:
     """
     Results of a system scan
+    A partial result only covers the root files named in partial_names,
+    files contains the ones that exist and the others were removed.
+    This is also how deltas are published, in which case an empty
+    partial result means that nothing changed.
+
+    The files can also be given in their SystemFileCodec encoding, in
+    which case they are only decoded when first accessed.
     """
     def __init__(self,
                  timestamp: datetime,
-                 files: List[SystemFile],
+                 files: Optional[List[SystemFile]],
                  failed: bool = False,
-                 error_message: str = None):
+                 error_message: str = None,
+                 partial_names: Optional[Set[str]] = None,
+                 encoded_files: Optional[bytes] = None):
         self.timestamp = timestamp
-        self.files = files
+        self.__files = files
+        self.__encoded_files = encoded_files
         self.failed = failed
         self.error_message = error_message
+        self.partial_names = partial_names
+
+    @property
+    def files(self) -> List[SystemFile]:
+        if self.__files is None and self.__encoded_files is not None:
+            self.__files = SystemFileCodec.decode(self.__encoded_files)
+            self.__encoded_files = None
+        return self.__files
+
+    @property
+    def is_partial(self) -> bool:
+        return self.partial_names is not None
+
+    def merged_with(self, later: "ScannerResult") -> "ScannerResult":
+        """
+        Returns the combination of this result and a later one
+        :param later:
+        :return:
+        """
+        if not later.is_partial:
+            return later
+        files_by_name = {file.name: file for file in self.files}
+        for name in later.partial_names:
+            files_by_name.pop(name, None)
+        for file in later.files:
+            files_by_name[file.name] = file
+        return ScannerResult(
+            timestamp=later.timestamp,
+            files=sorted(files_by_name.values(), key=lambda f: f.name),
+            failed=later.failed,
+            error_message=later.error_message,
+            partial_names=(self.partial_names | later.partial_names) if self.is_partial else None
+        )
+
+
+class SharedScannerResult:
+    """
+    ScannerResult whose files were written to a SharedScanBuffer
+    """
+    def __init__(self, result: ScannerResult, descriptor: SharedScanBuffer.Descriptor):
+        self.timestamp = result.timestamp
+        self.failed = result.failed
+        self.error_message = result.error_message
+        self.descriptor = descriptor
+
+    def load(self, shared_buffer: SharedScanBuffer) -> Optional[ScannerResult]:
+        """
+        Copy the encoded files out of the buffer
+        Returns None if they were overwritten
+        """
+        data = shared_buffer.read(self.descriptor)
+        if data is None:
+            return None
+        return ScannerResult(timestamp=self.timestamp,
+                             files=None,
+                             failed=self.failed,
+                             error_message=self.error_message,
+                             encoded_files=data)
 
 
 class ScannerProcess(AppProcess):
     """
     Process to scan a file system and publish the result
+
+    Besides the periodic full scans, a scan of only some root files can be
+    requested with force_scan(). If the scanner supports it, these publish
+    partial results, and don't push back the next full scan.
+
+    With publish_deltas, the process remembers the last published result
+    and only publishes the root files that changed since then, as a partial
+    result. This keeps unchanged trees out of the IPC queue, and spares the
+    consumer from comparing them. The first result, and the first one after
+    a failed scan, is always a full one.
+
+    With use_shared_memory, large full results are passed through a
+    SharedScanBuffer in their compact encoding, and only a small descriptor
+    goes through the IPC queue. The owner then copies them out, and only
+    decodes them when the files are accessed. Partial results are always
+    small enough to go through the queue.
     """
+    # Smallest encoded result that is passed through shared memory
+    __SHARED_MEMORY_MIN_SIZE = 64 * 1024
+    # Max time to block on a watching scanner before checking the wake event
+    __WATCH_POLL_INTERVAL_IN_SECS = 0.5
+
     def __init__(self,
                  scanner: IScanner, interval_in_ms: int,
-                 verbose: bool = True):
+                 verbose: bool = True,
+                 publish_deltas: bool = False,
+                 use_shared_memory: bool = False):
         """
         Create a scanner process
         :param scanner: IScanner implementation
         :param interval_in_ms: Minimum interval (in ms) between results
+        :param publish_deltas: publish only the changes since the previous result
+        :param use_shared_memory: pass large results through shared memory
         """
         super().__init__(name=scanner.__class__.__name__)
         self.__queue = multiprocessing.Queue()
         self.__wake_event = multiprocessing.Event()
+        # Scan requests: a list of root names, or None for a full scan
+        # A SimpleQueue is written synchronously, so a request is always
+        # visible by the time the wake event is seen
+        self.__request_queue = multiprocessing.SimpleQueue()
         self.__scanner = scanner
         self.__interval_in_ms = interval_in_ms
+        self.__next_full_scan_time = None  # type: Optional[float]
+        self.__publish_deltas = publish_deltas
+        # Last published state of each root file, in delta mode
+        self.__published_files = None  # type: Optional[Dict[str, SystemFile]]
+        # Written by the scanner process, read by the owner
+        self.__shared_buffer = SharedScanBuffer() if use_shared_memory else None
+        # Set by the scanner process after each published result, owned by the reader
+        self.__result_event = None  # type: Optional[multiprocessing.synchronize.Event]
         self.verbose = verbose
 
+    def set_result_event(self, result_event: multiprocessing.synchronize.Event):
+        """
+        Set an event for the process to set whenever it publishes a result
+        Must be called before the process is started
+        :param result_event:
+        :return:
+        """
+        self.__result_event = result_event
+
     @overrides(AppProcess)
     def run_init(self):
         # Set the base logger for scanner
@@ -79,36 +218,141 @@ class ScannerProcess(AppProcess):
 
     @overrides(AppProcess)
     def run_cleanup(self):
-        pass
+        if self.__shared_buffer is not None:
+            self.__shared_buffer.close()
 
     @overrides(AppProcess)
     def run_loop(self):
+        names = self.__pop_requested_names()
         timestamp_start = datetime.now()
-        if self.verbose:
-            self.logger.debug("Running a scan")
+        files = None
         try:
-            files = self.__scanner.scan()
-            result = ScannerResult(timestamp=timestamp_start,
-                                   files=files)
+            if names is not None and self.__next_full_scan_time is not None and \
+                    time.monotonic() < self.__next_full_scan_time:
+                if self.verbose:
+                    self.logger.debug("Running a scan of {}".format(sorted(names)))
+                files = self.__scanner.scan_roots(names)
+            if files is None:
+                names = None
+                if self.verbose:
+                    self.logger.debug("Running a scan")
+                self.__next_full_scan_time = time.monotonic() + self.__interval_in_ms / 1000.0
+                files = self.__scanner.scan()
+            if self.__publish_deltas:
+                result = self.__create_delta_result(timestamp_start, files, names)
+            else:
+                result = ScannerResult(timestamp=timestamp_start,
+                                       files=files,
+                                       partial_names=names)
         except ScannerError as e:
             # Non-recoverable errors continue up as a fatal error
             if not e.recoverable:
                 raise
+            if names is None:
+                # The failed result replaces everything
+                self.__published_files = None
+            # A failed partial scan leaves the previous result as is
             result = ScannerResult(timestamp=timestamp_start,
                                    files=[],
                                    failed=True,
-                                   error_message=str(e))
-        self.__queue.put(result)
+                                   error_message=str(e),
+                                   partial_names=set() if names is not None else None)
+        self.__publish(result)
         delta_in_s = (datetime.now() - timestamp_start).total_seconds()
-        delta_in_ms = int(delta_in_s * 1000)
         if self.verbose:
             self.logger.debug("Scan took {:.3f}s".format(delta_in_s))
 
-        # Wait until the next interval, or until a wake event is fired
-        if delta_in_ms < self.__interval_in_ms:
-            wait_time_in_s = float(self.__interval_in_ms - delta_in_ms) / 1000.0
-            self.__wake_event.wait(timeout=wait_time_in_s)
-            self.__wake_event.clear()
+        # Wait until the next full scan, or until a wake event is fired
+        wait_time_in_s = self.__next_full_scan_time - time.monotonic()
+        if wait_time_in_s > 0 and self.__request_queue.empty():
+            if self.__scanner.is_watching():
+                self.__wait_for_changes(wait_time_in_s)
+            else:
+                self.__wake_event.wait(timeout=wait_time_in_s)
+        self.__wake_event.clear()
+
+    def __publish(self, result: ScannerResult):
+        self.__queue.put(self.__pack(result))
+        if self.__result_event is not None:
+            self.__result_event.set()
+
+    def __pack(self, result: ScannerResult):
+        if self.__shared_buffer is not None and not result.is_partial and result.files:
+            data = SystemFileCodec.encode(result.files)
+            if len(data) >= ScannerProcess.__SHARED_MEMORY_MIN_SIZE:
+                descriptor = self.__shared_buffer.write(data)
+                if descriptor is not None:
+                    return SharedScannerResult(result, descriptor)
+                self.logger.warning("Not enough shared memory for a scan result of {} bytes".format(len(data)))
+        return result
+
+    def __create_delta_result(self,
+                              timestamp: datetime,
+                              files: List[SystemFile],
+                              scanned_names: Optional[Set[str]]) -> ScannerResult:
+        """
+        Create the result with the changes since the last published result
+        :param timestamp:
+        :param files: scan result
+        :param scanned_names: names of the scanned root files, None if everything was scanned
+        :return:
+        """
+        if self.__published_files is None:
+            if scanned_names is not None:
+                # Nothing to compare against, publish as is
+                return ScannerResult(timestamp=timestamp, files=files, partial_names=scanned_names)
+            self.__published_files = {file.name: file for file in files}
+            return ScannerResult(timestamp=timestamp, files=files)
+
+        new_files = {file.name: file for file in files}
+        if scanned_names is None:
+            scanned_names = self.__published_files.keys()
+        changed_names = set()
+        changed_files = []
+        for name in set(scanned_names) | new_files.keys():
+            prev_file = self.__published_files.get(name)
+            file = new_files.get(name)
+            if file is None:
+                if prev_file is not None:
+                    del self.__published_files[name]
+                    changed_names.add(name)
+            # Incremental scanners reuse the SystemFiles of unchanged trees,
+            # so most comparisons stop at the identity check
+            elif prev_file is None or (prev_file is not file and prev_file != file):
+                self.__published_files[name] = file
+                changed_names.add(name)
+                changed_files.append(file)
+        changed_files.sort(key=lambda f: f.name)
+        return ScannerResult(timestamp=timestamp, files=changed_files, partial_names=changed_names)
+
+    def __pop_requested_names(self) -> Optional[Set[str]]:
+        """
+        Returns the root names of all pending scan requests
+        Returns None if a full scan is due or was requested
+        """
+        names = set()
+        full_scan = False
+        while not self.__request_queue.empty():
+            request = self.__request_queue.get()
+            if request is None:
+                full_scan = True
+            else:
+                names.update(request)
+        if full_scan or not names:
+            return None
+        return names
+
+    def __wait_for_changes(self, timeout_in_s: float):
+        """
+        Wait until the scanner detects a change, a wake event is fired, or the timeout expires
+        """
+        deadline = time.monotonic() + timeout_in_s
+        while not self.__wake_event.is_set():
+            remaining_in_s = deadline - time.monotonic()
+            if remaining_in_s <= 0:
+                break
+            if self.__scanner.wait_for_changes(min(remaining_in_s, ScannerProcess.__WATCH_POLL_INTERVAL_IN_SECS)):
+                break
 
     def pop_latest_result(self) -> Optional[ScannerResult]:
         """
@@ -120,11 +364,33 @@ class ScannerProcess(AppProcess):
         latest_scan = None
         try:
             while True:
-                latest_scan = self.__queue.get(block=False)
+                result = self.__queue.get(block=False)
+                if isinstance(result, SharedScannerResult):
+                    result = result.load(self.__shared_buffer)
+                    if result is None:
+                        # Overwritten, so there's a newer full result on the way
+                        self.logger.debug("Dropped a scan result that was overwritten in shared memory")
+                        continue
+                # Partial results only make sense on top of the earlier ones
+                latest_scan = latest_scan.merged_with(result) if latest_scan is not None else result
         except queue.Empty:
             pass
         return latest_scan
 
-    def force_scan(self):
-        """Force process to wake and do an immediate scan"""
+    def close_shared_memory(self):
+        """
+        Release the shared memory used for results
+        Should be called once the process has exited
+        :return:
+        """
+        if self.__shared_buffer is not None:
+            self.__shared_buffer.close()
+
+    def force_scan(self, names: Optional[Iterable[str]] = None):
+        """
+        Force process to wake and do an immediate scan
+        :param names: names of the root files to rescan, None to rescan everything
+        :return:
+        """
+        self.__request_queue.put(list(names) if names is not None else None)
         self.__wake_event.set()
@@ -0,0 +1,137 @@
+# Copyright 2017, Inderpreet Singh, All rights reserved.
+
+import os
+import struct
+from multiprocessing import resource_tracker, shared_memory
+from typing import Dict, List, Optional, Tuple
+
+
+class SharedScanBuffer:
+    """
+    Double-buffered shared memory for passing encoded scan results from a
+    scanner process to its owner
+
+    The writer alternates between two segments, so the reader can still copy
+    out the previous result while the next one is being written. Each segment
+    starts with a header holding a sequence number, which is cleared while the
+    segment is written (a seqlock). A reader that falls a whole cycle behind
+    sees a different sequence number and gets nothing; by then a newer result
+    has already been written.
+
+    Segments are grown as needed, but only if /dev/shm has the space for them,
+    since running out of space there crashes the writer with a SIGBUS.
+
+    Note: segments are not left to the multiprocessing resource tracker, which
+          would unlink them when either side exits. The writer unlinks the
+          segments it replaces, and close() on either side unlinks the rest.
+    """
+    Descriptor = Tuple[str, int]  # segment name, sequence number
+
+    __NUM_SLOTS = 2
+    __HEADER = struct.Struct("<QQ")  # sequence number, data size
+    __MIN_SEGMENT_SIZE = 1024 * 1024
+    __SHM_PATH = "/dev/shm"
+
+    def __init__(self):
+        # Writer state
+        self.__segments = [None] * SharedScanBuffer.__NUM_SLOTS  # type: List[Optional[shared_memory.SharedMemory]]
+        self.__sequence = 0
+        # Reader state
+        self.__attached = dict()  # type: Dict[str, shared_memory.SharedMemory]
+
+    def write(self, data: bytes) -> Optional[Descriptor]:
+        """
+        Write the data into the next segment
+        Returns None if there's no space for it in shared memory
+        :param data:
+        :return: descriptor to pass to read()
+        """
+        self.__sequence += 1
+        slot = self.__sequence % SharedScanBuffer.__NUM_SLOTS
+        header_size = SharedScanBuffer.__HEADER.size
+        segment = self.__segments[slot]
+        if segment is None or segment.size < header_size + len(data):
+            if segment is not None:
+                SharedScanBuffer.__unlink(segment)
+                self.__segments[slot] = None
+            # Leave some room to grow
+            size = max(SharedScanBuffer.__MIN_SEGMENT_SIZE, (header_size + len(data)) * 5 // 4)
+            if not SharedScanBuffer.__has_space(size):
+                return None
+            segment = shared_memory.SharedMemory(create=True, size=size)
+            SharedScanBuffer.__untrack(segment)
+            self.__segments[slot] = segment
+        buf = segment.buf
+        SharedScanBuffer.__HEADER.pack_into(buf, 0, 0, 0)
+        buf[header_size:header_size + len(data)] = data
+        SharedScanBuffer.__HEADER.pack_into(buf, 0, self.__sequence, len(data))
+        return segment.name, self.__sequence
+
+    def read(self, descriptor: Descriptor) -> Optional[bytes]:
+        """
+        Copy out the data written with the given descriptor
+        Returns None if it was overwritten or is gone
+        :param descriptor:
+        :return:
+        """
+        name, sequence = descriptor
+        segment = self.__attached.get(name)
+        if segment is None:
+            try:
+                segment = shared_memory.SharedMemory(name=name)
+            except FileNotFoundError:
+                return None
+            SharedScanBuffer.__untrack(segment)
+            self.__attached[name] = segment
+            # Segments that were replaced by the writer won't be used again
+            while len(self.__attached) > SharedScanBuffer.__NUM_SLOTS:
+                old_name = next(iter(self.__attached))
+                self.__attached.pop(old_name).close()
+        buf = segment.buf
+        header_size = SharedScanBuffer.__HEADER.size
+        sequence_before, size = SharedScanBuffer.__HEADER.unpack_from(buf, 0)
+        if sequence_before != sequence:
+            return None
+        data = bytes(buf[header_size:header_size + size])
+        sequence_after, _ = SharedScanBuffer.__HEADER.unpack_from(buf, 0)
+        if sequence_after != sequence:
+            return None
+        return data
+
+    def close(self):
+        """
+        Release and unlink all the segments known to this side
+        :return:
+        """
+        for segment in self.__segments:
+            if segment is not None:
+                SharedScanBuffer.__unlink(segment)
+        self.__segments = [None] * SharedScanBuffer.__NUM_SLOTS
+        for segment in self.__attached.values():
+            SharedScanBuffer.__unlink(segment)
+        self.__attached.clear()
+
+    @staticmethod
+    def __has_space(size: int) -> bool:
+        try:
+            stat = os.statvfs(SharedScanBuffer.__SHM_PATH)
+        except OSError:
+            # Not a tmpfs backed platform, nothing to check
+            return True
+        return stat.f_bavail * stat.f_frsize >= size
+
+    @staticmethod
+    def __untrack(segment: shared_memory.SharedMemory):
+        # noinspection PyProtectedMember
+        resource_tracker.unregister(segment._name, "shared_memory")
+
+    @staticmethod
+    def __unlink(segment: shared_memory.SharedMemory):
+        segment.close()
+        try:
+            # Unlink through the os, SharedMemory.unlink() would also
+            # unregister the segment from the resource tracker
+            # noinspection PyProtectedMember
+            shared_memory._posixshmem.shm_unlink(segment._name)
+        except FileNotFoundError:
+            pass
@@ -1,7 +1,8 @@
 # Copyright 2017, Inderpreet Singh, All rights reserved.
 
 import logging
-from typing import List, Optional, Tuple
+import multiprocessing.synchronize
+from typing import Iterable, List, Optional, Tuple
 
 from common import Context, MultiprocessingLogger
 from .scan import ScannerProcess, ScannerResult, ActiveScanner, LocalScanner, RemoteScanner
@@ -26,13 +27,15 @@ class ScanManager:
 
     def __init__(self,
                  context: Context,
-                 mp_logger: MultiprocessingLogger):
+                 mp_logger: MultiprocessingLogger,
+                 result_event: Optional[multiprocessing.synchronize.Event] = None):
         """
         Create the scan manager with all scanner processes.
 
         Args:
             context: Application context with config
             mp_logger: Multiprocessing logger for child processes
+            result_event: Event set by the scanner processes whenever they publish a result
         """
         self.__context = context
         self.logger = context.logger.getChild("ScanManager")
@@ -44,7 +47,9 @@ class ScanManager:
         self.__active_scanner = ActiveScanner(context.config.lftp.local_path)
         self.__local_scanner = LocalScanner(
             local_path=context.config.lftp.local_path,
-            use_temp_file=context.config.lftp.use_temp_file
+            use_temp_file=context.config.lftp.use_temp_file,
+            use_inotify=context.config.controller.use_local_inotify,
+            num_scan_threads=context.config.controller.num_local_scan_threads
         )
         self.__remote_scanner = RemoteScanner(
             remote_address=context.config.lftp.remote_address,
@@ -53,7 +58,10 @@ class ScanManager:
             remote_port=context.config.lftp.remote_port,
             remote_path_to_scan=context.config.lftp.remote_path,
             local_path_to_scan_script=context.args.local_path_to_scanfs,
-            remote_path_to_scan_script=context.config.lftp.remote_path_to_scan_script
+            remote_path_to_scan_script=context.config.lftp.remote_path_to_scan_script,
+            num_scan_threads=context.config.controller.num_remote_scan_threads,
+            use_agent=context.config.controller.use_remote_scan_agent,
+            use_watch=context.config.controller.use_remote_inotify
         )
 
         # Create the scanner processes
@@ -65,10 +73,14 @@ class ScanManager:
         self.__local_scan_process = ScannerProcess(
             scanner=self.__local_scanner,
             interval_in_ms=context.config.controller.interval_ms_local_scan,
+            publish_deltas=True,
+            use_shared_memory=context.config.controller.use_shared_memory_scan_results
         )
         self.__remote_scan_process = ScannerProcess(
             scanner=self.__remote_scanner,
             interval_in_ms=context.config.controller.interval_ms_remote_scan,
+            publish_deltas=True,
+            use_shared_memory=context.config.controller.use_shared_memory_scan_results
         )
 
         # Setup multiprocess logging
@@ -76,6 +88,11 @@ class ScanManager:
         self.__local_scan_process.set_multiprocessing_logger(mp_logger)
         self.__remote_scan_process.set_multiprocessing_logger(mp_logger)
 
+        if result_event is not None:
+            self.__active_scan_process.set_result_event(result_event)
+            self.__local_scan_process.set_result_event(result_event)
+            self.__remote_scan_process.set_result_event(result_event)
+
         self.__started = False
 
     def start(self):
@@ -106,6 +123,8 @@ class ScanManager:
         self.__active_scan_process.join()
         self.__local_scan_process.join()
         self.__remote_scan_process.join()
+        self.__local_scan_process.close_shared_memory()
+        self.__remote_scan_process.close_shared_memory()
         self.__started = False
         self.logger.debug("Scanner processes stopped")
 
@@ -152,20 +171,28 @@ class ScanManager:
         self.__local_scan_process.propagate_exception()
         self.__remote_scan_process.propagate_exception()
 
-    def force_local_scan(self):
+    def force_local_scan(self, file_names: Optional[Iterable[str]] = None):
         """
         Force an immediate local scan.
 
         Use after local file operations (e.g., deletion) to quickly
         update the model with the new filesystem state.
+
+        Args:
+            file_names: Names of the root files to rescan, or None to rescan everything.
+                A targeted scan publishes a partial result.
         """
-        self.__local_scan_process.force_scan()
+        self.__local_scan_process.force_scan(file_names)
 
-    def force_remote_scan(self):
+    def force_remote_scan(self, file_names: Optional[Iterable[str]] = None):
         """
         Force an immediate remote scan.
 
         Use after remote file operations (e.g., deletion) to quickly
         update the model with the new filesystem state.
+
+        Args:
+            file_names: Names of the root files to rescan, or None to rescan everything.
+                A targeted scan publishes a partial result.
         """
-        self.__remote_scan_process.force_scan()
+        self.__remote_scan_process.force_scan(file_names)
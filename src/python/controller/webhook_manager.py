@@ -1,7 +1,7 @@
 # Copyright 2017, Inderpreet Singh, All rights reserved.
 
 from queue import Queue
-from typing import Dict, List, Set
+from typing import Callable, Dict, List, Optional, Set
 
 from common import Context
 
@@ -24,6 +24,17 @@ class WebhookManager:
         self.__context = context
         self.logger = context.logger.getChild("WebhookManager")
         self.__import_queue = Queue()
+        self.__import_callback = None  # type: Optional[Callable[[], None]]
+
+    def set_import_callback(self, callback: Callable[[], None]):
+        """
+        Set a callback that is called after each enqueued import, e.g. to
+        wake the thread that calls process()
+
+        Args:
+            callback: Called with no arguments, from the web server thread
+        """
+        self.__import_callback = callback
 
     def enqueue_import(self, source: str, file_name: str):
         """
@@ -36,6 +47,8 @@ class WebhookManager:
         """
         self.__import_queue.put((source, file_name))
         self.logger.info("{} webhook import enqueued: '{}'".format(source, file_name))
+        if self.__import_callback is not None:
+            self.__import_callback()
 
     def process(self, name_to_root: Dict[str, str]) -> List[str]:
         """
@@ -1,6 +1,6 @@
 # Copyright 2017, Inderpreet Singh, All rights reserved.
 
-from .lftp import Lftp, LftpError
+from .lftp import Lftp, LftpError, LftpStatusMetrics
 from .job_status import LftpJobStatus
 from .job_status_parser import (
     LftpJobStatusParser,
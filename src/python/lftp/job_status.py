@@ -2,7 +2,7 @@
 
 from collections import namedtuple
 from enum import Enum
-from typing import List, Tuple
+from typing import List, Optional, Tuple
 
 
 class LftpJobStatus:
@@ -41,7 +41,7 @@ class LftpJobStatus:
         self.__flags = flags
         self.__total_transfer_state = LftpJobStatus.TransferState(None, None, None, None, None)
         # dict of active file transfer states, maps filename to their transfer state
-        # there's no hierarchical info for now
+        # the filename is the path of the file relative to the job's root
         self.__active_files_state = {}
 
     @property
@@ -78,6 +78,14 @@ class LftpJobStatus:
         """
         return list(zip(self.__active_files_state.keys(), self.__active_files_state.values()))
 
+    def get_active_file_transfer_state(self, filename: str) -> Optional[TransferState]:
+        """
+        Returns the transfer state of the given file, None if it's not active
+        :param filename: path of the file relative to the job's root
+        :return:
+        """
+        return self.__active_files_state.get(filename, None)
+
     def clear_active_files(self):
         """
         Clears all active file transfer states.
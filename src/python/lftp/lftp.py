@@ -2,8 +2,10 @@
 
 import logging
 import re
+import time
+from dataclasses import dataclass, replace
 from functools import wraps
-from typing import Callable, Union, List, Optional
+from typing import Callable, Dict, Iterable, Union, List, Optional, Tuple
 
 # 3rd party libs
 import pexpect
@@ -24,6 +26,18 @@ class LftpError(AppError):
     pass
 
 
+@dataclass
+class LftpStatusMetrics:
+    """Counters and timings of the status() calls of an Lftp instance"""
+    num_polls: int = 0
+    # Polls whose output was identical to the previous one, so parsing was skipped
+    num_unchanged: int = 0
+    last_poll_latency_in_secs: float = 0.0
+    total_poll_latency_in_secs: float = 0.0
+    last_parse_time_in_secs: float = 0.0
+    total_parse_time_in_secs: float = 0.0
+
+
 class Lftp:
     """
     Lftp command utility
@@ -42,6 +56,9 @@ class Lftp:
     __SET_SFTP_AUTO_CONFIRM = "sftp:auto-confirm"
     __SET_SFTP_CONNECT_PROGRAM = "sftp:connect-program"
 
+    # Longest line of ';'-separated commands sent in one exchange by the batch methods
+    __MAX_BATCH_COMMAND_LINE_LENGTH = 2048
+
     def __init__(self,
                  address: str,
                  port: int,
@@ -57,6 +74,11 @@ class Lftp:
         self.__job_status_parser = LftpJobStatusParser()
         self.__timeout = 180  # in seconds
         self.__consecutive_status_errors = 0
+        # Output and statuses of the last status() call, to skip parsing identical output
+        self.__last_status_output = None
+        self.__last_statuses = []
+        self.__status_version = 0
+        self.__status_metrics = LftpStatusMetrics()
 
         self.__log_command_output = False
         self.__pending_error = None
@@ -162,6 +184,26 @@ class Lftp:
                 self.__pending_error = error_out
         return out
 
+    def __run_commands(self, commands: List[str]):
+        """
+        Run the commands in order, in as few exchanges as possible
+        Commands are joined into ';'-separated command lines, each of which is
+        a single round trip to the lftp prompt
+        :param commands:
+        :return:
+        """
+        line = []
+        line_length = 0
+        for command in commands:
+            if line and line_length + len(command) > Lftp.__MAX_BATCH_COMMAND_LINE_LENGTH:
+                self.__run_command("; ".join(line))
+                line = []
+                line_length = 0
+            line.append(command)
+            line_length += len(command) + 2
+        if line:
+            self.__run_command("; ".join(line))
+
     @staticmethod
     def __detect_errors_from_output(out: str) -> bool:
         errors = [
@@ -312,23 +354,57 @@ class Lftp:
     def sftp_connect_program(self, program: str):
         self.__set(Lftp.__SET_SFTP_CONNECT_PROGRAM, program)
 
+    @property
+    def status_version(self) -> int:
+        """
+        Incremented whenever status() parses a new output
+        Two status() results with the same status_version are identical.
+        """
+        return self.__status_version
+
+    @property
+    def status_metrics(self) -> LftpStatusMetrics:
+        """Copy of the poll and parse metrics of status()"""
+        return replace(self.__status_metrics)
+
     def status(self) -> List[LftpJobStatus]:
         """
         Return a status list of queued and running jobs
+        If the output of lftp is identical to that of the previous call, the previous
+        statuses are returned without parsing again, and status_version is unchanged.
         :return:
         """
+        metrics = self.__status_metrics
+        start_time = time.perf_counter()
         out = self.__run_command("jobs -v")
+        metrics.num_polls += 1
+        metrics.last_poll_latency_in_secs = time.perf_counter() - start_time
+        metrics.total_poll_latency_in_secs += metrics.last_poll_latency_in_secs
+
+        if out == self.__last_status_output:
+            metrics.num_unchanged += 1
+            return list(self.__last_statuses)
+
+        start_time = time.perf_counter()
         try:
             statuses = self.__job_status_parser.parse(out)
             self.__consecutive_status_errors = 0
+            self.__last_status_output = out
         except LftpJobStatusParserError:
             self.__consecutive_status_errors += 1
+            # Parse the output again next time, it may have been a transient error
+            self.__last_status_output = None
             if self.__consecutive_status_errors <= MAX_CONSECUTIVE_STATUS_ERRORS:
                 self.logger.warning(f"Ignoring status error (count={self.__consecutive_status_errors})")
                 statuses = []
             else:
                 raise
-        return statuses
+        finally:
+            metrics.last_parse_time_in_secs = time.perf_counter() - start_time
+            metrics.total_parse_time_in_secs += metrics.last_parse_time_in_secs
+        self.__last_statuses = statuses
+        self.__status_version += 1
+        return list(statuses)
 
     def queue(self, name: str, is_dir: bool):
         """
@@ -340,11 +416,23 @@ class Lftp:
         :param is_dir: true if folder, false if file
         :return:
         """
+        self.__run_command(self.__queue_command(name, is_dir))
+
+    def queue_many(self, files: Iterable[Tuple[str, bool]]):
+        """
+        Queues a job for download for each of the files, see queue()
+        The jobs are queued in order, with as few lftp round trips as possible
+        :param files: (name, is_dir) of each file or folder to download
+        :return:
+        """
+        self.__run_commands([self.__queue_command(name, is_dir) for name, is_dir in files])
+
+    def __queue_command(self, name: str, is_dir: bool) -> str:
         # Escape single and double quotes in any string used in queue command
         def escape(s: str) -> str:
             return s.replace("'", "\\'").replace("\"", "\\\"")
 
-        command = " ".join([
+        return " ".join([
             "queue",
             "'",
             "pget" if not is_dir else "mirror",
@@ -355,7 +443,6 @@ class Lftp:
             "\"{local_dir}/\"".format(local_dir=escape(self.__base_local_dir_path)),
             "'"
         ])
-        self.__run_command(command)
 
     def kill(self, name: str) -> bool:
         """
@@ -375,15 +462,45 @@ class Lftp:
         # Note: there's a chance that job ids change between when we called status
         #       and when we execute the kill command
         #       in this case the wrong job may be killed, there's nothing we can do about it
+        self.__run_command(self.__kill_command(job_to_kill))
+        return True
+
+    def kill_many(self, names: Iterable[str]) -> Dict[str, bool]:
+        """
+        Kill the queued or running jobs of all the given names, see kill()
+        Job ids are looked up in a single status, and all the jobs are killed
+        with as few lftp round trips as possible
+        :param names:
+        :return: for each name, True if its job was found, False otherwise
+        """
+        statuses = dict()
+        for status in self.status():
+            # Same as kill(), the first job of a name is the one killed
+            statuses.setdefault(status.name, status)
+        jobs_to_kill = []
+        found = dict()
+        for name in names:
+            found[name] = name in statuses
+            if found[name]:
+                jobs_to_kill.append(statuses[name])
+            else:
+                self.logger.debug("Kill failed to find job '{}'".format(name))
+        # Queued jobs are deleted by their position in the queue, so delete them
+        # from the back to keep the positions of the rest valid, and before any
+        # running job is killed, which could start the job at the front
+        jobs_to_kill.sort(key=lambda j: (j.state != LftpJobStatus.State.QUEUED, -j.id))
+        self.__run_commands([self.__kill_command(job) for job in jobs_to_kill])
+        return found
+
+    def __kill_command(self, job_to_kill: LftpJobStatus) -> str:
         if job_to_kill.state == LftpJobStatus.State.RUNNING:
-            self.logger.debug("Killing running job '{}'...".format(name))
-            self.__run_command("kill {}".format(job_to_kill.id))
+            self.logger.debug("Killing running job '{}'...".format(job_to_kill.name))
+            return "kill {}".format(job_to_kill.id)
         elif job_to_kill.state == LftpJobStatus.State.QUEUED:
-            self.logger.debug("Killing queued job '{}'...".format(name))
-            self.__run_command("queue --delete {}".format(job_to_kill.id))
+            self.logger.debug("Killing queued job '{}'...".format(job_to_kill.name))
+            return "queue --delete {}".format(job_to_kill.id)
         else:
             raise NotImplementedError("Unsupported state {}".format(str(job_to_kill.state)))
-        return True
 
     def kill_all(self):
         """
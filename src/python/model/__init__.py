@@ -1,5 +1,5 @@
 # Copyright 2017, Inderpreet Singh, All rights reserved.
 
-from .model import Model, IModelListener, ModelError
+from .model import Model, ModelSnapshot, IModelListener, ModelError
 from .file import ModelFile
 from .diff import ModelDiff, ModelDiffUtil
@@ -1,7 +1,7 @@
 # Copyright 2017, Inderpreet Singh, All rights reserved.
 
 from enum import Enum
-from typing import List, Optional
+from typing import List, Optional, Tuple
 import copy
 
 # my libs
@@ -12,19 +12,28 @@ from .model import Model
 class ModelDiff:
     """
     Represents a single change in the model
+
+    An UPDATED change also describes which fields changed, see changed_fields
     """
     class Change(Enum):
         ADDED = 0
         REMOVED = 1
         UPDATED = 2
 
+    # Pseudo-field of a changed file whose set of children changed
+    FIELD_CHILDREN = "children"
+
     def __init__(self, change: Change, old_file: Optional[ModelFile], new_file: Optional[ModelFile]):
         self.__change = change
         self.__old_file = old_file
         self.__new_file = new_file
+        self.__changed_fields = None  # computed on first access
 
     def __eq__(self, other):
-        return self.__dict__ == other.__dict__
+        # changed_fields is derived from the files
+        return self.__change == other.__change and \
+            self.__old_file == other.__old_file and \
+            self.__new_file == other.__new_file
 
     def __repr__(self):
         return str(self.__dict__)
@@ -41,8 +50,68 @@ class ModelDiff:
     def new_file(self) -> Optional[ModelFile]:
         return self.__new_file
 
+    @property
+    def changed_fields(self) -> List[Tuple[str, str]]:
+        """
+        For an UPDATED change, the (full path, field name) of every field that
+        changed in the file or any of its descendants. Empty for other changes.
+        """
+        if self.__changed_fields is None:
+            if self.__change == ModelDiff.Change.UPDATED:
+                self.__changed_fields = ModelDiffUtil.diff_fields(self.__old_file, self.__new_file)
+            else:
+                self.__changed_fields = []
+        return self.__changed_fields
+
 
 class ModelDiffUtil:
+    @staticmethod
+    def diff_fields(file_before: ModelFile, file_after: ModelFile) -> List[Tuple[str, str]]:
+        """
+        Compare two versions of a file and list the fields that changed
+        Fields are listed as (full path, field name) pairs, see diff_changed_files
+        :param file_before:
+        :param file_after:
+        :return:
+        """
+        return [
+            (changed_file.full_path, field)
+            for changed_file, fields in ModelDiffUtil.diff_changed_files(file_before, file_after)
+            for field in fields
+        ]
+
+    @staticmethod
+    def diff_changed_files(file_before: ModelFile,
+                           file_after: ModelFile) -> List[Tuple[ModelFile, List[str]]]:
+        """
+        Compare two versions of a file and list the files in it that changed
+        Each changed file, from the after version, is listed with the names of its
+        changed fields, parents before children. If the children of a file were added
+        or removed, its ModelDiff.FIELD_CHILDREN is listed instead of the fields of
+        its children. Subtrees with the same fingerprint are skipped without being walked.
+        :param file_before:
+        :param file_after:
+        :return:
+        """
+        changed_files = []
+        stack = [(file_before, file_after)]
+        while stack:
+            before, after = stack.pop()
+            if before is after or \
+                    (before.is_frozen and after.is_frozen and before.fingerprint == after.fingerprint):
+                continue
+            fields = before.changed_fields(after)
+            children_before = {child.name: child for child in before.get_children()}
+            children_after = after.get_children()
+            if children_before.keys() != {child.name for child in children_after}:
+                fields.append(ModelDiff.FIELD_CHILDREN)
+            else:
+                for child_after in reversed(children_after):
+                    stack.append((children_before[child_after.name], child_after))
+            if fields:
+                changed_files.append((after, fields))
+        return changed_files
+
     @staticmethod
     def diff_models(model_before: Model, model_after: Model) -> List[ModelDiff]:
         """
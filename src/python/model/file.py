@@ -3,8 +3,10 @@
 from datetime import datetime
 from enum import Enum
 from typing import Optional, List
-import copy
 import os
+import sys
+import time
+import weakref
 
 
 class ModelFile:
@@ -20,6 +22,18 @@ class ModelFile:
     Thread-safety: ModelFile objects become immutable once frozen via freeze().
     After freezing, all setter operations will raise an error. This allows
     safe sharing of file references across threads without deep copying.
+
+    Frozen files also have a structural hash (fingerprint) over their fields
+    and the fingerprints of their children. Two frozen files with different
+    fingerprints are unequal without comparing their fields. As fingerprints
+    can collide, frozen files with the same fingerprint are still compared
+    field by field.
+
+    Models hold hundreds of thousands of these, twice over while the old and
+    new models are diffed, so the representation is kept compact: attributes
+    live in slots, names are interned, timestamps are stored as epoch seconds
+    and only turned into datetimes on access, and children become a tuple
+    once frozen.
     """
     class State(Enum):
         DEFAULT = 0
@@ -35,8 +49,35 @@ class ModelFile:
         IMPORTED = 1                # Imported by Sonarr/Radarr
         WAITING_FOR_IMPORT = 2      # Detected by *arr, awaiting import
 
+    __slots__ = (
+        "__name",
+        "__is_dir",
+        "__state",
+        "__remote_size",
+        "__local_size",
+        "__transferred_size",
+        "__downloading_speed",
+        "__eta",
+        "__is_extractable",
+        "__local_created_timestamp",
+        "__local_modified_timestamp",
+        "__remote_created_timestamp",
+        "__remote_modified_timestamp",
+        "__update_timestamp",
+        "__children",
+        "__parent",
+        "__frozen",
+        "__import_status",
+        "__fingerprint",
+        "__full_path",
+        "__weakref__"
+    )
+
+    # Slots that are derived from the others and are not pickled
+    __DERIVED_SLOTS = ("_ModelFile__fingerprint", "_ModelFile__full_path")
+
     def __init__(self, name: str, is_dir: bool):
-        self.__name = name  # file or folder name
+        self.__name = sys.intern(name)  # file or folder name
         self.__is_dir = is_dir  # True if this is a dir, False if file
         self.__state = ModelFile.State.DEFAULT  # status
         self.__remote_size = None  # remote size in bytes, None if file does not exist
@@ -45,17 +86,20 @@ class ModelFile:
         self.__downloading_speed = None  # in bytes / sec, None if not downloading
         self.__eta = None  # est. time remaining in seconds, None if not available
         self.__is_extractable = False  # whether file is an archive or dir contains archives
+        # timestamps are in epoch seconds, None if not available
         self.__local_created_timestamp = None
         self.__local_modified_timestamp = None
         self.__remote_created_timestamp = None
         self.__remote_modified_timestamp = None
         # timestamp of the latest update
         # Note: timestamp is not part of equality operator
-        self.__update_timestamp = datetime.now()
-        self.__children = []  # children files
-        self.__parent = None  # direct predecessor
+        self.__update_timestamp = time.time()
+        self.__children = ()  # children files, a list once a child is added
+        self.__parent = None  # weak reference to the direct predecessor
         self.__frozen = False  # immutability flag
         self.__import_status = ModelFile.ImportStatus.NONE
+        self.__fingerprint = None  # cached structural hash, only for frozen files
+        self.__full_path = None  # cached full path, only for frozen files
 
     @property
     def is_frozen(self) -> bool:
@@ -71,6 +115,7 @@ class ModelFile:
         if self.__frozen:
             return  # Already frozen
         self.__frozen = True
+        self.__children = tuple(self.__children)
         # Recursively freeze all children
         for child in self.__children:
             child.freeze()
@@ -79,29 +124,111 @@ class ModelFile:
         """Raises an error if the file is frozen"""
         if self.__frozen:
             raise ValueError("Cannot modify frozen ModelFile '{}'".format(self.__name))
+        # About to be modified, e.g. an unfrozen copy of a frozen file
+        self.__fingerprint = None
 
-    def __eq__(self, other):
+    @property
+    def fingerprint(self) -> int:
+        """
+        Structural hash of this file and all its children
+        Covers the same fields as equality. Only cached once the file is frozen.
+        """
+        if self.__fingerprint is not None:
+            return self.__fingerprint
+        fingerprint = hash((
+            self.__compared_fields(),
+            # Children are compared by name, not by order
+            tuple(sorted(child.fingerprint for child in self.__children))
+        ))
+        if self.__frozen:
+            self.__fingerprint = fingerprint
+        return fingerprint
+
+    # Names of the fields returned by __compared_fields(), in the same order
+    COMPARED_FIELDS = (
+        "name",
+        "is_dir",
+        "state",
+        "remote_size",
+        "local_size",
+        "transferred_size",
+        "downloading_speed",
+        "eta",
+        "is_extractable",
+        "local_created_timestamp",
+        "local_modified_timestamp",
+        "remote_created_timestamp",
+        "remote_modified_timestamp",
+        "import_status"
+    )
+
+    def __compared_fields(self) -> tuple:
         # disregard in comparisons:
         #   timestamp: we don't care about it
         #   parent: semantics are to check self and children only
-        #   children: check these manually for easier debugging
+        #   children: these are compared separately
         #   frozen: immutability flag doesn't affect equality
-        ka = set(self.__dict__).difference({
-            "_ModelFile__update_timestamp",
-            "_ModelFile__parent",
-            "_ModelFile__children",
-            "_ModelFile__frozen"
-        })
-        kb = set(other.__dict__).difference({
-            "_ModelFile__update_timestamp",
-            "_ModelFile__parent",
-            "_ModelFile__children",
-            "_ModelFile__frozen"
-        })
-        # Check self properties
-        if ka != kb:
+        #   fingerprint, full path: derived from the other fields
+        return (
+            self.__name,
+            self.__is_dir,
+            self.__state,
+            self.__remote_size,
+            self.__local_size,
+            self.__transferred_size,
+            self.__downloading_speed,
+            self.__eta,
+            self.__is_extractable,
+            self.__local_created_timestamp,
+            self.__local_modified_timestamp,
+            self.__remote_created_timestamp,
+            self.__remote_modified_timestamp,
+            self.__import_status
+        )
+
+    def changed_fields(self, other: "ModelFile") -> List[str]:
+        """
+        Names of the fields, out of COMPARED_FIELDS, that differ from other
+        Children are not compared
+        """
+        return [
+            field
+            for field, mine, others in zip(ModelFile.COMPARED_FIELDS,
+                                           self.__compared_fields(),
+                                           other.__compared_fields())
+            if mine != others
+        ]
+
+    def __getstate__(self):
+        # The fingerprint is built from str hashes, which are salted per process
+        state = {
+            slot: getattr(self, slot)
+            for slot in ModelFile.__mangled_slots()
+            if slot not in ModelFile.__DERIVED_SLOTS
+        }
+        state["_ModelFile__parent"] = self.parent
+        return state
+
+    def __setstate__(self, state):
+        for slot, value in state.items():
+            setattr(self, slot, value)
+        self.__name = sys.intern(self.__name)
+        self.__parent = weakref.ref(self.__parent) if self.__parent is not None else None
+        self.__fingerprint = None
+        self.__full_path = None
+
+    @staticmethod
+    def __mangled_slots():
+        return ("_ModelFile" + slot for slot in ModelFile.__slots__ if slot != "__weakref__")
+
+    def __eq__(self, other):
+        if self is other:
+            return True
+        if self.__frozen and other.__frozen and self.fingerprint != other.fingerprint:
             return False
-        if not all(self.__dict__[k] == other.__dict__[k] for k in ka):
+
+        # Check self properties
+        if self.__compared_fields() != other.__compared_fields():
             return False
 
         # Check children's properties
@@ -118,7 +245,7 @@ class ModelFile:
         return True
 
     def __repr__(self):
-        return str(self.__dict__)
+        return str({slot: getattr(self, slot) for slot in ModelFile.__mangled_slots()})
 
     @property
     def name(self) -> str: return self.__name
@@ -197,14 +324,14 @@ class ModelFile:
             raise TypeError
 
     @property
-    def update_timestamp(self) -> datetime: return self.__update_timestamp
+    def update_timestamp(self) -> datetime: return datetime.fromtimestamp(self.__update_timestamp)
 
     @update_timestamp.setter
     def update_timestamp(self, update_timestamp: datetime):
         self._check_frozen()
         if type(update_timestamp) != datetime:
             raise TypeError
-        self.__update_timestamp = update_timestamp
+        self.__update_timestamp = update_timestamp.timestamp()
 
     @property
     def eta(self) -> Optional[int]: return self.__eta
@@ -241,51 +368,77 @@ class ModelFile:
         self.__import_status = import_status
 
     @property
-    def local_created_timestamp(self) -> datetime: return self.__local_created_timestamp
+    def local_created_timestamp(self) -> Optional[datetime]:
+        return datetime.fromtimestamp(self.__local_created_timestamp) if self.__local_created_timestamp is not None else None
 
     @local_created_timestamp.setter
     def local_created_timestamp(self, local_created_timestamp: datetime):
         self._check_frozen()
         if type(local_created_timestamp) != datetime:
             raise TypeError
-        self.__local_created_timestamp = local_created_timestamp
+        self.__local_created_timestamp = local_created_timestamp.timestamp()
 
     @property
-    def local_modified_timestamp(self) -> datetime: return self.__local_modified_timestamp
+    def local_modified_timestamp(self) -> Optional[datetime]:
+        return datetime.fromtimestamp(self.__local_modified_timestamp) if self.__local_modified_timestamp is not None else None
 
     @local_modified_timestamp.setter
     def local_modified_timestamp(self, local_modified_timestamp: datetime):
         self._check_frozen()
         if type(local_modified_timestamp) != datetime:
             raise TypeError
-        self.__local_modified_timestamp = local_modified_timestamp
+        self.__local_modified_timestamp = local_modified_timestamp.timestamp()
 
     @property
-    def remote_created_timestamp(self) -> datetime: return self.__remote_created_timestamp
+    def remote_created_timestamp(self) -> Optional[datetime]:
+        return datetime.fromtimestamp(self.__remote_created_timestamp) if self.__remote_created_timestamp is not None else None
 
     @remote_created_timestamp.setter
     def remote_created_timestamp(self, remote_created_timestamp: datetime):
         self._check_frozen()
         if type(remote_created_timestamp) != datetime:
             raise TypeError
-        self.__remote_created_timestamp = remote_created_timestamp
+        self.__remote_created_timestamp = remote_created_timestamp.timestamp()
 
     @property
-    def remote_modified_timestamp(self) -> datetime: return self.__remote_modified_timestamp
+    def remote_modified_timestamp(self) -> Optional[datetime]:
+        return datetime.fromtimestamp(self.__remote_modified_timestamp) if self.__remote_modified_timestamp is not None else None
 
     @remote_modified_timestamp.setter
     def remote_modified_timestamp(self, remote_modified_timestamp: datetime):
         self._check_frozen()
         if type(remote_modified_timestamp) != datetime:
             raise TypeError
-        self.__remote_modified_timestamp = remote_modified_timestamp
+        self.__remote_modified_timestamp = remote_modified_timestamp.timestamp()
+
+    def set_epoch_timestamps(self,
+                             local_created: Optional[float],
+                             local_modified: Optional[float],
+                             remote_created: Optional[float],
+                             remote_modified: Optional[float]):
+        """
+        Set all the created and modified timestamps from epoch seconds
+        This avoids a round trip through datetime when copying them from SystemFiles
+        """
+        self._check_frozen()
+        self.__local_created_timestamp = local_created
+        self.__local_modified_timestamp = local_modified
+        self.__remote_created_timestamp = remote_created
+        self.__remote_modified_timestamp = remote_modified
 
     @property
     def full_path(self) -> str:
-        """Full path including all predecessors"""
-        if self.__parent:
-            return os.path.join(self.__parent.full_path, self.name)
-        return self.name
+        """
+        Full path including all predecessors
+        Only cached once frozen, until then the file can still be moved to another parent
+        """
+        if self.__full_path is not None:
+            return self.__full_path
+        parent = self.parent
+        full_path = os.path.join(parent.full_path, self.name) if parent else self.name
+        if self.__frozen:
+            self.__full_path = full_path
+        return full_path
 
     def add_child(self, child_file: "ModelFile"):
         self._check_frozen()
@@ -296,12 +449,49 @@ class ModelFile:
             raise ValueError("Cannot add parent as a child")
         if child_file.name in (f.name for f in self.__children):
             raise ValueError("Cannot add child more than once")
+        self.__append_child(child_file)
+
+    def add_shared_child(self, child_file: "ModelFile"):
+        """
+        Add a frozen child that is shared with another tree, e.g. one from a
+        previous build of the same file. This file must have the same full path
+        as the child's parent, and must already be in its own tree.
+        The child is not moved, so older trees that hold it are not affected,
+        and its parent is not this file (see parent). Its full path is cached
+        from this file, so it stays valid once the older trees are gone.
+        """
+        self._check_frozen()
+        if not child_file.is_frozen:
+            raise ValueError("Cannot share a child that is not frozen")
+        if child_file.__parent is None:
+            raise ValueError("Cannot share a child that has no parent")
+        if not self.is_dir:
+            raise TypeError("Cannot add child to a non-directory")
+        if child_file.name in (f.name for f in self.__children):
+            raise ValueError("Cannot add child more than once")
+        self.__append_child(child_file)
+        if child_file.__full_path is None:
+            child_file.__full_path = os.path.join(self.full_path, child_file.name)
+
+    def __append_child(self, child_file: "ModelFile"):
+        # Children may still be the tuple shared with a frozen original of this file
+        if type(self.__children) is tuple:
+            self.__children = list(self.__children)
         self.__children.append(child_file)
-        child_file._ModelFile__parent = self
+        if not child_file.__frozen:
+            # Weak, so that a frozen child shared with a newer tree doesn't keep this tree alive
+            child_file.__parent = weakref.ref(self)
 
     def get_children(self) -> List["ModelFile"]:
-        return copy.copy(self.__children)
+        return list(self.__children)
 
     @property
     def parent(self) -> Optional["ModelFile"]:
-        return self.__parent
+        """
+        The file this file was added to as a child
+        Only a weak reference to the parent is kept, so this is None once the
+        parent is gone. For a child shared by several trees (see add_shared_child()),
+        this is its parent in the tree it was built in, while that tree is alive.
+        Use full_path rather than walking up the parents of a shared child.
+        """
+        return self.__parent() if self.__parent is not None else None
@@ -1,9 +1,12 @@
 # Copyright 2017, Inderpreet Singh, All rights reserved.
 
+import collections
 import logging
 import threading
+import uuid
 from abc import ABC, abstractmethod
-from typing import Set
+from types import MappingProxyType
+from typing import Set, List, Tuple, Optional, Dict
 
 # my libs
 from common import AppError
@@ -49,34 +52,205 @@ class IModelListener(ABC):
         """
         pass
 
+    def files_changed(self, changes: List[Tuple[Optional[ModelFile], Optional[ModelFile]]]):
+        """
+        Event indicating that a batch of changes was made to the model, see Model.apply_batch()
+        Each change is an (old file, new file) pair, with None as the old file of an added
+        file and as the new file of a removed file.
+        By default this calls the per-file events for each change in order. Listeners
+        that can consume the whole batch at once should override this.
+        :param changes:
+        :return:
+        """
+        for old_file, new_file in changes:
+            if old_file is None:
+                self.file_added(new_file)
+            elif new_file is None:
+                self.file_removed(old_file)
+            else:
+                self.file_updated(old_file, new_file)
+
+
+class ModelSnapshot:
+    """
+    Immutable view of the model files as of one model version
+    Snapshots are never modified once created, so they can be read from any
+    thread without locking.
+    """
+    __slots__ = ("__journal_id", "__version", "__files")
+
+    def __init__(self, journal_id: str, version: int, files: Dict[str, ModelFile]):
+        """
+        :param journal_id:
+        :param version:
+        :param files: name->file, must not be modified afterwards
+        """
+        self.__journal_id = journal_id
+        self.__version = version
+        self.__files = MappingProxyType(files)
+
+    @property
+    def journal_id(self) -> str:
+        return self.__journal_id
+
+    @property
+    def version(self) -> int:
+        return self.__version
+
+    def get_file(self, name: str) -> ModelFile:
+        if name not in self.__files:
+            raise ModelError("File does not exist in the model")
+        return self.__files[name]
+
+    def get_file_names(self) -> Set[str]:
+        return set(self.__files.keys())
+
+    def get_files(self) -> List[ModelFile]:
+        return list(self.__files.values())
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.__files
+
+    def __len__(self) -> int:
+        return len(self.__files)
+
 
 class Model:
     """
     Represents the entire state of lftp
 
-    Thread-safety: Listener operations are protected by __listeners_lock.
-    The copy-under-lock pattern is used when notifying listeners to prevent
-    race conditions with concurrent add/remove operations.
+    Thread-safety: the model is changed by one writer at a time, and readers
+    never block on it. Every change publishes a new ModelSnapshot; the files
+    dict of a published snapshot is never modified again (copy-on-write), so
+    get_file(), get_file_names() and snapshot can be called from any thread.
+    Publishing a snapshot and copying the listeners to notify happen under
+    __lock, as does adding a listener, so a listener added together with
+    a snapshot (see add_listener_and_get_snapshot()) is notified of exactly
+    the changes after that snapshot.
+
+    Versioning: every add, remove and update increments the model version by
+    exactly one before listeners are notified of it. If journal_size is set,
+    the most recent changes are kept in a bounded journal so that a client that
+    knows the version it last saw can catch up with get_changes_since().
+    Versions are only meaningful together with the journal_id of the model.
     """
-    def __init__(self):
+    def __init__(self, journal_size: int = 0):
         self.logger = logging.getLogger("Model")
-        self.__files = {}  # name->LftpFile
         self.__listeners = []
-        self.__listeners_lock = threading.Lock()
+        self.__lock = threading.Lock()
+        self.__journal_id = uuid.uuid4().hex[:12]
+        # (version, name, old file, new file) of the most recent changes
+        self.__journal = collections.deque(maxlen=journal_size) if journal_size > 0 else None
+        self.__files = {}  # name->LftpFile, shared with the current snapshot
+        self.__snapshot = ModelSnapshot(self.__journal_id, 0, self.__files)
 
     def set_base_logger(self, base_logger: logging.Logger):
         self.logger = base_logger.getChild("Model")
 
-    def add_listener(self, listener: IModelListener):
+    @property
+    def journal_id(self) -> str:
+        """Identifies this model instance, e.g. to tell apart versions from before a restart"""
+        return self.__journal_id
+
+    @property
+    def version(self) -> int:
+        """Number of changes made to the model so far"""
+        return self.__snapshot.version
+
+    @property
+    def snapshot(self) -> ModelSnapshot:
+        """The files of the model as of its current version"""
+        return self.__snapshot
+
+    def get_changes_since(self, version: int) -> Optional[List[Tuple[Optional[ModelFile], Optional[ModelFile]]]]:
         """
-        Add a model listener
+        Returns the changes made after the given version, one per changed file
+        Each change is the (old file, new file) pair of the file at the given version
+        and now, with None for a file that did not exist. Files that were added and
+        then removed again are left out.
+        :param version:
+        :return: None if the journal no longer covers the given version
+        """
+        with self.__lock:
+            return self.__get_changes_since(version)
+
+    def add_listener_and_get_snapshot(self, listener: IModelListener) -> ModelSnapshot:
+        """
+        Add a model listener, and return the snapshot its events start after
+        The listener is notified of every change after the returned snapshot's
+        version, and of none before it.
         :param listener:
         :return:
         """
         self.logger.debug("LftpModel: Adding a listener")
-        with self.__listeners_lock:
+        with self.__lock:
+            if listener not in self.__listeners:
+                self.__listeners.append(listener)
+            return self.__snapshot
+
+    def add_listener_and_get_changes_since(self, listener: IModelListener, version: int) \
+            -> Tuple[ModelSnapshot, Optional[List[Tuple[Optional[ModelFile], Optional[ModelFile]]]]]:
+        """
+        Like add_listener_and_get_snapshot(), but also returns the changes between
+        the given version and the returned snapshot, see get_changes_since()
+        :param listener:
+        :param version:
+        :return: (snapshot, changes)
+        """
+        self.logger.debug("LftpModel: Adding a listener")
+        with self.__lock:
             if listener not in self.__listeners:
                 self.__listeners.append(listener)
+            return self.__snapshot, self.__get_changes_since(version)
+
+    def __get_changes_since(self, version: int) \
+            -> Optional[List[Tuple[Optional[ModelFile], Optional[ModelFile]]]]:
+        current_version = self.__snapshot.version
+        if version == current_version:
+            return []
+        if self.__journal is None or not self.__journal or \
+                version > current_version or version < self.__journal[0][0] - 1:
+            return None
+        changes = collections.OrderedDict()  # name -> [old file, new file]
+        for change_version, name, old_file, new_file in reversed(self.__journal):
+            if change_version <= version:
+                break
+            if name in changes:
+                changes[name][0] = old_file
+            else:
+                changes[name] = [old_file, new_file]
+        return [
+            (old_file, new_file)
+            for old_file, new_file in reversed(changes.values())
+            if old_file is not None or new_file is not None
+        ]
+
+    def __publish(self,
+                  files: Dict[str, ModelFile],
+                  changes: List[Tuple[str, Optional[ModelFile], Optional[ModelFile]]]) -> List[IModelListener]:
+        """
+        Publish a new snapshot of the given files, made by the given (name, old file, new file) changes
+        :return: the listeners to notify of the changes
+        """
+        with self.__lock:
+            version = self.__snapshot.version
+            if self.__journal is not None:
+                for name, old_file, new_file in changes:
+                    version += 1
+                    self.__journal.append((version, name, old_file, new_file))
+            else:
+                version += len(changes)
+            self.__files = files
+            self.__snapshot = ModelSnapshot(self.__journal_id, version, files)
+            return list(self.__listeners)
+
+    def add_listener(self, listener: IModelListener):
+        """
+        Add a model listener
+        :param listener:
+        :return:
+        """
+        self.add_listener_and_get_snapshot(listener)
 
     def remove_listener(self, listener: IModelListener):
         """
@@ -85,7 +259,7 @@ class Model:
         :return:
         """
         self.logger.debug("LftpModel: Removing a listener")
-        with self.__listeners_lock:
+        with self.__lock:
             if listener not in self.__listeners:
                 self.logger.error("LftpModel: listener does not exist!")
             else:
@@ -98,16 +272,14 @@ class Model:
         :return:
         """
         self.logger.debug("LftpModel: Adding file '{}'".format(file.name))
-        if file.name in self.__files:
+        if file.name in self.__snapshot:
             raise ModelError("File already exists in the model")
         # Freeze the file to make it immutable before storing
         file.freeze()
-        self.__files[file.name] = file
-        # Copy-under-lock: copy listeners while holding lock, then iterate outside lock
-        with self.__listeners_lock:
-            listeners = list(self.__listeners)
-        for listener in listeners:
-            listener.file_added(self.__files[file.name])
+        files = self.__copy_files()
+        files[file.name] = file
+        for listener in self.__publish(files, [(file.name, None, file)]):
+            listener.file_added(file)
 
     def remove_file(self, filename: str):
         """
@@ -116,14 +288,11 @@ class Model:
         :return:
         """
         self.logger.debug("LftpModel: Removing file '{}'".format(filename))
-        if filename not in self.__files:
+        if filename not in self.__snapshot:
             raise ModelError("File does not exist in the model")
-        file = self.__files[filename]
-        del self.__files[filename]
-        # Copy-under-lock: copy listeners while holding lock, then iterate outside lock
-        with self.__listeners_lock:
-            listeners = list(self.__listeners)
-        for listener in listeners:
+        files = self.__copy_files()
+        file = files.pop(filename)
+        for listener in self.__publish(files, [(filename, file, None)]):
             listener.file_removed(file)
 
     def update_file(self, file: ModelFile):
@@ -133,19 +302,64 @@ class Model:
         :return:
         """
         self.logger.debug("LftpModel: Updating file '{}'".format(file.name))
-        if file.name not in self.__files:
+        if file.name not in self.__snapshot:
             raise ModelError("File does not exist in the model")
-        old_file = self.__files[file.name]
+        files = self.__copy_files()
+        old_file = files[file.name]
         new_file = file
         # Freeze the new file to make it immutable before storing
         new_file.freeze()
-        self.__files[file.name] = new_file
-        # Copy-under-lock: copy listeners while holding lock, then iterate outside lock
-        with self.__listeners_lock:
-            listeners = list(self.__listeners)
-        for listener in listeners:
+        files[file.name] = new_file
+        for listener in self.__publish(files, [(file.name, old_file, new_file)]):
             listener.file_updated(old_file, new_file)
 
+    def apply_batch(self, changes: List[Tuple[Optional[ModelFile], Optional[ModelFile]]]):
+        """
+        Apply a batch of changes, and notify each listener once with all of them
+        Each change is an (old file, new file) pair: (None, new file) adds a file,
+        (old file, None) removes the file of that name and (old file, new file)
+        updates the file of that name. Each change increments the version by one,
+        but only one snapshot is published for the whole batch.
+        If a change fails, the changes before it are still published and notified.
+        :param changes:
+        :return:
+        """
+        self.logger.debug("LftpModel: Applying a batch of {} changes".format(len(changes)))
+        files = self.__copy_files()
+        applied_changes = []
+        journal_changes = []
+        try:
+            for old_file, new_file in changes:
+                if old_file is None:
+                    if new_file.name in files:
+                        raise ModelError("File already exists in the model")
+                    new_file.freeze()
+                    files[new_file.name] = new_file
+                    journal_changes.append((new_file.name, None, new_file))
+                    applied_changes.append((None, new_file))
+                elif new_file is None:
+                    if old_file.name not in files:
+                        raise ModelError("File does not exist in the model")
+                    removed_file = files.pop(old_file.name)
+                    journal_changes.append((old_file.name, removed_file, None))
+                    applied_changes.append((removed_file, None))
+                else:
+                    if new_file.name not in files:
+                        raise ModelError("File does not exist in the model")
+                    replaced_file = files[new_file.name]
+                    new_file.freeze()
+                    files[new_file.name] = new_file
+                    journal_changes.append((new_file.name, replaced_file, new_file))
+                    applied_changes.append((replaced_file, new_file))
+        finally:
+            if applied_changes:
+                for listener in self.__publish(files, journal_changes):
+                    listener.files_changed(applied_changes)
+
+    def __copy_files(self) -> Dict[str, ModelFile]:
+        # The current files are shared with readers of the snapshot, so changes go to a copy
+        return dict(self.__files)
+
     def get_file(self, name: str) -> ModelFile:
         """
         Returns the file of the given name.
@@ -153,9 +367,7 @@ class Model:
         :param name:
         :return:
         """
-        if name not in self.__files:
-            raise ModelError("File does not exist in the model")
-        return self.__files[name]
+        return self.__snapshot.get_file(name)
 
     def get_file_names(self) -> Set[str]:
-        return set(self.__files.keys())
+        return self.__snapshot.get_file_names()
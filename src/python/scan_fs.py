@@ -5,7 +5,11 @@ import sys
 import argparse
 
 # my libs
-from system import SystemScanner, SystemFile, SystemScannerError
+from system import SystemScanner, SystemFile, SystemScannerError, SystemFileCodec, ScanAgent
+
+
+# Number of incremental scans between forced full rescans in daemon mode
+DAEMON_FULL_SCAN_INTERVAL = 30
 
 
 if __name__ == "__main__":
@@ -18,11 +22,40 @@ if __name__ == "__main__":
                         help="Exclude hidden files")
     parser.add_argument("-H", "--human-readable", action="store_true", default=False,
                         help="Human readable output")
+    parser.add_argument("-j", "--threads", type=int, default=1,
+                        help="Number of threads used to walk the directory tree")
+    parser.add_argument("-f", "--format", choices=["pickle", "binary"], default="pickle",
+                        help="Output format")
+    parser.add_argument("--state-file", default=None,
+                        help="File to keep the scan snapshot in. Enables delta output with the binary format")
+    parser.add_argument("--since", default=None,
+                        help="Token of the previous scan, only changes since then are output")
+    parser.add_argument("--daemon", action="store_true", default=False,
+                        help="Keep running and serve scan requests from stdin (implies binary delta output). "
+                             "Clients can also ask to be notified of changes, using inotify")
     args = parser.parse_args()
 
     scanner = SystemScanner(args.path)
     if args.exclude_hidden:
         scanner.add_exclude_prefix(".")
+    if args.threads < 1:
+        sys.exit("Number of threads must be positive")
+    scanner.set_num_threads(args.threads)
+
+    if args.daemon:
+        # The scanner lives across requests, so make the most of it
+        scanner.set_incremental(True, full_scan_interval=DAEMON_FULL_SCAN_INTERVAL)
+        ScanAgent(scanner, args.state_file).serve(sys.stdin, sys.stdout.buffer)
+        sys.exit(0)
+
+    if args.format == "binary" and args.state_file and not args.human_readable:
+        try:
+            bytes_out = ScanAgent(scanner, args.state_file).scan(args.since)
+        except SystemScannerError as e:
+            sys.exit("SystemScannerError: {}".format(str(e)))
+        sys.stdout.buffer.write(bytes_out)
+        sys.exit(0)
+
     try:
         root_files = scanner.scan()
     except SystemScannerError as e:
@@ -39,6 +72,9 @@ if __name__ == "__main__":
                 print_file(child, level+1)
         for root_file in root_files:
             print_file(root_file, 0)
+    elif args.format == "binary":
+        bytes_out = SystemFileCodec.encode(root_files)
+        sys.stdout.buffer.write(bytes_out)
     else:
         bytes_out = pickle.dumps(root_files)
         sys.stdout.buffer.write(bytes_out)
@@ -316,6 +316,13 @@ class Seedsync:
         config.controller.extract_path = "/tmp"
         config.controller.use_local_path_as_extract_path = True
         config.controller.max_tracked_files = 10000
+        config.controller.use_local_inotify = False
+        config.controller.num_local_scan_threads = 1
+        config.controller.num_remote_scan_threads = 1
+        config.controller.use_remote_scan_agent = False
+        config.controller.use_remote_inotify = False
+        config.controller.use_shared_memory_scan_results = False
+        config.controller.model_build_shard_min_roots = 20000
 
         config.web.port = 8800
 
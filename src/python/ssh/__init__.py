@@ -1,3 +1,3 @@
 # Copyright 2017, Inderpreet Singh, All rights reserved.
 
-from .sshcp import Sshcp, SshcpError
+from .sshcp import Sshcp, SshcpError, SshcpTimeoutError, SshcpChannel
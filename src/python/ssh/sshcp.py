@@ -2,6 +2,8 @@
 
 import logging
 import time
+import tty
+from typing import Optional, List
 
 import pexpect
 
@@ -16,6 +18,13 @@ class SshcpError(AppError):
     pass
 
 
+class SshcpTimeoutError(SshcpError):
+    """
+    Exception indicating that an ssh channel timed out waiting for output
+    """
+    pass
+
+
 class Sshcp:
     """
     Scp command utility
@@ -38,11 +47,10 @@ class Sshcp:
     def set_base_logger(self, base_logger: logging.Logger):
         self.logger = base_logger.getChild(self.__class__.__name__)
 
-    def __run_command(self,
-                      command: str,
-                      flags: str,
-                      args: str) -> bytes:
-
+    def __build_command(self,
+                        command: str,
+                        flags: str,
+                        args: str) -> str:
         command_args = [
             command,
             flags
@@ -66,40 +74,52 @@ class Sshcp:
 
         command_args.append(args)
 
-        command = " ".join(command_args)
+        return " ".join(command_args)
+
+    def __login(self, sp: pexpect.spawn):
+        """
+        Answer the password prompt of a freshly spawned command, if using a password
+        """
+        if self.__password is not None:
+            i = sp.expect([
+                'password: ',  # i=0, all's good
+                pexpect.EOF,  # i=1, unknown error
+                'lost connection',  # i=2, connection refused
+                'Could not resolve hostname',  # i=3, bad hostname
+                'Connection refused',  # i=4, connection refused
+                'Name or service not known',  # i=5, bad hostname (newer SSH)
+                'No route to host',  # i=6, bad host (newer SSH)
+                'Connection timed out',  # i=7, connection timeout (newer SSH)
+            ])
+            if i > 0:
+                before = sp.before.decode().strip() if sp.before != pexpect.EOF else ""
+                after = sp.after.decode().strip() if sp.after != pexpect.EOF else ""
+                self.logger.warning("Command failed: '{} - {}'".format(before, after))
+            if i == 1:
+                error_msg = "Unknown error"
+                if sp.before.decode().strip():
+                    error_msg += " - " + sp.before.decode().strip()
+                raise SshcpError(error_msg)
+            elif i in {3, 5}:
+                raise SshcpError("Bad hostname: {}".format(self.__host))
+            elif i in {2, 4, 6, 7}:
+                error_msg = "Connection refused by server"
+                if sp.before.decode().strip():
+                    error_msg += " - " + sp.before.decode().strip()
+                raise SshcpError(error_msg)
+            sp.sendline(self.__password)
+
+    def __run_command(self,
+                      command: str,
+                      flags: str,
+                      args: str) -> bytes:
+        command = self.__build_command(command, flags, args)
         self.logger.debug("Command: {}".format(command))
 
         start_time = time.time()
         sp = pexpect.spawn(command)
         try:
-            if self.__password is not None:
-                i = sp.expect([
-                    'password: ',  # i=0, all's good
-                    pexpect.EOF,  # i=1, unknown error
-                    'lost connection',  # i=2, connection refused
-                    'Could not resolve hostname',  # i=3, bad hostname
-                    'Connection refused',  # i=4, connection refused
-                    'Name or service not known',  # i=5, bad hostname (newer SSH)
-                    'No route to host',  # i=6, bad host (newer SSH)
-                    'Connection timed out',  # i=7, connection timeout (newer SSH)
-                ])
-                if i > 0:
-                    before = sp.before.decode().strip() if sp.before != pexpect.EOF else ""
-                    after = sp.after.decode().strip() if sp.after != pexpect.EOF else ""
-                    self.logger.warning("Command failed: '{} - {}'".format(before, after))
-                if i == 1:
-                    error_msg = "Unknown error"
-                    if sp.before.decode().strip():
-                        error_msg += " - " + sp.before.decode().strip()
-                    raise SshcpError(error_msg)
-                elif i in {3, 5}:
-                    raise SshcpError("Bad hostname: {}".format(self.__host))
-                elif i in {2, 4, 6, 7}:
-                    error_msg = "Connection refused by server"
-                    if sp.before.decode().strip():
-                        error_msg += " - " + sp.before.decode().strip()
-                    raise SshcpError(error_msg)
-                sp.sendline(self.__password)
+            self.__login(sp)
 
             i = sp.expect(
                 [
@@ -151,6 +171,43 @@ class Sshcp:
         :param command:
         :return:
         """
+        return self.__run_command(
+            command="ssh",
+            flags=" ".join(self.__ssh_flags()),
+            args=" ".join(self.__ssh_args(command))
+        )
+
+    def open_channel(self, command: str) -> "SshcpChannel":
+        """
+        Start a long-running shell command on remote server
+        The command's stdin and stdout are available through the returned channel
+        :param command:
+        :return:
+        """
+        command = self.__build_command(
+            command="ssh",
+            flags=" ".join(self.__ssh_flags()),
+            args=" ".join(self.__ssh_args(command))
+        )
+        self.logger.debug("Channel command: {}".format(command))
+        sp = SshcpChannel.spawn(command)
+        try:
+            self.__login(sp)
+        except pexpect.exceptions.TIMEOUT:
+            self.logger.exception("Timed out")
+            sp.close(force=True)
+            raise SshcpError("Timed out")
+        except SshcpError:
+            sp.close(force=True)
+            raise
+        return SshcpChannel(sp, self.__TIMEOUT_SECS, self.logger)
+
+    def __ssh_flags(self):
+        return [
+            "-p", str(self.__port),  # port
+        ]
+
+    def __ssh_args(self, command: str):
         if not command:
             raise ValueError("Command cannot be empty")
 
@@ -165,18 +222,10 @@ class Sshcp:
             # no double quote in command, cover with double quotes
             command = '"{}"'.format(command)
 
-        flags = [
-            "-p", str(self.__port),  # port
-        ]
-        args = [
+        return [
             "{}@{}".format(self.__user, self.__host),
             command
         ]
-        return self.__run_command(
-            command="ssh",
-            flags=" ".join(flags),
-            args=" ".join(args)
-        )
 
     def copy(self, local_path: str, remote_path: str):
         """
@@ -203,3 +252,109 @@ class Sshcp:
             flags=" ".join(flags),
             args=" ".join(args)
         )
+
+
+class SshcpChannel:
+    """
+    A long-running remote command, used to exchange messages over a single ssh session
+    The output passes through a pty, so binary data must be encoded (e.g. as base64)
+    The pty is in raw mode (see spawn()), so lines of any length can be sent
+    """
+    def __init__(self, sp: pexpect.spawn, timeout_in_secs: float, logger: logging.Logger):
+        self.__sp = sp
+        self.__timeout_in_secs = timeout_in_secs
+        self.logger = logger
+
+    @staticmethod
+    def spawn(command: str, args: Optional[List[str]] = None) -> pexpect.spawn:
+        """
+        Spawn the command of a channel
+        Its pty is put in raw mode before the command starts. In the default
+        canonical mode, the kernel cuts input lines at 4096 bytes.
+        :param command:
+        :param args:
+        :return:
+        """
+        return pexpect.spawn(command, args or [], echo=False, preexec_fn=SshcpChannel.__set_raw_stdin)
+
+    @staticmethod
+    def __set_raw_stdin():
+        # Runs in the child, where stdin (fd 0) is the pty
+        tty.setraw(0)
+
+    def is_alive(self) -> bool:
+        return self.__sp is not None and self.__sp.isalive()
+
+    def send_line(self, line: str):
+        """
+        Write a line to the command's stdin
+        :param line:
+        :return:
+        """
+        if not self.is_alive():
+            raise SshcpError("Channel is closed")
+        try:
+            self.__sp.sendline(line)
+        except OSError as e:
+            raise SshcpError("Failed to write to channel: {}".format(str(e)))
+
+    def expect(self, pattern: bytes, timeout_in_secs: Optional[float] = None):
+        """
+        Wait for the output to match the given regex
+        Any output before the match is discarded
+        :param pattern:
+        :param timeout_in_secs: defaults to the ssh timeout
+        :return: the match object
+        """
+        if self.__sp is None:
+            raise SshcpError("Channel is closed")
+        timeout = self.__timeout_in_secs if timeout_in_secs is None else timeout_in_secs
+        try:
+            i = self.__sp.expect([pattern, 'password: ', pexpect.EOF], timeout=timeout)
+        except pexpect.exceptions.TIMEOUT:
+            raise SshcpTimeoutError("Timed out")
+        if i == 1:
+            raise SshcpError("Incorrect password")
+        elif i == 2:
+            error_msg = "Channel closed"
+            before = self.__sp.before.decode(errors="replace").strip()
+            if before:
+                error_msg += " - " + before
+            raise SshcpError(error_msg)
+        return self.__sp.match
+
+    def read(self, size: int, timeout_in_secs: Optional[float] = None) -> bytes:
+        """
+        Read exactly the given number of bytes of output
+        :param size:
+        :param timeout_in_secs: defaults to the ssh timeout
+        :return:
+        """
+        if self.__sp is None:
+            raise SshcpError("Channel is closed")
+        timeout = self.__timeout_in_secs if timeout_in_secs is None else timeout_in_secs
+        # Output that was read while matching is kept in the pexpect buffer
+        buffered = self.__sp.buffer
+        data = bytearray(buffered[:size])
+        self.__sp.buffer = buffered[size:]
+        deadline = time.monotonic() + timeout
+        while len(data) < size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise SshcpTimeoutError("Timed out")
+            try:
+                data += self.__sp.read_nonblocking(size - len(data), timeout=remaining)
+            except pexpect.exceptions.TIMEOUT:
+                raise SshcpTimeoutError("Timed out")
+            except pexpect.exceptions.EOF:
+                raise SshcpError("Channel closed")
+        return bytes(data)
+
+    def close(self):
+        """
+        Terminate the remote command
+        :return:
+        """
+        if self.__sp is not None:
+            self.__sp.close(force=True)
+            self.__sp = None
@@ -2,3 +2,7 @@
 
 from .scanner import SystemScanner, SystemScannerError
 from .file import SystemFile
+from .codec import SystemFileCodec, SystemFileCodecError, SystemFileCodecVersionError
+from .delta import SystemFileDelta, SystemScanSnapshot
+from .inotify import InotifyWatcher, InotifyError, InotifyWatchLimitError
+from .scan_agent import ScanAgent
@@ -0,0 +1,219 @@
+# Copyright 2017, Inderpreet Singh, All rights reserved.
+
+import struct
+from datetime import datetime, timedelta
+from typing import List
+
+# my libs
+from common import AppError
+from .file import SystemFile
+
+
+class SystemFileCodecError(AppError):
+    """
+    Exception indicating that encoded system file data is invalid
+    """
+    pass
+
+
+class SystemFileCodecVersionError(SystemFileCodecError):
+    """
+    Exception indicating that encoded system file data has an unsupported version
+    """
+    pass
+
+
+class SystemFileCodec:
+    """
+    Compact binary encoding for a list of SystemFile trees
+
+    Layout (all integers little-endian):
+        header      magic "SFSB", u16 version, u16 reserved,
+                    u32 num strings, u32 num entries, u32 string table size
+        strings     u32 length of each string, then the utf-8 bytes of all strings
+        entries     one packed array per field, in pre-order (parents before children):
+                        i32 parent index (-1 for root entries)
+                        u32 name index into the string table
+                        u64 size
+                        u8  flags (is_dir, has created time, has modified time)
+                        i64 created time, in microseconds since 1970-01-01
+                        i64 modified time, in microseconds since 1970-01-01
+        trailer     magic "SFSE"
+
+    Timestamps are naive datetimes (same as SystemScanner creates them), so
+    they are encoded as an offset from a naive epoch rather than converted
+    through a timezone.
+
+    Unlike pickle, decoding never executes anything from the data, so it is
+    safe to use on data from a remote server.
+
+    Note: the data is framed by non-whitespace magic strings so that it
+          survives the output stripping done by Sshcp.shell
+    """
+    MAGIC = b"SFSB"
+    TRAILER = b"SFSE"
+    VERSION = 1
+
+    __HEADER = struct.Struct("<4sHHIII")
+    __FLAG_IS_DIR = 0x01
+    __FLAG_HAS_CREATED = 0x02
+    __FLAG_HAS_MODIFIED = 0x04
+    __EPOCH = datetime(1970, 1, 1)
+    __ONE_MICROSECOND = timedelta(microseconds=1)
+
+    @staticmethod
+    def is_encoded(data: bytes) -> bool:
+        """Returns true if the data looks like the output of encode()"""
+        return data[:len(SystemFileCodec.MAGIC)] == SystemFileCodec.MAGIC
+
+    @staticmethod
+    def encode(files: List[SystemFile]) -> bytes:
+        """
+        Encode a list of SystemFile trees
+        :param files:
+        :return:
+        """
+        string_indices = dict()
+        strings = []
+        parents = []
+        names = []
+        sizes = []
+        flags = []
+        created = []
+        modified = []
+
+        stack = [(file, -1) for file in reversed(files)]
+        while stack:
+            file, parent_index = stack.pop()
+            index = len(parents)
+            name_index = string_indices.get(file.name)
+            if name_index is None:
+                name_index = len(strings)
+                string_indices[file.name] = name_index
+                strings.append(file.name.encode("utf-8", "surrogatepass"))
+            file_flags = SystemFileCodec.__FLAG_IS_DIR if file.is_dir else 0
+            file_created = 0
+            if file.timestamp_created is not None:
+                file_flags |= SystemFileCodec.__FLAG_HAS_CREATED
+                file_created = SystemFileCodec.__to_microseconds(file.timestamp_created)
+            file_modified = 0
+            if file.timestamp_modified is not None:
+                file_flags |= SystemFileCodec.__FLAG_HAS_MODIFIED
+                file_modified = SystemFileCodec.__to_microseconds(file.timestamp_modified)
+            parents.append(parent_index)
+            names.append(name_index)
+            sizes.append(file.size)
+            flags.append(file_flags)
+            created.append(file_created)
+            modified.append(file_modified)
+            for child in reversed(file.children):
+                stack.append((child, index))
+
+        num_entries = len(parents)
+        string_bytes = b"".join(strings)
+        return b"".join([
+            SystemFileCodec.__HEADER.pack(
+                SystemFileCodec.MAGIC,
+                SystemFileCodec.VERSION,
+                0,
+                len(strings),
+                num_entries,
+                len(string_bytes)
+            ),
+            struct.pack("<{}I".format(len(strings)), *[len(s) for s in strings]),
+            string_bytes,
+            struct.pack("<{}i".format(num_entries), *parents),
+            struct.pack("<{}I".format(num_entries), *names),
+            struct.pack("<{}Q".format(num_entries), *sizes),
+            struct.pack("<{}B".format(num_entries), *flags),
+            struct.pack("<{}q".format(num_entries), *created),
+            struct.pack("<{}q".format(num_entries), *modified),
+            SystemFileCodec.TRAILER
+        ])
+
+    @staticmethod
+    def decode(data: bytes) -> List[SystemFile]:
+        """
+        Decode the output of encode() back into a list of SystemFile trees
+        The data is decoded in a single pass, without copying it
+        :param data:
+        :return:
+        """
+        view = memoryview(data)
+        header_size = SystemFileCodec.__HEADER.size
+        if len(view) < header_size:
+            raise SystemFileCodecError("Data is too short ({} bytes)".format(len(view)))
+        magic, version, _, num_strings, num_entries, string_table_size = \
+            SystemFileCodec.__HEADER.unpack_from(view, 0)
+        if magic != SystemFileCodec.MAGIC:
+            raise SystemFileCodecError("Bad magic: {}".format(magic))
+        if version != SystemFileCodec.VERSION:
+            raise SystemFileCodecVersionError("Unsupported version: {}".format(version))
+        expected_size = header_size + 4 * num_strings + string_table_size + \
+            (4 + 4 + 8 + 1 + 8 + 8) * num_entries + len(SystemFileCodec.TRAILER)
+        if len(view) != expected_size:
+            raise SystemFileCodecError("Bad data size: expected {} bytes, got {}".format(
+                expected_size, len(view)
+            ))
+        if bytes(view[-len(SystemFileCodec.TRAILER):]) != SystemFileCodec.TRAILER:
+            raise SystemFileCodecError("Bad trailer")
+
+        offset = header_size
+        string_lengths = struct.unpack_from("<{}I".format(num_strings), view, offset)
+        offset += 4 * num_strings
+        strings = []
+        try:
+            for length in string_lengths:
+                end = offset + length
+                strings.append(str(view[offset:end], "utf-8", "surrogatepass"))
+                offset = end
+        except UnicodeDecodeError as e:
+            raise SystemFileCodecError("Bad string: {}".format(str(e)))
+        if offset != header_size + 4 * num_strings + string_table_size:
+            raise SystemFileCodecError("Bad string table")
+
+        def unpack_array(fmt: str, item_size: int):
+            nonlocal offset
+            values = struct.unpack_from("<{}{}".format(num_entries, fmt), view, offset)
+            offset += item_size * num_entries
+            return values
+        parents = unpack_array("i", 4)
+        names = unpack_array("I", 4)
+        sizes = unpack_array("Q", 8)
+        flags = unpack_array("B", 1)
+        created = unpack_array("q", 8)
+        modified = unpack_array("q", 8)
+
+        epoch = SystemFileCodec.__EPOCH
+        one_microsecond = SystemFileCodec.__ONE_MICROSECOND
+        root_files = []
+        files = []
+        try:
+            for index in range(num_entries):
+                file_flags = flags[index]
+                file = SystemFile(
+                    strings[names[index]],
+                    sizes[index],
+                    bool(file_flags & SystemFileCodec.__FLAG_IS_DIR),
+                    time_created=(epoch + created[index] * one_microsecond)
+                    if file_flags & SystemFileCodec.__FLAG_HAS_CREATED else None,
+                    time_modified=(epoch + modified[index] * one_microsecond)
+                    if file_flags & SystemFileCodec.__FLAG_HAS_MODIFIED else None
+                )
+                parent_index = parents[index]
+                if parent_index < 0:
+                    root_files.append(file)
+                elif parent_index < index:
+                    files[parent_index].add_child(file)
+                else:
+                    raise SystemFileCodecError("Bad parent index {} for entry {}".format(parent_index, index))
+                files.append(file)
+        except IndexError:
+            raise SystemFileCodecError("Bad name index")
+        except (TypeError, OverflowError) as e:
+            raise SystemFileCodecError("Bad entry: {}".format(str(e)))
+        return root_files
+
+    @staticmethod
+    def __to_microseconds(timestamp: datetime) -> int:
+        return (timestamp - SystemFileCodec.__EPOCH) // SystemFileCodec.__ONE_MICROSECOND
@@ -0,0 +1,229 @@
+# Copyright 2017, Inderpreet Singh, All rights reserved.
+
+import hashlib
+import json
+import os
+import struct
+from typing import Dict, List, Optional, Tuple
+
+# my libs
+from .codec import SystemFileCodec, SystemFileCodecError, SystemFileCodecVersionError
+from .file import SystemFile
+
+
+class SystemFileDelta:
+    """
+    Changes to a list of root SystemFiles since a previous scan
+    A full delta contains all the root files and replaces the previous result
+    """
+    MAGIC = b"SFSD"
+    VERSION = 1
+
+    __HEADER = struct.Struct("<4sHHI")
+    __FLAG_FULL = 0x01
+
+    def __init__(self, token: str, is_full: bool, files: List[SystemFile], removed_names: List[str]):
+        """
+        :param token: token that identifies the state after this delta
+        :param is_full: true if files contains all the root files
+        :param files: root files that were added or changed
+        :param removed_names: names of the root files that were removed
+        """
+        self.__token = token
+        self.__is_full = is_full
+        self.__files = files
+        self.__removed_names = removed_names
+
+    @property
+    def token(self) -> str: return self.__token
+
+    @property
+    def is_full(self) -> bool: return self.__is_full
+
+    @property
+    def files(self) -> List[SystemFile]: return self.__files
+
+    @property
+    def removed_names(self) -> List[str]: return self.__removed_names
+
+    @staticmethod
+    def is_encoded(data: bytes) -> bool:
+        """Returns true if the data looks like the output of encode()"""
+        return data[:len(SystemFileDelta.MAGIC)] == SystemFileDelta.MAGIC
+
+    def encode(self) -> bytes:
+        """
+        Layout (all integers little-endian):
+            magic "SFSD", u16 version, u16 flags, u32 token length, token,
+            u32 num removed names, u32 length + utf-8 bytes of each removed name,
+            SystemFileCodec encoding of the added and changed files
+        """
+        token_bytes = self.__token.encode("ascii")
+        parts = [
+            SystemFileDelta.__HEADER.pack(
+                SystemFileDelta.MAGIC,
+                SystemFileDelta.VERSION,
+                SystemFileDelta.__FLAG_FULL if self.__is_full else 0,
+                len(token_bytes)
+            ),
+            token_bytes,
+            struct.pack("<I", len(self.__removed_names))
+        ]
+        for name in self.__removed_names:
+            name_bytes = name.encode("utf-8", "surrogatepass")
+            parts.append(struct.pack("<I", len(name_bytes)))
+            parts.append(name_bytes)
+        parts.append(SystemFileCodec.encode(self.__files))
+        return b"".join(parts)
+
+    @staticmethod
+    def decode(data: bytes) -> "SystemFileDelta":
+        """
+        Decode the output of encode()
+        :param data:
+        :return:
+        """
+        view = memoryview(data)
+        try:
+            magic, version, flags, token_length = SystemFileDelta.__HEADER.unpack_from(view, 0)
+            if magic != SystemFileDelta.MAGIC:
+                raise SystemFileCodecError("Bad delta magic: {}".format(magic))
+            if version != SystemFileDelta.VERSION:
+                raise SystemFileCodecVersionError("Unsupported delta version: {}".format(version))
+            offset = SystemFileDelta.__HEADER.size
+            token = str(view[offset:offset + token_length], "ascii")
+            offset += token_length
+            num_removed, = struct.unpack_from("<I", view, offset)
+            offset += 4
+            removed_names = []
+            for _ in range(num_removed):
+                name_length, = struct.unpack_from("<I", view, offset)
+                offset += 4
+                if offset + name_length > len(view):
+                    raise SystemFileCodecError("Bad removed name length")
+                removed_names.append(str(view[offset:offset + name_length], "utf-8", "surrogatepass"))
+                offset += name_length
+        except (struct.error, UnicodeDecodeError) as e:
+            raise SystemFileCodecError("Bad delta header: {}".format(str(e)))
+        files = SystemFileCodec.decode(view[offset:])
+        return SystemFileDelta(
+            token=token,
+            is_full=bool(flags & SystemFileDelta.__FLAG_FULL),
+            files=files,
+            removed_names=removed_names
+        )
+
+
+class SystemScanSnapshot:
+    """
+    Fingerprints of the root files of a scan
+    Used by scan_fs to compute the delta between two scans, without
+    keeping the previous scan result around.
+
+    The token is derived from the fingerprints, so two snapshots with
+    the same token describe the same scan result.
+    """
+    VERSION = 1
+
+    def __init__(self, digests: Dict[str, str], is_unique: bool = True):
+        """
+        :param digests: root file name -> fingerprint of its tree
+        :param is_unique: false if multiple root files had the same name,
+                          in which case only full deltas can be created
+        """
+        self.__digests = digests
+        self.__is_unique = is_unique
+        hasher = hashlib.md5()
+        hasher.update(str(SystemScanSnapshot.VERSION).encode())
+        for name in sorted(digests.keys()):
+            hasher.update(name.encode("utf-8", "surrogatepass"))
+            hasher.update(b"\0")
+            hasher.update(digests[name].encode())
+            hasher.update(b"\n")
+        if not is_unique:
+            hasher.update(b"not unique")
+        self.__token = hasher.hexdigest()
+
+    @property
+    def token(self) -> str: return self.__token
+
+    @staticmethod
+    def from_files(files: List[SystemFile],
+                   digest_cache: Optional[Dict[int, Tuple[SystemFile, str]]] = None) -> "SystemScanSnapshot":
+        """
+        Create the snapshot of a scan result
+        :param files:
+        :param digest_cache: optional fingerprint cache that is kept between calls.
+                             Root files are looked up by identity, so this only pays
+                             off with an incremental scanner, which reuses the
+                             SystemFiles of unchanged trees.
+        :return:
+        """
+        digests = dict()
+        next_digest_cache = dict()
+        for file in files:
+            cached = digest_cache.get(id(file)) if digest_cache is not None else None
+            if cached is not None and cached[0] is file:
+                digest = cached[1]
+            else:
+                digest = hashlib.md5(SystemFileCodec.encode([file])).hexdigest()
+            # Keep a reference to the file so that its id is not reused
+            next_digest_cache[id(file)] = (file, digest)
+            digests[file.name] = digest
+        if digest_cache is not None:
+            digest_cache.clear()
+            digest_cache.update(next_digest_cache)
+        return SystemScanSnapshot(digests, is_unique=(len(digests) == len(files)))
+
+    def create_delta(self,
+                     files: List[SystemFile],
+                     previous: Optional["SystemScanSnapshot"],
+                     since_token: Optional[str]) -> SystemFileDelta:
+        """
+        Create the delta from the state identified by since_token to this snapshot
+        The delta is a full one unless since_token matches the previous snapshot
+        :param files: the scan result that this snapshot was created from
+        :param previous: snapshot of the previous scan, if any
+        :param since_token: token of the state that the client has, if any
+        :return:
+        """
+        if previous is None or since_token is None or since_token != previous.token or \
+                not self.__is_unique or not previous.__is_unique:
+            return SystemFileDelta(self.__token, True, files, [])
+        changed_files = [f for f in files if previous.__digests.get(f.name) != self.__digests[f.name]]
+        removed_names = sorted(name for name in previous.__digests.keys() if name not in self.__digests)
+        return SystemFileDelta(self.__token, False, changed_files, removed_names)
+
+    @staticmethod
+    def load(path: str) -> Optional["SystemScanSnapshot"]:
+        """
+        Load a snapshot saved with save()
+        Returns None if there's no valid snapshot at the path
+        """
+        try:
+            with open(path, "r") as f:
+                content = json.load(f)
+            if content.get("version") != SystemScanSnapshot.VERSION:
+                return None
+            snapshot = SystemScanSnapshot(content["digests"], content["is_unique"])
+            if snapshot.token != content["token"]:
+                return None
+            return snapshot
+        except (OSError, ValueError, KeyError, TypeError, AttributeError):
+            return None
+
+    def save(self, path: str):
+        """
+        Save the snapshot, atomically replacing any existing one
+        :param path:
+        :return:
+        """
+        temp_path = "{}.{}.tmp".format(path, os.getpid())
+        with open(temp_path, "w") as f:
+            json.dump({
+                "version": SystemScanSnapshot.VERSION,
+                "token": self.__token,
+                "is_unique": self.__is_unique,
+                "digests": self.__digests
+            }, f, separators=(",", ":"))
+        os.replace(temp_path, path)
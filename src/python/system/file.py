@@ -1,13 +1,36 @@
 # Copyright 2017, Inderpreet Singh, All rights reserved.
 
-from typing import List
+import pickle
+import sys
+from typing import Sequence, Optional
 from datetime import datetime
 
 
 class SystemFile:
     """
     Represents a system file or directory
+
+    Files have a structural hash (fingerprint) over their fields and the
+    fingerprints of their children, so two different trees that were already
+    compared before are usually told apart by a single int comparison. As
+    fingerprints can collide, files with the same fingerprint are still
+    compared field by field.
+
+    Scans hold hundreds of thousands of these, so the representation is kept
+    compact: attributes live in slots, names are interned, timestamps are
+    stored as epoch seconds and only turned into datetimes on access, and
+    plain files share a single empty children tuple.
     """
+    __slots__ = (
+        "__name",
+        "__size",
+        "__is_dir",
+        "__time_created",
+        "__time_modified",
+        "__children",
+        "__fingerprint"
+    )
+
     def __init__(self,
                  name: str,
                  size: int,
@@ -16,18 +39,86 @@ class SystemFile:
                  time_modified: datetime = None):
         if size < 0:
             raise ValueError("File size must be greater than zero")
-        self.__name = name
+        self.__name = sys.intern(name)
         self.__size = size  # in bytes
         self.__is_dir = is_dir
-        self.__timestamp_created = time_created
-        self.__timestamp_modified = time_modified
-        self.__children = []
+        self.__time_created = time_created.timestamp() if time_created is not None else None
+        self.__time_modified = time_modified.timestamp() if time_modified is not None else None
+        self.__children = [] if is_dir else ()
+        self.__fingerprint = None
 
     def __eq__(self, other):
-        return self.__dict__ == other.__dict__
+        if self is other:
+            return True
+        if not isinstance(other, SystemFile):
+            return NotImplemented
+        if self.fingerprint != other.fingerprint:
+            return False
+        return (
+            self.__name == other.__name and
+            self.__size == other.__size and
+            self.__is_dir == other.__is_dir and
+            self.__time_created == other.__time_created and
+            self.__time_modified == other.__time_modified and
+            len(self.__children) == len(other.__children) and
+            all(mine == others for mine, others in zip(self.__children, other.__children))
+        )
+
+    def __getstate__(self):
+        # The fingerprint is built from str hashes, which are salted per process
+        return (
+            self.__name,
+            self.__size,
+            self.__is_dir,
+            self.__time_created,
+            self.__time_modified,
+            self.__children
+        )
+
+    def __setstate__(self, state):
+        if isinstance(state, dict):
+            state = SystemFile.__state_from_dict(state)
+        (
+            name,
+            self.__size,
+            self.__is_dir,
+            self.__time_created,
+            self.__time_modified,
+            self.__children
+        ) = state
+        self.__name = sys.intern(name)
+        self.__fingerprint = None
+
+    @staticmethod
+    def __state_from_dict(state: dict) -> tuple:
+        """
+        Convert the state of a SystemFile pickled before it had slots, as sent by
+        a remote scanfs that hasn't been upgraded yet, to the current state
+        """
+        try:
+            is_dir = state["_SystemFile__is_dir"]
+            time_created = state["_SystemFile__timestamp_created"]
+            time_modified = state["_SystemFile__timestamp_modified"]
+            return (
+                state["_SystemFile__name"],
+                state["_SystemFile__size"],
+                is_dir,
+                time_created.timestamp() if time_created is not None else None,
+                time_modified.timestamp() if time_modified is not None else None,
+                list(state["_SystemFile__children"]) if is_dir else ()
+            )
+        except (KeyError, AttributeError, TypeError) as e:
+            raise pickle.UnpicklingError("Invalid SystemFile state: {}".format(str(e)))
 
     def __repr__(self):
-        return str(self.__dict__)
+        return str({
+            "name": self.__name,
+            "size": self.__size,
+            "is_dir": self.__is_dir,
+            "timestamp_created": self.timestamp_created,
+            "timestamp_modified": self.timestamp_modified,
+            "children": self.__children
+        })
 
     @property
     def name(self) -> str: return self.__name
@@ -39,15 +130,41 @@ class SystemFile:
     def is_dir(self) -> bool: return self.__is_dir
 
     @property
-    def timestamp_created(self) -> datetime: return self.__timestamp_created
+    def timestamp_created(self) -> Optional[datetime]:
+        return datetime.fromtimestamp(self.__time_created) if self.__time_created is not None else None
+
+    @property
+    def timestamp_modified(self) -> Optional[datetime]:
+        return datetime.fromtimestamp(self.__time_modified) if self.__time_modified is not None else None
+
+    @property
+    def epoch_created(self) -> Optional[float]: return self.__time_created
+
+    @property
+    def epoch_modified(self) -> Optional[float]: return self.__time_modified
 
     @property
-    def timestamp_modified(self) -> datetime: return self.__timestamp_modified
+    def children(self) -> Sequence["SystemFile"]: return self.__children
 
     @property
-    def children(self) -> List["SystemFile"]: return self.__children
+    def fingerprint(self) -> int:
+        """
+        Structural hash of this file and all its children
+        This is computed on first access, so the tree must be complete by then
+        """
+        if self.__fingerprint is None:
+            self.__fingerprint = hash((
+                self.__name,
+                self.__size,
+                self.__is_dir,
+                self.__time_created,
+                self.__time_modified,
+                tuple(child.fingerprint for child in self.__children)
+            ))
+        return self.__fingerprint
 
     def add_child(self, file: "SystemFile"):
         if not self.__is_dir:
             raise TypeError("Cannot add children to a file")
         self.__children.append(file)
+        self.__fingerprint = None
@@ -0,0 +1,222 @@
+# Copyright 2017, Inderpreet Singh, All rights reserved.
+
+import ctypes
+import ctypes.util
+import errno
+import os
+import select
+import struct
+import sys
+from typing import Dict, Optional, Set
+
+# my libs
+from common import AppError
+
+
+class InotifyError(AppError):
+    """
+    Exception indicating that inotify is unavailable or failed
+    """
+    pass
+
+
+class InotifyWatchLimitError(InotifyError):
+    """
+    Exception indicating that the inotify watch limit was exceeded
+    (see /proc/sys/fs/inotify/max_user_watches)
+    """
+    pass
+
+
+class InotifyWatcher:
+    """
+    Watches a directory tree for changes using Linux inotify
+    inotify is accessed through ctypes, so there are no native dependencies.
+
+    Watches are added recursively for every directory under the root path.
+    Changes are reported as the set of root entry names (i.e. the first path
+    component relative to the root path) that were affected. A result of None
+    means that events were lost (e.g. the event queue overflowed) and the
+    caller must fall back to a full scan.
+
+    Note: symlinked directories are not followed
+    """
+    IN_MODIFY = 0x00000002
+    IN_ATTRIB = 0x00000004
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_FROM = 0x00000040
+    IN_MOVED_TO = 0x00000080
+    IN_CREATE = 0x00000100
+    IN_DELETE = 0x00000200
+    IN_DELETE_SELF = 0x00000400
+    IN_MOVE_SELF = 0x00000800
+    IN_Q_OVERFLOW = 0x00004000
+    IN_IGNORED = 0x00008000
+    IN_ONLYDIR = 0x01000000
+    IN_ISDIR = 0x40000000
+
+    IN_CLOEXEC = 0o2000000
+    IN_NONBLOCK = 0o4000
+
+    __WATCH_MASK = IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | \
+        IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR
+    __EVENT_HEADER = struct.Struct("iIII")
+    __READ_BUFFER_SIZE = 64 * 1024
+
+    def __init__(self, root_path: str):
+        self.__root_path = os.path.abspath(root_path)
+        self.__libc = None
+        self.__fd = None
+        self.__wd_to_path = dict()  # type: Dict[int, str]
+        self.__changes = set()  # type: Set[str]
+        self.__overflowed = False
+
+    @staticmethod
+    def is_supported() -> bool:
+        """Returns true if inotify is available on this platform"""
+        return sys.platform.startswith("linux")
+
+    @property
+    def num_watches(self) -> int:
+        return len(self.__wd_to_path)
+
+    def start(self):
+        """
+        Create the inotify instance and add watches for the whole tree
+        :return:
+        """
+        if not InotifyWatcher.is_supported():
+            raise InotifyError("inotify is not supported on {}".format(sys.platform))
+        try:
+            self.__libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+            inotify_init1 = self.__libc.inotify_init1
+        except (OSError, AttributeError) as e:
+            raise InotifyError("Failed to load inotify from libc: {}".format(str(e)))
+        inotify_init1.argtypes = [ctypes.c_int]
+        inotify_init1.restype = ctypes.c_int
+        self.__libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        self.__libc.inotify_add_watch.restype = ctypes.c_int
+        self.__libc.inotify_rm_watch.argtypes = [ctypes.c_int, ctypes.c_int]
+        self.__libc.inotify_rm_watch.restype = ctypes.c_int
+
+        fd = inotify_init1(InotifyWatcher.IN_NONBLOCK | InotifyWatcher.IN_CLOEXEC)
+        if fd < 0:
+            err = ctypes.get_errno()
+            raise InotifyError("inotify_init1 failed: {}".format(os.strerror(err)))
+        self.__fd = fd
+        try:
+            self.__add_watches_recursive(self.__root_path, is_root=True)
+        except InotifyError:
+            self.close()
+            raise
+
+    def close(self):
+        """
+        Close the inotify instance, removing all watches
+        :return:
+        """
+        if self.__fd is not None:
+            os.close(self.__fd)
+            self.__fd = None
+        self.__wd_to_path.clear()
+        self.__changes.clear()
+        self.__overflowed = False
+
+    def poll(self, timeout_in_s: float) -> bool:
+        """
+        Wait up to the given timeout for events, and accumulate any pending ones
+        :param timeout_in_s:
+        :return: True if any events were read
+        """
+        if self.__fd is None:
+            raise InotifyError("Watcher is not started")
+        readable, _, _ = select.select([self.__fd], [], [], max(timeout_in_s, 0))
+        if not readable:
+            return False
+        got_events = False
+        while True:
+            try:
+                buf = os.read(self.__fd, InotifyWatcher.__READ_BUFFER_SIZE)
+            except BlockingIOError:
+                break
+            if not buf:
+                break
+            got_events = True
+            self.__process_events(buf)
+        return got_events
+
+    def pop_changes(self) -> Optional[Set[str]]:
+        """
+        Returns the names of the root entries that changed since the last call
+        Returns None if events were lost, in which case the whole tree must be rescanned
+        :return:
+        """
+        if self.__overflowed:
+            changes = None
+        else:
+            changes = self.__changes
+        self.__changes = set()
+        self.__overflowed = False
+        return changes
+
+    def __process_events(self, buf: bytes):
+        offset = 0
+        header_size = InotifyWatcher.__EVENT_HEADER.size
+        while offset + header_size <= len(buf):
+            wd, mask, _, name_len = InotifyWatcher.__EVENT_HEADER.unpack_from(buf, offset)
+            offset += header_size
+            name = buf[offset:offset + name_len].rstrip(b"\0")
+            offset += name_len
+
+            if mask & InotifyWatcher.IN_Q_OVERFLOW:
+                self.__overflowed = True
+                continue
+            if mask & InotifyWatcher.IN_IGNORED:
+                # Watch was removed, either explicitly or because the dir is gone
+                self.__wd_to_path.pop(wd, None)
+                continue
+            dir_path = self.__wd_to_path.get(wd)
+            if dir_path is None:
+                # Event for a watch we no longer track
+                continue
+            is_root = dir_path == self.__root_path
+            if is_root and not name:
+                if mask & (InotifyWatcher.IN_DELETE_SELF | InotifyWatcher.IN_MOVE_SELF):
+                    # The root itself went away, only a full scan can sort this out
+                    self.__overflowed = True
+                continue
+
+            path = os.path.join(dir_path, os.fsdecode(name)) if name else dir_path
+            root_name = os.path.relpath(path, self.__root_path).split(os.sep)[0]
+            self.__changes.add(root_name)
+
+            if name and mask & InotifyWatcher.IN_ISDIR:
+                if mask & InotifyWatcher.IN_MOVED_FROM:
+                    self.__remove_watches_recursive(path)
+                elif mask & (InotifyWatcher.IN_CREATE | InotifyWatcher.IN_MOVED_TO):
+                    self.__add_watches_recursive(path, is_root=False)
+
+    def __add_watches_recursive(self, path: str, is_root: bool):
+        self.__add_watch(path, is_root)
+        for dir_path, dir_names, _ in os.walk(path):
+            for dir_name in dir_names:
+                self.__add_watch(os.path.join(dir_path, dir_name), False)
+
+    def __add_watch(self, path: str, is_root: bool):
+        wd = self.__libc.inotify_add_watch(self.__fd, os.fsencode(path), InotifyWatcher.__WATCH_MASK)
+        if wd < 0:
+            err = ctypes.get_errno()
+            if err == errno.ENOSPC:
+                raise InotifyWatchLimitError("inotify watch limit reached while watching {}".format(path))
+            if is_root:
+                raise InotifyError("Failed to watch {}: {}".format(path, os.strerror(err)))
+            # Sub-directory may have been deleted already, or may not be accessible
+            return
+        self.__wd_to_path[wd] = path
+
+    def __remove_watches_recursive(self, path: str):
+        prefix = path + os.sep
+        for wd, wd_path in list(self.__wd_to_path.items()):
+            if wd_path == path or wd_path.startswith(prefix):
+                self.__libc.inotify_rm_watch(self.__fd, wd)
+                del self.__wd_to_path[wd]
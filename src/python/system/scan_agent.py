@@ -0,0 +1,236 @@
+# Copyright 2017, Inderpreet Singh, All rights reserved.
+
+import base64
+import json
+import threading
+import time
+from typing import BinaryIO, Dict, List, Optional, TextIO, Tuple
+
+# my libs
+from .delta import SystemScanSnapshot
+from .file import SystemFile
+from .inotify import InotifyWatcher, InotifyError
+from .scanner import SystemScanner, SystemScannerError
+
+
+class ScanAgent:
+    """
+    Runs scans on request, for the scan_fs daemon mode
+
+    The agent stays running on the remote server, so the cost of starting
+    an ssh session and the scanfs executable is only paid once. It also
+    keeps the scanner (and its incremental cache) around between scans.
+
+    Requests are json lines on the input:
+        {"op": "scan", "since": <token of the previous scan, or null>,
+         "roots": <names of the root files to rescan, or null for all>}
+        {"op": "watch"}
+
+    Each request gets a response frame on the output:
+        @@SCANFS <status> <payload length>\n<base64 payload>\n
+    The status is OK, with an encoded SystemFileDelta as the payload,
+    or ERROR, with an error message as the payload.
+    The payload is base64 encoded so that it survives the pty that the
+    ssh output is read through.
+
+    A watch request starts watching the scan path with inotify. From then
+    on, the agent also writes unsolicited CHANGES frames, whose payload is
+    a json list of the root file names that changed (or null if events
+    were lost). These can arrive at any time, including before the
+    response to a request. If inotify is not available, the watch request
+    gets an ERROR response and the client should keep polling.
+
+    The roots of a scan request are only honoured if the since token
+    matches the previous scan by this agent, otherwise everything is
+    rescanned.
+    """
+    STATUS_OK = "OK"
+    STATUS_ERROR = "ERROR"
+    STATUS_CHANGES = "CHANGES"
+    FRAME_HEADER_PATTERN = rb"@@SCANFS (OK|ERROR|CHANGES) (\d+)\r?\n"
+
+    OP_SCAN = "scan"
+    OP_WATCH = "watch"
+
+    # Changes are reported once the events stop for this long
+    __WATCH_DEBOUNCE_IN_SECS = 0.2
+    # Max time spent waiting for a burst of events to end
+    __WATCH_MAX_DEBOUNCE_IN_SECS = 2.0
+    # Max time that the watch thread takes to notice that it should stop
+    __WATCH_POLL_INTERVAL_IN_SECS = 0.5
+
+    def __init__(self, scanner: SystemScanner, state_file: Optional[str]):
+        """
+        :param scanner:
+        :param state_file: file to keep the scan snapshot in, None to only keep it in memory
+        """
+        self.__scanner = scanner
+        self.__state_file = state_file
+        self.__snapshot = None  # type: Optional[SystemScanSnapshot]
+        self.__snapshot_loaded = False
+        self.__digest_cache = dict()  # type: Dict[int, Tuple[SystemFile, str]]
+        # Result of the previous scan, for targeted rescans
+        self.__root_files = None  # type: Optional[List[SystemFile]]
+        self.__out_lock = threading.Lock()
+        self.__watch_thread = None  # type: Optional[threading.Thread]
+        self.__stop_watching = threading.Event()
+
+    def scan(self, since_token: Optional[str], roots: Optional[List[str]] = None) -> bytes:
+        """
+        Scan and return the encoded delta since the given token
+        :param since_token:
+        :param roots: names of the root files that changed, None if unknown
+        :return:
+        """
+        if not self.__snapshot_loaded:
+            if self.__state_file:
+                self.__snapshot = SystemScanSnapshot.load(self.__state_file)
+            self.__snapshot_loaded = True
+        previous_snapshot = self.__snapshot
+        if roots is not None and self.__root_files is not None and \
+                previous_snapshot is not None and since_token == previous_snapshot.token:
+            root_files = self.__rescan_roots(roots)
+        else:
+            root_files = self.__scanner.scan()
+        snapshot = SystemScanSnapshot.from_files(root_files, self.__digest_cache)
+        delta = snapshot.create_delta(root_files, previous_snapshot, since_token)
+        if self.__state_file and (previous_snapshot is None or previous_snapshot.token != snapshot.token):
+            try:
+                snapshot.save(self.__state_file)
+            except OSError:
+                # Can't report this without corrupting the output, the next
+                # scan will simply be a full one
+                pass
+        self.__snapshot = snapshot
+        self.__root_files = root_files
+        return delta.encode()
+
+    def __rescan_roots(self, roots: List[str]) -> List[SystemFile]:
+        files_by_name = {file.name: file for file in self.__root_files}
+        for name in roots:
+            if not name or self.__scanner.is_excluded(name):
+                continue
+            try:
+                file = self.__scanner.scan_single(name)
+            except (SystemScannerError, FileNotFoundError):
+                # Root entry was removed
+                files_by_name.pop(name, None)
+                continue
+            files_by_name[file.name] = file
+        return sorted(files_by_name.values(), key=lambda f: f.name)
+
+    def serve(self, in_stream: TextIO, out_stream: BinaryIO):
+        """
+        Serve requests until the input is closed
+        :param in_stream:
+        :param out_stream:
+        :return:
+        """
+        try:
+            while True:
+                line = in_stream.readline()
+                if not line:
+                    break
+                line = line.strip()
+                if not line:
+                    continue
+                status, payload = self.__handle_request(line, out_stream)
+                self.__write_frame(out_stream, status, payload)
+        finally:
+            self.__stop_watching.set()
+            if self.__watch_thread is not None:
+                self.__watch_thread.join()
+
+    def __handle_request(self, line: str, out_stream: BinaryIO) -> Tuple[str, bytes]:
+        try:
+            request = json.loads(line)
+            op = request.get("op", ScanAgent.OP_SCAN)
+            since_token = request.get("since")
+            if since_token is not None and not isinstance(since_token, str):
+                raise ValueError("Bad token")
+            roots = request.get("roots")
+            if roots is not None and \
+                    (not isinstance(roots, list) or not all(isinstance(root, str) for root in roots)):
+                raise ValueError("Bad roots")
+        except (ValueError, AttributeError) as e:
+            return ScanAgent.STATUS_ERROR, "Bad request: {}".format(str(e)).encode()
+
+        if op == ScanAgent.OP_SCAN:
+            try:
+                return ScanAgent.STATUS_OK, self.scan(since_token, roots)
+            except SystemScannerError as e:
+                return ScanAgent.STATUS_ERROR, "SystemScannerError: {}".format(str(e)).encode()
+        elif op == ScanAgent.OP_WATCH:
+            try:
+                self.__start_watching(out_stream)
+            except InotifyError as e:
+                return ScanAgent.STATUS_ERROR, "InotifyError: {}".format(str(e)).encode()
+            return ScanAgent.STATUS_OK, b""
+        else:
+            return ScanAgent.STATUS_ERROR, "Bad request: unknown op {}".format(op).encode()
+
+    def __start_watching(self, out_stream: BinaryIO):
+        if self.__watch_thread is not None:
+            return
+        watcher = InotifyWatcher(self.__scanner.path_to_scan)
+        watcher.start()
+        self.__watch_thread = threading.Thread(target=self.__watch, args=(watcher, out_stream),
+                                               name="ScanAgentWatch", daemon=True)
+        self.__watch_thread.start()
+
+    def __watch(self, watcher: InotifyWatcher, out_stream: BinaryIO):
+        try:
+            while not self.__stop_watching.is_set():
+                if not watcher.poll(ScanAgent.__WATCH_POLL_INTERVAL_IN_SECS):
+                    continue
+                # Wait for the burst of events to end
+                deadline = time.monotonic() + ScanAgent.__WATCH_MAX_DEBOUNCE_IN_SECS
+                while time.monotonic() < deadline and watcher.poll(ScanAgent.__WATCH_DEBOUNCE_IN_SECS):
+                    pass
+                changes = watcher.pop_changes()
+                if changes is not None:
+                    changes = sorted(name for name in changes if not self.__scanner.is_excluded(name))
+                    if not changes:
+                        continue
+                self.__write_frame(out_stream, ScanAgent.STATUS_CHANGES, json.dumps(changes).encode())
+        except InotifyError:
+            # Report lost events, the client's periodic scans take over from here
+            try:
+                self.__write_frame(out_stream, ScanAgent.STATUS_CHANGES, json.dumps(None).encode())
+            except (OSError, ValueError):
+                pass
+        except (OSError, ValueError):
+            # Output was closed
+            pass
+        finally:
+            watcher.close()
+
+    def __write_frame(self, out_stream: BinaryIO, status: str, payload: bytes):
+        with self.__out_lock:
+            out_stream.write(ScanAgent.encode_response(status, payload))
+            out_stream.flush()
+
+    @staticmethod
+    def encode_request(since_token: Optional[str], roots: Optional[List[str]] = None) -> str:
+        return json.dumps({"op": ScanAgent.OP_SCAN, "since": since_token, "roots": roots})
+
+    @staticmethod
+    def encode_watch_request() -> str:
+        return json.dumps({"op": ScanAgent.OP_WATCH})
+
+    @staticmethod
+    def encode_response(status: str, payload: bytes) -> bytes:
+        encoded_payload = base64.b64encode(payload)
+        return b"".join([
+            "@@SCANFS {} {}\n".format(status, len(encoded_payload)).encode(),
+            encoded_payload,
+            b"\n"
+        ])
+
+    @staticmethod
+    def decode_response_payload(encoded_payload: bytes) -> bytes:
+        """
+        Decode the payload of a response frame
+        Raises ValueError if the payload is invalid
+        """
+        return base64.b64decode(encoded_payload, validate=True)
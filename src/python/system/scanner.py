@@ -1,12 +1,15 @@
 # Copyright 2017, Inderpreet Singh, All rights reserved.
 
 import os
+import queue
 import re
-from typing import List
+import stat
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Set
 from datetime import datetime
 
 # my libs
-from common import AppError
+from common import AppError, Constants
 from .file import SystemFile
 
 
@@ -36,7 +39,7 @@ class SystemScanner:
     Scans system to generate list of files and sizes
     Children are returned in alphabetical order
     """
-    __LFTP_STATUS_FILE_SUFFIX = ".lftp-pget-status"
+    __LFTP_STATUS_FILE_SUFFIX = Constants.LFTP_STATUS_FILE_SUFFIX
 
     def __init__(self, path_to_scan: str):
         """
@@ -47,6 +50,26 @@ class SystemScanner:
         self.exclude_suffixes = [SystemScanner.__LFTP_STATUS_FILE_SUFFIX]
         self.__lftp_temp_file_suffix = None
 
+        # Incremental scan state
+        # The directory cache maps path -> (signature, filtered entry names)
+        # The file cache maps path -> (signature, SystemFile)
+        # Lookups go to the caches from the previous scan, while the current
+        # scan writes into fresh caches so that deleted paths are pruned
+        self.__incremental = False
+        self.__full_scan_interval = 0
+        self.__num_scans_since_full_scan = 0
+        self.__dir_cache = dict()
+        self.__file_cache = dict()
+        self.__next_dir_cache = self.__dir_cache
+        self.__next_file_cache = self.__file_cache
+        self.cache_hits = 0  # number of directories that did not need to be re-listed
+        self.cache_misses = 0  # number of directories that were re-listed
+
+        # Parallel walk state
+        # Maps directory path -> listing (or the exception raised while listing it)
+        self.__num_threads = 1
+        self.__prefetched = None  # type: Optional[Dict[str, object]]
+
     def add_exclude_prefix(self, prefix: str):
         """
         Exclude files that begin with the given prefix
@@ -54,6 +77,7 @@ class SystemScanner:
         :return:
         """
         self.exclude_prefixes.append(prefix)
+        self.clear_cache()
 
     def add_exclude_suffix(self, suffix: str):
         """
@@ -62,6 +86,21 @@ class SystemScanner:
         :return:
         """
         self.exclude_suffixes.append(suffix)
+        self.clear_cache()
+
+    def is_excluded(self, name: str) -> bool:
+        """
+        Returns true if files with the given name are excluded from scans
+        :param name:
+        :return:
+        """
+        for prefix in self.exclude_prefixes:
+            if name.startswith(prefix):
+                return True
+        for suffix in self.exclude_suffixes:
+            if name.endswith(suffix):
+                return True
+        return False
 
     def set_lftp_temp_suffix(self, suffix: str):
         """
@@ -71,6 +110,53 @@ class SystemScanner:
         :return:
         """
         self.__lftp_temp_file_suffix = suffix
+        self.clear_cache()
+
+    def set_incremental(self, enabled: bool, full_scan_interval: int = 0):
+        """
+        Enable or disable incremental scanning
+        In incremental mode the scanner remembers the (inode, mtime, ctime) of
+        every directory it walks. Unchanged directories are not re-listed, and
+        files and sub-trees whose stat signatures haven't changed reuse the
+        SystemFile objects from the previous scan. Files are still stat'ed on
+        every scan because in-place writes don't touch the parent directory.
+        The result is identical to a full scan.
+        :param enabled:
+        :param full_scan_interval: discard the cache every this many scans, 0 to never discard it
+        :return:
+        """
+        if full_scan_interval < 0:
+            raise ValueError("Full scan interval must be zero or greater")
+        self.__incremental = enabled
+        self.__full_scan_interval = full_scan_interval
+        self.clear_cache()
+
+    def set_num_threads(self, num_threads: int):
+        """
+        Set the number of threads used to walk the tree
+        With more than one thread, directory listings and stats are fanned out
+        to a thread pool (they release the GIL), which hides the latency of
+        slow filesystems such as NFS or SMB mounts. The SystemFile tree is
+        still built on the calling thread, so the result is identical to a
+        serial scan. Works with incremental mode.
+        :param num_threads: 1 to walk serially
+        :return:
+        """
+        if num_threads < 1:
+            raise ValueError("Number of threads must be positive")
+        self.__num_threads = num_threads
+
+    def clear_cache(self):
+        """
+        Discard the incremental scan cache
+        The next scan will walk the entire tree
+        :return:
+        """
+        self.__dir_cache = dict()
+        self.__file_cache = dict()
+        self.__next_dir_cache = self.__dir_cache
+        self.__next_file_cache = self.__file_cache
+        self.__num_scans_since_full_scan = 0
 
     def scan(self) -> List[SystemFile]:
         """
@@ -81,7 +167,25 @@ class SystemScanner:
             raise SystemScannerError("Path does not exist: {}".format(self.path_to_scan))
         elif not os.path.isdir(self.path_to_scan):
             raise SystemScannerError("Path is not a directory: {}".format(self.path_to_scan))
-        return self.__create_children(self.path_to_scan)
+        if not self.__incremental:
+            return self.__create_root_children()
+
+        # Periodically force a full rescan as a safety net
+        if self.__full_scan_interval and self.__num_scans_since_full_scan >= self.__full_scan_interval:
+            self.clear_cache()
+        self.__next_dir_cache = dict()
+        self.__next_file_cache = dict()
+        try:
+            children = self.__create_root_children()
+        except Exception:
+            # Keep the previous cache around, the partial one is incomplete
+            self.__next_dir_cache = self.__dir_cache
+            self.__next_file_cache = self.__file_cache
+            raise
+        self.__dir_cache = self.__next_dir_cache
+        self.__file_cache = self.__next_file_cache
+        self.__num_scans_since_full_scan += 1
+        return children
 
     def scan_single(self, name: str) -> SystemFile:
         """
@@ -110,7 +214,7 @@ class SystemScanner:
             )
         )
 
-    def __create_system_file(self, entry) -> SystemFile:
+    def __create_system_file(self, entry, status_names: Optional[Set[str]] = None) -> SystemFile:
         """
         Creates a system file from a DirEntry.
 
@@ -120,77 +224,248 @@ class SystemScanner:
 
         Args:
             entry: DirEntry object
+            status_names: names of the lftp status files next to the entry, None if unknown
 
         Returns:
             The SystemFile object
         """
+        if self.__incremental:
+            return self.__create_system_file_cached(entry, status_names)
+        return self.__create_system_file_uncached(entry, status_names)
+
+    def __create_system_file_cached(self, entry, status_names: Optional[Set[str]]) -> SystemFile:
+        """
+        Creates a system file from a DirEntry, reusing the SystemFile from the
+        previous scan if the entry (and its sub-tree) hasn't changed
+        """
+        entry_stat = entry.stat()
         if entry.is_dir():
             sub_children = self.__create_children(entry.path)
-            name = entry.name.encode('utf-8', 'surrogateescape').decode('utf-8', 'replace')
-            size = sum(sub_child.size for sub_child in sub_children)
-            time_created = None
-            try:
-                time_created = datetime.fromtimestamp(entry.stat().st_birthtime)
-            except AttributeError:
-                time_created = datetime.fromtimestamp(entry.stat().st_ctime)
-            time_modified = datetime.fromtimestamp(entry.stat().st_mtime)
-            sys_file = SystemFile(name,
-                                  size,
-                                  True,
-                                  time_created=time_created,
-                                  time_modified=time_modified)
-            for sub_child in sub_children:
-                sys_file.add_child(sub_child)
+            signature = (entry_stat.st_ino, entry_stat.st_mtime_ns, entry_stat.st_ctime_ns)
+            cached = self.__file_cache.get(entry.path)
+            if cached is not None and cached[0] == signature and \
+                    len(cached[1].children) == len(sub_children) and \
+                    all(a is b for a, b in zip(cached[1].children, sub_children)):
+                sys_file = cached[1]
+            else:
+                sys_file = self.__create_dir_system_file(entry, sub_children)
         else:
-            file_size = entry.stat().st_size
-            # Check if it's a partial lftp file, and if so, use the lftp
-            # status to get the real file size
-            lftp_status_file_path = entry.path + SystemScanner.__LFTP_STATUS_FILE_SUFFIX
-            if os.path.isfile(lftp_status_file_path):
-                with open(lftp_status_file_path, "r") as f:
-                    file_size = SystemScanner._lftp_status_file_size(f.read())
-            # Check to see if this is a lftp temp file, and if so, use the real name
-            file_name = entry.name.encode('utf-8', 'surrogateescape').decode('utf-8', 'replace')
-            if self.__lftp_temp_file_suffix is not None and \
-                    file_name != self.__lftp_temp_file_suffix and \
-                    file_name.endswith(self.__lftp_temp_file_suffix):
-                file_name = file_name[:-len(self.__lftp_temp_file_suffix)]
-            time_created = None
-            try:
-                time_created = datetime.fromtimestamp(entry.stat().st_birthtime)
-            except AttributeError:
-                time_created = datetime.fromtimestamp(entry.stat().st_ctime)
-            time_modified = datetime.fromtimestamp(entry.stat().st_mtime)
-            sys_file = SystemFile(file_name,
-                                  file_size,
-                                  False,
-                                  time_created=time_created,
-                                  time_modified=time_modified)
+            # The lftp status file determines the size of partial files, so it's part of the signature
+            status_signature = None
+            status_path = self.__lftp_status_file_path(entry, status_names)
+            if status_path is not None:
+                try:
+                    status_stat = os.stat(status_path)
+                    if stat.S_ISREG(status_stat.st_mode):
+                        status_signature = (status_stat.st_ino, status_stat.st_size, status_stat.st_mtime_ns)
+                except (FileNotFoundError, NotADirectoryError):
+                    pass
+            signature = (entry_stat.st_ino, entry_stat.st_size, entry_stat.st_mtime_ns,
+                         entry_stat.st_ctime_ns, status_signature)
+            cached = self.__file_cache.get(entry.path)
+            if cached is not None and cached[0] == signature:
+                sys_file = cached[1]
+            else:
+                sys_file = self.__create_file_system_file(entry, status_names)
+        self.__next_file_cache[entry.path] = (signature, sys_file)
+        return sys_file
+
+    def __create_system_file_uncached(self, entry, status_names: Optional[Set[str]]) -> SystemFile:
+        if entry.is_dir():
+            return self.__create_dir_system_file(entry, self.__create_children(entry.path))
+        else:
+            return self.__create_file_system_file(entry, status_names)
+
+    def __create_dir_system_file(self, entry, sub_children: List[SystemFile]) -> SystemFile:
+        name = entry.name.encode('utf-8', 'surrogateescape').decode('utf-8', 'replace')
+        size = sum(sub_child.size for sub_child in sub_children)
+        time_created = None
+        try:
+            time_created = datetime.fromtimestamp(entry.stat().st_birthtime)
+        except AttributeError:
+            time_created = datetime.fromtimestamp(entry.stat().st_ctime)
+        time_modified = datetime.fromtimestamp(entry.stat().st_mtime)
+        sys_file = SystemFile(name,
+                              size,
+                              True,
+                              time_created=time_created,
+                              time_modified=time_modified)
+        for sub_child in sub_children:
+            sys_file.add_child(sub_child)
         return sys_file
 
+    def __create_file_system_file(self, entry, status_names: Optional[Set[str]]) -> SystemFile:
+        file_size = entry.stat().st_size
+        # Check if it's a partial lftp file, and if so, use the lftp
+        # status to get the real file size
+        lftp_status_file_path = self.__lftp_status_file_path(entry, status_names)
+        if lftp_status_file_path is not None and os.path.isfile(lftp_status_file_path):
+            with open(lftp_status_file_path, "r") as f:
+                file_size = SystemScanner._lftp_status_file_size(f.read())
+        # Check to see if this is a lftp temp file, and if so, use the real name
+        file_name = entry.name.encode('utf-8', 'surrogateescape').decode('utf-8', 'replace')
+        if self.__lftp_temp_file_suffix is not None and \
+                file_name != self.__lftp_temp_file_suffix and \
+                file_name.endswith(self.__lftp_temp_file_suffix):
+            file_name = file_name[:-len(self.__lftp_temp_file_suffix)]
+        time_created = None
+        try:
+            time_created = datetime.fromtimestamp(entry.stat().st_birthtime)
+        except AttributeError:
+            time_created = datetime.fromtimestamp(entry.stat().st_ctime)
+        time_modified = datetime.fromtimestamp(entry.stat().st_mtime)
+        return SystemFile(file_name,
+                          file_size,
+                          False,
+                          time_created=time_created,
+                          time_modified=time_modified)
+
+    @staticmethod
+    def __lftp_status_file_path(entry, status_names: Optional[Set[str]]) -> Optional[str]:
+        """
+        Returns the path of the entry's lftp status file
+        Returns None if the directory listing shows that there isn't one
+        """
+        status_path = entry.path + SystemScanner.__LFTP_STATUS_FILE_SUFFIX
+        if status_names is not None and os.path.basename(status_path) not in status_names:
+            return None
+        return status_path
+
+    def __create_root_children(self) -> List[SystemFile]:
+        if self.__num_threads > 1:
+            self.__prefetched = self.__prefetch_listings(self.path_to_scan)
+        try:
+            return self.__create_children(self.path_to_scan)
+        finally:
+            self.__prefetched = None
+
     def __create_children(self, path: str) -> List[SystemFile]:
         children = []
+        entries, status_names = self.__get_listing(path)
         # Files may get deleted while scanning, ignore the error
-        for entry in os.scandir(path):
-            # Skip excluded entries
-            skip = False
-            for prefix in self.exclude_prefixes:
-                if entry.name.startswith(prefix):
-                    skip = True
-            for suffix in self.exclude_suffixes:
-                if entry.name.endswith(suffix):
-                    skip = True
-            if skip:
-                continue
-
+        for entry in entries:
             try:
-                sys_file = self.__create_system_file(entry)
+                sys_file = self.__create_system_file(entry, status_names)
             except FileNotFoundError:
                 continue
             children.append(sys_file)
         children.sort(key=lambda fl: fl.name)
         return children
 
+    def __get_listing(self, path: str):
+        """
+        Returns the (entries, status names) of the given directory
+        The listing comes from the parallel walk if there was one
+        """
+        listing = None
+        if self.__prefetched is not None:
+            listing = self.__prefetched.pop(path, None)
+        if listing is None:
+            listing = self.__list_dir_any(path)
+        elif isinstance(listing, Exception):
+            # Raise listing errors in the same place as a serial scan would
+            raise listing
+        entries, status_names, cache_hit = listing
+        if cache_hit is True:
+            self.cache_hits += 1
+        elif cache_hit is False:
+            self.cache_misses += 1
+        return entries, status_names
+
+    def __list_dir_any(self, path: str):
+        if self.__incremental:
+            return self.__list_dir_cached(path)
+        entries, status_names = self.__list_dir(path)
+        return entries, status_names, None
+
+    def __prefetch_listings(self, root_path: str) -> Dict[str, object]:
+        """
+        Lists the whole tree using a pool of threads
+        Workers only list a single directory each and never wait on other
+        workers; sub-directories are queued from this thread as results
+        come in.
+        """
+        listings = dict()
+        results = queue.Queue()
+        with ThreadPoolExecutor(max_workers=self.__num_threads) as executor:
+            executor.submit(self.__prefetch_listing, root_path, results)
+            num_pending = 1
+            while num_pending > 0:
+                path, listing = results.get()
+                num_pending -= 1
+                listings[path] = listing
+                if isinstance(listing, Exception):
+                    continue
+                for entry in listing[0]:
+                    if entry.is_dir():
+                        executor.submit(self.__prefetch_listing, entry.path, results)
+                        num_pending += 1
+        return listings
+
+    def __prefetch_listing(self, path: str, results: queue.Queue):
+        try:
+            listing = self.__list_dir_any(path)
+        except Exception as e:
+            listing = e
+        results.put((path, listing))
+
+    def __list_dir(self, path: str):
+        """
+        Returns the DirEntry objects in the given directory, minus the excluded ones,
+        and the names of the lftp status files in the directory
+        Entries are stat'ed here so that a parallel walk does the I/O on the worker threads
+        """
+        entries = []
+        status_names = set()
+        with os.scandir(path) as it:
+            for entry in it:
+                if entry.name.endswith(SystemScanner.__LFTP_STATUS_FILE_SUFFIX):
+                    status_names.add(entry.name)
+                # Skip excluded entries
+                if self.is_excluded(entry.name):
+                    continue
+                # DirEntry caches these results
+                try:
+                    entry.is_dir()
+                    entry.stat()
+                except FileNotFoundError:
+                    # Deleted while scanning, or a broken symlink
+                    continue
+                entries.append(entry)
+        return entries, status_names
+
+    def __list_dir_cached(self, path: str):
+        """
+        Same as __list_dir, but reuses the entry names from the previous scan
+        if the directory hasn't changed since then
+        Also returns whether the cache was hit
+        """
+        # Note: stat the directory before listing it, so that a change that races
+        #       with the listing invalidates the cache entry on the next scan
+        dir_stat = os.stat(path)
+        signature = (dir_stat.st_ino, dir_stat.st_mtime_ns, dir_stat.st_ctime_ns)
+        cached = self.__dir_cache.get(path)
+        if cached is None or cached[0] != signature:
+            entries, status_names = self.__list_dir(path)
+            self.__next_dir_cache[path] = (signature, [entry.name for entry in entries], status_names)
+            return entries, status_names, False
+
+        self.__next_dir_cache[path] = cached
+        entries = []
+        for name in cached[1]:
+            entry_path = os.path.join(path, name)
+            try:
+                entry_stat = os.stat(entry_path)
+            except FileNotFoundError:
+                continue
+            entries.append(PseudoDirEntry(
+                name=name,
+                path=entry_path,
+                is_dir=stat.S_ISDIR(entry_stat.st_mode),
+                stat=entry_stat
+            ))
+        return entries, cached[2], True
+
     @staticmethod
     def _lftp_status_file_size(status: str) -> int:
         """
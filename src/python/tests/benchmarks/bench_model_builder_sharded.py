@@ -0,0 +1,56 @@
+# Copyright 2017, Inderpreet Singh, All rights reserved.
+
+"""
+Benchmark for the sharded model build
+
+Times a cold ModelBuilder.build_model() of a library, in-process and
+sharded across worker processes. Reports the wall-clock time and the CPU
+time of the calling (controller) thread, which is what holds the GIL and
+stalls the web server threads.
+
+Usage (from src/python):
+    python -m tests.benchmarks.bench_model_builder_sharded --roots 10000 50000 100000
+"""
+
+import argparse
+import time
+
+from controller import ModelBuilder
+from .bench_scan_wire_format import build_tree
+
+
+def main():
+    parser = argparse.ArgumentParser(description="sharded model build benchmark")
+    parser.add_argument("--roots", type=int, nargs="+", default=[10000, 50000, 100000],
+                        help="Number of root files in each library")
+    parser.add_argument("--files-per-dir", type=int, default=4)
+    parser.add_argument("--runs", type=int, default=3)
+    args = parser.parse_args()
+
+    print("{:>8} {:<10} {:>10} {:>10}".format("roots", "mode", "wall", "thread"))
+    for num_roots in args.roots:
+        # build_tree counts the root and its files as entries
+        remote_files = build_tree(num_roots * (args.files_per_dir + 1), args.files_per_dir)
+        local_files = build_tree(num_roots // 2 * (args.files_per_dir + 1), args.files_per_dir)
+        for mode, shard_min_roots in [("in-process", 0), ("sharded", 1)]:
+            best_wall = None
+            best_thread = None
+            for _ in range(args.runs):
+                model_builder = ModelBuilder(shard_min_roots=shard_min_roots)
+                model_builder.set_remote_files(remote_files)
+                model_builder.set_local_files(local_files)
+                wall_start = time.perf_counter()
+                thread_start = time.thread_time()
+                model = model_builder.build_model()
+                thread_time = time.thread_time() - thread_start
+                wall_time = time.perf_counter() - wall_start
+                model_builder.close()
+                if len(model.get_file_names()) != len(remote_files):
+                    raise RuntimeError("Wrong number of files in the model")
+                best_wall = wall_time if best_wall is None else min(best_wall, wall_time)
+                best_thread = thread_time if best_thread is None else min(best_thread, thread_time)
+            print("{:>8} {:<10} {:>9.3f}s {:>9.3f}s".format(num_roots, mode, best_wall, best_thread))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+# Copyright 2017, Inderpreet Singh, All rights reserved.
+
+"""
+Benchmark for building the model of a large downloading mirror job
+
+Builds the model of a single mirror job with many files, some of which
+are actively transferring, and times a full build and a rebuild after a
+progress update of the active transfers.
+
+Usage (from src/python):
+    python -m tests.benchmarks.bench_model_builder_transfers --files 10000 --active 50
+"""
+
+import argparse
+
+from controller import ModelBuilder
+from lftp import LftpJobStatus
+from system import SystemFile
+from .bench_scan_wire_format import best_time
+
+
+def build_sources(num_files: int, files_per_dir: int, num_active: int, transferred: int):
+    """
+    Build the remote, local and lftp status of a partially downloaded mirror job
+    The first num_active files (spread over the sub-directories) are transferring
+    """
+    num_dirs = (num_files + files_per_dir - 1) // files_per_dir
+    remote = SystemFile("Some.Show.S01.1080p.WEB-DL.x264-GROUP", 0, True)
+    local = SystemFile("Some.Show.S01.1080p.WEB-DL.x264-GROUP", 0, True)
+    status = LftpJobStatus(0, LftpJobStatus.Type.MIRROR, LftpJobStatus.State.RUNNING, remote.name, "")
+    status.total_transfer_state = LftpJobStatus.TransferState(None, None, None, 1000000, 100)
+    active_paths = set()
+    for i in range(num_active):
+        active_paths.add("Disc{:03d}/Part{:04d}.rar".format(i % num_dirs, i // num_dirs))
+    for d in range(num_dirs):
+        dir_name = "Disc{:03d}".format(d)
+        remote_dir = SystemFile(dir_name, 0, True)
+        local_dir = SystemFile(dir_name, 0, True)
+        for f in range(min(files_per_dir, num_files - d * files_per_dir)):
+            file_name = "Part{:04d}.rar".format(f)
+            path = "{}/{}".format(dir_name, file_name)
+            remote_dir.add_child(SystemFile(file_name, 1000000, False))
+            if path in active_paths:
+                local_dir.add_child(SystemFile(file_name, transferred, False))
+                status.add_active_file_transfer_state(
+                    path, LftpJobStatus.TransferState(transferred, 1000000, transferred // 10000, 20000, 50)
+                )
+            else:
+                local_dir.add_child(SystemFile(file_name, 1000000, False))
+        remote.add_child(remote_dir)
+        local.add_child(local_dir)
+    return remote, local, status
+
+
+def main():
+    parser = argparse.ArgumentParser(description="model builder benchmark for a large mirror job")
+    parser.add_argument("--files", type=int, default=10000, help="Number of files in the job")
+    parser.add_argument("--files-per-dir", type=int, default=100)
+    parser.add_argument("--active", type=int, default=50, help="Number of active transfers")
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    def full_build():
+        remote, local, status = build_sources(args.files, args.files_per_dir, args.active, 1000)
+        model_builder = ModelBuilder()
+        model_builder.set_remote_files([remote])
+        model_builder.set_local_files([local])
+        model_builder.set_lftp_statuses([status])
+        return lambda: model_builder.build_model()
+
+    def rebuild():
+        remote, local, status = build_sources(args.files, args.files_per_dir, args.active, 1000)
+        model_builder = ModelBuilder()
+        model_builder.set_remote_files([remote])
+        model_builder.set_local_files([local])
+        model_builder.set_lftp_statuses([status])
+        model_builder.build_model()
+        remote, local, status = build_sources(args.files, args.files_per_dir, args.active, 2000)
+        model_builder.set_local_files([local])
+        model_builder.set_lftp_statuses([status])
+        return lambda: model_builder.build_model()
+
+    print("Mirror job with {} files, {} active transfers".format(args.files, args.active))
+    for name, setup in [("full build", full_build), ("rebuild", rebuild)]:
+        # Each run needs a fresh builder, so only the build itself is timed
+        best = None
+        for _ in range(args.runs):
+            build = setup()
+            elapsed, _ = best_time(build, 1)
+            best = elapsed if best is None else min(best, elapsed)
+        print("{:<12} {:>9.3f}s".format(name, best))
+
+
+if __name__ == "__main__":
+    main()
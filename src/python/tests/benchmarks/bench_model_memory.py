@@ -0,0 +1,74 @@
+# Copyright 2017, Inderpreet Singh, All rights reserved.
+
+"""
+Benchmark for the memory footprint of scanned and built files
+
+Builds a synthetic remote tree, copies it as a fully downloaded local tree,
+builds the model from them and reports the memory retained per SystemFile
+and per ModelFile node.
+
+Usage (from src/python):
+    python -m tests.benchmarks.bench_model_memory --entries 100000
+"""
+
+import argparse
+import gc
+import tracemalloc
+from typing import List
+
+from controller import ModelBuilder
+from system import SystemFile
+from .bench_scan_wire_format import build_tree
+
+
+def count_nodes(files: List[SystemFile]) -> int:
+    count = 0
+    stack = list(files)
+    while stack:
+        file = stack.pop()
+        count += 1
+        stack.extend(file.children)
+    return count
+
+
+def traced_size(func):
+    """
+    Returns the result of func and the memory that it still holds on to
+    """
+    gc.collect()
+    tracemalloc.start()
+    try:
+        result = func()
+        gc.collect()
+        size, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return result, size
+
+
+def main():
+    parser = argparse.ArgumentParser(description="memory footprint of scanned and built files")
+    parser.add_argument("--entries", type=int, default=100000, help="Number of entries in the tree")
+    parser.add_argument("--files-per-dir", type=int, default=12)
+    args = parser.parse_args()
+
+    remote_files, remote_size = traced_size(lambda: build_tree(args.entries, args.files_per_dir))
+    local_files = build_tree(args.entries, args.files_per_dir)
+    num_nodes = count_nodes(remote_files)
+
+    def build_model():
+        model_builder = ModelBuilder()
+        model_builder.set_remote_files(remote_files)
+        model_builder.set_local_files(local_files)
+        model = model_builder.build_model()
+        # Only keep the model, not the builder's caches
+        return model
+    model, model_size = traced_size(build_model)
+
+    print("nodes:       {}".format(num_nodes))
+    print("SystemFile:  {:.0f} bytes/node".format(remote_size / num_nodes))
+    print("ModelFile:   {:.0f} bytes/node".format(model_size / num_nodes))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+# Copyright 2017, Inderpreet Singh, All rights reserved.
+
+"""
+Benchmark for passing scan results from a scanner process to the controller
+
+Compares the time spent on the controller thread to receive a full scan
+result when it is pickled through the IPC queue, and when its encoding is
+passed through a SharedScanBuffer. The "pop" column is the time to get the
+result out of the queue (and shared memory); "pop+files" also includes
+accessing its files, which decodes them in the shared memory case.
+
+Only the controller side is timed, so the pickle numbers leave out reading
+the payload from the queue's pipe.
+
+Usage (from src/python):
+    python -m tests.benchmarks.bench_scan_result_transport --entries 10000 100000 1000000
+"""
+
+import argparse
+import pickle
+from datetime import datetime
+
+from controller import ScannerResult
+from controller.scan.scanner_process import SharedScannerResult
+from controller.scan.shared_buffer import SharedScanBuffer
+from system import SystemFileCodec
+from .bench_scan_wire_format import build_tree, best_time
+
+
+def main():
+    parser = argparse.ArgumentParser(description="scan result transport benchmark")
+    parser.add_argument("--entries", type=int, nargs="+", default=[10000, 100000, 1000000],
+                        help="Number of entries in each tree")
+    parser.add_argument("--files-per-dir", type=int, default=12)
+    parser.add_argument("--runs", type=int, default=3)
+    args = parser.parse_args()
+
+    print("{:>10} {:<8} {:>12} {:>10} {:>10}".format("entries", "method", "queue bytes", "pop", "pop+files"))
+    for num_entries in args.entries:
+        root_files = build_tree(num_entries, args.files_per_dir)
+        result = ScannerResult(timestamp=datetime.now(), files=root_files)
+
+        # Pickled through the queue
+        pickle_data = pickle.dumps(result)
+        pickle_pop_time, _ = best_time(lambda: pickle.loads(pickle_data), args.runs)
+
+        # Through shared memory, with only the descriptor pickled
+        writer = SharedScanBuffer()
+        reader = SharedScanBuffer()
+        try:
+            descriptor = writer.write(SystemFileCodec.encode(root_files))
+            if descriptor is None:
+                raise RuntimeError("Not enough shared memory")
+            shared_data = pickle.dumps(SharedScannerResult(result, descriptor))
+
+            def shared_pop():
+                return pickle.loads(shared_data).load(reader)
+
+            def shared_pop_files():
+                return shared_pop().files
+            shared_pop_time, _ = best_time(shared_pop, args.runs)
+            shared_pop_files_time, shared_files = best_time(shared_pop_files, args.runs)
+        finally:
+            reader.close()
+            writer.close()
+        if shared_files != root_files:
+            raise RuntimeError("Decoded tree differs from the original")
+
+        for name, size, pop_time, pop_files_time in [
+            ("pickle", len(pickle_data), pickle_pop_time, pickle_pop_time),
+            ("shm", len(shared_data), shared_pop_time, shared_pop_files_time),
+        ]:
+            print("{:>10} {:<8} {:>12} {:>9.3f}s {:>9.3f}s".format(
+                num_entries, name, size, pop_time, pop_files_time
+            ))
+
+
+if __name__ == "__main__":
+    main()
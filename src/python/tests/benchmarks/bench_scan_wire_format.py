@@ -0,0 +1,94 @@
+# Copyright 2017, Inderpreet Singh, All rights reserved.
+
+"""
+Benchmark for the scan_fs output formats
+
+Compares the payload size, encode time and decode time of pickle and
+SystemFileCodec on a synthetic remote tree.
+
+Usage (from src/python):
+    python -m tests.benchmarks.bench_scan_wire_format --entries 100000
+"""
+
+import argparse
+import pickle
+import time
+from datetime import datetime, timedelta
+from typing import List
+
+from system import SystemFile, SystemFileCodec
+
+
+def build_tree(num_entries: int, files_per_dir: int) -> List[SystemFile]:
+    """
+    Build a seedbox-like tree: root directories of releases, each containing some files
+    """
+    root_files = []
+    base_time = datetime(2020, 1, 1)
+    count = 0
+    index = 0
+    while count < num_entries:
+        timestamp = base_time + timedelta(seconds=index * 37, microseconds=index)
+        sub_files = []
+        for i in range(min(files_per_dir, num_entries - count - 1)):
+            sub_files.append(SystemFile(
+                "Some.Show.S01E{:02d}.1080p.WEB-DL.x264-GROUP.mkv".format(i),
+                1000000 + index * i,
+                False,
+                time_created=timestamp,
+                time_modified=timestamp + timedelta(seconds=i)
+            ))
+        root = SystemFile(
+            "Some.Show.S01.1080p.WEB-DL.x264-GROUP.{}".format(index),
+            sum(f.size for f in sub_files),
+            True,
+            time_created=timestamp,
+            time_modified=timestamp
+        )
+        for sub_file in sub_files:
+            root.add_child(sub_file)
+        root_files.append(root)
+        count += 1 + len(sub_files)
+        index += 1
+    return root_files
+
+
+def best_time(func, num_runs: int):
+    best = None
+    result = None
+    for _ in range(num_runs):
+        start = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="scan_fs output format benchmark")
+    parser.add_argument("--entries", type=int, default=100000, help="Number of entries in the tree")
+    parser.add_argument("--files-per-dir", type=int, default=12)
+    parser.add_argument("--runs", type=int, default=3)
+    args = parser.parse_args()
+
+    root_files = build_tree(args.entries, args.files_per_dir)
+    print("Tree with {} entries".format(args.entries))
+
+    pickle_encode_time, pickle_data = best_time(lambda: pickle.dumps(root_files), args.runs)
+    pickle_decode_time, pickle_files = best_time(lambda: pickle.loads(pickle_data), args.runs)
+    binary_encode_time, binary_data = best_time(lambda: SystemFileCodec.encode(root_files), args.runs)
+    binary_decode_time, binary_files = best_time(lambda: SystemFileCodec.decode(binary_data), args.runs)
+    if pickle_files != root_files or binary_files != root_files:
+        raise RuntimeError("Decoded tree differs from the original")
+
+    print("{:<8} {:>12} {:>10} {:>10}".format("format", "bytes", "encode", "decode"))
+    for name, size, encode_time, decode_time in [
+        ("pickle", len(pickle_data), pickle_encode_time, pickle_decode_time),
+        ("binary", len(binary_data), binary_encode_time, binary_decode_time),
+    ]:
+        print("{:<8} {:>12} {:>9.3f}s {:>9.3f}s".format(name, size, encode_time, decode_time))
+    print("binary payload is {:.1f}% of pickle".format(100.0 * len(binary_data) / len(pickle_data)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+# Copyright 2017, Inderpreet Singh, All rights reserved.
+
+"""
+Benchmark for the SystemScanner walk modes
+
+Builds a synthetic tree and times serial, parallel, incremental and
+parallel+incremental scans of it. The speedup of the parallel walk depends
+heavily on the filesystem latency, so use --path to put the tree on the
+filesystem of interest (e.g. an NFS or SMB mount), or use --latency-ms to
+simulate a per-directory round trip on a local tree.
+
+Usage (from src/python):
+    python -m tests.benchmarks.bench_system_scanner --entries 100000 --threads 8
+"""
+
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+from system import SystemScanner
+
+
+def add_scandir_latency(latency_in_s: float):
+    """
+    Delay every os.scandir call, similar to a READDIR round trip on a network filesystem
+    """
+    real_scandir = os.scandir
+
+    def slow_scandir(path):
+        time.sleep(latency_in_s)
+        return real_scandir(path)
+    os.scandir = slow_scandir
+
+
+def build_tree(root: str, num_entries: int, files_per_dir: int, dirs_per_dir: int) -> int:
+    """
+    Build a tree with roughly the given number of entries
+    :return: the actual number of entries created
+    """
+    count = 0
+    pending = [root]
+    while pending and count < num_entries:
+        parent = pending.pop(0)
+        for i in range(files_per_dir):
+            if count >= num_entries:
+                break
+            with open(os.path.join(parent, "file{}.bin".format(i)), "wb") as f:
+                f.write(b"\0" * (i % 7))
+            count += 1
+        for i in range(dirs_per_dir):
+            if count >= num_entries:
+                break
+            path = os.path.join(parent, "dir{}".format(i))
+            os.mkdir(path)
+            pending.append(path)
+            count += 1
+    return count
+
+
+def time_scans(scanner: SystemScanner, num_runs: int):
+    """
+    :return: (time of first scan, best time of the remaining scans, result)
+    """
+    start = time.perf_counter()
+    result = scanner.scan()
+    first = time.perf_counter() - start
+    best = None
+    for _ in range(num_runs):
+        start = time.perf_counter()
+        scanner.scan()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return first, best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="SystemScanner benchmark")
+    parser.add_argument("--entries", type=int, default=100000, help="Number of entries in the tree")
+    parser.add_argument("--files-per-dir", type=int, default=40)
+    parser.add_argument("--dirs-per-dir", type=int, default=8)
+    parser.add_argument("--threads", type=int, default=8, help="Number of threads for the parallel walk")
+    parser.add_argument("--runs", type=int, default=3, help="Number of repeated scans")
+    parser.add_argument("--path", default=None, help="Directory in which to create the tree")
+    parser.add_argument("--latency-ms", type=float, default=0,
+                        help="Simulated latency of each directory listing")
+    args = parser.parse_args()
+
+    root = tempfile.mkdtemp(prefix="bench_system_scanner", dir=args.path)
+    try:
+        print("Building tree in {}...".format(root))
+        num_entries = build_tree(root, args.entries, args.files_per_dir, args.dirs_per_dir)
+        print("Created {} entries".format(num_entries))
+        if args.latency_ms > 0:
+            add_scandir_latency(args.latency_ms / 1000)
+
+        reference = None
+        baseline = None
+        for name, num_threads, incremental in [
+            ("serial", 1, False),
+            ("parallel", args.threads, False),
+            ("serial incremental", 1, True),
+            ("parallel incremental", args.threads, True),
+        ]:
+            scanner = SystemScanner(root)
+            scanner.set_num_threads(num_threads)
+            scanner.set_incremental(incremental)
+            first, best, result = time_scans(scanner, args.runs)
+            if reference is None:
+                reference = result
+                baseline = best
+            elif result != reference:
+                raise RuntimeError("{} scan result differs from the serial scan".format(name))
+            print("{:<22} first {:8.3f}s  repeat {:8.3f}s  speedup {:5.2f}x".format(
+                name, first, best, baseline / best
+            ))
+    finally:
+        shutil.rmtree(root)
+
+
+if __name__ == "__main__":
+    main()
@@ -289,7 +289,14 @@ class TestConfig(unittest.TestCase):
             "interval_ms_downloading_scan": "2000",
             "extract_path": "/extract/path",
             "use_local_path_as_extract_path": "True",
-            "max_tracked_files": "10000"
+            "max_tracked_files": "10000",
+            "use_local_inotify": "True",
+            "num_local_scan_threads": "4",
+            "num_remote_scan_threads": "8",
+            "use_remote_scan_agent": "False",
+            "use_remote_inotify": "True",
+            "use_shared_memory_scan_results": "True",
+            "model_build_shard_min_roots": "5000"
         }
         controller = Config.Controller.from_dict(good_dict)
         self.assertEqual(30000, controller.interval_ms_remote_scan)
@@ -298,6 +305,13 @@ class TestConfig(unittest.TestCase):
         self.assertEqual("/extract/path", controller.extract_path)
         self.assertEqual(True, controller.use_local_path_as_extract_path)
         self.assertEqual(10000, controller.max_tracked_files)
+        self.assertEqual(True, controller.use_local_inotify)
+        self.assertEqual(4, controller.num_local_scan_threads)
+        self.assertEqual(8, controller.num_remote_scan_threads)
+        self.assertEqual(False, controller.use_remote_scan_agent)
+        self.assertEqual(True, controller.use_remote_inotify)
+        self.assertEqual(True, controller.use_shared_memory_scan_results)
+        self.assertEqual(5000, controller.model_build_shard_min_roots)
 
         self.check_common(Config.Controller,
                           good_dict,
@@ -321,6 +335,34 @@ class TestConfig(unittest.TestCase):
         self.check_bad_value_error(Config.Controller, good_dict, "use_local_path_as_extract_path", "-1")
         self.check_bad_value_error(Config.Controller, good_dict, "max_tracked_files", "-1")
         self.check_bad_value_error(Config.Controller, good_dict, "max_tracked_files", "0")
+        self.check_bad_value_error(Config.Controller, good_dict, "use_local_inotify", "SomeString")
+        self.check_bad_value_error(Config.Controller, good_dict, "num_local_scan_threads", "0")
+        self.check_bad_value_error(Config.Controller, good_dict, "num_local_scan_threads", "-1")
+        self.check_bad_value_error(Config.Controller, good_dict, "num_remote_scan_threads", "0")
+        self.check_bad_value_error(Config.Controller, good_dict, "num_remote_scan_threads", "-1")
+        self.check_bad_value_error(Config.Controller, good_dict, "use_remote_scan_agent", "SomeString")
+        self.check_bad_value_error(Config.Controller, good_dict, "use_remote_inotify", "SomeString")
+        self.check_bad_value_error(Config.Controller, good_dict, "use_shared_memory_scan_results", "SomeString")
+        self.check_bad_value_error(Config.Controller, good_dict, "model_build_shard_min_roots", "-1")
+        self.check_bad_value_error(Config.Controller, good_dict, "model_build_shard_min_roots", "SomeString")
+
+    def test_controller_optional_keys_use_defaults(self):
+        good_dict = {
+            "interval_ms_remote_scan": "30000",
+            "interval_ms_local_scan": "10000",
+            "interval_ms_downloading_scan": "2000",
+            "extract_path": "/extract/path",
+            "use_local_path_as_extract_path": "True",
+            "max_tracked_files": "10000"
+        }
+        controller = Config.Controller.from_dict(good_dict)
+        self.assertEqual(False, controller.use_local_inotify)
+        self.assertEqual(1, controller.num_local_scan_threads)
+        self.assertEqual(1, controller.num_remote_scan_threads)
+        self.assertEqual(False, controller.use_remote_scan_agent)
+        self.assertEqual(False, controller.use_remote_inotify)
+        self.assertEqual(False, controller.use_shared_memory_scan_results)
+        self.assertEqual(20000, controller.model_build_shard_min_roots)
 
     def test_web(self):
         good_dict = {
@@ -480,6 +522,13 @@ class TestConfig(unittest.TestCase):
         config.controller.extract_path = "/path/extract/stuff"
         config.controller.use_local_path_as_extract_path = True
         config.controller.max_tracked_files = 10000
+        config.controller.use_local_inotify = True
+        config.controller.num_local_scan_threads = 4
+        config.controller.num_remote_scan_threads = 2
+        config.controller.use_remote_scan_agent = False
+        config.controller.use_remote_inotify = True
+        config.controller.use_shared_memory_scan_results = True
+        config.controller.model_build_shard_min_roots = 5000
         config.web.port = 13
         config.autoqueue.enabled = True
         config.autoqueue.patterns_only = True
@@ -526,6 +575,13 @@ class TestConfig(unittest.TestCase):
         extract_path = /path/extract/stuff
         use_local_path_as_extract_path = True
         max_tracked_files = 10000
+        use_local_inotify = True
+        num_local_scan_threads = 4
+        num_remote_scan_threads = 2
+        use_remote_scan_agent = False
+        use_remote_inotify = True
+        use_shared_memory_scan_results = True
+        model_build_shard_min_roots = 5000
 
         [Web]
         port = 13
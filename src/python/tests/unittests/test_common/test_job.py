@@ -25,6 +25,25 @@ class DummyFailingJob(Job):
         self.cleanup_run = True
 
 
+class DummyWaitingJob(Job):
+    def setup(self):
+        # noinspection PyAttributeOutsideInit
+        self.executes = 0
+        # noinspection PyAttributeOutsideInit
+        self.waits = 0
+
+    def execute(self):
+        self.executes += 1
+
+    def wait(self):
+        self.waits += 1
+        if self.waits == 3:
+            self.terminate()
+
+    def cleanup(self):
+        pass
+
+
 class TestJob(unittest.TestCase):
     def test_exception_propagates(self):
         context = MagicMock()
@@ -46,3 +65,13 @@ class TestJob(unittest.TestCase):
         job.terminate()
         job.join()
         self.assertTrue(job.cleanup_run)
+
+    def test_wait_runs_between_executes(self):
+        context = MagicMock()
+        # noinspection PyTypeChecker
+        job = DummyWaitingJob("DummyWaitingJob", context)
+        job.start()
+        job.join(timeout=5)
+        self.assertFalse(job.is_alive())
+        self.assertEqual(3, job.executes)
+        self.assertEqual(3, job.waits)
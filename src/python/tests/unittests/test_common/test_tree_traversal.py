@@ -0,0 +1,51 @@
+# Copyright 2017, Inderpreet Singh, All rights reserved.
+
+import unittest
+
+from common import TreeTraversal
+
+
+class TestTreeTraversal(unittest.TestCase):
+    def setUp(self):
+        # a -> (aa -> (aaa, aab), ab), b
+        self.tree = {
+            "a": ["aa", "ab"],
+            "aa": ["aaa", "aab"],
+            "aaa": [],
+            "aab": [],
+            "ab": [],
+            "b": []
+        }
+
+    def test_pre_order(self):
+        self.assertEqual(
+            ["a", "aa", "aaa", "aab", "ab", "b"],
+            list(TreeTraversal.pre_order(["a", "b"], self.tree.get))
+        )
+        self.assertEqual([], list(TreeTraversal.pre_order([], self.tree.get)))
+
+    def test_fold(self):
+        expanded = []
+        combined = []
+
+        def expand(node):
+            expanded.append(node)
+            return self.tree[node]
+
+        def combine(node, results):
+            combined.append(node)
+            # Number of nodes in the subtree
+            return 1 + sum(results)
+
+        self.assertEqual(5, TreeTraversal.fold("a", expand, combine))
+        self.assertEqual(["a", "aa", "aaa", "aab", "ab"], expanded)
+        self.assertEqual(["aaa", "aab", "aa", "ab", "a"], combined)
+
+    def test_fold_deep_tree(self):
+        depth = 10000
+        result = TreeTraversal.fold(
+            0,
+            lambda node: [node + 1] if node < depth else [],
+            lambda node, results: 1 + sum(results)
+        )
+        self.assertEqual(depth + 1, result)
@@ -367,6 +367,35 @@ class TestAutoQueue(unittest.TestCase):
         self.assertEqual(set([Controller.Command.Action.QUEUE]*3), {c.action for c in commands})
         self.assertEqual({"File.One", "File.Two", "File.Three"}, {c.filename for c in commands})
 
+    def test_matching_batched_new_files_are_queued(self):
+        persist = AutoQueuePersist()
+        persist.add_pattern(AutoQueuePattern(pattern="File.*"))
+
+        # noinspection PyTypeChecker
+        auto_queue = AutoQueue(self.context, persist, self.controller)
+
+        file_one = ModelFile("File.One", True)
+        file_one.remote_size = 100
+        file_two = ModelFile("File.Two", True)
+        file_two.remote_size = 200
+        file_three = ModelFile("File.Three", True)
+        file_three.remote_size = 300
+
+        self.model_listener.files_changed([
+            (None, file_one),
+            (file_two, None),
+            (file_two, file_three),
+            (None, file_three)
+        ])
+        self.assertEqual([file_one, file_three], self.model_listener.new_files)
+        self.assertEqual([(file_two, file_three)], self.model_listener.modified_files)
+        auto_queue.process()
+        calls = self.controller.queue_command.call_args_list
+        self.assertEqual(2, len(calls))
+        commands = [call[0][0] for call in calls]
+        self.assertEqual({Controller.Command.Action.QUEUE}, {c.action for c in commands})
+        self.assertEqual({"File.One", "File.Three"}, {c.filename for c in commands})
+
     def test_matching_initial_files_are_queued(self):
         persist = AutoQueuePersist()
         persist.add_pattern(AutoQueuePattern(pattern="File.One"))
@@ -40,3 +40,12 @@ class TestControllerJob(unittest.TestCase):
     def test_cleanup_exits_controller(self):
         self.job.cleanup()
         self.mock_controller.exit.assert_called_once()
+
+    def test_wait_waits_for_controller_work(self):
+        self.job.wait()
+        self.mock_controller.wait_for_work.assert_called_once()
+
+    def test_terminate_wakes_controller(self):
+        self.job.terminate()
+        self.assertTrue(self.job.shutdown_flag.is_set())
+        self.mock_controller.wake.assert_called_once()
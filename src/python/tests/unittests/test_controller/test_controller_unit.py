@@ -1,5 +1,6 @@
 # Copyright 2017, Inderpreet Singh, All rights reserved.
 
+import threading
 import unittest
 from unittest.mock import MagicMock, patch, call
 from queue import Queue
@@ -113,6 +114,12 @@ class TestControllerInit(BaseControllerTestCase):
     def test_init_creates_file_operation_manager(self):
         self.mock_file_op_manager_cls.assert_called_once()
 
+    def test_init_wakes_on_new_work(self):
+        # Scanner results, completed extractions and webhook imports all set the same event
+        wake_event = self.mock_scan_manager_cls.call_args.kwargs["result_event"]
+        self.assertIs(wake_event, self.mock_file_op_manager_cls.call_args.kwargs["completed_event"])
+        self.mock_webhook_manager.set_import_callback.assert_called_once_with(self.controller.wake)
+
     def test_init_creates_memory_monitor(self):
         self.mock_memory_monitor_cls.assert_called_once()
         self.mock_memory_monitor.set_base_logger.assert_called_once()
@@ -153,6 +160,7 @@ class TestControllerLifecycle(BaseControllerTestCase):
         self.mock_lftp_manager.exit.assert_called_once()
         self.mock_scan_manager.stop.assert_called_once()
         self.mock_file_op_manager.stop.assert_called_once()
+        self.mock_model_builder.close.assert_called_once()
         self.mock_mp_logger.stop.assert_called_once()
 
     def test_exit_without_start_is_safe(self):
@@ -218,12 +226,75 @@ class TestControllerPublicAPI(BaseControllerTestCase):
         self._add_file_to_model("another_file", remote_size=200)
         mock_listener.file_added.assert_called_once()
 
+    def test_get_model_changes_and_add_listener(self):
+        self._add_file_to_model("existing_file", remote_size=100)
+        mock_listener = MagicMock(spec=IModelListener)
+        journal_id, version, files, changes = \
+            self.controller.get_model_changes_and_add_listener(mock_listener, None, None)
+        self.assertEqual(["existing_file"], [f.name for f in files])
+        self.assertIsNone(changes)
+
+        # Resume from the returned version
+        self.controller.remove_model_listener(mock_listener)
+        new_file = self._add_file_to_model("another_file", remote_size=200)
+        _, new_version, files, changes = \
+            self.controller.get_model_changes_and_add_listener(mock_listener, journal_id, version)
+        self.assertEqual(version + 1, new_version)
+        self.assertIsNone(files)
+        self.assertEqual([(None, new_file)], changes)
+        # Listener should be active
+        self._add_file_to_model("third_file", remote_size=200)
+        mock_listener.file_added.assert_called_once()
+
+        # Versions of another model can't be resumed from
+        self.controller.remove_model_listener(mock_listener)
+        _, _, files, changes = \
+            self.controller.get_model_changes_and_add_listener(mock_listener, "other", version)
+        self.assertEqual(3, len(files))
+        self.assertIsNone(changes)
+
+    def test_model_readers_do_not_wait_for_model_update(self):
+        self._add_file_to_model("existing_file", remote_size=100)
+        mock_listener = MagicMock(spec=IModelListener)
+        results = []
+
+        def read():
+            results.append(self.controller.get_model_files())
+            results.append(self.controller.get_model_files_and_add_listener(mock_listener))
+            results.append(self.controller.get_model_changes_and_add_listener(mock_listener, None, None)[2])
+
+        # Hold the model lock as a model update in progress would
+        with self.controller._Controller__model_lock:
+            reader = threading.Thread(target=read)
+            reader.start()
+            reader.join(timeout=5)
+            self.assertFalse(reader.is_alive())
+        self.assertEqual([["existing_file"]] * 3, [[f.name for f in files] for files in results])
+
     def test_queue_command_adds_to_queue(self):
         cmd = Controller.Command(Controller.Command.Action.QUEUE, "file")
         self.controller.queue_command(cmd)
         self.assertEqual(1, self.controller._Controller__command_queue.qsize())
 
 
+    def test_queue_command_wakes_wait_for_work(self):
+        self.controller.wait_for_work()
+        self.controller.queue_command(Controller.Command(Controller.Command.Action.QUEUE, "file"))
+        waiter = threading.Thread(target=self.controller.wait_for_work)
+        waiter.start()
+        # Returns long before the max process interval
+        waiter.join(timeout=0.1)
+        self.assertFalse(waiter.is_alive())
+
+    def test_wait_for_work_times_out(self):
+        self.controller.wake()
+        self.controller.wait_for_work()
+        # A wake is only seen once
+        with patch.object(Controller, "_Controller__MAX_PROCESS_INTERVAL_IN_SECS", 0.01):
+            self.controller.wait_for_work()
+        self.assertFalse(self.controller._Controller__wake_event.is_set())
+
+
 class TestControllerCommandQueue(BaseControllerTestCase):
     """Tests for QUEUE command processing."""
 
@@ -575,7 +646,258 @@ class TestControllerCommandCommon(BaseControllerTestCase):
         self.controller.process()
         mock_cb1.on_success.assert_called_once()
         mock_cb2.on_success.assert_called_once()
-        self.assertEqual(2, self.mock_lftp_manager.queue.call_count)
+        # Commands are executed one at a time, only batch commands are batched
+        self.assertEqual([call("file1", False), call("file2", False)], self.mock_lftp_manager.queue.call_args_list)
+        self.mock_lftp_manager.queue_many.assert_not_called()
+
+    def test_queue_commands(self):
+        self._add_file_to_model("file1", remote_size=5000)
+        self._add_file_to_model("file2")  # not on remote
+        self._add_file_to_model("dir3", is_dir=True, remote_size=3000)
+        self.persist.stopped_file_names.add("dir3")
+        callbacks = []
+        for name in ["file1", "file2", "missing", "dir3"]:
+            cmd = Controller.Command(Controller.Command.Action.QUEUE, name)
+            callbacks.append(MagicMock(spec=Controller.Command.ICallback))
+            cmd.add_callback(callbacks[-1])
+            self.controller.queue_command(cmd)
+        self.controller.process()
+        self.assertEqual([call("file1", False), call("dir3", True)], self.mock_lftp_manager.queue.call_args_list)
+        callbacks[0].on_success.assert_called_once_with()
+        callbacks[1].on_failure.assert_called_once_with("File 'file2' does not exist remotely", 404)
+        callbacks[2].on_failure.assert_called_once_with("File 'missing' not found", 404)
+        callbacks[3].on_success.assert_called_once_with()
+        self.assertNotIn("dir3", self.persist.stopped_file_names)
+
+    def test_queue_commands_lftp_error_fails_only_its_command(self):
+        self._add_file_to_model("file1", remote_size=5000)
+        self._add_file_to_model("file2", remote_size=3000)
+        self.mock_lftp_manager.queue.side_effect = [LftpError("boom"), None]
+        callbacks = []
+        for name in ["file1", "file2"]:
+            cmd = Controller.Command(Controller.Command.Action.QUEUE, name)
+            callbacks.append(MagicMock(spec=Controller.Command.ICallback))
+            cmd.add_callback(callbacks[-1])
+            self.controller.queue_command(cmd)
+        self.controller.process()
+        callbacks[0].on_failure.assert_called_once_with("Lftp error: boom", 500)
+        callbacks[0].on_success.assert_not_called()
+        callbacks[1].on_success.assert_called_once_with()
+        callbacks[1].on_failure.assert_not_called()
+
+    def test_stop_commands(self):
+        self._add_file_to_model("file1", state=ModelFile.State.DOWNLOADING)
+        self._add_file_to_model("file2", state=ModelFile.State.DEFAULT)
+        self._add_file_to_model("file3", state=ModelFile.State.QUEUED)
+        self._add_file_to_model("file4", state=ModelFile.State.QUEUED)
+        # lftp has no job for file4
+        self.mock_lftp_manager.kill.side_effect = lambda name: name != "file4"
+        callbacks = []
+        for name in ["file1", "file2", "file3", "file4"]:
+            cmd = Controller.Command(Controller.Command.Action.STOP, name)
+            callbacks.append(MagicMock(spec=Controller.Command.ICallback))
+            cmd.add_callback(callbacks[-1])
+            self.controller.queue_command(cmd)
+        self.controller.process()
+        self.assertEqual([call("file1"), call("file3"), call("file4")], self.mock_lftp_manager.kill.call_args_list)
+        self.mock_lftp_manager.kill_many.assert_not_called()
+        callbacks[0].on_success.assert_called_once_with()
+        callbacks[1].on_failure.assert_called_once_with("File 'file2' is not Queued or Downloading", 409)
+        callbacks[2].on_success.assert_called_once_with()
+        callbacks[3].on_failure.assert_called_once_with("File 'file4' is not Queued or Downloading", 409)
+        self.assertEqual({"file1", "file3"}, set(self.persist.stopped_file_names))
+
+    def test_commands_executed_in_order(self):
+        self._add_file_to_model("file1", remote_size=5000, state=ModelFile.State.QUEUED)
+        self._add_file_to_model("file2", remote_size=3000)
+        for action, name in [(Controller.Command.Action.QUEUE, "file2"),
+                             (Controller.Command.Action.STOP, "file1"),
+                             (Controller.Command.Action.QUEUE, "file1")]:
+            self.controller.queue_command(Controller.Command(action, name))
+        self.controller.process()
+        self.assertEqual(
+            [call.queue("file2", False), call.kill("file1"), call.queue("file1", False)],
+            [c for c in self.mock_lftp_manager.mock_calls if c[0] in ("queue", "kill")]
+        )
+        self.mock_lftp_manager.queue_many.assert_not_called()
+
+
+class TestControllerBatchCommand(BaseControllerTestCase):
+    """Tests for Controller.BatchCommand processing."""
+
+    def setUp(self):
+        super().setUp()
+        self._make_controller_started()
+
+    def _queue_and_process_batch_command(self, action, filenames):
+        """Helper: queue and process a batch command, and return its results."""
+        batch_command = Controller.BatchCommand(action, filenames)
+        mock_cb = MagicMock(spec=Controller.BatchCommand.ICallback)
+        batch_command.add_callback(mock_cb)
+        self.controller.queue_batch_command(batch_command)
+        self.controller.process()
+        mock_cb.on_complete.assert_called_once()
+        return mock_cb.on_complete.call_args[0][0]
+
+    def _summary(self, results):
+        return [(name, r.success, r.error, r.error_code) for name, r in results.items()]
+
+    def test_queue_batch(self):
+        self._add_file_to_model("file1", remote_size=5000)
+        self._add_file_to_model("file2")  # not on remote
+        self._add_file_to_model("dir3", is_dir=True, remote_size=3000)
+        self.persist.stopped_file_names.add("dir3")
+        results = self._queue_and_process_batch_command(
+            Controller.Command.Action.QUEUE, ["file1", "file2", "missing", "dir3"]
+        )
+        self.mock_lftp_manager.queue_many.assert_called_once_with([("file1", False), ("dir3", True)])
+        self.assertEqual([
+            ("file1", True, None, None),
+            ("file2", False, "File 'file2' does not exist remotely", 404),
+            ("missing", False, "File 'missing' not found", 404),
+            ("dir3", True, None, None),
+        ], self._summary(results))
+        self.assertNotIn("dir3", self.persist.stopped_file_names)
+
+    def test_queue_batch_of_one_file(self):
+        self._add_file_to_model("file1", remote_size=5000)
+        results = self._queue_and_process_batch_command(Controller.Command.Action.QUEUE, ["file1"])
+        self.mock_lftp_manager.queue.assert_called_once_with("file1", False)
+        self.mock_lftp_manager.queue_many.assert_not_called()
+        self.assertEqual([("file1", True, None, None)], self._summary(results))
+
+    def test_queue_batch_lftp_error_retries_files_one_at_a_time(self):
+        self._add_file_to_model("file1", remote_size=5000)
+        self._add_file_to_model("file2", remote_size=3000)
+        self.mock_lftp_manager.queue_many.side_effect = LftpError("boom")
+        self.mock_lftp_manager.queue.side_effect = [None, LftpError("file2 boom")]
+        results = self._queue_and_process_batch_command(
+            Controller.Command.Action.QUEUE, ["file1", "file2", "missing"]
+        )
+        self.assertEqual([call("file1", False), call("file2", False)], self.mock_lftp_manager.queue.call_args_list)
+        self.assertEqual([
+            ("file1", True, None, None),
+            ("file2", False, "Lftp error: file2 boom", 500),
+            ("missing", False, "File 'missing' not found", 404),
+        ], self._summary(results))
+        self.assertNotIn("file1", self.persist.stopped_file_names)
+
+    def test_stop_batch_lftp_error_retries_files_one_at_a_time(self):
+        self._add_file_to_model("file1", state=ModelFile.State.DOWNLOADING)
+        self._add_file_to_model("file2", state=ModelFile.State.QUEUED)
+        self._add_file_to_model("file3", state=ModelFile.State.QUEUED)
+        self.mock_lftp_manager.kill_many.side_effect = LftpJobStatusParserError("bad status")
+        self.mock_lftp_manager.kill.side_effect = [True, False, LftpError("boom")]
+        results = self._queue_and_process_batch_command(
+            Controller.Command.Action.STOP, ["file1", "file2", "file3"]
+        )
+        self.assertEqual([
+            ("file1", True, None, None),
+            ("file2", False, "File 'file2' is not Queued or Downloading", 409),
+            ("file3", False, "Lftp error: boom", 500),
+        ], self._summary(results))
+        self.assertEqual({"file1"}, set(self.persist.stopped_file_names))
+
+    def test_stop_batch(self):
+        self._add_file_to_model("file1", state=ModelFile.State.DOWNLOADING)
+        self._add_file_to_model("file2")
+        self._add_file_to_model("file3", state=ModelFile.State.QUEUED)
+        self._add_file_to_model("file4", state=ModelFile.State.QUEUED)
+        # lftp has no job for file4
+        self.mock_lftp_manager.kill_many.return_value = {"file1": True, "file3": True, "file4": False}
+        results = self._queue_and_process_batch_command(
+            Controller.Command.Action.STOP, ["file1", "file2", "file3", "file4"]
+        )
+        self.mock_lftp_manager.kill_many.assert_called_once_with(["file1", "file3", "file4"])
+        self.assertEqual([True, False, True, False], [r.success for r in results.values()])
+        self.assertEqual(409, results["file2"].error_code)
+        self.assertEqual(("File 'file4' is not Queued or Downloading", 409),
+                         (results["file4"].error, results["file4"].error_code))
+        self.assertEqual({"file1", "file3"}, set(self.persist.stopped_file_names))
+
+    def test_extract_batch(self):
+        file1 = self._add_file_to_model("file1", local_size=100)
+        self._add_file_to_model("file2")  # not local
+        file3 = self._add_file_to_model("file3", state=ModelFile.State.DOWNLOADED, local_size=100)
+        results = self._queue_and_process_batch_command(
+            Controller.Command.Action.EXTRACT, ["file1", "file2", "file3"]
+        )
+        self.mock_file_op_manager.extract_many.assert_called_once_with([file1, file3])
+        self.mock_file_op_manager.extract.assert_not_called()
+        self.assertEqual([True, False, True], [r.success for r in results.values()])
+        self.assertEqual("File 'file2' does not exist locally", results["file2"].error)
+
+    def test_delete_local_batch(self):
+        file1 = self._add_file_to_model("file1", local_size=100)
+        file2 = self._add_file_to_model("file2", local_size=100)
+        self._add_file_to_model("file3", state=ModelFile.State.DOWNLOADING, local_size=100)
+        results = self._queue_and_process_batch_command(
+            Controller.Command.Action.DELETE_LOCAL, ["file1", "file2", "file3"]
+        )
+        self.mock_file_op_manager.delete_local_many.assert_called_once_with([file1, file2])
+        self.assertEqual([True, True, False], [r.success for r in results.values()])
+        self.assertEqual(409, results["file3"].error_code)
+        self.assertEqual({"file1", "file2"}, set(self.persist.stopped_file_names))
+
+    def test_delete_remote_batch(self):
+        file1 = self._add_file_to_model("file1", remote_size=100)
+        file2 = self._add_file_to_model("file2", state=ModelFile.State.DELETED, remote_size=100)
+        self._add_file_to_model("file3")  # not on remote
+        results = self._queue_and_process_batch_command(
+            Controller.Command.Action.DELETE_REMOTE, ["file1", "file2", "file3"]
+        )
+        self.mock_file_op_manager.delete_remote_many.assert_called_once_with([file1, file2])
+        self.assertEqual([True, True, False], [r.success for r in results.values()])
+        self.assertEqual(404, results["file3"].error_code)
+
+    def test_duplicate_files_executed_once(self):
+        self._add_file_to_model("file1", remote_size=5000)
+        self._add_file_to_model("file2", remote_size=5000)
+        results = self._queue_and_process_batch_command(
+            Controller.Command.Action.QUEUE, ["file1", "file2", "file1"]
+        )
+        self.mock_lftp_manager.queue_many.assert_called_once_with([("file1", False), ("file2", False)])
+        self.assertEqual(["file1", "file2"], list(results.keys()))
+
+    def test_all_files_invalid_executes_nothing(self):
+        results = self._queue_and_process_batch_command(
+            Controller.Command.Action.QUEUE, ["missing1", "missing2"]
+        )
+        self.mock_lftp_manager.queue.assert_not_called()
+        self.mock_lftp_manager.queue_many.assert_not_called()
+        self.assertEqual([False, False], [r.success for r in results.values()])
+
+    def test_batch_ordered_with_other_commands(self):
+        self._add_file_to_model("file1", remote_size=5000, state=ModelFile.State.QUEUED)
+        self._add_file_to_model("file2", remote_size=3000)
+        self.controller.queue_command(Controller.Command(Controller.Command.Action.STOP, "file1"))
+        self.controller.queue_batch_command(
+            Controller.BatchCommand(Controller.Command.Action.QUEUE, ["file1", "file2"])
+        )
+        self.controller.queue_command(Controller.Command(Controller.Command.Action.STOP, "file2"))
+        self.controller.process()
+        self.assertEqual(
+            [call.kill("file1"), call.queue_many([("file1", False), ("file2", False)])],
+            [c for c in self.mock_lftp_manager.mock_calls if c[0] in ("kill", "queue_many")]
+        )
+        # The batch queued file1 again after it was stopped
+        self.assertNotIn("file1", self.persist.stopped_file_names)
+
+    def test_1000_file_batch_in_one_process(self):
+        names = ["file{}".format(i) for i in range(1000)]
+        self.controller._Controller__model.apply_batch([
+            (None, self._make_remote_file(name)) for name in names
+        ])
+        results = self._queue_and_process_batch_command(Controller.Command.Action.QUEUE, names)
+        self.mock_lftp_manager.queue_many.assert_called_once()
+        self.assertEqual(1000, len(self.mock_lftp_manager.queue_many.call_args[0][0]))
+        self.assertTrue(all(r.success for r in results.values()))
+
+    @staticmethod
+    def _make_remote_file(name):
+        f = ModelFile(name, False)
+        f.remote_size = 100
+        return f
 
 
 class TestControllerCollect(BaseControllerTestCase):
@@ -612,6 +934,7 @@ class TestControllerFeedModelBuilder(BaseControllerTestCase):
 
     def test_remote_scan_sets_remote_files(self):
         remote_scan = MagicMock()
+        remote_scan.is_partial = False
         self.controller._feed_model_builder(
             remote_scan, None, None, None, None, []
         )
@@ -619,11 +942,34 @@ class TestControllerFeedModelBuilder(BaseControllerTestCase):
 
     def test_local_scan_sets_local_files(self):
         local_scan = MagicMock()
+        local_scan.is_partial = False
         self.controller._feed_model_builder(
             None, local_scan, None, None, None, []
         )
         self.mock_model_builder.set_local_files.assert_called_once_with(local_scan.files)
 
+    def test_partial_remote_scan_updates_remote_files(self):
+        remote_scan = MagicMock()
+        remote_scan.is_partial = True
+        self.controller._feed_model_builder(
+            remote_scan, None, None, None, None, []
+        )
+        self.mock_model_builder.update_remote_files.assert_called_once_with(
+            remote_scan.files, remote_scan.partial_names
+        )
+        self.mock_model_builder.set_remote_files.assert_not_called()
+
+    def test_partial_local_scan_updates_local_files(self):
+        local_scan = MagicMock()
+        local_scan.is_partial = True
+        self.controller._feed_model_builder(
+            None, local_scan, None, None, None, []
+        )
+        self.mock_model_builder.update_local_files.assert_called_once_with(
+            local_scan.files, local_scan.partial_names
+        )
+        self.mock_model_builder.set_local_files.assert_not_called()
+
     def test_active_scan_sets_active_files(self):
         active_scan = MagicMock()
         self.controller._feed_model_builder(
@@ -633,10 +979,11 @@ class TestControllerFeedModelBuilder(BaseControllerTestCase):
 
     def test_lftp_statuses_sets_lftp_statuses(self):
         lftp_statuses = [MagicMock()]
+        self.mock_lftp_manager.status_version = 7
         self.controller._feed_model_builder(
             None, None, None, lftp_statuses, None, []
         )
-        self.mock_model_builder.set_lftp_statuses.assert_called_once_with(lftp_statuses)
+        self.mock_model_builder.set_lftp_statuses.assert_called_once_with(lftp_statuses, 7)
 
     def test_extract_statuses_sets_extract_statuses(self):
         extract_statuses = MagicMock()
@@ -1044,6 +1391,24 @@ class TestControllerWebhookIntegration(BaseControllerTestCase):
         self.assertIn("File.A", self.persist.imported_file_names)
         self.assertIn("File.B", self.persist.imported_file_names)
 
+    def test_webhook_imports_update_model_in_one_batch(self):
+        self._add_file_to_model("File.A", remote_size=5000)
+        self._add_file_to_model("File.B", remote_size=3000)
+        model = self.controller._Controller__model
+        version = model.version
+        listener = MagicMock()
+        model.add_listener(listener)
+        self.mock_webhook_manager.process.return_value = ["File.A", "File.B", "File.A", "Missing"]
+        with patch.object(model, "update_file", wraps=model.update_file) as update_file:
+            self.controller.process()
+        update_file.assert_not_called()
+        listener.files_changed.assert_called_once()
+        self.assertEqual(["File.A", "File.B"],
+                         sorted(new.name for _, new in listener.files_changed.call_args[0][0]))
+        self.assertEqual(version + 2, model.version)
+        for name in ["File.A", "File.B"]:
+            self.assertEqual(ModelFile.ImportStatus.IMPORTED, model.get_file(name).import_status)
+
     def test_webhook_no_imports_when_empty(self):
         self.mock_webhook_manager.process.return_value = []
         self.controller.process()
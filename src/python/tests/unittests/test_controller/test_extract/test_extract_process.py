@@ -278,3 +278,27 @@ class TestExtractProcess(unittest.TestCase):
         self.process.extract(c)
         while self.extract_counter.value < 3:
             pass
+
+    @timeout_decorator.timeout(5)
+    def test_forwards_batched_extract_commands(self):
+        a = ModelFile("a", False)
+        a.local_size = 100
+        b = ModelFile("b", False)
+        b.local_size = 200
+        c = ModelFile("c", True)
+        c.local_size = 300
+
+        self.extract_names = multiprocessing.Manager().list()
+
+        def _extract(file: ModelFile):
+            self.extract_names.append(file.name)
+        self.mock_dispatch.extract.side_effect = _extract
+
+        self.process = ExtractProcess(out_dir_path="", local_path="")
+        self.process.start()
+
+        self.process.extract_many([a, b])
+        self.process.extract(c)
+        while len(self.extract_names) < 3:
+            pass
+        self.assertEqual(["a", "b", "c"], list(self.extract_names))
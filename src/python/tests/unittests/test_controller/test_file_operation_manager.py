@@ -132,6 +132,23 @@ class TestFileOperationManager(unittest.TestCase):
 
         mock_extract.extract.assert_called_once_with(mock_file)
 
+    @patch('controller.file_operation_manager.ExtractProcess')
+    def test_extract_many_delegates_to_extract_process(self, mock_extract_class):
+        """Test that extract_many() delegates to ExtractProcess.extract_many()."""
+        mock_extract = MagicMock()
+        mock_extract_class.return_value = mock_extract
+        mock_files = [MagicMock(), MagicMock()]
+
+        manager = FileOperationManager(
+            self.mock_context,
+            self.mock_mp_logger,
+            self.mock_force_local_scan,
+            self.mock_force_remote_scan
+        )
+        manager.extract_many(mock_files)
+
+        mock_extract.extract_many.assert_called_once_with(mock_files)
+
     @patch('controller.file_operation_manager.ExtractProcess')
     def test_pop_extract_statuses_delegates_to_extract_process(self, mock_extract_class):
         """Test that pop_extract_statuses() delegates to ExtractProcess."""
@@ -255,7 +272,7 @@ class TestFileOperationManager(unittest.TestCase):
         self.assertTrue(result)
         mock_delete_class.assert_called_once_with(
             local_path="/local/path",
-            file_name="test_file"
+            file_names=["test_file"]
         )
         mock_delete.start.assert_called_once()
 
@@ -284,10 +301,68 @@ class TestFileOperationManager(unittest.TestCase):
             remote_password="password",
             remote_port=22,
             remote_path="/remote/path",
-            file_name="test_file"
+            file_names=["test_file"]
         )
         mock_delete.start.assert_called_once()
 
+    @patch('controller.file_operation_manager.DeleteLocalProcess')
+    @patch('controller.file_operation_manager.ExtractProcess')
+    def test_delete_local_many_starts_one_delete_process(self, mock_extract_class, mock_delete_class):
+        """Test that delete_local_many() starts a single DeleteLocalProcess for all files."""
+        mock_extract_class.return_value = MagicMock()
+        mock_delete = MagicMock()
+        mock_delete.is_alive.return_value = False
+        mock_delete_class.return_value = mock_delete
+        mock_file_a = MagicMock()
+        mock_file_a.name = "a"
+        mock_file_b = MagicMock()
+        mock_file_b.name = "b"
+
+        manager = FileOperationManager(
+            self.mock_context,
+            self.mock_mp_logger,
+            self.mock_force_local_scan,
+            self.mock_force_remote_scan
+        )
+        result = manager.delete_local_many([mock_file_a, mock_file_b])
+
+        self.assertTrue(result)
+        mock_delete_class.assert_called_once_with(
+            local_path="/local/path",
+            file_names=["a", "b"]
+        )
+        mock_delete.start.assert_called_once()
+        manager.cleanup_completed_processes()
+        self.mock_force_local_scan.assert_called_once_with(["a", "b"])
+
+    @patch('controller.file_operation_manager.DeleteRemoteProcess')
+    @patch('controller.file_operation_manager.ExtractProcess')
+    def test_delete_remote_many_starts_one_delete_process(self, mock_extract_class, mock_delete_class):
+        """Test that delete_remote_many() starts a single DeleteRemoteProcess for all files."""
+        mock_extract_class.return_value = MagicMock()
+        mock_delete = MagicMock()
+        mock_delete.is_alive.return_value = False
+        mock_delete_class.return_value = mock_delete
+        mock_file_a = MagicMock()
+        mock_file_a.name = "a"
+        mock_file_b = MagicMock()
+        mock_file_b.name = "b"
+
+        manager = FileOperationManager(
+            self.mock_context,
+            self.mock_mp_logger,
+            self.mock_force_local_scan,
+            self.mock_force_remote_scan
+        )
+        result = manager.delete_remote_many([mock_file_a, mock_file_b])
+
+        self.assertTrue(result)
+        mock_delete_class.assert_called_once()
+        self.assertEqual(["a", "b"], mock_delete_class.call_args.kwargs["file_names"])
+        mock_delete.start.assert_called_once()
+        manager.cleanup_completed_processes()
+        self.mock_force_remote_scan.assert_called_once_with(["a", "b"])
+
     @patch('controller.file_operation_manager.DeleteRemoteProcess')
     @patch('controller.file_operation_manager.ExtractProcess')
     def test_delete_remote_uses_none_password_with_ssh_key(self, mock_extract_class, mock_delete_class):
@@ -330,7 +405,7 @@ class TestFileOperationManager(unittest.TestCase):
         manager.delete_local(mock_file)
         manager.cleanup_completed_processes()
 
-        self.mock_force_local_scan.assert_called_once()
+        self.mock_force_local_scan.assert_called_once_with(["test_file"])
         mock_delete.propagate_exception.assert_called_once()
 
     @patch('controller.file_operation_manager.DeleteLocalProcess')
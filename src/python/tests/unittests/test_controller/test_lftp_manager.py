@@ -96,9 +96,10 @@ class TestLftpManager(unittest.TestCase):
         """Test that kill() delegates to Lftp.kill()."""
         mock_lftp = MagicMock()
         mock_lftp_class.return_value = mock_lftp
+        mock_lftp.kill.return_value = False
 
         manager = LftpManager(self.mock_context)
-        manager.kill("test_file")
+        self.assertFalse(manager.kill("test_file"))
 
         mock_lftp.kill.assert_called_once_with("test_file")
 
@@ -114,6 +115,29 @@ class TestLftpManager(unittest.TestCase):
         with self.assertRaises(LftpError):
             manager.kill("test_file")
 
+    @patch('controller.lftp_manager.Lftp')
+    def test_queue_many_delegates_to_lftp(self, mock_lftp_class):
+        """Test that queue_many() delegates to Lftp.queue_many()."""
+        mock_lftp = MagicMock()
+        mock_lftp_class.return_value = mock_lftp
+
+        manager = LftpManager(self.mock_context)
+        manager.queue_many([("a", True), ("b", False)])
+
+        mock_lftp.queue_many.assert_called_once_with([("a", True), ("b", False)])
+
+    @patch('controller.lftp_manager.Lftp')
+    def test_kill_many_delegates_to_lftp(self, mock_lftp_class):
+        """Test that kill_many() delegates to Lftp.kill_many()."""
+        mock_lftp = MagicMock()
+        mock_lftp.kill_many.return_value = {"a": True, "b": False}
+        mock_lftp_class.return_value = mock_lftp
+
+        manager = LftpManager(self.mock_context)
+
+        self.assertEqual({"a": True, "b": False}, manager.kill_many(["a", "b"]))
+        mock_lftp.kill_many.assert_called_once_with(["a", "b"])
+
     @patch('controller.lftp_manager.Lftp')
     def test_status_returns_lftp_status(self, mock_lftp_class):
         """Test that status() returns Lftp status."""
@@ -152,6 +176,99 @@ class TestLftpManager(unittest.TestCase):
 
         self.assertIsNone(result)
 
+    @patch('controller.lftp_manager.time')
+    @patch('controller.lftp_manager.Lftp')
+    def test_status_polls_every_call_while_jobs_exist(self, mock_lftp_class, mock_time):
+        """Test that status() polls lftp on every call while it has jobs."""
+        mock_lftp = MagicMock()
+        mock_lftp.status.return_value = [MagicMock()]
+        mock_lftp_class.return_value = mock_lftp
+        mock_time.monotonic.return_value = 100.0
+
+        manager = LftpManager(self.mock_context)
+        for _ in range(3):
+            self.assertEqual(1, len(manager.status()))
+
+        self.assertEqual(3, mock_lftp.status.call_count)
+        self.assertEqual(0, manager.num_skipped_status_polls)
+
+    @patch('controller.lftp_manager.time')
+    @patch('controller.lftp_manager.Lftp')
+    def test_status_backs_off_while_idle(self, mock_lftp_class, mock_time):
+        """Test that status() polls an idle lftp at doubling intervals, up to a max."""
+        mock_lftp = MagicMock()
+        mock_lftp.status.return_value = []
+        mock_lftp_class.return_value = mock_lftp
+        mock_time.monotonic.return_value = 100.0
+
+        manager = LftpManager(self.mock_context)
+        self.assertEqual([], manager.status())
+        # Skipped until 1s later
+        mock_time.monotonic.return_value = 100.9
+        self.assertIsNone(manager.status())
+        self.assertEqual(1, mock_lftp.status.call_count)
+        self.assertEqual(1, manager.num_skipped_status_polls)
+        mock_time.monotonic.return_value = 101.0
+        self.assertEqual([], manager.status())
+        # Then 2s later
+        mock_time.monotonic.return_value = 102.9
+        self.assertIsNone(manager.status())
+        mock_time.monotonic.return_value = 103.0
+        self.assertEqual([], manager.status())
+        self.assertEqual(3, mock_lftp.status.call_count)
+        # Interval is capped
+        for now in [107.0, 115.0, 123.0, 131.0]:
+            mock_time.monotonic.return_value = now - 0.1
+            self.assertIsNone(manager.status())
+            mock_time.monotonic.return_value = now
+            self.assertEqual([], manager.status())
+        self.assertEqual(7, mock_lftp.status.call_count)
+
+    @patch('controller.lftp_manager.time')
+    @patch('controller.lftp_manager.Lftp')
+    def test_status_polls_again_after_jobs_change(self, mock_lftp_class, mock_time):
+        """Test that queueing or killing resets the idle back off."""
+        mock_lftp = MagicMock()
+        mock_lftp.status.return_value = []
+        mock_lftp_class.return_value = mock_lftp
+        mock_time.monotonic.return_value = 100.0
+
+        for change_jobs in [lambda m: m.queue("a", False),
+                            lambda m: m.queue_many([("a", False)]),
+                            lambda m: m.kill("a"),
+                            lambda m: m.kill_many(["a"])]:
+            manager = LftpManager(self.mock_context)
+            mock_lftp.status.reset_mock()
+            manager.status()
+            self.assertIsNone(manager.status())
+            change_jobs(manager)
+            self.assertEqual([], manager.status())
+            self.assertEqual(2, mock_lftp.status.call_count)
+
+    @patch('controller.lftp_manager.Lftp')
+    def test_status_error_does_not_back_off(self, mock_lftp_class):
+        """Test that status() polls again on the next call after an error."""
+        mock_lftp = MagicMock()
+        mock_lftp.status.side_effect = [LftpError("Status failed"), []]
+        mock_lftp_class.return_value = mock_lftp
+
+        manager = LftpManager(self.mock_context)
+        self.assertIsNone(manager.status())
+        self.assertEqual([], manager.status())
+        self.assertEqual(2, mock_lftp.status.call_count)
+
+    @patch('controller.lftp_manager.Lftp')
+    def test_status_version_and_metrics_delegate_to_lftp(self, mock_lftp_class):
+        """Test that status_version and status_metrics come from Lftp."""
+        mock_lftp = MagicMock()
+        mock_lftp.status_version = 5
+        mock_lftp_class.return_value = mock_lftp
+
+        manager = LftpManager(self.mock_context)
+
+        self.assertEqual(5, manager.status_version)
+        self.assertEqual(mock_lftp.status_metrics, manager.status_metrics)
+
     @patch('controller.lftp_manager.Lftp')
     def test_exit_delegates_to_lftp(self, mock_lftp_class):
         """Test that exit() delegates to Lftp.exit()."""
@@ -1,8 +1,12 @@
 # Copyright 2017, Inderpreet Singh, All rights reserved.
 
+import gc
 import logging
 import sys
+import tracemalloc
 import unittest
+import weakref
+from concurrent.futures import ProcessPoolExecutor
 from unittest.mock import patch
 from datetime import datetime
 
@@ -12,6 +16,7 @@ from model import ModelError, ModelFile, Model
 from controller import ModelBuilder
 from controller.extract import ExtractStatus
 from common.bounded_ordered_set import BoundedOrderedSet
+from common import TreeTraversal
 
 
 class TestModelBuilder(unittest.TestCase):
@@ -1323,6 +1328,29 @@ class TestModelBuilder(unittest.TestCase):
         self.model_builder.set_active_files([])
         self.assertFalse(self.model_builder.has_changes())
 
+    def test_lftp_statuses_of_same_version_are_skipped(self):
+        s_a = LftpJobStatus(0, LftpJobStatus.Type.PGET, LftpJobStatus.State.QUEUED, "a", "")
+        s_b = LftpJobStatus(1, LftpJobStatus.Type.PGET, LftpJobStatus.State.QUEUED, "b", "")
+        self.model_builder.set_lftp_statuses([s_a], status_version=1)
+        model = self.model_builder.build_model()
+        self.assertEqual({"a"}, model.get_file_names())
+
+        # Same version is taken to be unchanged, even if the statuses differ
+        self.model_builder.set_lftp_statuses([s_a, s_b], status_version=1)
+        self.assertFalse(self.model_builder.has_changes())
+
+        # New version is compared
+        self.model_builder.set_lftp_statuses([s_a, s_b], status_version=2)
+        self.assertTrue(self.model_builder.has_changes())
+        model = self.model_builder.build_model()
+        self.assertEqual({"a", "b"}, model.get_file_names())
+
+        # Clear forgets the version
+        self.model_builder.clear()
+        self.model_builder.set_lftp_statuses([s_a], status_version=2)
+        model = self.model_builder.build_model()
+        self.assertEqual({"a"}, model.get_file_names())
+
     def test_rebuild_on_local_files(self):
         self.assertTrue(self.model_builder.has_changes())
 
@@ -1454,3 +1482,286 @@ class TestModelBuilder(unittest.TestCase):
         # Invalidate on different
         self.model_builder.set_extracted_files({"a", "c"})
         self.assertTrue(self.model_builder.has_changes())
+
+    def test_update_remote_files(self):
+        self.model_builder.set_remote_files([
+            SystemFile("a", 100, False),
+            SystemFile("b", 200, False),
+            SystemFile("c", 300, False)
+        ])
+        self.model_builder.build_model()
+        self.assertFalse(self.model_builder.has_changes())
+
+        # Does not invalidate on same
+        self.model_builder.update_remote_files([SystemFile("a", 100, False)], {"a", "d"})
+        self.assertFalse(self.model_builder.has_changes())
+
+        # Only the scanned files are replaced
+        self.model_builder.update_remote_files([SystemFile("b", 250, False)], {"b", "c"})
+        self.assertTrue(self.model_builder.has_changes())
+        model = self.model_builder.build_model()
+        self.assertEqual({"a", "b"}, model.get_file_names())
+        self.assertEqual(100, model.get_file("a").remote_size)
+        self.assertEqual(250, model.get_file("b").remote_size)
+
+    def test_update_local_files(self):
+        self.model_builder.set_local_files([
+            SystemFile("a", 100, False),
+            SystemFile("b", 200, False)
+        ])
+        self.model_builder.build_model()
+
+        self.model_builder.update_local_files([SystemFile("c", 300, False)], {"a", "c"})
+        self.assertTrue(self.model_builder.has_changes())
+        model = self.model_builder.build_model()
+        self.assertEqual({"b", "c"}, model.get_file_names())
+        self.assertEqual(200, model.get_file("b").local_size)
+        self.assertEqual(300, model.get_file("c").local_size)
+
+    def test_rebuilds_only_dirty_roots(self):
+        self.model_builder.set_remote_files([
+            SystemFile("a", 100, False),
+            SystemFile("b", 200, False)
+        ])
+        model = self.model_builder.build_model()
+        file_a = model.get_file("a")
+        file_b = model.get_file("b")
+
+        self.model_builder.set_remote_files([
+            SystemFile("a", 100, False),
+            SystemFile("b", 250, False)
+        ])
+        model = self.model_builder.build_model()
+        self.assertIs(file_a, model.get_file("a"))
+        self.assertIsNot(file_b, model.get_file("b"))
+        self.assertEqual(250, model.get_file("b").remote_size)
+
+        # Same set object, modified in place
+        downloaded_files = BoundedOrderedSet()
+        self.model_builder.set_downloaded_files(downloaded_files)
+        self.assertFalse(self.model_builder.has_changes())
+        downloaded_files.add("a")
+        self.model_builder.set_downloaded_files(downloaded_files)
+        self.assertTrue(self.model_builder.has_changes())
+        model = self.model_builder.build_model()
+        self.assertIsNot(file_a, model.get_file("a"))
+
+    def test_incremental_build_matches_full_build(self):
+        downloaded_files = BoundedOrderedSet()
+        extracted_files = BoundedOrderedSet()
+
+        def remote(b_size: int, with_c: bool):
+            r_a = SystemFile("a", 30, True)
+            r_a.add_child(SystemFile("aa", 10, False))
+            r_a.add_child(SystemFile("ab.rar", 20, False))
+            files = [r_a, SystemFile("b", b_size, False), SystemFile("d", 40, False)]
+            if with_c:
+                files.append(SystemFile("c", 50, False))
+            return files
+
+        def local(aa_size: int, ab_size: int, with_d: bool):
+            l_a = SystemFile("a", aa_size + ab_size, True)
+            l_a.add_child(SystemFile("aa", aa_size, False))
+            l_a.add_child(SystemFile("ab.rar", ab_size, False))
+            files = [l_a, SystemFile("b", 100, False)]
+            if with_d:
+                files.append(SystemFile("d", 40, False))
+            return files
+
+        def status(aa_local_size: int):
+            s_a = LftpJobStatus(0, LftpJobStatus.Type.MIRROR, LftpJobStatus.State.RUNNING, "a", "")
+            s_a.total_transfer_state = LftpJobStatus.TransferState(aa_local_size, 30, 10, 5, 2)
+            s_a.add_active_file_transfer_state("aa", LftpJobStatus.TransferState(aa_local_size, 10, 20, 5, 1))
+            return s_a
+
+        sources = dict()
+
+        def step(**kwargs):
+            sources.update(kwargs)
+            for key, value in kwargs.items():
+                getattr(self.model_builder, "set_" + key)(value)
+            incremental_model = self.model_builder.build_model()
+
+            full_builder = ModelBuilder()
+            for key, value in sources.items():
+                getattr(full_builder, "set_" + key)(value)
+            full_model = full_builder.build_model()
+
+            self.assertEqual(full_model.get_file_names(), incremental_model.get_file_names())
+            for name in full_model.get_file_names():
+                self.assertEqual(full_model.get_file(name), incremental_model.get_file(name))
+
+        step(remote_files=remote(100, True),
+             local_files=local(0, 0, True),
+             lftp_statuses=[],
+             extract_statuses=[],
+             downloaded_files=downloaded_files,
+             extracted_files=extracted_files)
+        step(lftp_statuses=[status(2)], local_files=local(2, 0, True))
+        step(lftp_statuses=[status(6)], local_files=local(6, 0, True))
+        step(lftp_statuses=[], local_files=local(10, 20, True))
+        step(remote_files=remote(150, True))
+        downloaded_files.add("a")
+        step(downloaded_files=downloaded_files)
+        step(extract_statuses=[ExtractStatus("a", True, ExtractStatus.State.EXTRACTING)])
+        extracted_files.add("a")
+        step(extract_statuses=[], extracted_files=extracted_files)
+        downloaded_files.add("d")
+        step(downloaded_files=downloaded_files, local_files=local(10, 20, False))
+        step(remote_files=remote(150, False))
+        step(local_files=[])
+
+    @staticmethod
+    def __build_downloading_dir(num_children: int, transferred: int):
+        """Sources of a dir that is downloading its first child"""
+        r_a = SystemFile("a", 100 * num_children, True)
+        l_a = SystemFile("a", 100 * (num_children - 1) + transferred, True)
+        for i in range(num_children):
+            r_a.add_child(SystemFile("a{}.rar".format(i), 100, False))
+            l_a.add_child(SystemFile("a{}.rar".format(i), transferred if i == 0 else 100, False))
+        s_a = LftpJobStatus(0, LftpJobStatus.Type.MIRROR, LftpJobStatus.State.RUNNING, "a", "")
+        s_a.total_transfer_state = LftpJobStatus.TransferState(None, None, None, 10, 5)
+        s_a.add_active_file_transfer_state("a0.rar", LftpJobStatus.TransferState(transferred, 100, None, 10, 5))
+        return r_a, l_a, s_a
+
+    def test_reuses_unchanged_child_subtrees(self):
+        r_a, l_a, s_a = self.__build_downloading_dir(3, 10)
+        self.model_builder.set_remote_files([r_a])
+        self.model_builder.set_local_files([l_a])
+        self.model_builder.set_lftp_statuses([s_a])
+        prev_file = self.model_builder.build_model().get_file("a")
+        prev_children = {f.name: f for f in prev_file.get_children()}
+        prev_file_ref = weakref.ref(prev_file)
+        del prev_file
+
+        r_a, l_a, s_a = self.__build_downloading_dir(3, 20)
+        self.model_builder.set_remote_files([r_a])
+        self.model_builder.set_local_files([l_a])
+        self.model_builder.set_lftp_statuses([s_a])
+        model_file = self.model_builder.build_model().get_file("a")
+        children = {f.name: f for f in model_file.get_children()}
+        self.assertIsNot(prev_children["a0.rar"], children["a0.rar"])
+        self.assertEqual(20, children["a0.rar"].local_size)
+        self.assertIs(prev_children["a1.rar"], children["a1.rar"])
+        self.assertIs(prev_children["a2.rar"], children["a2.rar"])
+        # Shared children don't keep the previous root alive, and don't need it for their path
+        gc.collect()
+        self.assertIsNone(prev_file_ref())
+        self.assertIsNone(children["a1.rar"].parent)
+        self.assertEqual("a/a1.rar", children["a1.rar"].full_path)
+        self.assertIs(model_file, children["a0.rar"].parent)
+        self.assertEqual(220, model_file.transferred_size)
+        self.assertTrue(model_file.is_extractable)
+
+        # Same as a full build
+        full_builder = ModelBuilder()
+        full_builder.set_remote_files([r_a])
+        full_builder.set_local_files([l_a])
+        full_builder.set_lftp_statuses([s_a])
+        self.assertEqual(full_builder.build_model().get_file("a"), model_file)
+
+        # Change of root state rebuilds the children
+        self.model_builder.set_lftp_statuses([])
+        model_file = self.model_builder.build_model().get_file("a")
+        self.assertIsNot(children["a1.rar"], model_file.get_children()[1])
+
+    def test_rebuild_reduces_allocations(self):
+        def measure(model_builder: ModelBuilder, transferred: int):
+            r_a, l_a, s_a = self.__build_downloading_dir(2000, transferred)
+            model_builder.set_remote_files([r_a])
+            model_builder.set_local_files([l_a])
+            model_builder.set_lftp_statuses([s_a])
+            # Collect cyclic garbage left behind by earlier tests so only this build is traced
+            gc.collect()
+            tracemalloc.start()
+            try:
+                model = model_builder.build_model()
+                # Full paths are cached once read, as the web stream reads them for every file
+                roots = [model.get_file(name) for name in model.get_file_names()]
+                for model_file in TreeTraversal.pre_order(roots, lambda f: f.get_children()):
+                    _ = model_file.full_path
+                del model
+                _, peak = tracemalloc.get_traced_memory()
+                gc.collect()
+                size, _ = tracemalloc.get_traced_memory()
+                # (allocated and still in use, peak)
+                return size, peak
+            finally:
+                tracemalloc.stop()
+
+        measure(self.model_builder, 10)
+        incremental_size, incremental_peak = measure(self.model_builder, 20)
+        full_size, full_peak = measure(ModelBuilder(), 20)
+        # What remains is per child bookkeeping: the subtree cache and the root's children
+        self.assertLess(incremental_size, full_size / 8)
+        self.assertLess(incremental_peak, full_peak / 2)
+
+    @patch("controller.model_builder.os.cpu_count", return_value=2)
+    def test_sharded_build_matches_in_process_build(self, _):
+        def set_sources(model_builder: ModelBuilder):
+            r_a = SystemFile("a", 30, True)
+            r_a.add_child(SystemFile("aa", 10, False))
+            r_a.add_child(SystemFile("ab.rar", 20, False))
+            l_a = SystemFile("a", 10, True)
+            l_a.add_child(SystemFile("aa", 10, False))
+            s_a = LftpJobStatus(0, LftpJobStatus.Type.MIRROR, LftpJobStatus.State.RUNNING, "a", "")
+            s_a.total_transfer_state = LftpJobStatus.TransferState(10, 30, 33, 10, 2)
+            model_builder.set_remote_files([r_a] + [SystemFile("r{}".format(i), i, False) for i in range(40)])
+            model_builder.set_local_files([l_a, SystemFile("r1", 1, False), SystemFile("r2", 2, False)])
+            model_builder.set_lftp_statuses([s_a])
+            model_builder.set_downloaded_files(BoundedOrderedSet(iterable=["d", "r3", "r4"]))
+            model_builder.set_extracted_files(BoundedOrderedSet(iterable=["r2"]))
+            return r_a, l_a
+
+        sharded_builder = ModelBuilder(shard_min_roots=10)
+        self.addCleanup(sharded_builder.close)
+        r_a, l_a = set_sources(sharded_builder)
+        in_process_builder = ModelBuilder()
+        set_sources(in_process_builder)
+        with self.assertLogs("ModelBuilder", level=logging.DEBUG) as logs, \
+                patch("controller.model_builder.ProcessPoolExecutor", wraps=ProcessPoolExecutor) as executor_cls:
+            sharded_model = sharded_builder.build_model()
+        self.assertIn("DEBUG:ModelBuilder:Building 41 roots in 8 shards", logs.output)
+        # Workers are not forked from this (multithreaded) process
+        executor_cls.assert_called_once()
+        self.assertNotEqual("fork", executor_cls.call_args.kwargs["mp_context"].get_start_method())
+        # Workers failing would fall back to an in-process build with a warning
+        self.assertFalse([line for line in logs.output if line.startswith("WARNING")])
+        in_process_model = in_process_builder.build_model()
+        self.assertEqual(in_process_model.get_file_names(), sharded_model.get_file_names())
+        for name in in_process_model.get_file_names():
+            self.assertEqual(in_process_model.get_file(name), sharded_model.get_file(name))
+        self.assertEqual(ModelFile.State.EXTRACTED, sharded_model.get_file("r2").state)
+        self.assertEqual(ModelFile.State.DOWNLOADING, sharded_model.get_file("a").state)
+        self.assertEqual(ModelFile.State.DELETED, sharded_model.get_file("r3").state)
+        file_a = sharded_model.get_file("a")
+        self.assertTrue(all(child.parent is file_a for child in file_a.get_children()))
+
+        # Subtrees built by the workers are reused by an in-process rebuild of the root,
+        # and refer to the builder's own sources
+        subtree_aa = sharded_builder._ModelBuilder__built_subtrees["a"]["aa"]
+        self.assertIs(r_a.children[0], subtree_aa[0])
+        self.assertIs(l_a.children[0], subtree_aa[1])
+        s_a = LftpJobStatus(0, LftpJobStatus.Type.MIRROR, LftpJobStatus.State.RUNNING, "a", "")
+        s_a.total_transfer_state = LftpJobStatus.TransferState(10, 30, 33, 20, 1)
+        sharded_builder.set_lftp_statuses([s_a])
+        rebuilt_file_a = sharded_builder.build_model().get_file("a")
+        self.assertIsNot(file_a, rebuilt_file_a)
+        self.assertEqual(
+            {id(child) for child in file_a.get_children()},
+            {id(child) for child in rebuilt_file_a.get_children()}
+        )
+
+        # The workers are kept for the next sharded build
+        sharded_builder.set_remote_files([SystemFile("r{}".format(i), i + 1, False) for i in range(40)])
+        with patch("controller.model_builder.ProcessPoolExecutor") as executor_cls:
+            self.assertEqual(41, len(sharded_builder.build_model().get_file_names()))
+        executor_cls.assert_not_called()
+
+        # Below the threshold, dirty roots are built in-process
+        sharded_builder = ModelBuilder(shard_min_roots=1000)
+        set_sources(sharded_builder)
+        with patch("controller.model_builder.ProcessPoolExecutor") as mock_executor:
+            sharded_builder.build_model()
+        mock_executor.assert_not_called()
+
@@ -0,0 +1,133 @@
+# Copyright 2017, Inderpreet Singh, All rights reserved.
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from controller.scan import LocalScanner, ScannerError
+from system import SystemScanner, InotifyWatcher
+
+
+class TestLocalScanner(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp(prefix="test_local_scanner")
+        os.makedirs(os.path.join(self.temp_dir, "a", "aa"))
+        self.touch(10, "a", "aa", "aaa")
+        self.touch(20, "b")
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def touch(self, size, *args):
+        with open(os.path.join(self.temp_dir, *args), "wb") as f:
+            f.write(bytearray([0xff] * size))
+
+    def write_lftp_status(self, name, size):
+        with open(os.path.join(self.temp_dir, name + ".lftp-pget-status"), "w") as f:
+            f.write("size={}\n0.pos=0\n0.limit={}\n".format(size, size))
+
+    def full_scan(self, use_temp_file=False):
+        scanner = SystemScanner(self.temp_dir)
+        if use_temp_file:
+            scanner.set_lftp_temp_suffix(".lftp")
+        return scanner.scan()
+
+    def test_scan(self):
+        scanner = LocalScanner(self.temp_dir, use_temp_file=False)
+        self.assertEqual(self.full_scan(), scanner.scan())
+        self.assertFalse(scanner.is_watching())
+        self.assertFalse(scanner.wait_for_changes(0))
+
+    def test_scan_non_incremental(self):
+        scanner = LocalScanner(self.temp_dir, use_temp_file=False, incremental=False)
+        self.assertEqual(self.full_scan(), scanner.scan())
+
+    def test_scan_parallel(self):
+        scanner = LocalScanner(self.temp_dir, use_temp_file=False, num_scan_threads=4)
+        self.assertEqual(self.full_scan(), scanner.scan())
+        self.touch(30, "a", "ab")
+        self.assertEqual(self.full_scan(), scanner.scan())
+
+    def test_scan_roots(self):
+        scanner = LocalScanner(self.temp_dir, use_temp_file=True)
+        scanner.scan()
+        os.remove(os.path.join(self.temp_dir, "b"))
+        self.touch(30, "c")
+        self.touch(40, "d.lftp")
+        self.touch(50, "a", "aa", "aab")
+        files = scanner.scan_roots({"b", "c", "d"})
+        self.assertEqual(["c", "d"], [f.name for f in files])
+        self.assertEqual([30, 40], [f.size for f in files])
+        self.assertEqual(self.full_scan(use_temp_file=True), scanner.scan())
+
+    def test_scan_roots_skips_excluded_names(self):
+        scanner = LocalScanner(self.temp_dir, use_temp_file=True)
+        scanner.scan()
+        self.touch(30, "c")
+        self.write_lftp_status("c", 30)
+        files = scanner.scan_roots({"c", "c.lftp-pget-status"})
+        self.assertEqual(["c"], [f.name for f in files])
+
+    def test_scan_missing_path_fails(self):
+        scanner = LocalScanner(os.path.join(self.temp_dir, "nope"), use_temp_file=False)
+        with self.assertRaises(ScannerError) as ctx:
+            scanner.scan()
+        self.assertFalse(ctx.exception.recoverable)
+
+
+@unittest.skipIf(not InotifyWatcher.is_supported(), "inotify is only available on Linux")
+class TestLocalScannerInotify(TestLocalScanner):
+    # Generous timeout to wait for events, tests return as soon as they arrive
+    WAIT_TIMEOUT_IN_SECS = 5.0
+
+    def create_scanner(self, use_temp_file=False):
+        scanner = LocalScanner(self.temp_dir, use_temp_file=use_temp_file, use_inotify=True)
+        self.assertEqual(self.full_scan(use_temp_file), scanner.scan())
+        self.assertTrue(scanner.is_watching())
+        return scanner
+
+    def wait_and_scan(self, scanner):
+        self.assertTrue(scanner.wait_for_changes(TestLocalScannerInotify.WAIT_TIMEOUT_IN_SECS))
+        return scanner.scan()
+
+    def test_no_changes(self):
+        scanner = self.create_scanner()
+        self.assertFalse(scanner.wait_for_changes(0))
+        self.assertEqual(self.full_scan(), scanner.scan())
+
+    def test_targeted_rescan_on_change(self):
+        scanner = self.create_scanner()
+        self.touch(30, "a", "aa", "aab")
+        self.assertEqual(self.full_scan(), self.wait_and_scan(scanner))
+
+    def test_targeted_rescan_on_add_and_delete(self):
+        scanner = self.create_scanner()
+        self.touch(40, "c")
+        shutil.rmtree(os.path.join(self.temp_dir, "a"))
+        files = self.wait_and_scan(scanner)
+        self.assertEqual(self.full_scan(), files)
+        self.assertEqual(["b", "c"], [f.name for f in files])
+
+    def test_targeted_rescan_temp_file_rename(self):
+        self.touch(50, "c.mkv.lftp")
+        scanner = self.create_scanner(use_temp_file=True)
+        os.rename(os.path.join(self.temp_dir, "c.mkv.lftp"), os.path.join(self.temp_dir, "c.mkv"))
+        files = self.wait_and_scan(scanner)
+        self.assertEqual(self.full_scan(use_temp_file=True), files)
+        self.assertEqual(["a", "b", "c.mkv"], [f.name for f in files])
+
+    def test_targeted_rescan_skips_lftp_status_file(self):
+        scanner = self.create_scanner(use_temp_file=True)
+        self.touch(30, "c")
+        self.write_lftp_status("c", 30)
+        files = self.wait_and_scan(scanner)
+        self.assertEqual(self.full_scan(use_temp_file=True), files)
+        self.assertEqual(["a", "b", "c"], [f.name for f in files])
+
+    def test_falls_back_to_full_scan_when_root_is_replaced(self):
+        scanner = self.create_scanner()
+        shutil.rmtree(self.temp_dir)
+        os.mkdir(self.temp_dir)
+        self.touch(60, "d")
+        self.assertEqual(self.full_scan(), self.wait_and_scan(scanner))
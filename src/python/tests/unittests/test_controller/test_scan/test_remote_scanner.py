@@ -7,11 +7,61 @@ from unittest.mock import patch, call, ANY
 import tempfile
 import os
 import pickle
+import re
 import shutil
+import json
 
 from controller.scan import RemoteScanner, ScannerError
-from ssh import SshcpError
+from ssh import SshcpError, SshcpTimeoutError
 from common import Localization
+from system import SystemFile, SystemFileCodec, SystemFileDelta, ScanAgent
+
+
+class FakeChannel:
+    """
+    Stands in for an SshcpChannel to a scanfs agent
+    Each request is answered with the next response in the list, a response
+    can also be an SshcpError to raise
+    Unsolicited output can be added with push()
+    """
+    def __init__(self, responses):
+        self.responses = responses
+        self.requests = []
+        self.closed = False
+        self.__buffer = b""
+        self.__error = None
+
+    def is_alive(self):
+        return not self.closed
+
+    def send_line(self, line):
+        self.requests.append(line)
+        response = self.responses.pop(0)
+        if isinstance(response, SshcpError):
+            self.__buffer = b""
+            self.__error = response
+        else:
+            self.__buffer += response
+            self.__error = None
+
+    def push(self, data):
+        self.__buffer += data
+
+    def expect(self, pattern, timeout_in_secs=None):
+        if self.__error is not None:
+            raise self.__error
+        match = re.search(pattern, self.__buffer)
+        if match is None:
+            raise SshcpTimeoutError("Timed out")
+        self.__buffer = self.__buffer[match.end():]
+        return match
+
+    def read(self, size, timeout_in_secs=None):
+        data, self.__buffer = self.__buffer[:size], self.__buffer[size:]
+        return data
+
+    def close(self):
+        self.closed = True
 
 
 class TestRemoteScanner(unittest.TestCase):
@@ -285,7 +335,39 @@ class TestRemoteScanner(unittest.TestCase):
         scanner.scan()
         self.assertEqual(2, self.mock_ssh.shell.call_count)
         self.mock_ssh.shell.assert_called_with(
-            "'/remote/path/to/scan/script' '/remote/path/to/scan'"
+            "'/remote/path/to/scan/script' '/remote/path/to/scan' --format binary"
+            " --state-file '/remote/path/to/scan/script.a4069bcc.state'"
+        )
+
+    def test_passes_num_threads_to_scan_command(self):
+        scanner = RemoteScanner(
+            remote_address="my remote address",
+            remote_username="my remote user",
+            remote_password="my password",
+            remote_port=1234,
+            remote_path_to_scan="/remote/path/to/scan",
+            local_path_to_scan_script=TestRemoteScanner.temp_scan_script,
+            remote_path_to_scan_script="/remote/path/to/scan/script",
+            num_scan_threads=8
+        )
+
+        self.ssh_run_command_count = 0
+
+        # Ssh returns error for md5sum check, empty pickle dump for later commands
+        def ssh_shell(*args):
+            self.ssh_run_command_count += 1
+            if self.ssh_run_command_count == 1:
+                # md5sum check
+                return b''
+            else:
+                # later tries
+                return pickle.dumps([])
+        self.mock_ssh.shell.side_effect = ssh_shell
+
+        scanner.scan()
+        self.mock_ssh.shell.assert_called_with(
+            "'/remote/path/to/scan/script' '/remote/path/to/scan' --format binary"
+            " --state-file '/remote/path/to/scan/script.a4069bcc.state' --threads 8"
         )
 
     def test_raises_nonrecoverable_error_on_first_failed_ssh(self):
@@ -471,3 +553,388 @@ class TestRemoteScanner(unittest.TestCase):
             str(ctx.exception)
         )
         self.assertFalse(ctx.exception.recoverable)
+
+    def create_scanner(self) -> RemoteScanner:
+        return RemoteScanner(
+            remote_address="my remote address",
+            remote_username="my remote user",
+            remote_password="my password",
+            remote_port=1234,
+            remote_path_to_scan="/remote/path/to/scan",
+            local_path_to_scan_script=TestRemoteScanner.temp_scan_script,
+            remote_path_to_scan_script="/remote/path/to/scan/script"
+        )
+
+    def test_decodes_binary_output(self):
+        scanner = self.create_scanner()
+        a = SystemFile("a", 100, True)
+        a.add_child(SystemFile("aa", 100, False))
+        files = [a, SystemFile("b", 20, False)]
+
+        def ssh_shell(command):
+            if command.startswith("md5sum"):
+                return b''
+            return SystemFileCodec.encode(files)
+        self.mock_ssh.shell.side_effect = ssh_shell
+
+        self.assertEqual(files, scanner.scan())
+
+    def test_falls_back_to_pickle_if_binary_format_unsupported(self):
+        scanner = self.create_scanner()
+        files = [SystemFile("a", 100, False)]
+
+        def ssh_shell(command):
+            if command.startswith("md5sum"):
+                return b''
+            if "--format binary" in command:
+                raise SshcpError("scan_fs.py: error: unrecognized arguments: --format binary")
+            return pickle.dumps(files)
+        self.mock_ssh.shell.side_effect = ssh_shell
+
+        self.assertEqual(files, scanner.scan())
+        self.mock_ssh.shell.assert_called_with("'/remote/path/to/scan/script' '/remote/path/to/scan'")
+        # Binary format is not retried
+        self.mock_ssh.shell.reset_mock()
+        self.assertEqual(files, scanner.scan())
+        self.mock_ssh.shell.assert_called_once_with("'/remote/path/to/scan/script' '/remote/path/to/scan'")
+
+    def test_falls_back_to_pickle_on_unsupported_binary_version(self):
+        scanner = self.create_scanner()
+        files = [SystemFile("a", 100, False)]
+        data = bytearray(SystemFileCodec.encode(files))
+        data[4] = 99  # version
+
+        def ssh_shell(command):
+            if command.startswith("md5sum"):
+                return b''
+            if "--format binary" in command:
+                return bytes(data)
+            return pickle.dumps(files)
+        self.mock_ssh.shell.side_effect = ssh_shell
+
+        self.assertEqual(files, scanner.scan())
+        self.mock_ssh.shell.assert_called_with("'/remote/path/to/scan/script' '/remote/path/to/scan'")
+
+    def test_raises_nonrecoverable_error_on_corrupt_binary_output(self):
+        scanner = self.create_scanner()
+        data = SystemFileCodec.encode([SystemFile("a", 100, False)])
+
+        def ssh_shell(command):
+            if command.startswith("md5sum"):
+                return b''
+            return data[:-1]
+        self.mock_ssh.shell.side_effect = ssh_shell
+
+        with self.assertRaises(ScannerError) as ctx:
+            scanner.scan()
+        self.assertEqual(Localization.Error.REMOTE_SERVER_SCAN.format("Invalid scan data"), str(ctx.exception))
+        self.assertFalse(ctx.exception.recoverable)
+
+    def test_applies_delta_output(self):
+        scanner = self.create_scanner()
+        a = SystemFile("a", 100, False)
+        b = SystemFile("b", 200, False)
+        b2 = SystemFile("b", 300, False)
+        c = SystemFile("c", 400, False)
+        outputs = [
+            SystemFileDelta("token1", True, [a, b], []).encode(),
+            SystemFileDelta("token2", False, [c, b2], ["a"]).encode(),
+            SystemFileDelta("token2", False, [], []).encode(),
+        ]
+        commands = []
+
+        def ssh_shell(command):
+            if command.startswith("md5sum"):
+                return b''
+            commands.append(command)
+            return outputs[len(commands) - 1]
+        self.mock_ssh.shell.side_effect = ssh_shell
+
+        self.assertEqual([a, b], scanner.scan())
+        self.assertNotIn("--since", commands[0])
+        self.assertEqual([b2, c], scanner.scan())
+        self.assertTrue(commands[1].endswith("--since token1"))
+        self.assertEqual([b2, c], scanner.scan())
+        self.assertTrue(commands[2].endswith("--since token2"))
+
+    def test_full_delta_replaces_previous_result(self):
+        scanner = self.create_scanner()
+        a = SystemFile("a", 100, False)
+        b = SystemFile("b", 200, False)
+        outputs = [
+            SystemFileDelta("token1", True, [a, b], []).encode(),
+            # e.g. remote snapshot didn't match our token
+            SystemFileDelta("token2", True, [b], []).encode(),
+        ]
+        self.ssh_run_command_count = 0
+
+        def ssh_shell(command):
+            if command.startswith("md5sum"):
+                return b''
+            self.ssh_run_command_count += 1
+            return outputs[self.ssh_run_command_count - 1]
+        self.mock_ssh.shell.side_effect = ssh_shell
+
+        self.assertEqual([a, b], scanner.scan())
+        self.assertEqual([b], scanner.scan())
+
+    def test_falls_back_to_full_scans_if_delta_unsupported(self):
+        scanner = self.create_scanner()
+        files = [SystemFile("a", 100, False)]
+
+        def ssh_shell(command):
+            if command.startswith("md5sum"):
+                return b''
+            if "--state-file" in command:
+                raise SshcpError("scan_fs.py: error: unrecognized arguments: --state-file")
+            return SystemFileCodec.encode(files)
+        self.mock_ssh.shell.side_effect = ssh_shell
+
+        self.assertEqual(files, scanner.scan())
+        self.mock_ssh.shell.assert_called_with(
+            "'/remote/path/to/scan/script' '/remote/path/to/scan' --format binary"
+        )
+
+    def create_agent_scanner(self, use_watch: bool = False) -> RemoteScanner:
+        scanner = RemoteScanner(
+            remote_address="my remote address",
+            remote_username="my remote user",
+            remote_password="my password",
+            remote_port=1234,
+            remote_path_to_scan="/remote/path/to/scan",
+            local_path_to_scan_script=TestRemoteScanner.temp_scan_script,
+            remote_path_to_scan_script="/remote/path/to/scan/script",
+            use_agent=True,
+            use_watch=use_watch
+        )
+        # md5sum check
+        self.mock_ssh.shell.return_value = b''
+        return scanner
+
+    @staticmethod
+    def agent_response(delta: SystemFileDelta) -> bytes:
+        return ScanAgent.encode_response(ScanAgent.STATUS_OK, delta.encode()).replace(b"\n", b"\r\n")
+
+    @staticmethod
+    def agent_changes(names) -> bytes:
+        return ScanAgent.encode_response(ScanAgent.STATUS_CHANGES, json.dumps(names).encode())
+
+    def test_agent_scans_over_one_channel(self):
+        scanner = self.create_agent_scanner()
+        a = SystemFile("a", 100, False)
+        b = SystemFile("b", 200, False)
+        channel = FakeChannel([
+            self.agent_response(SystemFileDelta("token1", True, [a], [])),
+            self.agent_response(SystemFileDelta("token2", False, [b], [])),
+            self.agent_response(SystemFileDelta("token3", False, [], ["a"])),
+        ])
+        self.mock_ssh.open_channel.return_value = channel
+
+        self.assertEqual([a], scanner.scan())
+        self.assertEqual([a, b], scanner.scan())
+        self.assertEqual([b], scanner.scan())
+        self.mock_ssh.open_channel.assert_called_once_with(
+            "'/remote/path/to/scan/script' '/remote/path/to/scan'"
+            " --daemon --state-file '/remote/path/to/scan/script.a4069bcc.state'"
+        )
+        self.assertEqual(
+            [ScanAgent.encode_request(None), ScanAgent.encode_request("token1"), ScanAgent.encode_request("token2")],
+            channel.requests
+        )
+        # Only the md5sum check went through a one-off ssh command
+        self.assertEqual(1, self.mock_ssh.shell.call_count)
+
+    def test_agent_reconnects_on_failure(self):
+        scanner = self.create_agent_scanner()
+        a = SystemFile("a", 100, False)
+        channel1 = FakeChannel([
+            self.agent_response(SystemFileDelta("token1", True, [a], [])),
+            SshcpError("Channel closed"),
+        ])
+        channel2 = FakeChannel([
+            self.agent_response(SystemFileDelta("token1", False, [], [])),
+        ])
+        self.mock_ssh.open_channel.side_effect = [channel1, channel2]
+
+        self.assertEqual([a], scanner.scan())
+        self.assertEqual([a], scanner.scan())
+        self.assertTrue(channel1.closed)
+        self.assertEqual(2, self.mock_ssh.open_channel.call_count)
+        # Retried request still carries the token
+        self.assertEqual([ScanAgent.encode_request("token1")], channel2.requests)
+
+    def test_agent_raises_recoverable_error_after_failed_reconnect(self):
+        scanner = self.create_agent_scanner()
+        a = SystemFile("a", 100, False)
+        self.mock_ssh.open_channel.side_effect = [
+            FakeChannel([self.agent_response(SystemFileDelta("token1", True, [a], [])), SshcpError("Channel closed")]),
+            SshcpError("Connection refused by server"),
+            FakeChannel([self.agent_response(SystemFileDelta("token1", False, [], []))]),
+        ]
+
+        self.assertEqual([a], scanner.scan())
+        with self.assertRaises(ScannerError) as ctx:
+            scanner.scan()
+        self.assertTrue(ctx.exception.recoverable)
+        self.assertEqual([a], scanner.scan())
+
+    def test_agent_error_response(self):
+        scanner = self.create_agent_scanner()
+        self.mock_ssh.open_channel.return_value = FakeChannel([
+            ScanAgent.encode_response(ScanAgent.STATUS_ERROR, b"SystemScannerError: Path does not exist")
+        ])
+        with self.assertRaises(ScannerError) as ctx:
+            scanner.scan()
+        self.assertEqual(
+            Localization.Error.REMOTE_SERVER_SCAN.format("SystemScannerError: Path does not exist"),
+            str(ctx.exception)
+        )
+        self.assertFalse(ctx.exception.recoverable)
+
+    def test_agent_falls_back_to_one_off_scans_if_unsupported(self):
+        scanner = self.create_agent_scanner()
+        files = [SystemFile("a", 100, False)]
+        self.mock_ssh.open_channel.return_value = FakeChannel([
+            SshcpError("Channel closed - scan_fs.py: error: unrecognized arguments: --daemon")
+        ])
+
+        def ssh_shell(command):
+            if command.startswith("md5sum"):
+                return b''
+            return SystemFileDelta("token1", True, files, []).encode()
+        self.mock_ssh.shell.side_effect = ssh_shell
+
+        self.assertEqual(files, scanner.scan())
+        self.assertEqual(files, scanner.scan())
+        self.mock_ssh.open_channel.assert_called_once()
+        self.assertTrue(self.mock_ssh.shell.call_args[0][0].endswith("--since token1"))
+
+    def test_agent_watch_rescans_changed_roots(self):
+        scanner = self.create_agent_scanner(use_watch=True)
+        a = SystemFile("a", 100, False)
+        b = SystemFile("b", 200, False)
+        b2 = SystemFile("b", 300, False)
+        channel = FakeChannel([
+            ScanAgent.encode_response(ScanAgent.STATUS_OK, b""),
+            self.agent_response(SystemFileDelta("token1", True, [a, b], [])),
+            self.agent_response(SystemFileDelta("token2", False, [b2], [])),
+        ])
+        self.mock_ssh.open_channel.return_value = channel
+
+        self.assertFalse(scanner.is_watching())
+        self.assertEqual([a, b], scanner.scan())
+        self.assertTrue(scanner.is_watching())
+        self.assertEqual(ScanAgent.encode_watch_request(), channel.requests[0])
+        self.assertEqual(None, json.loads(channel.requests[1])["roots"])
+
+        self.assertFalse(scanner.wait_for_changes(0.1))
+        channel.push(self.agent_changes(["b"]))
+        self.assertTrue(scanner.wait_for_changes(0.1))
+        self.assertEqual([a, b2], scanner.scan())
+        request = json.loads(channel.requests[2])
+        self.assertEqual(["b"], request["roots"])
+        self.assertEqual("token1", request["since"])
+        self.assertFalse(scanner.wait_for_changes(0.1))
+
+    def test_agent_watch_keeps_changes_received_during_scan(self):
+        scanner = self.create_agent_scanner(use_watch=True)
+        a = SystemFile("a", 100, False)
+        channel = FakeChannel([
+            ScanAgent.encode_response(ScanAgent.STATUS_OK, b""),
+            self.agent_changes(["a"]) + self.agent_response(SystemFileDelta("token1", True, [a], [])),
+            self.agent_response(SystemFileDelta("token1", False, [], [])),
+        ])
+        self.mock_ssh.open_channel.return_value = channel
+
+        self.assertEqual([a], scanner.scan())
+        self.assertTrue(scanner.wait_for_changes(0))
+        self.assertEqual([a], scanner.scan())
+        self.assertEqual(["a"], json.loads(channel.requests[2])["roots"])
+
+    def test_agent_watch_lost_events_rescan_everything(self):
+        scanner = self.create_agent_scanner(use_watch=True)
+        a = SystemFile("a", 100, False)
+        channel = FakeChannel([
+            ScanAgent.encode_response(ScanAgent.STATUS_OK, b""),
+            self.agent_response(SystemFileDelta("token1", True, [a], [])),
+            self.agent_response(SystemFileDelta("token1", False, [], [])),
+        ])
+        self.mock_ssh.open_channel.return_value = channel
+
+        scanner.scan()
+        channel.push(self.agent_changes(["a"]) + self.agent_changes(None))
+        self.assertTrue(scanner.wait_for_changes(0.1))
+        scanner.scan()
+        self.assertEqual(None, json.loads(channel.requests[2])["roots"])
+
+    def test_agent_watch_falls_back_to_polling_if_unsupported(self):
+        scanner = self.create_agent_scanner(use_watch=True)
+        a = SystemFile("a", 100, False)
+        channel = FakeChannel([
+            ScanAgent.encode_response(ScanAgent.STATUS_ERROR, b"InotifyError: inotify is not supported"),
+            self.agent_response(SystemFileDelta("token1", True, [a], [])),
+        ])
+        self.mock_ssh.open_channel.return_value = channel
+
+        self.assertEqual([a], scanner.scan())
+        self.assertFalse(scanner.is_watching())
+        self.assertFalse(scanner.wait_for_changes(0.1))
+
+    def test_agent_watch_channel_failure_wakes_up_scanner(self):
+        scanner = self.create_agent_scanner(use_watch=True)
+        a = SystemFile("a", 100, False)
+        channel1 = FakeChannel([
+            ScanAgent.encode_response(ScanAgent.STATUS_OK, b""),
+            self.agent_response(SystemFileDelta("token1", True, [a], [])),
+        ])
+        channel2 = FakeChannel([
+            ScanAgent.encode_response(ScanAgent.STATUS_OK, b""),
+            self.agent_response(SystemFileDelta("token1", False, [], [])),
+        ])
+        self.mock_ssh.open_channel.side_effect = [channel1, channel2]
+
+        scanner.scan()
+        channel1.push(b"@@SCANFS CHANGES 10\r\n")
+        with patch.object(channel1, "read", side_effect=SshcpError("Channel closed")):
+            self.assertTrue(scanner.wait_for_changes(0.1))
+        self.assertTrue(channel1.closed)
+        self.assertFalse(scanner.is_watching())
+        self.assertEqual([a], scanner.scan())
+        self.assertTrue(scanner.is_watching())
+
+    def test_agent_scan_roots(self):
+        scanner = self.create_agent_scanner()
+        a = SystemFile("a", 100, False)
+        b = SystemFile("b", 200, False)
+        b2 = SystemFile("b", 300, False)
+        channel = FakeChannel([
+            self.agent_response(SystemFileDelta("token1", True, [a, b], [])),
+            self.agent_response(SystemFileDelta("token2", False, [b2], [])),
+            self.agent_response(SystemFileDelta("token3", False, [], ["a"])),
+            self.agent_response(SystemFileDelta("token3", False, [], [])),
+        ])
+        self.mock_ssh.open_channel.return_value = channel
+
+        self.assertEqual([a, b], scanner.scan())
+        self.assertEqual([b2], scanner.scan_roots({"b", "c"}))
+        request = json.loads(channel.requests[1])
+        self.assertEqual(["b", "c"], request["roots"])
+        self.assertEqual("token1", request["since"])
+        self.assertEqual([], scanner.scan_roots({"a"}))
+        self.assertEqual([b2], scanner.scan())
+        self.assertEqual(None, json.loads(channel.requests[3])["roots"])
+
+    def test_scan_roots_unsupported_without_agent(self):
+        scanner = self.create_scanner()
+
+        def ssh_shell(command):
+            if command.startswith("md5sum"):
+                return b''
+            return SystemFileDelta("token1", True, [], []).encode()
+        self.mock_ssh.shell.side_effect = ssh_shell
+        scanner.scan()
+        self.assertIsNone(scanner.scan_roots({"a"}))
+
+    def test_agent_scan_roots_before_first_scan(self):
+        scanner = self.create_agent_scanner()
+        self.assertIsNone(scanner.scan_roots({"a"}))
@@ -8,8 +8,8 @@ from unittest.mock import MagicMock
 
 import timeout_decorator
 
-from controller import IScanner, ScannerProcess, ScannerError
-from system import SystemFile
+from controller import IScanner, ScannerProcess, ScannerError, ScannerResult
+from system import SystemFile, SystemFileCodec
 
 
 class DummyScanner(IScanner):
@@ -20,6 +20,64 @@ class DummyScanner(IScanner):
         pass
 
 
+class DummyWatchingScanner(DummyScanner):
+    """Scanner that reports a change on every wait"""
+    def __init__(self, scan_counter):
+        self.scan_counter = scan_counter
+
+    def scan(self):
+        self.scan_counter.value += 1
+        return []
+
+    def is_watching(self):
+        return True
+
+    def wait_for_changes(self, timeout_in_s: float) -> bool:
+        return True
+
+
+class DummyTargetedScanner(DummyScanner):
+    """Scanner that reports its targeted scans with a different size"""
+    def __init__(self, scan_counter, supported: bool = True):
+        self.scan_counter = scan_counter
+        self.supported = supported
+
+    def scan(self):
+        self.scan_counter.value += 1
+        return [SystemFile("a", 1, False), SystemFile("b", 1, False)]
+
+    def scan_roots(self, names):
+        if not self.supported:
+            return None
+        return [SystemFile(name, 2, False) for name in sorted(names) if name != "gone"]
+
+
+class TestScannerResult(unittest.TestCase):
+    def test_merged_with(self):
+        full = ScannerResult(1, [SystemFile("a", 1, False), SystemFile("b", 1, False)])
+        partial1 = ScannerResult(2, [SystemFile("c", 2, False)], partial_names={"b", "c"})
+        partial2 = ScannerResult(3, [SystemFile("a", 3, False)], partial_names={"a"})
+
+        merged = full.merged_with(partial1).merged_with(partial2)
+        self.assertFalse(merged.is_partial)
+        self.assertEqual(3, merged.timestamp)
+        self.assertEqual([SystemFile("a", 3, False), SystemFile("c", 2, False)], merged.files)
+
+        merged = partial1.merged_with(partial2)
+        self.assertEqual({"a", "b", "c"}, merged.partial_names)
+        self.assertEqual(["a", "c"], [f.name for f in merged.files])
+
+        self.assertIs(full, partial1.merged_with(full))
+
+    def test_decodes_encoded_files(self):
+        a = SystemFile("a", 100, True)
+        a.add_child(SystemFile("aa", 100, False))
+        result = ScannerResult(1, None, encoded_files=SystemFileCodec.encode([a]))
+        self.assertFalse(result.is_partial)
+        self.assertEqual([a], result.files)
+        self.assertIs(result.files, result.files)
+
+
 class TestScannerProcess(unittest.TestCase):
     def setUp(self):
         logger = logging.getLogger()
@@ -36,6 +94,8 @@ class TestScannerProcess(unittest.TestCase):
     def tearDown(self):
         if self.process:
             self.process.terminate()
+            self.process.join()
+            self.process.close_shared_memory()
 
     @timeout_decorator.timeout(10)
     def test_retrieves_scan_results(self):
@@ -160,6 +220,23 @@ class TestScannerProcess(unittest.TestCase):
         self.assertTrue(result.failed)
         self.assertEqual("recoverable error", result.error_message)
 
+    @timeout_decorator.timeout(10)
+    def test_sets_result_event_on_result(self):
+        mock_scanner = DummyScanner()
+        mock_scanner.scan = MagicMock(return_value=[SystemFile("a", 100, False)])
+        result_event = multiprocessing.Event()
+
+        self.process = ScannerProcess(scanner=mock_scanner,
+                                      interval_in_ms=10000)
+        self.process.set_result_event(result_event)
+        self.process.start()
+
+        self.assertTrue(result_event.wait(timeout=5))
+        result = None
+        while result is None:
+            result = self.process.pop_latest_result()
+        self.assertEqual(["a"], [f.name for f in result.files])
+
     @timeout_decorator.timeout(10)
     def test_sends_fatal_exception_on_nonrecoverable_error(self):
         mock_scanner = DummyScanner()
@@ -174,3 +251,155 @@ class TestScannerProcess(unittest.TestCase):
                 self.process.propagate_exception()
         # noinspection PyUnreachableCode
         self.assertEqual("non-recoverable error", str(ctx.exception))
+
+    @timeout_decorator.timeout(10)
+    def test_watching_scanner_wakes_on_change(self):
+        self.scan_counter = multiprocessing.Value('i', 0)
+        # Interval is much longer than the test timeout, so only change
+        # notifications can trigger the rescans
+        self.process = ScannerProcess(scanner=DummyWatchingScanner(self.scan_counter),
+                                      interval_in_ms=60*60*1000)
+        self.process.start()
+        while self.scan_counter.value < 3:
+            pass
+
+    def wait_for_result(self):
+        while True:
+            result = self.process.pop_latest_result()
+            if result:
+                return result
+
+    @timeout_decorator.timeout(10)
+    def test_targeted_scan(self):
+        self.scan_counter = multiprocessing.Value('i', 0)
+        # Interval is much longer than the test timeout, so only forced scans run
+        self.process = ScannerProcess(scanner=DummyTargetedScanner(self.scan_counter),
+                                      interval_in_ms=60*60*1000)
+        self.process.start()
+        result = self.wait_for_result()
+        self.assertFalse(result.is_partial)
+
+        self.process.force_scan(["b", "gone"])
+        result = self.wait_for_result()
+        self.assertTrue(result.is_partial)
+        self.assertEqual({"b", "gone"}, result.partial_names)
+        self.assertEqual([SystemFile("b", 2, False)], result.files)
+        self.assertEqual(1, self.scan_counter.value)
+
+        self.process.force_scan()
+        result = self.wait_for_result()
+        self.assertFalse(result.is_partial)
+        self.assertEqual(2, self.scan_counter.value)
+
+    @timeout_decorator.timeout(10)
+    def test_targeted_scan_falls_back_to_full_scan(self):
+        self.scan_counter = multiprocessing.Value('i', 0)
+        self.process = ScannerProcess(scanner=DummyTargetedScanner(self.scan_counter, supported=False),
+                                      interval_in_ms=60*60*1000)
+        self.process.start()
+        self.wait_for_result()
+
+        self.process.force_scan(["b"])
+        result = self.wait_for_result()
+        self.assertFalse(result.is_partial)
+        self.assertEqual([SystemFile("a", 1, False), SystemFile("b", 1, False)], result.files)
+        self.assertEqual(2, self.scan_counter.value)
+
+    @timeout_decorator.timeout(10)
+    def test_publishes_deltas(self):
+        self.scan_signal = multiprocessing.Value('i', 0)
+        a = SystemFile("a", 1, False)
+        b = SystemFile("b", 1, False)
+        b2 = SystemFile("b", 2, False)
+
+        mock_scanner = DummyScanner()
+        mock_scanner.scan = MagicMock()
+
+        def _scan():
+            if self.scan_signal.value == 0:
+                return [a, b]
+            elif self.scan_signal.value == 1:
+                return [a, b2]
+            elif self.scan_signal.value == 2:
+                return [b2]
+            raise ScannerError("recoverable error", recoverable=True)
+        mock_scanner.scan.side_effect = _scan
+
+        # Interval is much longer than the test timeout, so only forced scans run
+        self.process = ScannerProcess(scanner=mock_scanner,
+                                      interval_in_ms=60*60*1000,
+                                      publish_deltas=True)
+        self.process.start()
+
+        # First result is a full one
+        result = self.wait_for_result()
+        self.assertFalse(result.is_partial)
+        self.assertEqual([a, b], result.files)
+
+        # Changed file
+        self.scan_signal.value = 1
+        self.process.force_scan()
+        result = self.wait_for_result()
+        self.assertEqual({"b"}, result.partial_names)
+        self.assertEqual([b2], result.files)
+
+        # Nothing changed
+        self.process.force_scan()
+        result = self.wait_for_result()
+        self.assertEqual(set(), result.partial_names)
+        self.assertEqual([], result.files)
+
+        # Removed file
+        self.scan_signal.value = 2
+        self.process.force_scan()
+        result = self.wait_for_result()
+        self.assertEqual({"a"}, result.partial_names)
+        self.assertEqual([], result.files)
+
+        # A failed scan is followed by a full result
+        self.scan_signal.value = 3
+        self.process.force_scan()
+        result = self.wait_for_result()
+        self.assertTrue(result.failed)
+        self.assertFalse(result.is_partial)
+        self.scan_signal.value = 2
+        self.process.force_scan()
+        result = self.wait_for_result()
+        self.assertFalse(result.is_partial)
+        self.assertEqual([b2], result.files)
+
+    @timeout_decorator.timeout(10)
+    def test_passes_large_results_through_shared_memory(self):
+        self.scan_signal = multiprocessing.Value('i', 0)
+        small_files = [SystemFile("a", 1, False)]
+        large_files = []
+        for i in range(100):
+            d = SystemFile("dir{}".format(i), 50, True)
+            for j in range(50):
+                d.add_child(SystemFile("file{}".format(j), 1, False))
+            large_files.append(d)
+
+        mock_scanner = DummyScanner()
+        mock_scanner.scan = MagicMock()
+        mock_scanner.scan.side_effect = lambda: large_files if self.scan_signal.value == 0 else small_files
+
+        # Interval is much longer than the test timeout, so only forced scans run
+        self.process = ScannerProcess(scanner=mock_scanner,
+                                      interval_in_ms=60*60*1000,
+                                      use_shared_memory=True)
+        self.process.start()
+        result = self.wait_for_result()
+        self.assertFalse(result.is_partial)
+        self.assertEqual(large_files, result.files)
+
+        # Small results still go through the queue
+        self.scan_signal.value = 1
+        self.process.force_scan()
+        result = self.wait_for_result()
+        self.assertEqual(small_files, result.files)
+
+        # Back to a large one, in the other segment
+        self.scan_signal.value = 0
+        self.process.force_scan()
+        result = self.wait_for_result()
+        self.assertEqual(large_files, result.files)
@@ -0,0 +1,56 @@
+# Copyright 2017, Inderpreet Singh, All rights reserved.
+
+import unittest
+
+from controller.scan.shared_buffer import SharedScanBuffer
+
+
+class TestSharedScanBuffer(unittest.TestCase):
+    def setUp(self):
+        self.writer = SharedScanBuffer()
+        self.reader = SharedScanBuffer()
+
+    def tearDown(self):
+        self.reader.close()
+        self.writer.close()
+
+    def test_write_read(self):
+        descriptor = self.writer.write(b"first")
+        self.assertEqual(b"first", self.reader.read(descriptor))
+        # Can be read again
+        self.assertEqual(b"first", self.reader.read(descriptor))
+        descriptor = self.writer.write(b"")
+        self.assertEqual(b"", self.reader.read(descriptor))
+
+    def test_alternates_segments(self):
+        descriptor1 = self.writer.write(b"first")
+        descriptor2 = self.writer.write(b"second")
+        self.assertNotEqual(descriptor1[0], descriptor2[0])
+        self.assertEqual(b"second", self.reader.read(descriptor2))
+        self.assertEqual(b"first", self.reader.read(descriptor1))
+
+    def test_overwritten_result_is_not_read(self):
+        descriptor1 = self.writer.write(b"first")
+        self.writer.write(b"second")
+        descriptor3 = self.writer.write(b"third")
+        self.assertIsNone(self.reader.read(descriptor1))
+        self.assertEqual(b"third", self.reader.read(descriptor3))
+
+    def test_grows_segments(self):
+        descriptor1 = self.writer.write(b"small")
+        self.assertEqual(b"small", self.reader.read(descriptor1))
+        self.writer.write(b"small")
+        data = bytes(range(256)) * 10000
+        descriptor3 = self.writer.write(data)
+        # Same slot as the first write, but in a new segment
+        self.assertNotEqual(descriptor1[0], descriptor3[0])
+        self.assertEqual(data, self.reader.read(descriptor3))
+        # Replaced segment is gone
+        other_reader = SharedScanBuffer()
+        self.assertIsNone(other_reader.read(descriptor1))
+        other_reader.close()
+
+    def test_closed_segment_is_not_read(self):
+        descriptor = self.writer.write(b"first")
+        self.writer.close()
+        self.assertIsNone(self.reader.read(descriptor))
@@ -1,7 +1,7 @@
 # Copyright 2017, Inderpreet Singh, All rights reserved.
 
 import unittest
-from unittest.mock import MagicMock, patch, PropertyMock
+from unittest.mock import MagicMock, patch, PropertyMock, call
 
 from controller import ScanManager
 
@@ -29,6 +29,12 @@ class TestScanManager(unittest.TestCase):
         self.mock_context.config.controller.interval_ms_downloading_scan = 500
         self.mock_context.config.controller.interval_ms_local_scan = 30000
         self.mock_context.config.controller.interval_ms_remote_scan = 30000
+        self.mock_context.config.controller.use_local_inotify = False
+        self.mock_context.config.controller.num_local_scan_threads = 4
+        self.mock_context.config.controller.num_remote_scan_threads = 2
+        self.mock_context.config.controller.use_remote_scan_agent = True
+        self.mock_context.config.controller.use_remote_inotify = True
+        self.mock_context.config.controller.use_shared_memory_scan_results = True
 
         self.mock_mp_logger = MagicMock()
 
@@ -46,12 +52,42 @@ class TestScanManager(unittest.TestCase):
         mock_active_scanner.assert_called_once_with("/local/path")
         mock_local_scanner.assert_called_once_with(
             local_path="/local/path",
-            use_temp_file=False
+            use_temp_file=False,
+            use_inotify=False,
+            num_scan_threads=4
         )
         mock_remote_scanner.assert_called_once()
+        self.assertEqual(2, mock_remote_scanner.call_args.kwargs["num_scan_threads"])
+        self.assertEqual(True, mock_remote_scanner.call_args.kwargs["use_agent"])
+        self.assertEqual(True, mock_remote_scanner.call_args.kwargs["use_watch"])
 
         # Verify scanner processes were created (3 total)
         self.assertEqual(mock_scanner_process.call_count, 3)
+        # Local and remote scanners publish deltas, the active scanner doesn't
+        self.assertEqual(
+            [False, True, True],
+            [c.kwargs.get("publish_deltas", False) for c in mock_scanner_process.call_args_list]
+        )
+        self.assertEqual(
+            [False, True, True],
+            [c.kwargs.get("use_shared_memory", False) for c in mock_scanner_process.call_args_list]
+        )
+
+    @patch('controller.scan_manager.ScannerProcess')
+    @patch('controller.scan_manager.ActiveScanner')
+    @patch('controller.scan_manager.LocalScanner')
+    @patch('controller.scan_manager.RemoteScanner')
+    def test_init_sets_result_event(
+            self, mock_remote_scanner, mock_local_scanner,
+            mock_active_scanner, mock_scanner_process):
+        """Test that all scanner processes set the result event."""
+        mock_process = MagicMock()
+        mock_scanner_process.return_value = mock_process
+        result_event = MagicMock()
+
+        ScanManager(self.mock_context, self.mock_mp_logger, result_event=result_event)
+
+        self.assertEqual([call(result_event)] * 3, mock_process.set_result_event.call_args_list)
 
     @patch('controller.scan_manager.ScannerProcess')
     @patch('controller.scan_manager.ActiveScanner')
@@ -90,6 +126,7 @@ class TestScanManager(unittest.TestCase):
         # Verify terminate and join were called on each process (3 times each)
         self.assertEqual(mock_process.terminate.call_count, 3)
         self.assertEqual(mock_process.join.call_count, 3)
+        self.assertEqual(mock_process.close_shared_memory.call_count, 2)
 
     @patch('controller.scan_manager.ScannerProcess')
     @patch('controller.scan_manager.ActiveScanner')
@@ -227,6 +264,29 @@ class TestScanManager(unittest.TestCase):
         mock_local_process.force_scan.assert_not_called()
         mock_active_process.force_scan.assert_not_called()
 
+    @patch('controller.scan_manager.ScannerProcess')
+    @patch('controller.scan_manager.ActiveScanner')
+    @patch('controller.scan_manager.LocalScanner')
+    @patch('controller.scan_manager.RemoteScanner')
+    def test_force_targeted_scans_pass_file_names(
+            self, mock_remote_scanner, mock_local_scanner,
+            mock_active_scanner, mock_scanner_process):
+        """Test that targeted scans pass the file names to the scanner processes."""
+        mock_active_process = MagicMock()
+        mock_local_process = MagicMock()
+        mock_remote_process = MagicMock()
+
+        mock_scanner_process.side_effect = [
+            mock_active_process, mock_local_process, mock_remote_process
+        ]
+
+        manager = ScanManager(self.mock_context, self.mock_mp_logger)
+        manager.force_local_scan(["a"])
+        manager.force_remote_scan(["b", "c"])
+
+        mock_local_process.force_scan.assert_called_once_with(["a"])
+        mock_remote_process.force_scan.assert_called_once_with(["b", "c"])
+
     @patch('controller.scan_manager.ScannerProcess')
     @patch('controller.scan_manager.ActiveScanner')
     @patch('controller.scan_manager.LocalScanner')
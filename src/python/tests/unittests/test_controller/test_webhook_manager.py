@@ -29,6 +29,13 @@ class TestWebhookManager(unittest.TestCase):
         result = self.manager.process(self.name_to_root)
         self.assertEqual(["File.A"], result)
 
+    def test_enqueue_calls_import_callback(self):
+        callback = MagicMock()
+        self.manager.set_import_callback(callback)
+        self.manager.enqueue_import("Sonarr", "File.A")
+        callback.assert_called_once_with()
+        self.assertEqual(["File.A"], self.manager.process(self.name_to_root))
+
     def test_enqueue_and_process_no_match(self):
         self.manager.enqueue_import("Sonarr", "Unknown.File")
         result = self.manager.process(self.name_to_root)
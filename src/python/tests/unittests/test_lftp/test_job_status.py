@@ -88,6 +88,9 @@ class TestLftpJobStatus(unittest.TestCase):
         self.assertEqual({("a", LftpJobStatus.TransferState(10, 20, 50, 0, 0)),
                           ("b", LftpJobStatus.TransferState(25, 100, 25, 0, 0))},
                          set(status.get_active_file_transfer_states()))
+        self.assertEqual(LftpJobStatus.TransferState(25, 100, 25, 0, 0),
+                         status.get_active_file_transfer_state("b"))
+        self.assertIsNone(status.get_active_file_transfer_state("c"))
 
     def test_active_transfer_state_fails_on_queued(self):
         status = LftpJobStatus(job_id=-1,
@@ -201,6 +201,30 @@ class TestLftp(unittest.TestCase):
         statuses = self.lftp.status()
         self.assertEqual(0, len(statuses))
 
+    def test_status_unchanged_output_is_not_parsed_again(self):
+        statuses = self.lftp.status()
+        version = self.lftp.status_version
+        self.assertEqual(0, len(statuses))
+        statuses = self.lftp.status()
+        self.assertEqual(0, len(statuses))
+        self.assertEqual(version, self.lftp.status_version)
+        metrics = self.lftp.status_metrics
+        self.assertEqual(2, metrics.num_polls)
+        self.assertEqual(1, metrics.num_unchanged)
+        self.assertGreater(metrics.total_poll_latency_in_secs, 0)
+
+    @timeout_decorator.timeout(5)
+    def test_status_version_changes_with_output(self):
+        self.lftp.status()
+        version = self.lftp.status_version
+        self.lftp.rate_limit = 10  # so jobs don't finish right away
+        self.lftp.queue("c", False)
+        while True:
+            statuses = self.lftp.status()
+            if len(statuses) > 0:
+                break
+        self.assertGreater(self.lftp.status_version, version)
+
     @timeout_decorator.timeout(5)
     def test_queue_file(self):
         self.lftp.rate_limit = 10  # so jobs don't finish right away
@@ -448,6 +472,52 @@ class TestLftp(unittest.TestCase):
                 break
         self.assertEqual(0, len(statuses))
 
+    @timeout_decorator.timeout(5)
+    def test_queue_many(self):
+        self.lftp.rate_limit = 10  # so jobs don't finish right away
+        self.lftp.num_parallel_jobs = 1
+        self.lftp.queue_many([("a", True), ("d d", False), ("áßç", True)])
+        while True:
+            statuses = self.lftp.status()
+            self.lftp.raise_pending_error()
+            if len(statuses) > 2:
+                break
+        self.assertEqual(3, len(statuses))
+        # Queued in order
+        self.assertEqual(["d d", "áßç", "a"], [s.name for s in statuses])
+        self.assertEqual(
+            [LftpJobStatus.Type.PGET, LftpJobStatus.Type.MIRROR, LftpJobStatus.Type.MIRROR],
+            [s.type for s in statuses]
+        )
+        self.assertEqual(
+            [LftpJobStatus.State.QUEUED, LftpJobStatus.State.QUEUED, LftpJobStatus.State.RUNNING],
+            [s.state for s in statuses]
+        )
+
+    @timeout_decorator.timeout(5)
+    def test_kill_many(self):
+        self.lftp.rate_limit = 10  # so jobs don't finish right away
+        self.lftp.num_parallel_jobs = 2
+        # 2 jobs running, 3 jobs queued
+        self.lftp.queue_many([("a", True), ("d d", False), ("b", True), ("c", False), ("e e", True)])
+        while True:
+            statuses = self.lftp.status()
+            self.lftp.raise_pending_error()
+            if len(statuses) > 4:
+                break
+        self.assertEqual(5, len(statuses))
+
+        # Kill a running job and two queued jobs, including the first one in the queue
+        self.assertEqual({"b": True, "e e": True, "missing": False, "d d": True},
+                         self.lftp.kill_many(["b", "e e", "missing", "d d"]))
+        # The remaining queued job takes the slot of the killed running job
+        while True:
+            statuses = self.lftp.status()
+            self.lftp.raise_pending_error()
+            if len(statuses) == 2 and all(s.state == LftpJobStatus.State.RUNNING for s in statuses):
+                break
+        self.assertEqual({"a", "c"}, {s.name for s in statuses})
+
     @timeout_decorator.timeout(5)
     def test_kill_job_1(self):
         """Queued and running jobs killed one at a time"""
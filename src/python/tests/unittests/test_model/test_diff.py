@@ -2,6 +2,7 @@
 
 import unittest
 from datetime import datetime
+from unittest.mock import patch
 
 from model import Model, ModelFile, ModelDiff, ModelDiffUtil
 
@@ -115,3 +116,64 @@ class TestModelDiffUtil(unittest.TestCase):
         updated = [d for d in diffs if d.change == ModelDiff.Change.UPDATED]
         self.assertEqual(1, len(updated))
         self.assertEqual(ModelDiff(ModelDiff.Change.UPDATED, c1, c2), updated[0])
+        self.assertEqual([("c", "downloading_speed")], updated[0].changed_fields)
+        self.assertEqual([], added[0].changed_fields)
+
+    def test_diff_fields(self):
+        def build(aab_size: int, extra_child: bool):
+            a = ModelFile("a", True)
+            a.local_size = aab_size + 10
+            aa = ModelFile("aa", True)
+            aa.local_size = aab_size + 10
+            a.add_child(aa)
+            aaa = ModelFile("aaa", False)
+            aaa.local_size = 10
+            aa.add_child(aaa)
+            aab = ModelFile("aab", False)
+            aab.local_size = aab_size
+            aab.downloading_speed = aab_size
+            aa.add_child(aab)
+            ab = ModelFile("ab", True)
+            a.add_child(ab)
+            if extra_child:
+                ab.add_child(ModelFile("aba", False))
+            a.freeze()
+            return a
+
+        self.assertEqual([], ModelDiffUtil.diff_fields(build(10, False), build(10, False)))
+        self.assertEqual(
+            [
+                ("a", "local_size"),
+                ("a/aa", "local_size"),
+                ("a/aa/aab", "local_size"),
+                ("a/aa/aab", "downloading_speed")
+            ],
+            ModelDiffUtil.diff_fields(build(10, False), build(20, False))
+        )
+        self.assertEqual(
+            [("a/ab", ModelDiff.FIELD_CHILDREN)],
+            ModelDiffUtil.diff_fields(build(10, False), build(10, True))
+        )
+        changed_files = ModelDiffUtil.diff_changed_files(build(10, False), build(20, True))
+        self.assertEqual(["a", "a/aa", "a/aa/aab", "a/ab"], [f.full_path for f, _ in changed_files])
+
+    def test_diff_fields_skips_unchanged_subtrees(self):
+        def build(b_size: int):
+            root = ModelFile("root", True)
+            a = ModelFile("a", True)
+            root.add_child(a)
+            a.add_child(ModelFile("aa", False))
+            b = ModelFile("b", False)
+            b.local_size = b_size
+            root.add_child(b)
+            root.freeze()
+            return root
+
+        before = build(1)
+        after = build(2)
+        with patch.object(ModelFile, "changed_fields", autospec=True,
+                          side_effect=ModelFile.changed_fields) as mock_changed_fields:
+            self.assertEqual([("root/b", "local_size")], ModelDiffUtil.diff_fields(before, after))
+        # Subtree 'a' has the same fingerprint, so neither 'a' nor 'aa' is compared field by field
+        self.assertEqual(["root", "b"], [c[0][0].name for c in mock_changed_fields.call_args_list])
+
@@ -1,6 +1,10 @@
 # Copyright 2017, Inderpreet Singh, All rights reserved.
 
+import copy
+import gc
+import pickle
 import unittest
+import weakref
 from datetime import datetime
 
 from model import ModelFile
@@ -167,6 +171,45 @@ class TestModelFile(unittest.TestCase):
         file2.update_timestamp = datetime.now()
         self.assertTrue(file1 == file2)
 
+    def test_frozen_equality(self):
+        def build(ab_size: int, reverse: bool) -> ModelFile:
+            a = ModelFile("a", True)
+            a.remote_size = 3
+            aa = ModelFile("aa", False)
+            aa.remote_size = 1
+            ab = ModelFile("ab", False)
+            ab.remote_size = ab_size
+            for child in ([ab, aa] if reverse else [aa, ab]):
+                a.add_child(child)
+            a.freeze()
+            return a
+
+        a1 = build(2, False)
+        a2 = build(2, True)  # children order doesn't matter
+        a3 = build(3, False)
+        self.assertEqual(a1.fingerprint, a2.fingerprint)
+        self.assertEqual(a1, a2)
+        self.assertNotEqual(a1, a3)
+
+        # An unfrozen copy gets a new fingerprint when it's modified
+        a4 = copy.copy(a1)
+        a4._ModelFile__frozen = False
+        a4.state = ModelFile.State.DOWNLOADED
+        a4.freeze()
+        self.assertNotEqual(a1, a4)
+        self.assertNotEqual(a1.fingerprint, a4.fingerprint)
+
+        # Fingerprint is not pickled, but is the same once recomputed
+        a5 = pickle.loads(pickle.dumps(a1))
+        self.assertIsNone(a5._ModelFile__fingerprint)
+        self.assertEqual(a1, a5)
+
+        # Files whose fingerprints collide are still compared by their fields
+        a3._ModelFile__fingerprint = a1.fingerprint
+        self.assertNotEqual(a1, a3)
+        a3.get_children()[1]._ModelFile__fingerprint = a1.get_children()[1].fingerprint
+        self.assertNotEqual(a1, a3)
+
     def test_child(self):
         file_parent = ModelFile("parent", True)
         file_child1 = ModelFile("child1", True)
@@ -244,6 +287,19 @@ class TestModelFile(unittest.TestCase):
         self.assertEqual("a/aa/aaa", file_aaa.full_path)
         self.assertEqual("a/ab", file_ab.full_path)
 
+    def test_full_path_cached_once_frozen(self):
+        file_aa = ModelFile("aa", True)
+        file_aaa = ModelFile("aaa", False)
+        file_aa.add_child(file_aaa)
+        self.assertEqual("aa/aaa", file_aaa.full_path)
+        # Not cached yet, the parent can still be moved
+        file_a = ModelFile("a", True)
+        file_a.add_child(file_aa)
+        self.assertEqual("a/aa/aaa", file_aaa.full_path)
+        file_a.freeze()
+        self.assertEqual("a/aa/aaa", file_aaa.full_path)
+        self.assertEqual("a/aa/aaa", file_aaa._ModelFile__full_path)
+
     def test_parent(self):
         a = ModelFile("a", True)
         aa = ModelFile("aa", True)
@@ -253,3 +309,101 @@ class TestModelFile(unittest.TestCase):
         self.assertIsNone(a.parent)
         self.assertEqual(a, aa.parent)
         self.assertEqual(aa, aaa.parent)
+
+        # Parents survive pickling
+        a2 = pickle.loads(pickle.dumps(a))
+        aa2 = a2.get_children()[0]
+        self.assertIs(a2, aa2.parent)
+        self.assertIs(aa2, aa2.get_children()[0].parent)
+        self.assertEqual("a/aa/aaa", aa2.get_children()[0].full_path)
+
+    def test_add_shared_child(self):
+        a = ModelFile("a", True)
+        aa = ModelFile("aa", True)
+        a.add_child(aa)
+        aaa = ModelFile("aaa", False)
+        aa.add_child(aaa)
+        a.freeze()
+
+        # A new tree of the same file shares the unchanged child
+        a2 = ModelFile("a", True)
+        aa2 = ModelFile("aa", True)
+        a2.add_child(aa2)
+        aa2.add_shared_child(aaa)
+        a2.freeze()
+        self.assertIs(aaa, aa2.get_children()[0])
+        # The shared child is not modified, the old tree is unaffected
+        self.assertIs(aa, aaa.parent)
+        self.assertEqual([aaa], aa.get_children())
+
+        # The shared child doesn't keep the old tree alive, and keeps its full path without it
+        a_ref = weakref.ref(a)
+        del a, aa
+        gc.collect()
+        self.assertIsNone(a_ref())
+        self.assertIsNone(aaa.parent)
+        self.assertEqual("a/aa/aaa", aaa.full_path)
+
+        with self.assertRaises(ValueError):
+            ModelFile("b", True).add_shared_child(ModelFile("bb", False))
+        orphan = ModelFile("bb", False)
+        orphan.freeze()
+        with self.assertRaises(ValueError):
+            ModelFile("b", True).add_shared_child(orphan)
+
+    def test_compact_representation(self):
+        a = ModelFile("".join(["a", "b"]), True)
+        self.assertFalse(hasattr(a, "__dict__"))
+        self.assertIs("ab", a.name)
+        aa = ModelFile("aa", False)
+        a.add_child(aa)
+        a.freeze()
+        self.assertEqual(tuple, type(a._ModelFile__children))
+        self.assertEqual([aa], a.get_children())
+
+        # An unfrozen copy gets its own list of children
+        a2 = copy.copy(a)
+        a2._ModelFile__frozen = False
+        a2.add_child(ModelFile("ab", False))
+        self.assertEqual(["aa", "ab"], [f.name for f in a2.get_children()])
+        self.assertEqual(["aa"], [f.name for f in a.get_children()])
+
+    def test_timestamps_round_trip(self):
+        file = ModelFile("test", False)
+        timestamp = datetime(2018, 11, 9, 21, 40, 18, 123456)
+        file.local_created_timestamp = timestamp
+        file.remote_modified_timestamp = timestamp
+        file.update_timestamp = timestamp
+        self.assertEqual(timestamp, file.local_created_timestamp)
+        self.assertEqual(timestamp, file.remote_modified_timestamp)
+        self.assertEqual(timestamp, file.update_timestamp)
+        file2 = pickle.loads(pickle.dumps(file))
+        self.assertEqual(timestamp, file2.local_created_timestamp)
+        self.assertEqual(file, file2)
+
+    def test_set_epoch_timestamps(self):
+        file = ModelFile("test", False)
+        file.set_epoch_timestamps(1.5, None, 3.0, 4.25)
+        self.assertEqual(datetime.fromtimestamp(1.5), file.local_created_timestamp)
+        self.assertIsNone(file.local_modified_timestamp)
+        self.assertEqual(datetime.fromtimestamp(3.0), file.remote_created_timestamp)
+        self.assertEqual(datetime.fromtimestamp(4.25), file.remote_modified_timestamp)
+        file.freeze()
+        with self.assertRaises(ValueError):
+            file.set_epoch_timestamps(None, None, None, None)
+
+    def test_changed_fields(self):
+        a1 = ModelFile("a", True)
+        a1.local_size = 100
+        a1.eta = 10
+        a1.add_child(ModelFile("aa", False))
+        a2 = ModelFile("a", True)
+        a2.local_size = 200
+        a2.eta = 10
+        a2.update_timestamp = datetime(2018, 11, 9, 21, 40, 18)
+        # Children and update timestamp are not compared
+        self.assertEqual(["local_size"], a1.changed_fields(a2))
+        a2.state = ModelFile.State.DOWNLOADING
+        a2.local_modified_timestamp = datetime(2018, 11, 9, 21, 40, 18)
+        self.assertEqual(["state", "local_size", "local_modified_timestamp"], a1.changed_fields(a2))
+
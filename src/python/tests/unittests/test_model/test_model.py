@@ -2,11 +2,12 @@
 
 import logging
 import sys
+import threading
 import unittest
 from unittest.mock import MagicMock
 
 from common import overrides
-from model import Model, ModelFile, IModelListener, ModelError
+from model import Model, ModelSnapshot, ModelFile, IModelListener, ModelError
 
 
 class DummyModelListener(IModelListener):
@@ -165,3 +166,191 @@ class TestLftpModel(unittest.TestCase):
         # Attempting to modify a frozen file should raise an error
         with self.assertRaises(ValueError):
             new_file.local_size = 300
+
+    def test_version(self):
+        self.assertEqual(0, self.model.version)
+        self.model.add_file(ModelFile("a", False))
+        self.model.add_file(ModelFile("b", False))
+        self.model.update_file(ModelFile("a", False))
+        self.model.remove_file("b")
+        self.assertEqual(4, self.model.version)
+        self.assertNotEqual(Model().journal_id, self.model.journal_id)
+
+    def test_get_changes_since_without_journal(self):
+        self.model.add_file(ModelFile("a", False))
+        self.assertEqual([], self.model.get_changes_since(1))
+        self.assertIsNone(self.model.get_changes_since(0))
+
+    def test_get_changes_since(self):
+        model = Model(journal_size=10)
+        a1 = ModelFile("a", False)
+        model.add_file(a1)
+        b1 = ModelFile("b", False)
+        model.add_file(b1)
+        self.assertEqual([(None, a1), (None, b1)], model.get_changes_since(0))
+        self.assertEqual([(None, b1)], model.get_changes_since(1))
+        self.assertEqual([], model.get_changes_since(2))
+
+        # Changes are coalesced per file, in the order of their last change
+        a2 = ModelFile("a", False)
+        a2.local_size = 2
+        model.update_file(a2)
+        c1 = ModelFile("c", False)
+        model.add_file(c1)
+        a3 = ModelFile("a", False)
+        a3.local_size = 3
+        model.update_file(a3)
+        model.remove_file("b")
+        d1 = ModelFile("d", False)
+        model.add_file(d1)
+        model.remove_file("d")
+        self.assertEqual([(None, c1), (a1, a3), (b1, None)], model.get_changes_since(2))
+        self.assertEqual([(a2, a3), (b1, None)], model.get_changes_since(4))
+        self.assertEqual(8, model.version)
+
+        # Versions ahead of the model are not known
+        self.assertIsNone(model.get_changes_since(9))
+        self.assertIsNone(model.get_changes_since(-1))
+
+    def test_get_changes_since_journal_rolled_over(self):
+        model = Model(journal_size=3)
+        for i in range(5):
+            model.add_file(ModelFile(str(i), False))
+        # Journal has versions 3, 4 and 5
+        self.assertIsNone(model.get_changes_since(1))
+        self.assertEqual(["2", "3", "4"], [new.name for _, new in model.get_changes_since(2)])
+
+
+    def test_apply_batch(self):
+        a1 = ModelFile("a", False)
+        b1 = ModelFile("b", False)
+        self.model.add_file(a1)
+        self.model.add_file(b1)
+
+        listener = DummyModelListener()
+        listener.files_changed = MagicMock()
+        self.model.add_listener(listener)
+
+        a2 = ModelFile("a", False)
+        a2.local_size = 100
+        c1 = ModelFile("c", False)
+        self.model.apply_batch([(ModelFile("a", False), a2), (b1, None), (None, c1)])
+        self.assertEqual({"a", "c"}, self.model.get_file_names())
+        self.assertTrue(a2.is_frozen)
+        self.assertTrue(c1.is_frozen)
+        self.assertEqual(5, self.model.version)
+        # Listener is notified once, with the files actually replaced in the model
+        # noinspection PyUnresolvedReferences
+        listener.files_changed.assert_called_once_with([(a1, a2), (b1, None), (None, c1)])
+
+    def test_apply_batch_default_listener(self):
+        a1 = ModelFile("a", False)
+        b1 = ModelFile("b", False)
+        self.model.add_file(a1)
+        self.model.add_file(b1)
+
+        listener = DummyModelListener()
+        listener.file_added = MagicMock()
+        listener.file_removed = MagicMock()
+        listener.file_updated = MagicMock()
+        self.model.add_listener(listener)
+
+        a2 = ModelFile("a", False)
+        c1 = ModelFile("c", False)
+        self.model.apply_batch([(a1, a2), (b1, None), (None, c1)])
+        # noinspection PyUnresolvedReferences
+        listener.file_added.assert_called_once_with(c1)
+        # noinspection PyUnresolvedReferences
+        listener.file_removed.assert_called_once_with(b1)
+        # noinspection PyUnresolvedReferences
+        listener.file_updated.assert_called_once_with(a1, a2)
+
+    def test_apply_batch_error(self):
+        listener = DummyModelListener()
+        listener.files_changed = MagicMock()
+        self.model.add_listener(listener)
+
+        a1 = ModelFile("a", False)
+        with self.assertRaises(ModelError):
+            self.model.apply_batch([(None, a1), (ModelFile("b", False), None), (None, ModelFile("c", False))])
+        # Changes before the failure are applied and notified
+        self.assertEqual({"a"}, self.model.get_file_names())
+        # noinspection PyUnresolvedReferences
+        listener.files_changed.assert_called_once_with([(None, a1)])
+
+        listener.files_changed.reset_mock()
+        with self.assertRaises(ModelError):
+            self.model.apply_batch([(None, ModelFile("a", False))])
+        # noinspection PyUnresolvedReferences
+        listener.files_changed.assert_not_called()
+
+    def test_snapshot_is_immutable(self):
+        a = ModelFile("a", False)
+        self.model.add_file(a)
+        snapshot = self.model.snapshot
+        self.assertIsInstance(snapshot, ModelSnapshot)
+        self.assertEqual(1, snapshot.version)
+        self.assertEqual(self.model.journal_id, snapshot.journal_id)
+
+        self.model.add_file(ModelFile("b", False))
+        self.model.update_file(ModelFile("a", False))
+        self.model.apply_batch([(None, ModelFile("c", False)), (a, None)])
+        # Later changes publish new snapshots, and leave this one alone
+        self.assertEqual({"a"}, snapshot.get_file_names())
+        self.assertIs(a, snapshot.get_file("a"))
+        self.assertEqual([a], snapshot.get_files())
+        self.assertEqual(1, len(snapshot))
+        self.assertNotIn("b", snapshot)
+        with self.assertRaises(ModelError):
+            snapshot.get_file("b")
+        self.assertEqual({"b", "c"}, self.model.snapshot.get_file_names())
+        self.assertEqual(5, self.model.snapshot.version)
+
+    def test_add_listener_and_get_snapshot(self):
+        self.model.add_file(ModelFile("a", False))
+        listener = DummyModelListener()
+        listener.file_added = MagicMock()
+        snapshot = self.model.add_listener_and_get_snapshot(listener)
+        self.assertEqual({"a"}, snapshot.get_file_names())
+        # noinspection PyUnresolvedReferences
+        listener.file_added.assert_not_called()
+
+        b = ModelFile("b", False)
+        self.model.add_file(b)
+        # noinspection PyUnresolvedReferences
+        listener.file_added.assert_called_once_with(b)
+
+    def test_add_listener_and_get_changes_since(self):
+        model = Model(journal_size=10)
+        a = ModelFile("a", False)
+        model.add_file(a)
+        listener = DummyModelListener()
+        listener.file_added = MagicMock()
+        snapshot, changes = model.add_listener_and_get_changes_since(listener, 0)
+        self.assertEqual(1, snapshot.version)
+        self.assertEqual([(None, a)], changes)
+        # noinspection PyUnresolvedReferences
+        listener.file_added.assert_not_called()
+
+    def test_snapshot_read_during_changes(self):
+        # A reader without any locking always sees a snapshot consistent with its version
+        model = Model()
+        errors = []
+        done = threading.Event()
+
+        def read():
+            while not done.is_set():
+                snapshot = model.snapshot
+                if len(snapshot.get_files()) != snapshot.version:
+                    errors.append(snapshot.version)
+
+        reader = threading.Thread(target=read)
+        reader.start()
+        try:
+            for i in range(500):
+                model.add_file(ModelFile(str(i), False))
+        finally:
+            done.set()
+            reader.join()
+        self.assertEqual([], errors)
+        self.assertEqual(500, len(model.snapshot))
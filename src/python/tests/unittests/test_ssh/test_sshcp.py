@@ -226,3 +226,29 @@ class TestSshcp(unittest.TestCase):
         with self.assertRaises(SshcpError) as ctx:
             sshcp.shell("./some_bad_command.sh")
         self.assertTrue("./some_bad_command.sh" in str(ctx.exception))
+
+    @parameterized.expand(_PARAMS)
+    @timeout_decorator.timeout(5)
+    def test_open_channel(self, _, password):
+        sshcp = Sshcp(host=self.host, port=self.port, user=self.user, password=password)
+        channel = sshcp.open_channel("while read line; do echo \"got $line\"; done")
+        try:
+            channel.send_line("hello")
+            match = channel.expect(rb"got (\w+)\r?\n")
+            self.assertEqual(b"hello", match.group(1))
+            channel.send_line("world")
+            match = channel.expect(rb"got (\w+)\r?\n")
+            self.assertEqual(b"world", match.group(1))
+        finally:
+            channel.close()
+        self.assertFalse(channel.is_alive())
+
+    @parameterized.expand(_PARAMS)
+    @timeout_decorator.timeout(5)
+    def test_open_channel_error_command_exits(self, _, password):
+        sshcp = Sshcp(host=self.host, port=self.port, user=self.user, password=password)
+        channel = sshcp.open_channel("echo 'some error'; exit 1")
+        with self.assertRaises(SshcpError) as ctx:
+            channel.expect(rb"never")
+        self.assertIn("some error", str(ctx.exception))
+        channel.close()
@@ -0,0 +1,93 @@
+# Copyright 2017, Inderpreet Singh, All rights reserved.
+
+import base64
+import logging
+import sys
+import unittest
+
+import timeout_decorator
+
+from ssh import SshcpChannel, SshcpError, SshcpTimeoutError
+
+
+# Child that answers each line with a frame of base64-encoded binary data
+_FRAME_SERVER = """
+import base64, sys
+for line in sys.stdin:
+    size = int(line)
+    payload = base64.b64encode(bytes(i % 256 for i in range(size)))
+    sys.stdout.write("FRAME {}\\n".format(len(payload)))
+    sys.stdout.write(payload.decode() + "\\n")
+    sys.stdout.flush()
+"""
+
+
+# Child that answers each line with its length
+_LINE_LENGTH_SERVER = """
+import sys
+for line in sys.stdin:
+    sys.stdout.write("LENGTH {}\\n".format(len(line.rstrip("\\n"))))
+    sys.stdout.flush()
+"""
+
+
+class TestSshcpChannel(unittest.TestCase):
+    """
+    Tests the channel over a local process, through a pty like ssh is run
+    """
+    def create_channel(self, script: str, timeout_in_secs: float = 5) -> SshcpChannel:
+        sp = SshcpChannel.spawn(sys.executable, ["-c", script])
+        channel = SshcpChannel(sp, timeout_in_secs, logging.getLogger("TestSshcpChannel"))
+        self.addCleanup(channel.close)
+        return channel
+
+    @timeout_decorator.timeout(10)
+    def test_request_response(self):
+        channel = self.create_channel(_FRAME_SERVER)
+        self.assertTrue(channel.is_alive())
+        # Sizes that cover payloads that are smaller and larger than the pty buffers
+        for size in [0, 1, 10, 100000, 3, 1000000]:
+            channel.send_line(str(size))
+            match = channel.expect(rb"FRAME (\d+)\r?\n")
+            payload = base64.b64decode(channel.read(int(match.group(1))))
+            self.assertEqual(bytes(i % 256 for i in range(size)), payload)
+
+    @timeout_decorator.timeout(10)
+    def test_long_lines(self):
+        channel = self.create_channel(_LINE_LENGTH_SERVER)
+        # Longer than the 4096 byte line limit of a pty in canonical mode
+        for length in [10, 4095, 4096, 10000, 100000]:
+            channel.send_line("x" * length)
+            match = channel.expect(rb"LENGTH (\d+)\r?\n")
+            self.assertEqual(length, int(match.group(1)))
+
+    @timeout_decorator.timeout(10)
+    def test_expect_raises_on_exit(self):
+        channel = self.create_channel("print('bye'); import sys; sys.exit(1)")
+        with self.assertRaises(SshcpError) as ctx:
+            channel.expect(rb"FRAME")
+        self.assertIn("bye", str(ctx.exception))
+
+    @timeout_decorator.timeout(10)
+    def test_read_raises_on_exit(self):
+        channel = self.create_channel("print('FRAME 100'); print('abc')")
+        channel.expect(rb"FRAME (\d+)\r?\n")
+        with self.assertRaises(SshcpError):
+            channel.read(100)
+
+    @timeout_decorator.timeout(10)
+    def test_expect_raises_on_timeout(self):
+        channel = self.create_channel("import time; time.sleep(10)", timeout_in_secs=0.2)
+        with self.assertRaises(SshcpTimeoutError) as ctx:
+            channel.expect(rb"FRAME")
+        self.assertIn("Timed out", str(ctx.exception))
+
+    @timeout_decorator.timeout(10)
+    def test_closed_channel(self):
+        channel = self.create_channel(_FRAME_SERVER)
+        channel.close()
+        self.assertFalse(channel.is_alive())
+        with self.assertRaises(SshcpError):
+            channel.send_line("1")
+        with self.assertRaises(SshcpError):
+            channel.expect(rb"FRAME")
@@ -0,0 +1,99 @@
+# Copyright 2017, Inderpreet Singh, All rights reserved.
+
+import os
+import pickle
+import shutil
+import tempfile
+import unittest
+from datetime import datetime
+
+from system import SystemFile, SystemFileCodec, SystemFileCodecError, SystemFileCodecVersionError, SystemScanner
+
+
+class TestSystemFileCodec(unittest.TestCase):
+    def test_empty(self):
+        self.assertEqual([], SystemFileCodec.decode(SystemFileCodec.encode([])))
+
+    def test_round_trip(self):
+        a = SystemFile("a", 110, True,
+                       time_created=datetime(2018, 11, 9, 21, 40, 18, 123456),
+                       time_modified=datetime(2018, 11, 9, 21, 40, 19))
+        aa = SystemFile("aa", 100, True)
+        aa.add_child(SystemFile("aaa", 100, False, time_modified=datetime(1965, 1, 1)))
+        aa.add_child(SystemFile("a", 0, False))
+        a.add_child(aa)
+        a.add_child(SystemFile("ab", 10, False))
+        a.add_child(SystemFile("ac", 0, True))
+        b = SystemFile("b", 24 * 1024 * 1024 * 1024 * 1024, False)
+        files = [a, b]
+        decoded = SystemFileCodec.decode(SystemFileCodec.encode(files))
+        self.assertEqual(files, decoded)
+        self.assertEqual(["aa", "ab", "ac"], [f.name for f in decoded[0].children])
+        self.assertIsNone(decoded[1].timestamp_created)
+
+    def test_round_trip_unicode_names(self):
+        files = [SystemFile("déģķ", 1, False), SystemFile("dir�dir", 2, False), SystemFile("\udcff", 3, False)]
+        self.assertEqual(files, SystemFileCodec.decode(SystemFileCodec.encode(files)))
+
+    def test_round_trip_scanned_tree(self):
+        temp_dir = tempfile.mkdtemp(prefix="test_codec")
+        self.addCleanup(shutil.rmtree, temp_dir)
+        os.makedirs(os.path.join(temp_dir, "a", "aa"))
+        with open(os.path.join(temp_dir, "a", "aa", "aaa"), "wb") as f:
+            f.write(bytearray([0xff] * 100))
+        with open(os.path.join(temp_dir, "b"), "wb") as f:
+            f.write(bytearray([0xff] * 10))
+        files = SystemScanner(temp_dir).scan()
+        self.assertEqual(files, SystemFileCodec.decode(SystemFileCodec.encode(files)))
+
+    def test_names_are_interned(self):
+        files = []
+        for i in range(100):
+            d = SystemFile("dir{}".format(i), 0, True)
+            d.add_child(SystemFile("Sample", 0, True))
+            files.append(d)
+        data = SystemFileCodec.encode(files)
+        self.assertEqual(1, data.count(b"Sample"))
+        self.assertEqual(files, SystemFileCodec.decode(data))
+
+    def test_is_encoded(self):
+        self.assertTrue(SystemFileCodec.is_encoded(SystemFileCodec.encode([])))
+        self.assertFalse(SystemFileCodec.is_encoded(pickle.dumps([])))
+        self.assertFalse(SystemFileCodec.is_encoded(b""))
+
+    def test_survives_whitespace_strip(self):
+        # Sshcp strips the output
+        files = [SystemFile(" a ", 0x20, False)]
+        data = SystemFileCodec.encode(files)
+        self.assertEqual(data, data.strip())
+
+    def test_bad_data(self):
+        data = SystemFileCodec.encode([SystemFile("a", 1, True), SystemFile("b", 2, False)])
+        with self.assertRaises(SystemFileCodecError):
+            SystemFileCodec.decode(data[:10])
+        with self.assertRaises(SystemFileCodecError):
+            SystemFileCodec.decode(data[:-1])
+        with self.assertRaises(SystemFileCodecError):
+            SystemFileCodec.decode(b"XXXX" + data[4:])
+        with self.assertRaises(SystemFileCodecError):
+            SystemFileCodec.decode(data[:-4] + b"XXXX")
+
+    def test_bad_version(self):
+        data = bytearray(SystemFileCodec.encode([]))
+        data[4] = SystemFileCodec.VERSION + 1
+        with self.assertRaises(SystemFileCodecVersionError):
+            SystemFileCodec.decode(bytes(data))
+
+    def test_bad_parent_index(self):
+        # Entry "b" claims to be a child of the file "a"
+        data = bytearray(SystemFileCodec.encode([SystemFile("a", 1, False), SystemFile("b", 2, False)]))
+        header_size = 20
+        strings_size = 4 * 2 + 2
+        parents_offset = header_size + strings_size
+        data[parents_offset + 4:parents_offset + 8] = (0).to_bytes(4, "little", signed=True)
+        with self.assertRaises(SystemFileCodecError):
+            SystemFileCodec.decode(bytes(data))
+        # Forward reference
+        data[parents_offset + 4:parents_offset + 8] = (5).to_bytes(4, "little", signed=True)
+        with self.assertRaises(SystemFileCodecError):
+            SystemFileCodec.decode(bytes(data))
@@ -0,0 +1,125 @@
+# Copyright 2017, Inderpreet Singh, All rights reserved.
+
+import os
+import shutil
+import tempfile
+import unittest
+from datetime import datetime
+
+from system import SystemFile, SystemFileDelta, SystemScanSnapshot, SystemFileCodecError
+
+
+class TestSystemFileDelta(unittest.TestCase):
+    def test_round_trip(self):
+        a = SystemFile("a", 10, True, time_modified=datetime(2018, 11, 9, 21, 40, 18))
+        a.add_child(SystemFile("aa", 10, False))
+        delta = SystemFileDelta("abcdef", False, [a, SystemFile("b", 1, False)], ["c", "déģķ"])
+        decoded = SystemFileDelta.decode(delta.encode())
+        self.assertEqual("abcdef", decoded.token)
+        self.assertFalse(decoded.is_full)
+        self.assertEqual(delta.files, decoded.files)
+        self.assertEqual(["c", "déģķ"], decoded.removed_names)
+
+        decoded = SystemFileDelta.decode(SystemFileDelta("t", True, [], []).encode())
+        self.assertTrue(decoded.is_full)
+        self.assertEqual([], decoded.files)
+        self.assertEqual([], decoded.removed_names)
+
+    def test_is_encoded(self):
+        self.assertTrue(SystemFileDelta.is_encoded(SystemFileDelta("t", True, [], []).encode()))
+        self.assertFalse(SystemFileDelta.is_encoded(b"SFSB"))
+
+    def test_bad_data(self):
+        data = SystemFileDelta("token", False, [SystemFile("a", 1, False)], ["b"]).encode()
+        for bad_data in [data[:6], data[:20], data[:-1], b"XXXX" + data[4:]]:
+            with self.assertRaises(SystemFileCodecError):
+                SystemFileDelta.decode(bad_data)
+
+
+class TestSystemScanSnapshot(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp(prefix="test_delta")
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    @staticmethod
+    def create_files(b_size: int = 20):
+        a = SystemFile("a", 10, True)
+        a.add_child(SystemFile("aa", 10, False))
+        return [a, SystemFile("b", b_size, False), SystemFile("c", 30, False)]
+
+    def test_token_depends_on_content(self):
+        token1 = SystemScanSnapshot.from_files(self.create_files()).token
+        self.assertEqual(token1, SystemScanSnapshot.from_files(self.create_files()).token)
+        self.assertNotEqual(token1, SystemScanSnapshot.from_files(self.create_files(b_size=21)).token)
+        self.assertNotEqual(token1, SystemScanSnapshot.from_files(self.create_files()[:2]).token)
+
+    def test_full_delta_without_matching_token(self):
+        files = self.create_files()
+        previous = SystemScanSnapshot.from_files(files)
+        snapshot = SystemScanSnapshot.from_files(files)
+        for prev, since_token in [(None, None), (None, previous.token), (previous, None), (previous, "bad")]:
+            delta = snapshot.create_delta(files, prev, since_token)
+            self.assertTrue(delta.is_full)
+            self.assertEqual(files, delta.files)
+            self.assertEqual(snapshot.token, delta.token)
+
+    def test_delta(self):
+        previous = SystemScanSnapshot.from_files(self.create_files())
+        files = self.create_files(b_size=50)[:2]
+        files.append(SystemFile("d", 40, False))
+        snapshot = SystemScanSnapshot.from_files(files)
+        delta = snapshot.create_delta(files, previous, previous.token)
+        self.assertFalse(delta.is_full)
+        self.assertEqual(["b", "d"], [f.name for f in delta.files])
+        self.assertEqual(["c"], delta.removed_names)
+        self.assertEqual(snapshot.token, delta.token)
+
+    def test_empty_delta_when_unchanged(self):
+        previous = SystemScanSnapshot.from_files(self.create_files())
+        snapshot = SystemScanSnapshot.from_files(self.create_files())
+        delta = snapshot.create_delta(self.create_files(), previous, previous.token)
+        self.assertFalse(delta.is_full)
+        self.assertEqual([], delta.files)
+        self.assertEqual([], delta.removed_names)
+        self.assertLess(len(delta.encode()), 100)
+
+    def test_duplicate_names_force_full_delta(self):
+        files = [SystemFile("a", 1, False), SystemFile("a", 2, False)]
+        previous = SystemScanSnapshot.from_files(files)
+        snapshot = SystemScanSnapshot.from_files(files)
+        self.assertTrue(snapshot.create_delta(files, previous, previous.token).is_full)
+
+    def test_digest_cache(self):
+        files = self.create_files()
+        digest_cache = dict()
+        token = SystemScanSnapshot.from_files(files, digest_cache).token
+        self.assertEqual(token, SystemScanSnapshot.from_files(self.create_files()).token)
+        self.assertEqual({id(f) for f in files}, set(digest_cache.keys()))
+
+        # Same objects reuse their digests, new ones are fingerprinted
+        files2 = files[:2] + [SystemFile("c", 31, False)]
+        token2 = SystemScanSnapshot.from_files(files2, digest_cache).token
+        self.assertNotEqual(token, token2)
+        self.assertEqual(token2, SystemScanSnapshot.from_files(files2).token)
+        self.assertEqual({id(f) for f in files2}, set(digest_cache.keys()))
+
+    def test_save_and_load(self):
+        path = os.path.join(self.temp_dir, "state")
+        self.assertIsNone(SystemScanSnapshot.load(path))
+        snapshot = SystemScanSnapshot.from_files(self.create_files())
+        snapshot.save(path)
+        loaded = SystemScanSnapshot.load(path)
+        self.assertEqual(snapshot.token, loaded.token)
+        delta = loaded.create_delta(self.create_files(), snapshot, snapshot.token)
+        self.assertFalse(delta.is_full)
+        self.assertEqual([], delta.files)
+        self.assertEqual(["state"], os.listdir(self.temp_dir))
+
+    def test_load_corrupt_file(self):
+        path = os.path.join(self.temp_dir, "state")
+        for content in ["", "not json", "[]", '{"version": 1}', '{"version": 99, "token": "", "digests": {}}']:
+            with open(path, "w") as f:
+                f.write(content)
+            self.assertIsNone(SystemScanSnapshot.load(path))
@@ -1,11 +1,31 @@
 # Copyright 2017, Inderpreet Singh, All rights reserved.
 
+import pickle
 import unittest
 from datetime import datetime
 
 from system import SystemFile
 
 
+class _BaselineSystemFile:
+    """
+    Pickles like a SystemFile from before it had slots, with its attributes in a __dict__
+    """
+    def __init__(self, name, size, is_dir=False, time_created=None, time_modified=None):
+        self.state = {
+            "_SystemFile__name": name,
+            "_SystemFile__size": size,
+            "_SystemFile__is_dir": is_dir,
+            "_SystemFile__timestamp_created": time_created,
+            "_SystemFile__timestamp_modified": time_modified,
+            "_SystemFile__children": []
+        }
+
+    def __reduce_ex__(self, protocol):
+        # Unpickles like __newobj__ does, which checks that the class is our own
+        return object.__new__, (SystemFile,), self.state
+
+
 class TestSystemFile(unittest.TestCase):
     def test_name(self):
         sf = SystemFile("test", 0, False)
@@ -83,3 +103,79 @@ class TestSystemFile(unittest.TestCase):
         self.assertTrue(a1 == a2)
         self.assertFalse(a1 == a3)
         self.assertFalse(a1 == a4)
+
+    def test_fingerprint(self):
+        a1 = SystemFile("a", 50, is_dir=True, time_modified=datetime(2018, 11, 9, 21, 40, 18))
+        a1.add_child(SystemFile("aa", 40, is_dir=False))
+        a2 = SystemFile("a", 50, is_dir=True, time_modified=datetime(2018, 11, 9, 21, 40, 18))
+        a2.add_child(SystemFile("aa", 40, is_dir=False))
+        self.assertEqual(a1.fingerprint, a2.fingerprint)
+
+        # Adding a child updates the fingerprint
+        a2.add_child(SystemFile("ab", 10, is_dir=False))
+        self.assertNotEqual(a1.fingerprint, a2.fingerprint)
+        self.assertNotEqual(a1, a2)
+
+        # Fingerprint is not pickled, but is the same once recomputed
+        a3 = pickle.loads(pickle.dumps(a2))
+        self.assertIsNone(a3._SystemFile__fingerprint)
+        self.assertEqual(a2, a3)
+
+        # Files whose fingerprints collide are still compared by their fields
+        b1 = SystemFile("b", 10, is_dir=False)
+        b2 = SystemFile("b", 11, is_dir=False)
+        b2._SystemFile__fingerprint = b1.fingerprint
+        self.assertNotEqual(b1, b2)
+        a4 = pickle.loads(pickle.dumps(a2))
+        a4.children[1]._SystemFile__size = 11
+        a4._SystemFile__fingerprint = a2.fingerprint
+        self.assertNotEqual(a2, a4)
+
+        self.assertFalse(a1 == None)  # noqa: E711
+
+    def test_compact_representation(self):
+        sf = SystemFile("".join(["a", "b"]), 0, True,
+                        time_created=datetime(2018, 11, 9, 21, 40, 18, 123456),
+                        time_modified=datetime(2018, 11, 9, 21, 40, 19))
+        self.assertFalse(hasattr(sf, "__dict__"))
+        self.assertIs("ab", sf.name)
+        self.assertEqual(datetime(2018, 11, 9, 21, 40, 18, 123456).timestamp(), sf.epoch_created)
+        self.assertEqual(datetime(2018, 11, 9, 21, 40, 19).timestamp(), sf.epoch_modified)
+        self.assertIsNone(SystemFile("", 0, False).epoch_created)
+        # Plain files share the empty children tuple
+        self.assertIs(SystemFile("a", 0, False).children, SystemFile("b", 0, False).children)
+
+        sf.add_child(SystemFile("aa", 0, False))
+        sf2 = pickle.loads(pickle.dumps(sf))
+        self.assertEqual(sf, sf2)
+        self.assertEqual(datetime(2018, 11, 9, 21, 40, 18, 123456), sf2.timestamp_created)
+        self.assertEqual("aa", sf2.children[0].name)
+
+    def test_unpickle_baseline_format(self):
+        a = _BaselineSystemFile("a", 50, True,
+                                time_created=datetime(2018, 11, 9, 21, 40, 18, 123456),
+                                time_modified=datetime(2018, 11, 9, 21, 40, 19))
+        a.state["_SystemFile__children"].append(_BaselineSystemFile("aa", 40, False))
+        a.state["_SystemFile__children"].append(_BaselineSystemFile("ab", 10, False))
+        files = pickle.loads(pickle.dumps([a, _BaselineSystemFile("b", 5, False)]))
+
+        expected_a = SystemFile("a", 50, True,
+                                time_created=datetime(2018, 11, 9, 21, 40, 18, 123456),
+                                time_modified=datetime(2018, 11, 9, 21, 40, 19))
+        expected_a.add_child(SystemFile("aa", 40, False))
+        expected_a.add_child(SystemFile("ab", 10, False))
+        self.assertEqual([expected_a, SystemFile("b", 5, False)], files)
+        self.assertEqual("a", files[0].name)
+        self.assertEqual(50, files[0].size)
+        self.assertEqual(datetime(2018, 11, 9, 21, 40, 18, 123456), files[0].timestamp_created)
+        self.assertEqual(["aa", "ab"], [child.name for child in files[0].children])
+        self.assertIsNone(files[1].epoch_created)
+        self.assertIs(SystemFile("c", 0, False).children, files[1].children)
+        # Children can still be added to unpickled directories
+        files[0].add_child(SystemFile("ac", 1, False))
+        self.assertEqual(3, len(files[0].children))
+
+        bad = _BaselineSystemFile("a", 50, False)
+        del bad.state["_SystemFile__size"]
+        with self.assertRaises(pickle.UnpicklingError):
+            pickle.loads(pickle.dumps(bad))
@@ -0,0 +1,84 @@
+# Copyright 2017, Inderpreet Singh, All rights reserved.
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from system import InotifyWatcher, InotifyError
+
+
+@unittest.skipIf(not InotifyWatcher.is_supported(), "inotify is only available on Linux")
+class TestInotifyWatcher(unittest.TestCase):
+    # Generous timeout to wait for events, tests return as soon as they arrive
+    POLL_TIMEOUT_IN_SECS = 5.0
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp(prefix="test_inotify")
+        os.makedirs(os.path.join(self.temp_dir, "a", "aa"))
+        with open(os.path.join(self.temp_dir, "a", "aa", "aaa"), "wb") as f:
+            f.write(bytearray([0xff] * 10))
+        os.mkdir(os.path.join(self.temp_dir, "b"))
+        self.watcher = InotifyWatcher(self.temp_dir)
+        self.watcher.start()
+
+    def tearDown(self):
+        self.watcher.close()
+        shutil.rmtree(self.temp_dir)
+
+    def poll_changes(self):
+        self.assertTrue(self.watcher.poll(TestInotifyWatcher.POLL_TIMEOUT_IN_SECS))
+        # Drain anything else that's pending
+        while self.watcher.poll(0):
+            pass
+        return self.watcher.pop_changes()
+
+    def test_watches_all_directories(self):
+        # root, a, aa, b
+        self.assertEqual(4, self.watcher.num_watches)
+
+    def test_no_changes(self):
+        self.assertFalse(self.watcher.poll(0))
+        self.assertEqual(set(), self.watcher.pop_changes())
+
+    def test_root_file_created(self):
+        with open(os.path.join(self.temp_dir, "c"), "wb") as f:
+            f.write(bytearray([0xff] * 10))
+        self.assertEqual({"c"}, self.poll_changes())
+
+    def test_nested_file_modified(self):
+        with open(os.path.join(self.temp_dir, "a", "aa", "aaa"), "ab") as f:
+            f.write(bytearray([0xff] * 10))
+        self.assertEqual({"a"}, self.poll_changes())
+
+    def test_new_directory_is_watched(self):
+        os.mkdir(os.path.join(self.temp_dir, "b", "ba"))
+        self.assertEqual({"b"}, self.poll_changes())
+        self.assertEqual(5, self.watcher.num_watches)
+        with open(os.path.join(self.temp_dir, "b", "ba", "baa"), "wb") as f:
+            f.write(bytearray([0xff] * 10))
+        self.assertEqual({"b"}, self.poll_changes())
+
+    def test_directory_moved_between_roots(self):
+        os.rename(os.path.join(self.temp_dir, "a", "aa"), os.path.join(self.temp_dir, "b", "aa"))
+        self.assertEqual({"a", "b"}, self.poll_changes())
+        # Changes in the moved directory are reported against its new root
+        with open(os.path.join(self.temp_dir, "b", "aa", "aaa"), "ab") as f:
+            f.write(bytearray([0xff] * 10))
+        self.assertEqual({"b"}, self.poll_changes())
+
+    def test_directory_deleted(self):
+        shutil.rmtree(os.path.join(self.temp_dir, "a"))
+        self.assertEqual({"a"}, self.poll_changes())
+        # root, b
+        self.assertEqual(2, self.watcher.num_watches)
+
+    def test_root_deleted_requires_full_scan(self):
+        shutil.rmtree(self.temp_dir)
+        os.mkdir(self.temp_dir)
+        self.assertIsNone(self.poll_changes())
+
+    def test_poll_after_close_fails(self):
+        self.watcher.close()
+        with self.assertRaises(InotifyError):
+            self.watcher.poll(0)
@@ -0,0 +1,209 @@
+# Copyright 2017, Inderpreet Singh, All rights reserved.
+
+import io
+import json
+import os
+import queue
+import re
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+
+from system import SystemScanner, SystemFileDelta, ScanAgent, InotifyWatcher
+
+
+class QueueInput:
+    """Input stream whose lines are fed from another thread, None closes it"""
+    def __init__(self):
+        self.lines = queue.Queue()
+
+    def readline(self):
+        line = self.lines.get()
+        return "" if line is None else line + "\n"
+
+
+class LockedOutput(io.BytesIO):
+    def __init__(self):
+        super().__init__()
+        self.lock = threading.Lock()
+
+    def write(self, data):
+        with self.lock:
+            return super().write(data)
+
+    def getvalue(self):
+        with self.lock:
+            return super().getvalue()
+
+
+class TestScanAgent(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp(prefix="test_scan_agent")
+        self.scan_dir = os.path.join(self.temp_dir, "scan")
+        os.makedirs(os.path.join(self.scan_dir, "a"))
+        self.touch(10, "a", "aa")
+        self.touch(20, "b")
+        self.state_file = os.path.join(self.temp_dir, "state")
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def touch(self, size, *args):
+        with open(os.path.join(self.scan_dir, *args), "wb") as f:
+            f.write(bytearray([0xff] * size))
+
+    @staticmethod
+    def parse_responses(data: bytes):
+        responses = []
+        while data:
+            match = re.match(ScanAgent.FRAME_HEADER_PATTERN, data)
+            size = int(match.group(2))
+            payload = data[match.end():match.end() + size]
+            responses.append((match.group(1).decode(), ScanAgent.decode_response_payload(payload)))
+            data = data[match.end() + size + 1:]
+        return responses
+
+    def serve(self, agent: ScanAgent, *requests):
+        out_stream = io.BytesIO()
+        agent.serve(io.StringIO("".join(r + "\n" for r in requests)), out_stream)
+        return self.parse_responses(out_stream.getvalue())
+
+    def test_scan(self):
+        agent = ScanAgent(SystemScanner(self.scan_dir), self.state_file)
+        delta = SystemFileDelta.decode(agent.scan(None))
+        self.assertTrue(delta.is_full)
+        self.assertEqual(SystemScanner(self.scan_dir).scan(), delta.files)
+
+        self.touch(30, "c")
+        delta2 = SystemFileDelta.decode(agent.scan(delta.token))
+        self.assertFalse(delta2.is_full)
+        self.assertEqual(["c"], [f.name for f in delta2.files])
+
+    def test_serve(self):
+        agent = ScanAgent(SystemScanner(self.scan_dir), self.state_file)
+        responses = self.serve(agent, ScanAgent.encode_request(None))
+        self.assertEqual(1, len(responses))
+        status, payload = responses[0]
+        self.assertEqual(ScanAgent.STATUS_OK, status)
+        delta = SystemFileDelta.decode(payload)
+        self.assertEqual(SystemScanner(self.scan_dir).scan(), delta.files)
+
+        os.remove(os.path.join(self.scan_dir, "b"))
+        responses = self.serve(agent, ScanAgent.encode_request(delta.token), ScanAgent.encode_request(None))
+        self.assertEqual(2, len(responses))
+        delta2 = SystemFileDelta.decode(responses[0][1])
+        self.assertFalse(delta2.is_full)
+        self.assertEqual([], delta2.files)
+        self.assertEqual(["b"], delta2.removed_names)
+        self.assertTrue(SystemFileDelta.decode(responses[1][1]).is_full)
+
+    def test_snapshot_survives_restart(self):
+        agent = ScanAgent(SystemScanner(self.scan_dir), self.state_file)
+        token = SystemFileDelta.decode(agent.scan(None)).token
+        agent = ScanAgent(SystemScanner(self.scan_dir), self.state_file)
+        delta = SystemFileDelta.decode(agent.scan(token))
+        self.assertFalse(delta.is_full)
+        self.assertEqual([], delta.files)
+
+    def test_without_state_file(self):
+        agent = ScanAgent(SystemScanner(self.scan_dir), None)
+        token = SystemFileDelta.decode(agent.scan(None)).token
+        self.assertFalse(SystemFileDelta.decode(agent.scan(token)).is_full)
+        self.assertFalse(os.path.exists(self.state_file))
+
+    def test_bad_requests(self):
+        agent = ScanAgent(SystemScanner(self.scan_dir), None)
+        responses = self.serve(agent, "not json", '{"since": 5}', "", ScanAgent.encode_request(None))
+        self.assertEqual(3, len(responses))
+        self.assertEqual(ScanAgent.STATUS_ERROR, responses[0][0])
+        self.assertEqual(ScanAgent.STATUS_ERROR, responses[1][0])
+        self.assertEqual(ScanAgent.STATUS_OK, responses[2][0])
+
+    def test_scanner_error(self):
+        agent = ScanAgent(SystemScanner(os.path.join(self.temp_dir, "nope")), None)
+        responses = self.serve(agent, ScanAgent.encode_request(None))
+        status, payload = responses[0]
+        self.assertEqual(ScanAgent.STATUS_ERROR, status)
+        self.assertIn("SystemScannerError", payload.decode())
+
+    def test_scan_roots(self):
+        agent = ScanAgent(SystemScanner(self.scan_dir), None)
+        token = SystemFileDelta.decode(agent.scan(None)).token
+
+        self.touch(30, "a", "ab")
+        self.touch(40, "b")
+        self.touch(50, "c")
+        # Only the given roots are rescanned
+        delta = SystemFileDelta.decode(agent.scan(token, ["b", "c"]))
+        self.assertFalse(delta.is_full)
+        self.assertEqual(["b", "c"], [f.name for f in delta.files])
+        self.assertEqual([40, 50], [f.size for f in delta.files])
+
+        os.remove(os.path.join(self.scan_dir, "c"))
+        delta = SystemFileDelta.decode(agent.scan(delta.token, ["c"]))
+        self.assertEqual([], delta.files)
+        self.assertEqual(["c"], delta.removed_names)
+
+        # A full scan catches up with everything else
+        delta = SystemFileDelta.decode(agent.scan(delta.token))
+        self.assertEqual(["a"], [f.name for f in delta.files])
+        self.assertEqual(40, delta.files[0].size)
+
+    def test_scan_roots_with_unknown_token_rescans_everything(self):
+        agent = ScanAgent(SystemScanner(self.scan_dir), None)
+        agent.scan(None)
+        self.touch(30, "a", "ab")
+        delta = SystemFileDelta.decode(agent.scan("some other token", ["b"]))
+        self.assertTrue(delta.is_full)
+        self.assertEqual(SystemScanner(self.scan_dir).scan(), delta.files)
+
+    def test_scan_roots_skips_excluded_names(self):
+        scanner = SystemScanner(self.scan_dir)
+        scanner.add_exclude_prefix(".")
+        agent = ScanAgent(scanner, None)
+        token = SystemFileDelta.decode(agent.scan(None)).token
+        self.touch(10, ".hidden")
+        delta = SystemFileDelta.decode(agent.scan(token, [".hidden"]))
+        self.assertEqual([], delta.files)
+        self.assertEqual(token, delta.token)
+
+    def test_bad_roots(self):
+        agent = ScanAgent(SystemScanner(self.scan_dir), None)
+        responses = self.serve(agent,
+                               json.dumps({"since": None, "roots": "a"}),
+                               json.dumps({"since": None, "roots": [1]}),
+                               json.dumps({"op": "dance"}))
+        self.assertEqual([ScanAgent.STATUS_ERROR] * 3, [status for status, _ in responses])
+
+    @unittest.skipIf(not InotifyWatcher.is_supported(), "inotify is only available on Linux")
+    def test_watch(self):
+        scanner = SystemScanner(self.scan_dir)
+        scanner.add_exclude_prefix(".")
+        agent = ScanAgent(scanner, None)
+        in_stream = QueueInput()
+        out_stream = LockedOutput()
+        thread = threading.Thread(target=agent.serve, args=(in_stream, out_stream))
+        thread.start()
+        try:
+            in_stream.lines.put(ScanAgent.encode_watch_request())
+            self.wait_for_frames(out_stream, 1)
+            self.touch(1, ".hidden")
+            self.touch(30, "a", "ab")
+            self.touch(40, "c")
+            responses = self.wait_for_frames(out_stream, 2)
+            self.assertEqual((ScanAgent.STATUS_OK, b""), responses[0])
+            self.assertEqual(ScanAgent.STATUS_CHANGES, responses[1][0])
+            self.assertEqual(["a", "c"], json.loads(responses[1][1].decode()))
+        finally:
+            in_stream.lines.put(None)
+            thread.join()
+
+    def wait_for_frames(self, out_stream: LockedOutput, num_frames: int):
+        deadline = time.monotonic() + 5
+        while True:
+            responses = self.parse_responses(out_stream.getvalue())
+            if len(responses) >= num_frames or time.monotonic() > deadline:
+                return responses
+            time.sleep(0.05)
@@ -660,3 +660,187 @@ class TestSystemScanner(unittest.TestCase):
         self.assertEqual("dir�dir", folder.name)
         self.assertEqual("file�file", file.name)
         self.assertEqual(128, file.size)
+
+    def test_scan_incremental_matches_full_scan(self):
+        self.setup_default_tree()
+        full_scanner = SystemScanner(TestSystemScanner.temp_dir)
+        scanner = SystemScanner(TestSystemScanner.temp_dir)
+        scanner.set_incremental(True)
+
+        # First scan populates the cache
+        self.assertEqual(full_scanner.scan(), scanner.scan())
+        self.assertEqual(0, scanner.cache_hits)
+        # root, a, aa, .aaa, b, ba, bb, bba, bbc, bbca
+        self.assertEqual(10, scanner.cache_misses)
+
+        # Second scan should be served entirely from the cache
+        self.assertEqual(full_scanner.scan(), scanner.scan())
+        self.assertEqual(10, scanner.cache_hits)
+        self.assertEqual(10, scanner.cache_misses)
+
+    def test_scan_incremental_reuses_unchanged_subtrees(self):
+        self.setup_default_tree()
+        scanner = SystemScanner(TestSystemScanner.temp_dir)
+        scanner.set_incremental(True)
+        a1, b1, c1 = tuple(scanner.scan())
+
+        # Grow a file in place, this doesn't change the parent directory's mtime
+        with open(os.path.join(TestSystemScanner.temp_dir, "b", "ba", "baa"), "ab") as f:
+            f.write(bytearray([0xff] * 10))
+        a2, b2, c2 = tuple(scanner.scan())
+
+        self.assertIs(a1, a2)
+        self.assertIs(c1, c2)
+        self.assertIsNot(b1, b2)
+        ba, bb = tuple(b2.children)
+        self.assertIs(b1.children[1], bb)
+        self.assertEqual(512+7+10, ba.children[0].size)
+        self.assertEqual(512+7+10+24*1024*1024+24+1, b2.size)
+        self.assertEqual(SystemScanner(TestSystemScanner.temp_dir).scan(), [a2, b2, c2])
+
+    def test_scan_incremental_detects_added_and_removed_files(self):
+        self.setup_default_tree()
+        scanner = SystemScanner(TestSystemScanner.temp_dir)
+        scanner.set_incremental(True)
+        scanner.scan()
+
+        my_touch(100, "a", "ac")
+        my_mkdir("d")
+        shutil.rmtree(os.path.join(TestSystemScanner.temp_dir, "b", "bb", "bbc"))
+        files = scanner.scan()
+        self.assertEqual(SystemScanner(TestSystemScanner.temp_dir).scan(), files)
+        a, b, c, d = tuple(files)
+        self.assertEqual(["aa", "ab", "ac"], [f.name for f in a.children])
+        self.assertEqual(["bba", "bbb"], [f.name for f in b.children[1].children])
+        self.assertEqual("d", d.name)
+
+    def test_scan_incremental_lftp_partial_file(self):
+        tempdir = TestSystemScanner.temp_dir
+        os.mkdir(os.path.join(tempdir, "t"))
+        with open(os.path.join(tempdir, "t", "partial.mkv"), 'wb') as f:
+            f.write(bytearray([0xff] * 1000))
+        status_path = os.path.join(tempdir, "t", "partial.mkv.lftp-pget-status")
+        with open(status_path, "w") as f:
+            f.write("size=1000\n0.pos=10\n0.limit=1000\n")
+
+        scanner = SystemScanner(tempdir)
+        scanner.set_incremental(True)
+        self.assertEqual(10, scanner.scan()[0].size)
+
+        # Only the status file changes
+        with open(status_path, "w") as f:
+            f.write("size=1000\n0.pos=600\n0.limit=1000\n")
+        self.assertEqual(600, scanner.scan()[0].size)
+
+        # Download completes and status file is removed
+        os.remove(status_path)
+        self.assertEqual(1000, scanner.scan()[0].size)
+
+    def test_scan_incremental_full_scan_interval(self):
+        self.setup_default_tree()
+        scanner = SystemScanner(TestSystemScanner.temp_dir)
+        scanner.set_incremental(True, full_scan_interval=2)
+        files1 = scanner.scan()
+        files2 = scanner.scan()
+        self.assertIs(files1[0], files2[0])
+        self.assertEqual(10, scanner.cache_hits)
+        # Third scan is forced to be a full one
+        files3 = scanner.scan()
+        self.assertIsNot(files1[0], files3[0])
+        self.assertEqual(files1, files3)
+        self.assertEqual(10, scanner.cache_hits)
+        self.assertEqual(20, scanner.cache_misses)
+
+    def test_scan_incremental_cache_cleared_on_exclude_change(self):
+        self.setup_default_tree()
+        scanner = SystemScanner(TestSystemScanner.temp_dir)
+        scanner.set_incremental(True)
+        scanner.scan()
+        scanner.add_exclude_prefix(".")
+        files = scanner.scan()
+        a, b, c = tuple(files)
+        aa, ab = tuple(a.children)
+        self.assertEqual(0, len(aa.children))
+        self.assertEqual(12*1024+4, a.size)
+
+    def test_scan_parallel_matches_serial_scan(self):
+        self.setup_default_tree()
+        serial_scanner = SystemScanner(TestSystemScanner.temp_dir)
+        scanner = SystemScanner(TestSystemScanner.temp_dir)
+        scanner.set_num_threads(4)
+        self.assertEqual(serial_scanner.scan(), scanner.scan())
+
+        scanner.add_exclude_prefix(".")
+        serial_scanner.add_exclude_prefix(".")
+        self.assertEqual(serial_scanner.scan(), scanner.scan())
+
+    def test_scan_parallel_lftp_files(self):
+        tempdir = TestSystemScanner.temp_dir
+        os.mkdir(os.path.join(tempdir, "t"))
+        my_touch(1000, "t", "partial.mkv")
+        with open(os.path.join(tempdir, "t", "partial.mkv.lftp-pget-status"), "w") as f:
+            f.write("size=1000\n0.pos=10\n0.limit=1000\n")
+        my_touch(100, "u.mkv.lftp")
+
+        scanner = SystemScanner(tempdir)
+        scanner.set_lftp_temp_suffix(".lftp")
+        scanner.set_num_threads(4)
+        t, u = tuple(scanner.scan())
+        self.assertEqual(["partial.mkv"], [f.name for f in t.children])
+        self.assertEqual(10, t.size)
+        self.assertEqual("u.mkv", u.name)
+        self.assertEqual(100, u.size)
+
+    def test_scan_parallel_incremental(self):
+        self.setup_default_tree()
+        scanner = SystemScanner(TestSystemScanner.temp_dir)
+        scanner.set_incremental(True)
+        scanner.set_num_threads(4)
+        files1 = scanner.scan()
+        self.assertEqual(SystemScanner(TestSystemScanner.temp_dir).scan(), files1)
+        self.assertEqual(0, scanner.cache_hits)
+        self.assertEqual(10, scanner.cache_misses)
+
+        my_touch(100, "a", "ac")
+        files2 = scanner.scan()
+        self.assertEqual(SystemScanner(TestSystemScanner.temp_dir).scan(), files2)
+        self.assertIs(files1[1], files2[1])
+        self.assertEqual(["aa", "ab", "ac"], [f.name for f in files2[0].children])
+        # only a was re-listed
+        self.assertEqual(9, scanner.cache_hits)
+        self.assertEqual(11, scanner.cache_misses)
+
+    def test_scan_parallel_missing_path_fails(self):
+        scanner = SystemScanner(os.path.join(TestSystemScanner.temp_dir, "nope"))
+        scanner.set_num_threads(4)
+        with self.assertRaises(SystemScannerError):
+            scanner.scan()
+
+    def test_scan_parallel_files_deleted_while_scanning(self):
+        self.setup_default_tree()
+        scanner = SystemScanner(TestSystemScanner.temp_dir)
+        scanner.set_num_threads(4)
+
+        stop = False
+
+        def monkey_with_files():
+            orig = os.path.join(TestSystemScanner.temp_dir, "b")
+            dest = os.path.join(TestSystemScanner.temp_dir, "b_copy")
+            while not stop:
+                shutil.copytree(orig, dest)
+                shutil.rmtree(dest)
+        thread = Thread(target=monkey_with_files)
+        thread.start()
+
+        try:
+            for i in range(0, 500):
+                names = set([f.name for f in scanner.scan()])
+                self.assertTrue({"a", "b", "c"}.issubset(names))
+        finally:
+            stop = True
+            thread.join()
+
+    def test_set_num_threads_rejects_bad_values(self):
+        scanner = SystemScanner(TestSystemScanner.temp_dir)
+        with self.assertRaises(ValueError):
+            scanner.set_num_threads(0)
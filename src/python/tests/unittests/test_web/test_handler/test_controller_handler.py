@@ -5,7 +5,7 @@ from unittest.mock import MagicMock, patch, call
 import json
 
 from controller import Controller
-from web.handler.controller import ControllerHandler, WebResponseActionCallback
+from web.handler.controller import ControllerHandler, WebResponseActionCallback, WebResponseBatchCallback
 
 
 class TestWebResponseActionCallback(unittest.TestCase):
@@ -57,15 +57,18 @@ class TestControllerHandlerBulkCommand(unittest.TestCase):
             return self.handler._ControllerHandler__handle_bulk_command()
 
     def _setup_command_callback(self, success=True, error=None, error_code=400):
-        """Setup mock controller to capture and respond to commands."""
-        def side_effect(command):
-            for callback in command.callbacks:
-                if success:
-                    callback.on_success()
-                else:
-                    callback.on_failure(error, error_code)
-
-        self.mock_controller.queue_command.side_effect = side_effect
+        """Setup mock controller to capture and respond to batch commands."""
+        def side_effect(batch_command):
+            if success:
+                results = {f: Controller.BatchCommand.Result(True) for f in batch_command.filenames}
+            else:
+                results = {
+                    f: Controller.BatchCommand.Result(False, error, error_code) for f in batch_command.filenames
+                }
+            for callback in batch_command.callbacks:
+                callback.on_complete(results)
+
+        self.mock_controller.queue_batch_command.side_effect = side_effect
 
     # =========================================================================
     # Validation Tests
@@ -215,8 +218,9 @@ class TestControllerHandlerBulkCommand(unittest.TestCase):
         result_files = [r["file"] for r in body["results"]]
         self.assertEqual(["file1", "file2", "file3"], result_files)
 
-        # Controller should only receive 3 commands
-        self.assertEqual(3, self.mock_controller.queue_command.call_count)
+        # Controller should only receive the 3 unique files
+        batch_command = self.mock_controller.queue_batch_command.call_args[0][0]
+        self.assertEqual(["file1", "file2", "file3"], batch_command.filenames)
 
     def test_max_files_exactly_at_limit_succeeds(self):
         """Requests with exactly MAX_BULK_FILES should succeed."""
@@ -260,8 +264,12 @@ class TestControllerHandlerBulkCommand(unittest.TestCase):
         self.assertEqual(2, body["summary"]["succeeded"])
         self.assertEqual(0, body["summary"]["failed"])
 
-        # Verify commands were queued
-        self.assertEqual(2, self.mock_controller.queue_command.call_count)
+        # Verify one batch command was queued for both files
+        self.mock_controller.queue_batch_command.assert_called_once()
+        self.mock_controller.queue_command.assert_not_called()
+        batch_command = self.mock_controller.queue_batch_command.call_args[0][0]
+        self.assertEqual(Controller.Command.Action.QUEUE, batch_command.action)
+        self.assertEqual(["file1", "file2"], batch_command.filenames)
 
     def test_stop_action_success(self):
         self._setup_command_callback(success=True)
@@ -276,7 +284,7 @@ class TestControllerHandlerBulkCommand(unittest.TestCase):
         self.assertEqual(1, body["summary"]["succeeded"])
 
         # Verify the command action is STOP
-        command = self.mock_controller.queue_command.call_args[0][0]
+        command = self.mock_controller.queue_batch_command.call_args[0][0]
         self.assertEqual(Controller.Command.Action.STOP, command.action)
 
     def test_extract_action_success(self):
@@ -289,7 +297,7 @@ class TestControllerHandlerBulkCommand(unittest.TestCase):
 
         self.assertEqual(200, response.status_code)
 
-        command = self.mock_controller.queue_command.call_args[0][0]
+        command = self.mock_controller.queue_batch_command.call_args[0][0]
         self.assertEqual(Controller.Command.Action.EXTRACT, command.action)
 
     def test_delete_local_action_success(self):
@@ -302,7 +310,7 @@ class TestControllerHandlerBulkCommand(unittest.TestCase):
 
         self.assertEqual(200, response.status_code)
 
-        command = self.mock_controller.queue_command.call_args[0][0]
+        command = self.mock_controller.queue_batch_command.call_args[0][0]
         self.assertEqual(Controller.Command.Action.DELETE_LOCAL, command.action)
 
     def test_delete_remote_action_success(self):
@@ -315,7 +323,7 @@ class TestControllerHandlerBulkCommand(unittest.TestCase):
 
         self.assertEqual(200, response.status_code)
 
-        command = self.mock_controller.queue_command.call_args[0][0]
+        command = self.mock_controller.queue_batch_command.call_args[0][0]
         self.assertEqual(Controller.Command.Action.DELETE_REMOTE, command.action)
 
     # =========================================================================
@@ -344,17 +352,16 @@ class TestControllerHandlerBulkCommand(unittest.TestCase):
 
     def test_partial_failure(self):
         """Test that partial failures don't stop processing other files."""
-        call_count = [0]
-
-        def side_effect(command):
-            call_count[0] += 1
-            for callback in command.callbacks:
-                if call_count[0] == 2:  # Second file fails
-                    callback.on_failure("File not found", 404)
-                else:
-                    callback.on_success()
+        def side_effect(batch_command):
+            results = {
+                "file1": Controller.BatchCommand.Result(True),
+                "file2": Controller.BatchCommand.Result(False, "File not found", 404),  # Second file fails
+                "file3": Controller.BatchCommand.Result(True),
+            }
+            for callback in batch_command.callbacks:
+                callback.on_complete(results)
 
-        self.mock_controller.queue_command.side_effect = side_effect
+        self.mock_controller.queue_batch_command.side_effect = side_effect
 
         response = self._call_bulk_handler({
             "action": "queue",
@@ -430,11 +437,11 @@ class TestControllerHandlerBulkCommand(unittest.TestCase):
 
     def test_timeout_returns_504_error(self):
         """Test that commands that don't complete in time return 504 timeout error."""
-        def slow_side_effect(command):
+        def slow_side_effect(batch_command):
             # Don't call the callback - simulate a timeout
             pass
 
-        self.mock_controller.queue_command.side_effect = slow_side_effect
+        self.mock_controller.queue_batch_command.side_effect = slow_side_effect
 
         # Override the timeout to a very short value for testing
         original_timeout = ControllerHandler._BULK_TIMEOUT_PER_FILE
@@ -529,36 +536,46 @@ class TestControllerHandlerBulkCommand(unittest.TestCase):
         # Should complete in under 2 seconds (mocked controller is instant)
         self.assertLess(elapsed, 2.0, "500 files should process in under 2 seconds")
 
-    def test_parallel_queuing_batches_commands(self):
-        """Test that all commands are queued before waiting for callbacks."""
-        queued_times = []
-        callback_times = []
-
-        def side_effect(command):
-            import time
-            queued_times.append(time.time())
-            # Small delay to simulate controller processing
-            time.sleep(0.001)
-            for callback in command.callbacks:
-                callback.on_success()
-            callback_times.append(time.time())
-
-        self.mock_controller.queue_command.side_effect = side_effect
+    def test_bulk_request_queues_single_batch_command(self):
+        """Test that all files go to the controller in one batch command with one callback."""
+        self._setup_command_callback(success=True)
 
-        files = ["file1", "file2", "file3"]
+        files = ["file{}".format(i) for i in range(1000)]
         self._call_bulk_handler({
             "action": "queue",
             "files": files
         })
 
-        # All files should have been queued
-        self.assertEqual(3, len(queued_times))
+        self.mock_controller.queue_batch_command.assert_called_once()
+        self.mock_controller.queue_command.assert_not_called()
+        batch_command = self.mock_controller.queue_batch_command.call_args[0][0]
+        self.assertEqual(files, batch_command.filenames)
+        self.assertEqual(1, len(batch_command.callbacks))
+
+    def test_missing_result_for_file_is_a_failure(self):
+        def side_effect(batch_command):
+            for callback in batch_command.callbacks:
+                callback.on_complete({"file1": Controller.BatchCommand.Result(True)})
 
-        # With parallel queuing, all commands are queued first,
-        # then callbacks are waited on. In the mocked scenario,
-        # the callbacks are triggered immediately, so the order
-        # should still show all commands were processed.
-        self.assertEqual(3, self.mock_controller.queue_command.call_count)
+        self.mock_controller.queue_batch_command.side_effect = side_effect
+
+        response = self._call_bulk_handler({
+            "action": "queue",
+            "files": ["file1", "file2"]
+        })
+
+        body = json.loads(response.body)
+        self.assertTrue(body["results"][0]["success"])
+        self.assertFalse(body["results"][1]["success"])
+        self.assertEqual(500, body["results"][1]["error_code"])
+
+    def test_batch_callback_wait(self):
+        callback = WebResponseBatchCallback()
+        self.assertFalse(callback.wait(timeout=0.01))
+        results = {"file1": Controller.BatchCommand.Result(True)}
+        callback.on_complete(results)
+        self.assertTrue(callback.wait(timeout=1.0))
+        self.assertIs(results, callback.results)
 
     # =========================================================================
     # Rate Limiting Tests
@@ -1,5 +1,6 @@
 # Copyright 2017, Inderpreet Singh, All rights reserved.
 
+import json
 import unittest
 from unittest.mock import MagicMock
 
@@ -7,6 +8,7 @@ from controller import Controller
 from model import ModelFile
 from web.handler.stream_model import ModelStreamHandler, WebResponseModelListener
 from web.serialize import SerializeModel
+from tests.unittests.test_web.test_serialize.test_serialize import parse_stream
 
 
 class TestWebResponseModelListener(unittest.TestCase):
@@ -46,6 +48,35 @@ class TestWebResponseModelListener(unittest.TestCase):
         event = listener.get_next_event()
         self.assertIsNone(event)
 
+    def test_files_changed_puts_events_in_order(self):
+        listener = WebResponseModelListener()
+        a1 = ModelFile("a", False)
+        a2 = ModelFile("a", False)
+        b = ModelFile("b", False)
+        c = ModelFile("c", False)
+        listener.files_changed([])
+        listener.files_changed([(a1, a2), (b, None)])
+        listener.file_added(c)
+        events = [listener.get_next_event() for _ in range(4)]
+        self.assertEqual([SerializeModel.UpdateEvent.Change.UPDATED,
+                          SerializeModel.UpdateEvent.Change.REMOVED,
+                          SerializeModel.UpdateEvent.Change.ADDED],
+                         [e.change for e in events[:3]])
+        self.assertIs(a2, events[0].new_file)
+        self.assertIs(b, events[1].old_file)
+        self.assertIs(c, events[2].new_file)
+        self.assertIsNone(events[3])
+
+    def test_files_changed_queue_is_bounded_by_events(self):
+        listener = WebResponseModelListener(maxsize=2)
+        listener.files_changed([(None, ModelFile(name, False)) for name in ("a", "b", "c")])
+        self.assertEqual(2, listener.get_queue_size())
+        self.assertEqual(1, listener.get_dropped_count())
+        # The oldest event is dropped, not the whole batch
+        self.assertEqual("b", listener.get_next_event().new_file.name)
+        self.assertEqual("c", listener.get_next_event().new_file.name)
+        self.assertIsNone(listener.get_next_event())
+
 
 class TestModelStreamHandler(unittest.TestCase):
     def setUp(self):
@@ -144,3 +175,155 @@ class TestModelStreamHandler(unittest.TestCase):
         self.assertIn("realtime.txt", result2)
         result3 = self.handler.get_value()
         self.assertIsNone(result3)
+
+    def test_updates_sent_in_full_by_default(self):
+        self.mock_controller.get_model_files_and_add_listener.return_value = []
+        self.handler.set_request_query({})
+        self.handler.setup()
+        old_file = ModelFile("updated.txt", False)
+        new_file = ModelFile("updated.txt", False)
+        new_file.local_size = 100
+        self.handler.model_listener.file_updated(old_file, new_file)
+        result = self.handler.get_value()
+        self.assertIn("model-updated", result)
+
+    def test_updates_sent_as_patches_on_request(self):
+        self.mock_controller.get_model_files_and_add_listener.return_value = []
+        self.handler.set_request_query({"model_patch": "1"})
+        self.handler.setup()
+        self.handler.model_listener.file_added(ModelFile("added.txt", False))
+        # No field that is sent to the frontend changed, so this one is skipped
+        old_file = ModelFile("updated.txt", False)
+        new_file = ModelFile("updated.txt", False)
+        new_file.transferred_size = 100
+        self.handler.model_listener.file_updated(old_file, new_file)
+        new_file2 = ModelFile("updated.txt", False)
+        new_file2.local_size = 100
+        self.handler.model_listener.file_updated(new_file, new_file2)
+        result = self.handler.get_value()
+        self.assertIn("model-added", result)
+        result = self.handler.get_value()
+        self.assertIn("model-patch", result)
+        self.assertIn("local_size", result)
+        self.assertIsNone(self.handler.get_value())
+
+    def __get_values(self) -> list:
+        values = []
+        value = self.handler.get_value()
+        while value is not None:
+            values.append(parse_stream(value))
+            value = self.handler.get_value()
+        return values
+
+    def test_resumable_stream_tags_last_initial_event_and_updates(self):
+        self.mock_controller.get_model_changes_and_add_listener.return_value = \
+            ("j1", 7, [ModelFile("a", False), ModelFile("b", False)], None)
+        self.handler.set_request_query({"model_resume": "1"})
+        self.handler.set_last_event_id(None)
+        self.handler.setup()
+        self.mock_controller.get_model_changes_and_add_listener.assert_called_once_with(
+            self.handler.model_listener, None, None
+        )
+        self.handler.model_listener.file_added(ModelFile("c", False))
+        self.handler.model_listener.file_removed(ModelFile("a", False))
+        values = self.__get_values()
+        self.assertEqual(["model-added"] * 3 + ["model-removed"], [v["event"] for v in values])
+        self.assertEqual([None, "j1:7", "j1:8", "j1:9"], [v.get("id") for v in values])
+
+    def test_resumable_stream_sends_only_missed_changes(self):
+        a1 = ModelFile("a", False)
+        a2 = ModelFile("a", False)
+        a2.local_size = 100
+        self.mock_controller.get_model_changes_and_add_listener.return_value = \
+            ("j1", 10, None, [(None, ModelFile("c", False)), (a1, a2), (ModelFile("b", False), None)])
+        self.handler.set_request_query({"model_resume": "1"})
+        self.handler.set_last_event_id("j1:7")
+        self.handler.setup()
+        self.mock_controller.get_model_changes_and_add_listener.assert_called_once_with(
+            self.handler.model_listener, "j1", 7
+        )
+        values = self.__get_values()
+        self.assertEqual(["model-added", "model-updated", "model-removed"], [v["event"] for v in values])
+        self.assertEqual([None, None, "j1:10"], [v.get("id") for v in values])
+
+    def test_resumable_stream_resyncs_when_not_resumable(self):
+        self.mock_controller.get_model_changes_and_add_listener.return_value = \
+            ("j2", 3, [ModelFile("a", False)], None)
+        self.handler.set_request_query({"model_resume": "1"})
+        self.handler.set_last_event_id("j1:7")
+        self.handler.setup()
+        values = self.__get_values()
+        # The client's model is replaced
+        self.assertEqual(["model-init", "model-added"], [v["event"] for v in values])
+        self.assertEqual("[]", values[0]["data"])
+        self.assertEqual([None, "j2:3"], [v.get("id") for v in values])
+
+    def test_resumable_stream_ignores_bad_event_id(self):
+        self.mock_controller.get_model_changes_and_add_listener.return_value = ("j1", 0, [], None)
+        self.handler.set_request_query({"model_resume": "1"})
+        self.handler.set_last_event_id("garbage")
+        self.handler.setup()
+        self.mock_controller.get_model_changes_and_add_listener.assert_called_once_with(
+            self.handler.model_listener, None, None
+        )
+        values = self.__get_values()
+        self.assertEqual(["model-init"], [v["event"] for v in values])
+        self.assertEqual("j1:0", values[0]["id"])
+
+    def test_resumable_stream_resumes_after_listener_overflow(self):
+        old_listener = WebResponseModelListener(maxsize=2)
+        self.handler.model_listener = old_listener
+        self.mock_controller.get_model_changes_and_add_listener.side_effect = [
+            ("j1", 7, [ModelFile("a", False)], None),
+            ("j1", 12, None, [(None, ModelFile(name, False)) for name in ("b", "c", "d", "e", "f")]),
+        ]
+        self.handler.set_request_query({"model_resume": "1"})
+        self.handler.set_last_event_id(None)
+        self.handler.setup()
+        self.assertEqual("j1:7", parse_stream(self.handler.get_value())["id"])
+        for name in ("b", "c", "d", "e", "f"):
+            old_listener.file_added(ModelFile(name, False))
+        self.assertEqual(3, old_listener.get_dropped_count())
+        values = self.__get_values()
+        # The client is caught up from the last event it was sent, without duplicates
+        self.mock_controller.remove_model_listener.assert_called_once_with(old_listener)
+        self.mock_controller.get_model_changes_and_add_listener.assert_called_with(
+            self.handler.model_listener, "j1", 7
+        )
+        self.assertIsNot(old_listener, self.handler.model_listener)
+        self.assertEqual(["model-added"] * 5, [v["event"] for v in values])
+        self.assertEqual(["b", "c", "d", "e", "f"], [json.loads(v["data"])["new_file"]["name"] for v in values])
+        self.assertEqual([None, None, None, None, "j1:12"], [v.get("id") for v in values])
+        # Events keep their versions after the catch-up
+        self.handler.model_listener.file_removed(ModelFile("a", False))
+        self.assertEqual("j1:13", parse_stream(self.handler.get_value())["id"])
+
+    def test_stream_resends_model_after_listener_overflow(self):
+        old_listener = WebResponseModelListener(maxsize=2)
+        self.handler.model_listener = old_listener
+        self.mock_controller.get_model_files_and_add_listener.side_effect = [
+            [ModelFile("a", False)],
+            [ModelFile("a", False), ModelFile("b", False), ModelFile("c", False)],
+        ]
+        self.handler.set_request_query({})
+        self.handler.setup()
+        self.assertIsNotNone(self.handler.get_value())
+        for name in ("b", "c", "d"):
+            old_listener.file_added(ModelFile(name, False))
+        old_listener.file_removed(ModelFile("d", False))
+        values = self.__get_values()
+        # The client's model is replaced
+        self.mock_controller.remove_model_listener.assert_called_once_with(old_listener)
+        self.assertEqual(["model-init"] + ["model-added"] * 3, [v["event"] for v in values])
+        self.assertEqual("[]", values[0]["data"])
+
+    def test_stream_without_resume_has_no_event_ids(self):
+        self.mock_controller.get_model_files_and_add_listener.return_value = [ModelFile("a", False)]
+        self.handler.set_request_query({})
+        self.handler.set_last_event_id("j1:7")
+        self.handler.setup()
+        self.handler.model_listener.file_added(ModelFile("b", False))
+        values = self.__get_values()
+        self.assertEqual(2, len(values))
+        self.assertFalse([v for v in values if "id" in v])
+
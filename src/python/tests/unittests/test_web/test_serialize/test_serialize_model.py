@@ -332,3 +332,95 @@ class TestSerializeModel(unittest.TestCase):
         self.assertEqual("c/ca/caa", data[2]["children"][0]["children"][0]["full_path"])
         self.assertEqual("c/ca/cab", data[2]["children"][0]["children"][1]["full_path"])
         self.assertEqual("c/cb", data[2]["children"][1]["full_path"])
+
+    def test_patch_event(self):
+        def build(aab_local_size: int, aab_speed: int):
+            a = ModelFile("a", True)
+            a.local_size = 10 + aab_local_size
+            aa = ModelFile("aa", True)
+            a.add_child(aa)
+            aaa = ModelFile("aaa", False)
+            aaa.local_size = 10
+            aa.add_child(aaa)
+            aab = ModelFile("aab", False)
+            aab.local_size = aab_local_size
+            aab.downloading_speed = aab_speed
+            aab.transferred_size = aab_local_size
+            aa.add_child(aab)
+            a.freeze()
+            return a
+
+        serialize = SerializeModel()
+        out = parse_stream(
+            serialize.patch_event(SerializeModel.UpdateEvent(
+                SerializeModel.UpdateEvent.Change.UPDATED, build(10, 5), build(20, 6)
+            ))
+        )
+        self.assertEqual("model-patch", out["event"])
+        data = json.loads(out["data"])
+        self.assertEqual(
+            {
+                "name": "a",
+                "changes": [
+                    {"full_path": "a", "local_size": 30},
+                    {"full_path": "a/aa/aab", "local_size": 20, "downloading_speed": 6}
+                ]
+            },
+            data
+        )
+
+    def test_patch_event_children(self):
+        a1 = ModelFile("a", True)
+        a1.freeze()
+        a2 = ModelFile("a", True)
+        a2.add_child(ModelFile("aa", False))
+        a2.freeze()
+        serialize = SerializeModel()
+        out = parse_stream(
+            serialize.patch_event(SerializeModel.UpdateEvent(
+                SerializeModel.UpdateEvent.Change.UPDATED, a1, a2
+            ))
+        )
+        data = json.loads(out["data"])
+        self.assertEqual(1, len(data["changes"]))
+        self.assertEqual("a", data["changes"][0]["full_path"])
+        self.assertEqual(["aa"], [child["name"] for child in data["changes"][0]["children"]])
+        self.assertEqual("a/aa", data["changes"][0]["children"][0]["full_path"])
+
+    def test_patch_event_none_if_no_sent_field_changed(self):
+        a1 = ModelFile("a", False)
+        a1.transferred_size = 10
+        a2 = ModelFile("a", False)
+        a2.transferred_size = 20
+        serialize = SerializeModel()
+        self.assertIsNone(serialize.patch_event(SerializeModel.UpdateEvent(
+            SerializeModel.UpdateEvent.Change.UPDATED, a1, a2
+        )))
+
+    def test_patch_event_is_small_for_large_dirs(self):
+        def build(speed: int):
+            a = ModelFile("Some.Show.S01.1080p.WEB-DL.x264-GROUP", True)
+            for i in range(2000):
+                child = ModelFile("Some.Show.S01E01.part{:04d}.rar".format(i), False)
+                child.remote_size = 1000000
+                child.local_size = 1000000 if i > 0 else 500000
+                child.downloading_speed = speed if i == 0 else None
+                child.eta = 10 if i == 0 else None
+                a.add_child(child)
+            a.state = ModelFile.State.DOWNLOADING
+            a.downloading_speed = speed
+            a.freeze()
+            return a
+
+        event = SerializeModel.UpdateEvent(SerializeModel.UpdateEvent.Change.UPDATED, build(100), build(200))
+        serialize = SerializeModel()
+        self.assertGreater(len(serialize.update_event(event)), 100000)
+        self.assertLess(len(serialize.patch_event(event)), 500)
+
+    def test_event_id(self):
+        serialize = SerializeModel()
+        event = SerializeModel.UpdateEvent(SerializeModel.UpdateEvent.Change.ADDED, None, ModelFile("a", False))
+        self.assertNotIn("id", parse_stream(serialize.update_event(event)))
+        self.assertEqual("abc:12", parse_stream(serialize.update_event(event, event_id="abc:12"))["id"])
+        self.assertEqual("abc:13", parse_stream(serialize.model([], event_id="abc:13"))["id"])
+
@@ -4,7 +4,7 @@ import json
 import logging
 import time
 from threading import Event, Lock
-from typing import List, Tuple
+from typing import Dict, List, Optional, Tuple
 from urllib.parse import unquote
 
 from bottle import HTTPResponse, request
@@ -56,6 +56,35 @@ class WebResponseActionCallback(Controller.Command.ICallback):
         return self.__event.wait(timeout=timeout)
 
 
+class WebResponseBatchCallback(Controller.BatchCommand.ICallback):
+    """
+    Controller batch command callback used to wait for the results of a bulk request.
+    Clients should call wait() method to wait for the results,
+    then read them from 'results'
+    """
+
+    def __init__(self):
+        self.__event = Event()
+        self.results: Optional[Dict[str, Controller.BatchCommand.Result]] = None
+
+    @overrides(Controller.BatchCommand.ICallback)
+    def on_complete(self, results: Dict[str, Controller.BatchCommand.Result]):
+        self.results = results
+        self.__event.set()
+
+    def wait(self, timeout: float = None) -> bool:
+        """
+        Wait for the batch command to complete.
+
+        Args:
+            timeout: Maximum time to wait in seconds. None means wait forever.
+
+        Returns:
+            True if the event was set (command completed), False if timed out.
+        """
+        return self.__event.wait(timeout=timeout)
+
+
 class ControllerHandler(IHandler):
     def __init__(self, controller: Controller):
         self.__controller = controller
@@ -309,7 +338,7 @@ class ControllerHandler(IHandler):
 
         action = self._VALID_ACTIONS[action_name]
 
-        # Process files using parallel queuing for performance
+        # Process all files as one controller batch command
         results, succeeded, failed = self._process_bulk_commands(action, files, action_name)
 
         response = {
@@ -334,12 +363,11 @@ class ControllerHandler(IHandler):
         action_name: str
     ) -> Tuple[List[dict], int, int]:
         """
-        Process bulk commands with parallel queuing for improved performance.
+        Process bulk commands as a single controller batch command.
 
-        Instead of queuing one command and waiting for it to complete before
-        queuing the next, this method queues ALL commands first, allowing the
-        controller to process them in a single batch. This significantly reduces
-        latency for large file counts.
+        All files are checked against one model snapshot and executed together
+        in the next controller cycle, so the request waits for one callback
+        regardless of the number of files.
 
         Args:
             action: The action to perform on all files.
@@ -360,44 +388,35 @@ class ControllerHandler(IHandler):
             self._BULK_MAX_TIMEOUT
         )
 
-        # Phase 1: Queue all commands (parallel queuing)
-        commands_with_callbacks: List[Tuple[str, WebResponseActionCallback]] = []
-        for file_name in files:
-            command = Controller.Command(action, file_name)
-            callback = WebResponseActionCallback()
-            command.add_callback(callback)
-            self.__controller.queue_command(command)
-            commands_with_callbacks.append((file_name, callback))
-
-        queue_time = time.time()
-        logger.debug("Bulk {}: queued {} commands in {:.3f}s".format(
-            action_name, file_count, queue_time - start_time
-        ))
-
-        # Phase 2: Wait for all callbacks to complete
-        # The controller will process all queued commands in its next cycle,
-        # so waiting for all at once is much faster than waiting one-by-one.
+        batch_command = Controller.BatchCommand(action, files)
+        callback = WebResponseBatchCallback()
+        batch_command.add_callback(callback)
+        self.__controller.queue_batch_command(batch_command)
+
+        if not callback.wait(timeout=timeout):
+            logger.warning("Bulk {} timed out for {} file(s) after {:.3f}s".format(
+                action_name, file_count, time.time() - start_time
+            ))
+            results = [
+                {"file": file_name, "success": False, "error": "Operation timed out", "error_code": 504}
+                for file_name in files
+            ]
+            return results, 0, file_count
+
         results = []
         succeeded = 0
         failed = 0
-        timed_out = 0
-
-        # Calculate remaining time for each callback
-        for file_name, callback in commands_with_callbacks:
-            remaining_timeout = max(0.1, timeout - (time.time() - start_time))
-            completed = callback.wait(timeout=remaining_timeout)
-
-            if not completed:
-                # Timed out waiting for this command
+        for file_name in files:
+            result = callback.results.get(file_name)
+            if result is None:
                 results.append({
                     "file": file_name,
                     "success": False,
-                    "error": "Operation timed out",
-                    "error_code": 504
+                    "error": "No result for file '{}'".format(file_name),
+                    "error_code": 500
                 })
                 failed += 1
-                timed_out += 1
-            elif callback.success:
+            elif result.success:
                 results.append({
                     "file": file_name,
                     "success": True
@@ -407,26 +426,17 @@ class ControllerHandler(IHandler):
                 results.append({
                     "file": file_name,
                     "success": False,
-                    "error": callback.error,
-                    "error_code": callback.error_code
+                    "error": result.error,
+                    "error_code": result.error_code
                 })
                 failed += 1
 
         total_time = time.time() - start_time
-
-        # Log performance summary
-        if timed_out > 0:
-            logger.warning(
-                "Bulk {} completed: {}/{} succeeded, {} failed, {} timed out in {:.3f}s".format(
-                    action_name, succeeded, file_count, failed - timed_out, timed_out, total_time
-                )
-            )
-        else:
-            logger.info(
-                "Bulk {} completed: {}/{} succeeded in {:.3f}s ({:.1f} files/sec)".format(
-                    action_name, succeeded, file_count, total_time,
-                    file_count / total_time if total_time > 0 else 0
-                )
+        logger.info(
+            "Bulk {} completed: {}/{} succeeded in {:.3f}s ({:.1f} files/sec)".format(
+                action_name, succeeded, file_count, total_time,
+                file_count / total_time if total_time > 0 else 0
             )
+        )
 
         return results, succeeded, failed
@@ -1,9 +1,10 @@
 # Copyright 2017, Inderpreet Singh, All rights reserved.
 
-from typing import Optional, List
+import collections
+from typing import Optional, List, Mapping, Deque, Tuple
 
 from ..web_app import IStreamHandler
-from ..utils import StreamQueue
+from ..utils import StreamQueue, DEFAULT_QUEUE_MAXSIZE
 from ..serialize import SerializeModel
 from model import IModelListener, ModelFile
 from common import overrides
@@ -14,9 +15,13 @@ class WebResponseModelListener(IModelListener, StreamQueue[SerializeModel.Update
     """
     Model listener used by streams to listen to model updates
     One listener should be created for each new request
+
+    A batch of changes is put in the queue one event at a time, so that the
+    queue's maxsize bounds the number of events and an overflow drops the
+    oldest events rather than a whole batch.
     """
-    def __init__(self):
-        super().__init__()
+    def __init__(self, maxsize: int = DEFAULT_QUEUE_MAXSIZE):
+        super().__init__(maxsize=maxsize)
 
     @overrides(IModelListener)
     def file_added(self, file: ModelFile):
@@ -36,39 +41,152 @@ class WebResponseModelListener(IModelListener, StreamQueue[SerializeModel.Update
                                             old_file=old_file,
                                             new_file=new_file))
 
+    @overrides(IModelListener)
+    def files_changed(self, changes: List[Tuple[Optional[ModelFile], Optional[ModelFile]]]):
+        for old_file, new_file in changes:
+            self.put(SerializeModel.UpdateEvent.from_change(old_file, new_file))
+
 
 class ModelStreamHandler(IStreamHandler):
+    """
+    Streams the model to the frontend
+
+    By default every update is sent as the full old and new file. Clients that
+    connect with the "model_patch=1" query parameter instead get updates as
+    patches of only the changed fields.
+
+    Clients that connect with the "model_resume=1" query parameter get model
+    events tagged with the model version they bring the client to. When such a
+    client reconnects with a Last-Event-ID, it is only sent the changes it missed.
+    If the model journal no longer goes back that far, it is sent an empty
+    model-init followed by the whole model instead.
+
+    If the client falls so far behind that its listener drops events, the
+    listener is replaced and the client is caught up the same way, from the
+    last event it was sent.
+    """
+    __QUERY_MODEL_PATCH = "model_patch"
+    __QUERY_MODEL_RESUME = "model_resume"
+    __QUERY_TRUE_VALUES = ("1", "true")
+
     def __init__(self, controller: Controller):
         self.controller = controller
         self.serialize = SerializeModel()
         self.model_listener = WebResponseModelListener()
-        self.initial_model_files: List[ModelFile] = []
+        self.initial_events: Deque[SerializeModel.UpdateEvent] = collections.deque()
+        self.send_patches = False
+        self.resumable = False
+        self.__last_event_id = None
+        self.__journal_id = None
+        self.__version = None
+        self.__send_reset = False
+
+    @overrides(IStreamHandler)
+    def set_request_query(self, query: Mapping[str, str]):
+        self.send_patches = query.get(ModelStreamHandler.__QUERY_MODEL_PATCH) in \
+            ModelStreamHandler.__QUERY_TRUE_VALUES
+        self.resumable = query.get(ModelStreamHandler.__QUERY_MODEL_RESUME) in \
+            ModelStreamHandler.__QUERY_TRUE_VALUES
+
+    @overrides(IStreamHandler)
+    def set_last_event_id(self, last_event_id: Optional[str]):
+        self.__last_event_id = last_event_id
 
     @overrides(IStreamHandler)
     def setup(self):
-        self.initial_model_files = list(
-            self.controller.get_model_files_and_add_listener(self.model_listener)
+        if not self.resumable:
+            self.__set_initial_files(self.controller.get_model_files_and_add_listener(self.model_listener))
+            return
+
+        journal_id, version = ModelStreamHandler.__parse_event_id(self.__last_event_id)
+        # A reconnecting client has to drop the model it has if it can't be resumed
+        self.__resume(journal_id, version, send_reset=self.__last_event_id is not None)
+
+    def __resume(self, journal_id: Optional[str], version: Optional[int], send_reset: bool):
+        self.__journal_id, self.__version, model_files, changes = \
+            self.controller.get_model_changes_and_add_listener(self.model_listener, journal_id, version)
+        if changes is None:
+            self.__set_initial_files(model_files)
+            self.__send_reset = send_reset
+        else:
+            self.initial_events = collections.deque(
+                SerializeModel.UpdateEvent.from_change(old_file, new_file) for old_file, new_file in changes
+            )
+
+    def __set_initial_files(self, model_files: List[ModelFile]):
+        # Initial files are sent as "added" events
+        self.initial_events = collections.deque(
+            SerializeModel.UpdateEvent(
+                change=SerializeModel.UpdateEvent.Change.ADDED,
+                old_file=None,
+                new_file=file
+            ) for file in model_files
         )
 
+    def __resync(self):
+        """
+        Catches up a client whose listener dropped events, from the last event sent to it
+        The listener is replaced rather than emptied, as a model update in progress may
+        still put events in it. Those are part of the catch-up.
+        """
+        self.controller.remove_model_listener(self.model_listener)
+        self.model_listener = WebResponseModelListener(maxsize=self.model_listener.get_maxsize())
+        self.initial_events.clear()
+        if self.resumable:
+            self.__resume(self.__journal_id, self.__version, send_reset=True)
+        else:
+            self.__set_initial_files(self.controller.get_model_files_and_add_listener(self.model_listener))
+            self.__send_reset = True
+
+    @staticmethod
+    def __parse_event_id(event_id: Optional[str]) -> Tuple[Optional[str], Optional[int]]:
+        """Returns the (journal id, version) of an event id, (None, None) if it's not valid"""
+        if event_id:
+            journal_id, _, version = event_id.rpartition(":")
+            if journal_id and version.isdigit():
+                return journal_id, int(version)
+        return None, None
+
+    def __event_id(self) -> Optional[str]:
+        return "{}:{}".format(self.__journal_id, self.__version) if self.resumable else None
+
     @overrides(IStreamHandler)
     def get_value(self) -> Optional[str]:
-        # Send initial files one at a time as "added" events
+        if self.__send_reset:
+            self.__send_reset = False
+            return self.serialize.model([], event_id=None if self.initial_events else self.__event_id())
+
+        # Send initial events one at a time
         # The streaming loop ensures fair interleaving with other handlers
-        if self.initial_model_files:
-            file = self.initial_model_files.pop(0)
-            event = SerializeModel.UpdateEvent(
-                change=SerializeModel.UpdateEvent.Change.ADDED,
-                old_file=None,
-                new_file=file
-            )
-            return self.serialize.update_event(event)
+        while self.initial_events:
+            event = self.initial_events.popleft()
+            # Only the last initial event brings the client up to the current version
+            value = self.__serialize(event, None if self.initial_events else self.__event_id())
+            if value is not None:
+                return value
 
-        # After all initial files are sent, process real-time updates
+        # After all initial events are sent, process real-time updates
         event = self.model_listener.get_next_event()
-        if event is not None:
-            return self.serialize.update_event(event)
+        while event is not None:
+            # After a drop, this event's version is unknown, and the client has missed events
+            if self.model_listener.get_dropped_count() > 0:
+                self.__resync()
+                return self.get_value()
+            if self.__version is not None:
+                self.__version += 1
+            value = self.__serialize(event, self.__event_id())
+            if value is not None:
+                return value
+            event = self.model_listener.get_next_event()
         return None
 
+    def __serialize(self, event: SerializeModel.UpdateEvent, event_id: Optional[str]) -> Optional[str]:
+        """Returns None if the event doesn't need to be sent"""
+        if not self.send_patches or event.change != SerializeModel.UpdateEvent.Change.UPDATED:
+            return self.serialize.update_event(event, event_id=event_id)
+        # None of the fields shown by the frontend may have changed
+        return self.serialize.patch_event(event, event_id=event_id)
+
     @overrides(IStreamHandler)
     def cleanup(self):
         if self.model_listener:
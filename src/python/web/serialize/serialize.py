@@ -1,6 +1,7 @@
 # Copyright 2017, Inderpreet Singh, All rights reserved.
 
 from abc import ABC
+from typing import Optional
 
 
 class Serialize(ABC):
@@ -8,9 +9,14 @@ class Serialize(ABC):
     Base class for SSE serialization
     """
     # noinspection PyMethodMayBeStatic
-    def _sse_pack(self, event: str, data: str) -> str:
-        """Pack data in SSE format"""
+    def _sse_pack(self, event: str, data: str, event_id: Optional[str] = None) -> str:
+        """
+        Pack data in SSE format
+        A client that reconnects sends back the last event_id it got as Last-Event-ID
+        """
         buffer = ""
+        if event_id is not None:
+            buffer += "id: %s\n" % event_id
         buffer += "event: %s\n" % event
         buffer += "data: %s\n" % data
         buffer += "\n"
@@ -1,11 +1,12 @@
 # Copyright 2017, Inderpreet Singh, All rights reserved.
 
+from datetime import datetime
 from enum import Enum
 import json
 from typing import List, Optional
 
 from .serialize import Serialize
-from model import ModelFile
+from model import ModelFile, ModelDiff, ModelDiffUtil
 
 
 class SerializeModel(Serialize):
@@ -25,6 +26,17 @@ class SerializeModel(Serialize):
             self.old_file = old_file
             self.new_file = new_file
 
+        @staticmethod
+        def from_change(old_file: Optional[ModelFile], new_file: Optional[ModelFile]) -> "SerializeModel.UpdateEvent":
+            """Event of an (old file, new file) model change, see Model.apply_batch()"""
+            if old_file is None:
+                change = SerializeModel.UpdateEvent.Change.ADDED
+            elif new_file is None:
+                change = SerializeModel.UpdateEvent.Change.REMOVED
+            else:
+                change = SerializeModel.UpdateEvent.Change.UPDATED
+            return SerializeModel.UpdateEvent(change, old_file, new_file)
+
     # Event keys
     __EVENT_INIT = "model-init"
     __EVENT_UPDATE = {
@@ -34,6 +46,9 @@ class SerializeModel(Serialize):
     }
     __KEY_UPDATE_OLD_FILE = "old_file"
     __KEY_UPDATE_NEW_FILE = "new_file"
+    __EVENT_PATCH = "model-patch"
+    __KEY_PATCH_NAME = "name"
+    __KEY_PATCH_CHANGES = "changes"
 
     # Model file keys
     __KEY_FILE_NAME = "name"
@@ -66,34 +81,42 @@ class SerializeModel(Serialize):
         ModelFile.ImportStatus.WAITING_FOR_IMPORT: "waiting_for_import"
     }
 
+    # (ModelFile field, json key, json value of the field) in the order of the json dict
+    # Fields that are missing here, e.g. transferred_size, are not sent to the frontend
+    __FILE_FIELDS = (
+        ("name", __KEY_FILE_NAME, lambda f: f.name),
+        ("is_dir", __KEY_FILE_IS_DIR, lambda f: f.is_dir),
+        ("state", __KEY_FILE_STATE, lambda f: SerializeModel.__VALUES_FILE_STATE[f.state]),
+        ("remote_size", __KEY_FILE_REMOTE_SIZE, lambda f: f.remote_size),
+        ("local_size", __KEY_FILE_LOCAL_SIZE, lambda f: f.local_size),
+        ("downloading_speed", __KEY_FILE_DOWNLOADING_SPEED, lambda f: f.downloading_speed),
+        ("eta", __KEY_FILE_ETA, lambda f: f.eta),
+        ("is_extractable", __KEY_FILE_IS_EXTRACTABLE, lambda f: f.is_extractable),
+        ("local_created_timestamp", __KEY_FILE_LOCAL_CREATED_TIMESTAMP,
+         lambda f: SerializeModel.__timestamp_to_json(f.local_created_timestamp)),
+        ("local_modified_timestamp", __KEY_FILE_LOCAL_MODIFIED_TIMESTAMP,
+         lambda f: SerializeModel.__timestamp_to_json(f.local_modified_timestamp)),
+        ("remote_created_timestamp", __KEY_FILE_REMOTE_CREATED_TIMESTAMP,
+         lambda f: SerializeModel.__timestamp_to_json(f.remote_created_timestamp)),
+        ("remote_modified_timestamp", __KEY_FILE_REMOTE_MODIFIED_TIMESTAMP,
+         lambda f: SerializeModel.__timestamp_to_json(f.remote_modified_timestamp)),
+        ("full_path", __KEY_FILE_FULL_PATH, lambda f: f.full_path),
+        ("import_status", __KEY_FILE_IMPORT_STATUS,
+         lambda f: SerializeModel.__VALUES_FILE_IMPORT_STATUS[f.import_status]),
+        (ModelDiff.FIELD_CHILDREN, __KEY_FILE_CHILDREN,
+         lambda f: [SerializeModel.__model_file_to_json_dict(child) for child in f.get_children()])
+    )
+    __FILE_FIELDS_BY_NAME = {field[0]: field for field in __FILE_FIELDS}
+
+    @staticmethod
+    def __timestamp_to_json(timestamp: Optional[datetime]) -> Optional[str]:
+        return str(timestamp.timestamp()) if timestamp else None
+
     @staticmethod
     def __model_file_to_json_dict(model_file: ModelFile) -> dict:
-        json_dict = dict()
-        json_dict[SerializeModel.__KEY_FILE_NAME] = model_file.name
-        json_dict[SerializeModel.__KEY_FILE_IS_DIR] = model_file.is_dir
-        json_dict[SerializeModel.__KEY_FILE_STATE] = SerializeModel.__VALUES_FILE_STATE[model_file.state]
-        json_dict[SerializeModel.__KEY_FILE_REMOTE_SIZE] = model_file.remote_size
-        json_dict[SerializeModel.__KEY_FILE_LOCAL_SIZE] = model_file.local_size
-        json_dict[SerializeModel.__KEY_FILE_DOWNLOADING_SPEED] = model_file.downloading_speed
-        json_dict[SerializeModel.__KEY_FILE_ETA] = model_file.eta
-        json_dict[SerializeModel.__KEY_FILE_IS_EXTRACTABLE] = model_file.is_extractable
-        json_dict[SerializeModel.__KEY_FILE_LOCAL_CREATED_TIMESTAMP] = \
-            str(model_file.local_created_timestamp.timestamp()) if model_file.local_created_timestamp else None
-        json_dict[SerializeModel.__KEY_FILE_LOCAL_MODIFIED_TIMESTAMP] = \
-            str(model_file.local_modified_timestamp.timestamp()) if model_file.local_modified_timestamp else None
-        json_dict[SerializeModel.__KEY_FILE_REMOTE_CREATED_TIMESTAMP] = \
-            str(model_file.remote_created_timestamp.timestamp()) if model_file.remote_created_timestamp else None
-        json_dict[SerializeModel.__KEY_FILE_REMOTE_MODIFIED_TIMESTAMP] = \
-            str(model_file.remote_modified_timestamp.timestamp()) if model_file.remote_modified_timestamp else None
-        json_dict[SerializeModel.__KEY_FILE_FULL_PATH] = model_file.full_path
-        json_dict[SerializeModel.__KEY_FILE_IMPORT_STATUS] = \
-            SerializeModel.__VALUES_FILE_IMPORT_STATUS[model_file.import_status]
-        json_dict[SerializeModel.__KEY_FILE_CHILDREN] = list()
-        for child in model_file.get_children():
-            json_dict[SerializeModel.__KEY_FILE_CHILDREN].append(SerializeModel.__model_file_to_json_dict(child))
-        return json_dict
+        return {key: to_json(model_file) for _, key, to_json in SerializeModel.__FILE_FIELDS}
 
-    def model(self, model_files: List[ModelFile]) -> str:
+    def model(self, model_files: List[ModelFile], event_id: Optional[str] = None) -> str:
         """
         Serialize the model
         :return:
@@ -101,9 +124,10 @@ class SerializeModel(Serialize):
         model_json_list = [SerializeModel.__model_file_to_json_dict(f) for f in model_files]
         model_json = json.dumps(model_json_list)
         return self._sse_pack(event=SerializeModel.__EVENT_INIT,
-                              data=model_json)
+                              data=model_json,
+                              event_id=event_id)
 
-    def update_event(self, event: UpdateEvent):
+    def update_event(self, event: UpdateEvent, event_id: Optional[str] = None):
         model_file_json_dict = {
             SerializeModel.__KEY_UPDATE_OLD_FILE:
                 SerializeModel.__model_file_to_json_dict(event.old_file) if event.old_file else None,
@@ -112,4 +136,31 @@ class SerializeModel(Serialize):
         }
         model_file_json = json.dumps(model_file_json_dict)
         return self._sse_pack(event=SerializeModel.__EVENT_UPDATE[event.change],
-                              data=model_file_json)
+                              data=model_file_json,
+                              event_id=event_id)
+
+    def patch_event(self, event: UpdateEvent, event_id: Optional[str] = None) -> Optional[str]:
+        """
+        Serialize an UPDATED event as a patch of only the fields that changed
+        The patch lists, for each changed file or child (by full path), the new
+        value of its changed fields. A file whose children were added or removed
+        is sent with all its children.
+        :return: None if none of the changed fields are sent to the frontend
+        """
+        changes = []
+        for changed_file, fields in ModelDiffUtil.diff_changed_files(event.old_file, event.new_file):
+            json_fields = [SerializeModel.__FILE_FIELDS_BY_NAME[field]
+                           for field in fields if field in SerializeModel.__FILE_FIELDS_BY_NAME]
+            if json_fields:
+                change = {SerializeModel.__KEY_FILE_FULL_PATH: changed_file.full_path}
+                change.update({key: to_json(changed_file) for _, key, to_json in json_fields})
+                changes.append(change)
+        if not changes:
+            return None
+        patch_json = json.dumps({
+            SerializeModel.__KEY_PATCH_NAME: event.new_file.name,
+            SerializeModel.__KEY_PATCH_CHANGES: changes
+        })
+        return self._sse_pack(event=SerializeModel.__EVENT_PATCH,
+                              data=patch_json,
+                              event_id=event_id)
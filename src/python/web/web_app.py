@@ -1,6 +1,6 @@
 # Copyright 2017, Inderpreet Singh, All rights reserved.
 
-from typing import Type, Callable, Optional
+from typing import Type, Callable, Optional, Mapping
 from abc import ABC, abstractmethod
 import time
 
@@ -41,6 +41,24 @@ class IStreamHandler(ABC):
     def cleanup(self):
         pass
 
+    def set_request_query(self, query: Mapping[str, str]):
+        """
+        Called with the query parameters of the stream request, before setup()
+        Handlers can use these to let clients opt into different stream formats
+        :param query:
+        :return:
+        """
+        pass
+
+    def set_last_event_id(self, last_event_id: Optional[str]):
+        """
+        Called with the Last-Event-ID of the stream request, before setup()
+        This is the id of the last event a reconnecting client got
+        :param last_event_id: None for a new connection
+        :return:
+        """
+        pass
+
     @classmethod
     def register(cls, web_app: "WebApp", **kwargs):
         """
@@ -149,6 +167,8 @@ class WebApp(bottle.Bottle):
 
             # Call setup on all handlers
             for handler in handlers:
+                handler.set_request_query(bottle.request.query)
+                handler.set_last_event_id(bottle.request.get_header("Last-Event-ID"))
                 handler.setup()
 
             # Track time for heartbeat